@@ -0,0 +1,51 @@
+"""
+Opaque paging cursors for nearby results.
+
+Nearby rows are ordered by ``(distance, id)``, so the last row of a page is
+enough to start the next one. A cursor is that pair plus a fingerprint of the
+query it came from, base64url-encoded JSON; a cursor presented with different
+parameters (center, radius, filters) is rejected rather than silently paging
+a different result set. The page size may change between pages.
+"""
+import json
+import base64
+import hashlib
+import binascii
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _fingerprint(query: Sequence[Any]) -> str:
+    return hashlib.sha1(repr(tuple(query)).encode("utf-8")).hexdigest()[:12]
+
+
+def encode_cursor(row: Dict[str, Any], query: Sequence[Any]) -> str:
+    """The cursor for the page after ``row``, the last row of a page of ``query``."""
+    data = json.dumps([row["distance"], row["id"], _fingerprint(query)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, query: Sequence[Any]) -> Tuple[float, int]:
+    """
+    The (distance, id) a cursor resumes after.
+
+    Raises:
+        ValueError: If the cursor is malformed or was issued for another query
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        distance, bathroom_id, fingerprint = json.loads(data)
+        after = (float(distance), int(bathroom_id))
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if fingerprint != _fingerprint(query):
+        raise ValueError("Cursor was issued for a different query")
+    return after
+
+
+def next_cursor(rows: List[Dict[str, Any]], limit: int, query: Sequence[Any]) -> Optional[str]:
+    """The cursor for the page after ``rows``, or None when it was the last page."""
+    if len(rows) < limit or not rows:
+        return None
+    return encode_cursor(rows[-1], query)
@@ -1,9 +1,14 @@
 from fastapi import Depends, HTTPException, status
 from typing import Optional
+from config.database import Database, database
 
 # This file will contain dependencies for FastAPI routes
 # For example, authentication dependencies, database session dependencies, etc.
 
+def get_database() -> Database:
+    """Shared non-blocking database handle for the worker process."""
+    return database
+
 # Example of a dependency for authentication (to be implemented if needed)
 async def get_current_user():
     # This is a placeholder for authentication logic
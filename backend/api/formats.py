@@ -0,0 +1,273 @@
+"""
+Response formats for bathroom lists.
+
+Clients pick a format with ``format=`` or the ``Accept`` header and can trim
+rows to the columns they need with ``fields=``:
+
+``json`` (application/json)
+    The default: an array of row objects.
+
+``columns`` (application/vnd.saferoute.columns+json)
+    ``{"count": n, "columns": {"id": [...], "latitude": [...], ...}}``, each
+    key sent once instead of once per row.
+
+``packed`` (application/vnd.saferoute.packed)
+    Binary, little-endian::
+
+        b"SRP1" | uint32 header length | header JSON | column buffers
+
+    The header is ``{"count": n, "columns": [{"name", "type", "offset",
+    "length"}, ...]}`` with offsets relative to the end of the header. Types:
+
+    - ``int64``, ``int32``, ``float32``: packed arrays, one value per row
+    - ``e6``: int32 microdegrees (value * 1e6, about 0.1 m)
+    - ``bits``: bit-packed booleans, row i in bit i % 8 of byte i // 8;
+      null is false
+    - ``utf8``: uint32 offsets (count + 1) then the UTF-8 data, Arrow-style;
+      an extra ``nulls`` entry (bit-packed, set bit = null) points at the
+      null bitmap when the column has nulls
+
+JSON bodies are rendered with orjson when it is installed. With
+``RESPONSE_VALIDATION`` on (the default outside serve.py) rows are first
+validated against the route's response model and serialized by pydantic's
+compiled core; off, rows from the database and the indexes are trusted and
+rendered as they are.
+"""
+import json
+import struct
+from array import array
+from typing import List, Dict, Any, Optional, Tuple
+
+from fastapi import Response
+from fastapi.exceptions import ResponseValidationError
+
+from config.settings import RESPONSE_VALIDATION
+from models.bathroom import BathroomResult
+from services.metrics import span
+
+try:
+    import orjson
+except ImportError:  # Optional: the standard library renders the same JSON, more slowly
+    orjson = None
+
+try:
+    from pydantic import TypeAdapter, ValidationError
+except ImportError:  # pydantic 1: responses are not validated
+    TypeAdapter = ValidationError = None
+
+JSON_MEDIA_TYPE = "application/json"
+COLUMNS_MEDIA_TYPE = "application/vnd.saferoute.columns+json"
+PACKED_MEDIA_TYPE = "application/vnd.saferoute.packed"
+
+FORMATS = {
+    "json": JSON_MEDIA_TYPE,
+    "columns": COLUMNS_MEDIA_TYPE,
+    "packed": PACKED_MEDIA_TYPE,
+}
+
+PACKED_MAGIC = b"SRP1"
+
+# Columns a bathroom row can carry: the model's fields plus the distance of nearby results
+# and the score of search results
+BATHROOM_FIELDS = tuple(BathroomResult.__fields__)
+
+# Packed column types; anything not listed is utf8
+PACKED_TYPES = {
+    "id": "int64",
+    "latitude": "e6",
+    "longitude": "e6",
+    "is_unisex": "bits",
+    "is_accessible": "bits",
+    "has_changing_table": "bits",
+    "average_rating": "float32",
+    "total_ratings": "int32",
+    "distance": "float32",
+    "score": "float32",
+}
+
+_ARRAY_CODES = {"int64": "q", "int32": "i", "float32": "f", "e6": "i"}
+
+# Compiled validator/serializer per response model, built on first use
+_adapters: Dict[Any, Any] = {}
+
+
+def dumps(value: Any) -> bytes:
+    """Render a value as compact JSON; dates and other non-JSON values become strings."""
+    if orjson is not None:
+        return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def _adapter(model: Any):
+    adapter = _adapters.get(model)
+    if adapter is None:
+        adapter = _adapters[model] = TypeAdapter(model)
+    return adapter
+
+
+def render_json(content: Any, model: Any = None, validate: Optional[bool] = None) -> bytes:
+    """
+    Render a response body typed as ``model`` (e.g. ``List[Bathroom]``).
+
+    Trusted content is rendered as it is. With ``validate`` (by default
+    ``RESPONSE_VALIDATION``), it goes through the model's validator and
+    serializer, which also drop unknown columns.
+
+    Raises:
+        ResponseValidationError: If validated content does not fit the model; unlike
+            pydantic's error it is not a ValueError, so routes report it as a 500
+    """
+    if validate is None:
+        validate = RESPONSE_VALIDATION
+    with span("serialize"):
+        if validate and model is not None and TypeAdapter is not None:
+            adapter = _adapter(model)
+            try:
+                return adapter.dump_json(adapter.validate_python(content))
+            except ValidationError as e:
+                raise ResponseValidationError(e.errors(include_url=False)) from e
+        return dumps(content)
+
+
+def json_response(content: Any, model: Any = None, status_code: int = 200,
+                  headers: Optional[Dict[str, str]] = None) -> Response:
+    """A JSON response rendered by ``render_json``, bypassing FastAPI's generic encoder."""
+    return Response(content=render_json(content, model), status_code=status_code, media_type=JSON_MEDIA_TYPE,
+                    headers=headers)
+
+
+def negotiate(format: Optional[str], accept: Optional[str]) -> str:
+    """
+    Pick the response media type.
+
+    An explicit ``format`` wins; otherwise the first supported type listed
+    in ``accept``, falling back to JSON.
+
+    Raises:
+        ValueError: If ``format`` is not a known format
+    """
+    if format:
+        if format not in FORMATS:
+            raise ValueError(f"Unknown format '{format}'; expected one of {', '.join(FORMATS)}")
+        return FORMATS[format]
+    for part in (accept or "").split(","):
+        media_type = part.split(";")[0].strip()
+        if media_type in (COLUMNS_MEDIA_TYPE, PACKED_MEDIA_TYPE):
+            return media_type
+    return JSON_MEDIA_TYPE
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """
+    Parse a comma-separated ``fields`` parameter.
+
+    Raises:
+        ValueError: If a field is not a bathroom column
+    """
+    if not fields:
+        return None
+    names = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in BATHROOM_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return names
+
+
+def project(rows: List[Dict[str, Any]], fields: Optional[List[str]]) -> List[Dict[str, Any]]:
+    """Keep only ``fields`` of each row."""
+    if fields is None:
+        return rows
+    return [{name: row.get(name) for name in fields} for row in rows]
+
+
+def _columns_of(rows: List[Dict[str, Any]], fields: Optional[List[str]]) -> List[str]:
+    if fields is not None:
+        return fields
+    names = {}
+    for row in rows:
+        names.update(dict.fromkeys(row))
+    return list(names)
+
+
+def encode_columns(rows: List[Dict[str, Any]], fields: Optional[List[str]] = None) -> bytes:
+    """Encode rows as column-oriented JSON."""
+    names = _columns_of(rows, fields)
+    columns = {name: [row.get(name) for row in rows] for name in names}
+    return json.dumps({"count": len(rows), "columns": columns},
+                      separators=(",", ":"), default=str).encode("utf-8")
+
+
+def _pack_bits(values) -> bytes:
+    packed = bytearray((len(values) + 7) // 8)
+    for i, value in enumerate(values):
+        if value:
+            packed[i >> 3] |= 1 << (i & 7)
+    return bytes(packed)
+
+
+def _pack_column(kind: str, values: List[Any]) -> Tuple[bytes, Optional[bytes]]:
+    """Pack one column; returns its buffer and, for utf8 columns with nulls, the null bitmap."""
+    if kind == "bits":
+        return _pack_bits(values), None
+    if kind == "utf8":
+        offsets = array("I", [0])
+        data = bytearray()
+        has_nulls = False
+        for value in values:
+            if value is None:
+                has_nulls = True
+            else:
+                data += str(value).encode("utf-8")
+            offsets.append(len(data))
+        nulls = _pack_bits([value is None for value in values]) if has_nulls else None
+        return _to_little_endian(offsets).tobytes() + bytes(data), nulls
+    if kind == "e6":
+        values = [round((value or 0) * 1e6) for value in values]
+    elif kind == "float32":
+        values = [float(value or 0) for value in values]
+    else:
+        values = [int(value or 0) for value in values]
+    return _to_little_endian(array(_ARRAY_CODES[kind], values)).tobytes(), None
+
+
+def _to_little_endian(values: array) -> array:
+    if struct.pack("=I", 1) != struct.pack("<I", 1):
+        values.byteswap()
+    return values
+
+
+def encode_packed(rows: List[Dict[str, Any]], fields: Optional[List[str]] = None) -> bytes:
+    """Encode rows in the packed binary format described in the module docstring."""
+    names = _columns_of(rows, fields)
+    header_columns = []
+    buffers = []
+    offset = 0
+    for name in names:
+        kind = PACKED_TYPES.get(name, "utf8")
+        buffer, nulls = _pack_column(kind, [row.get(name) for row in rows])
+        column = {"name": name, "type": kind, "offset": offset, "length": len(buffer)}
+        buffers.append(buffer)
+        offset += len(buffer)
+        if nulls is not None:
+            column["nulls"] = {"offset": offset, "length": len(nulls)}
+            buffers.append(nulls)
+            offset += len(nulls)
+        header_columns.append(column)
+    header = json.dumps({"count": len(rows), "columns": header_columns}, separators=(",", ":")).encode("utf-8")
+    return b"".join([PACKED_MAGIC, struct.pack("<I", len(header)), header, *buffers])
+
+
+def bathrooms_response(rows: List[Dict[str, Any]], fields: Optional[List[str]], media_type: str) -> Response:
+    """
+    Render bathroom rows in the negotiated format.
+
+    Rows come straight from the database or the index, so they are encoded
+    directly instead of going through FastAPI's generic encoder. Trimmed rows
+    are not whole bathrooms, so only full JSON rows are ever validated.
+    """
+    if media_type == JSON_MEDIA_TYPE:
+        body = render_json(project(rows, fields), List[BathroomResult] if fields is None else None)
+    else:
+        with span("serialize"):
+            body = encode_columns(rows, fields) if media_type == COLUMNS_MEDIA_TYPE else encode_packed(rows, fields)
+    return Response(content=body, media_type=media_type, headers={"Vary": "Accept"})
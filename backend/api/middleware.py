@@ -0,0 +1,77 @@
+import time
+import logging
+from typing import Optional
+
+from config.settings import SLOW_REQUEST_MS, PROFILER_ENABLED, PROFILER_INTERVAL_MS, PROFILER_OUTPUT_DIR
+from services.metrics import request_seconds, slow_requests, start_request, end_request
+from services.profiler import SamplingProfiler
+
+logger = logging.getLogger(__name__)
+
+# Process-wide sampling profiler, or None unless PROFILER_ENABLED
+profiler: Optional[SamplingProfiler] = SamplingProfiler(
+    PROFILER_OUTPUT_DIR,
+    interval_seconds=PROFILER_INTERVAL_MS / 1000
+) if PROFILER_ENABLED else None
+
+
+class RequestMetricsMiddleware:
+    """
+    Time every HTTP request into ``saferoute_http_request_duration_seconds``.
+
+    Requests are labelled with their route template (``/api/bathrooms/{bathroom_id}``),
+    not the raw path, to keep the number of series bounded. Requests slower
+    than ``SLOW_REQUEST_MS`` log the time spent per span and, when the
+    profiler is running, dump the stacks sampled while they ran.
+    """
+
+    def __init__(self, app, slow_request_ms: float = SLOW_REQUEST_MS):
+        self.app = app
+        self.slow_seconds = slow_request_ms / 1000
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        spans, token = start_request()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            finished = time.perf_counter()
+            end_request(token)
+            elapsed = finished - started
+            template = self._route_template(scope)
+            request_seconds.observe(elapsed, scope["method"], template, str(status))
+            if self.slow_seconds and elapsed >= self.slow_seconds:
+                self._report_slow(scope, template, status, elapsed, spans, started, finished)
+
+    @staticmethod
+    def _route_template(scope) -> str:
+        # Newer FastAPI versions keep included routes unprefixed and record the full path separately
+        effective = (scope.get("fastapi") or {}).get("effective_route_context")
+        route = effective if effective is not None else scope.get("route")
+        return getattr(route, "path", None) or "unmatched"
+
+    def _report_slow(self, scope, template: str, status: int, elapsed: float, spans, started: float,
+                     finished: float) -> None:
+        slow_requests.inc(template)
+        accounted = sum(spans.values())
+        breakdown = ", ".join(f"{name} {seconds * 1000:.1f}ms"
+                              for name, seconds in sorted(spans.items(), key=lambda item: -item[1]))
+        message = (f"Slow request {scope['method']} {scope['path']} -> {status} in {elapsed * 1000:.1f}ms "
+                   f"({breakdown or 'no spans'}; other {max(0.0, elapsed - accounted) * 1000:.1f}ms)")
+        if profiler is not None and profiler.running:
+            path = profiler.dump(f"{scope['method']} {template}", started, finished)
+            if path:
+                message += f", stacks in {path}"
+        logger.warning(message)
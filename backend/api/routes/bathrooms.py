@@ -1,24 +1,51 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from typing import List, Optional
-from models.bathroom import Bathroom, BathroomCreate, BathroomUpdate
+from fastapi import APIRouter, Depends, HTTPException, Query, Header, Body, BackgroundTasks
+from typing import List, Optional, Dict, Any
+from models.bathroom import Bathroom, BathroomResult, BathroomCreate, BathroomUpdate, BulkDelete, NearestQuery, RouteQuery
+from config.settings import BATCH_MAX_POINTS, BULK_MAX_ITEMS, DEDUP_CHECK_ON_CREATE, SEARCH_INDEX_ENABLED
 from services.bathroom_service import BathroomService
+from services.dedup_service import DedupService
+from config.database import Database
+from api.dependencies import get_database
+from api.formats import negotiate, parse_fields, project, bathrooms_response, json_response
+from api.cursors import NEXT_CURSOR_HEADER, decode_cursor, next_cursor
 
 router = APIRouter(prefix="/bathrooms", tags=["bathrooms"])
 
-@router.get("/")
+@router.get("/", response_model=List[BathroomResult])
 async def get_bathrooms_by_location(
     latitude: float = Query(..., description="User's latitude"),
     longitude: float = Query(..., description="User's longitude"),
     radius: float = Query(5.0, description="Search radius in kilometers"),
     limit: int = Query(50, description="Maximum number of results to return"),
+    k: Optional[int] = Query(None, ge=1, description="Return the k nearest matches at any distance instead of radius and limit"),
     rating_min: Optional[float] = Query(None, description="Minimum rating filter"),
     is_unisex: Optional[bool] = Query(None, description="Filter for unisex bathrooms"),
     is_accessible: Optional[bool] = Query(None, description="Filter for accessible bathrooms"),
-    has_changing_table: Optional[bool] = Query(None, description="Filter for bathrooms with changing tables")
+    has_changing_table: Optional[bool] = Query(None, description="Filter for bathrooms with changing tables"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page, to continue outward from it"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. id,latitude,longitude"),
+    format: Optional[str] = Query(None, description="Response format: json, columns or packed (overrides Accept)"),
+    accept: Optional[str] = Header(None),
+    db: Database = Depends(get_database)
 ):
-    """Get bathrooms within a radius of the user's location."""
+    """
+    Get bathrooms within a radius of the user's location, nearest first.
+
+    Full pages carry an ``X-Next-Cursor`` header; pass it back as ``cursor``
+    with the same query to get the next ones out.
+    """
+    if k is not None:
+        radius, limit = None, k
+    query = (latitude, longitude, radius, rating_min, is_unisex, is_accessible, has_changing_table)
+    try:
+        media_type = negotiate(format, accept)
+        columns = parse_fields(fields)
+        after = decode_cursor(cursor, query) if cursor is not None else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     try:
         bathrooms = await BathroomService.get_bathrooms_by_location(
+            db,
             latitude=latitude,
             longitude=longitude,
             radius=radius,
@@ -26,47 +53,249 @@ async def get_bathrooms_by_location(
             rating_min=rating_min,
             is_unisex=is_unisex,
             is_accessible=is_accessible,
+            has_changing_table=has_changing_table,
+            after=after
+        )
+        response = bathrooms_response(bathrooms, columns, media_type)
+        following = next_cursor(bathrooms, limit, query)
+        if following is not None:
+            response.headers[NEXT_CURSOR_HEADER] = following
+        return response
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/viewport")
+async def get_bathrooms_in_viewport(
+    min_lat: float = Query(..., ge=-90, le=90, description="Southern edge of the viewport"),
+    min_lng: float = Query(..., ge=-180, le=180, description="Western edge of the viewport"),
+    max_lat: float = Query(..., ge=-90, le=90, description="Northern edge of the viewport"),
+    max_lng: float = Query(..., ge=-180, le=180, description="Eastern edge; less than min_lng when crossing the antimeridian"),
+    zoom: int = Query(..., ge=0, le=22, description="Map zoom level"),
+    rating_min: Optional[float] = Query(None, description="Minimum rating filter (half-star resolution for clusters)"),
+    is_unisex: Optional[bool] = Query(None, description="Filter for unisex bathrooms"),
+    is_accessible: Optional[bool] = Query(None, description="Filter for accessible bathrooms"),
+    has_changing_table: Optional[bool] = Query(None, description="Filter for bathrooms with changing tables"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns of individual bathrooms to return"),
+    db: Database = Depends(get_database)
+):
+    """Get clustered bathrooms in a map viewport, or individual ones at high zoom."""
+    if min_lat > max_lat:
+        raise HTTPException(status_code=400, detail="min_lat must not be greater than max_lat")
+    try:
+        columns = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        result = await BathroomService.get_bathrooms_in_viewport(
+            db,
+            min_lat=min_lat,
+            min_lng=min_lng,
+            max_lat=max_lat,
+            max_lng=max_lng,
+            zoom=zoom,
+            rating_min=rating_min,
+            is_unisex=is_unisex,
+            is_accessible=is_accessible,
             has_changing_table=has_changing_table
         )
-        return bathrooms
+        result["bathrooms"] = project(result["bathrooms"], columns)
+        return json_response(result)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/nearest", response_model=Dict[str, List[List[BathroomResult]]])
+async def get_nearest_bathrooms(
+    query: NearestQuery,
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return"),
+    db: Database = Depends(get_database)
+):
+    """Get the nearest bathrooms for each of many locations."""
+    if len(query.points) > BATCH_MAX_POINTS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_POINTS} points per request")
+    try:
+        columns = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        results = await BathroomService.get_nearest_bathrooms(
+            db,
+            points=[(point.latitude, point.longitude) for point in query.points],
+            radius=query.radius,
+            limit=query.limit,
+            rating_min=query.rating_min,
+            is_unisex=query.is_unisex,
+            is_accessible=query.is_accessible,
+            has_changing_table=query.has_changing_table
+        )
+        return json_response({"results": [project(bathrooms, columns) for bathrooms in results]},
+                             Dict[str, List[List[BathroomResult]]] if columns is None else None)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/route", response_model=List[BathroomResult])
+async def get_bathrooms_along_route(
+    query: RouteQuery,
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return"),
+    db: Database = Depends(get_database)
+):
+    """Get the bathrooms within a distance of a route, nearest to it first."""
+    if not query.points or len(query.points) > BATCH_MAX_POINTS:
+        raise HTTPException(status_code=400, detail=f"A route needs 1 to {BATCH_MAX_POINTS} points")
+    try:
+        columns = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        bathrooms = await BathroomService.get_bathrooms_along_route(
+            db,
+            points=[(point.latitude, point.longitude) for point in query.points],
+            radius=query.radius,
+            limit=query.limit,
+            rating_min=query.rating_min,
+            is_unisex=query.is_unisex,
+            is_accessible=query.is_accessible,
+            has_changing_table=query.has_changing_table
+        )
+        return json_response(project(bathrooms, columns), List[BathroomResult] if columns is None else None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/search", response_model=List[BathroomResult])
+async def search_bathrooms(
+    q: str = Query(..., min_length=1, description="Words to find in names, addresses and directions"),
+    latitude: Optional[float] = Query(None, ge=-90, le=90, description="Rank matches by distance from here"),
+    longitude: Optional[float] = Query(None, ge=-180, le=180, description="Rank matches by distance from here"),
+    radius: Optional[float] = Query(None, gt=0, description="Only match within this many kilometers of the location"),
+    limit: int = Query(20, ge=1, le=100, description="Maximum number of results to return"),
+    fuzzy: bool = Query(True, description="Tolerate misspelled words"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return"),
+    format: Optional[str] = Query(None, description="Response format: json, columns or packed (overrides Accept)"),
+    accept: Optional[str] = Header(None)
+):
+    """Search bathrooms by text, best match first, optionally near a location."""
+    if (latitude is None) != (longitude is None):
+        raise HTTPException(status_code=400, detail="latitude and longitude go together")
+    if radius is not None and latitude is None:
+        raise HTTPException(status_code=400, detail="radius needs a latitude and longitude")
+    try:
+        media_type = negotiate(format, accept)
+        columns = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        bathrooms = await BathroomService.search_bathrooms(
+            q,
+            limit=limit,
+            latitude=latitude,
+            longitude=longitude,
+            radius=radius,
+            fuzzy=fuzzy
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if bathrooms is None:
+        if not SEARCH_INDEX_ENABLED:
+            raise HTTPException(status_code=503, detail="Search is disabled (set SEARCH_INDEX_ENABLED=true)")
+        raise HTTPException(status_code=503, detail="Search index is not loaded yet")
+    return bathrooms_response(bathrooms, columns, media_type)
+
+def bulk_response(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    succeeded = sum(1 for result in results if result["status"] < 300)
+    return {"succeeded": succeeded, "failed": len(results) - succeeded, "results": results}
+
+def check_bulk_size(items: List[Any]) -> None:
+    if len(items) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_ITEMS} items per request")
+
+# Bulk routes come before /{bathroom_id}, which would otherwise match /bulk
+@router.post("/bulk")
+async def bulk_create_bathrooms(items: List[Any] = Body(..., description="BathroomCreate bodies"),
+                                db: Database = Depends(get_database)):
+    """Create many bathrooms; each item gets its own status (201, 422 or 500)."""
+    check_bulk_size(items)
+    try:
+        return bulk_response(await BathroomService.bulk_create(db, items))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.put("/bulk")
+async def bulk_update_bathrooms(items: List[Any] = Body(..., description="BathroomUpdate bodies with an id"),
+                                db: Database = Depends(get_database)):
+    """Update many bathrooms; each item gets its own status (200, 404, 422 or 500)."""
+    check_bulk_size(items)
+    try:
+        return bulk_response(await BathroomService.bulk_update(db, items))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/bulk/delete")
+async def bulk_delete_bathrooms(request: BulkDelete, db: Database = Depends(get_database)):
+    """Delete many bathrooms; each id gets its own status (204, 404, 422 or 500)."""
+    check_bulk_size(request.ids)
+    try:
+        return bulk_response(await BathroomService.bulk_delete(db, request.ids))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/{bathroom_id}")
-async def get_bathroom(bathroom_id: int):
+@router.get("/duplicates")
+async def get_pending_duplicates():
+    """Bathrooms created on this worker that look like duplicates of existing ones, not merged yet."""
+    return {"decisions": DedupService.pending()}
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """Get hit/miss/eviction counters of the nearby query cache."""
+    return BathroomService.cache_stats()
+
+@router.get("/{bathroom_id}", response_model=Bathroom)
+async def get_bathroom(
+    bathroom_id: int,
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return"),
+    db: Database = Depends(get_database)
+):
     """Get a bathroom by ID."""
     try:
-        bathroom = await BathroomService.get_bathroom(bathroom_id)
-        return bathroom
+        columns = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        bathroom = await BathroomService.get_bathroom(db, bathroom_id)
+        return json_response(project([bathroom], columns)[0], Bathroom if columns is None else None)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/", status_code=201)
-async def create_bathroom(bathroom: BathroomCreate):
+@router.post("/", status_code=201, response_model=Bathroom)
+async def create_bathroom(bathroom: BathroomCreate, background_tasks: BackgroundTasks,
+                          db: Database = Depends(get_database)):
     """Create a new bathroom."""
     try:
-        created_bathroom = await BathroomService.create_bathroom(bathroom)
-        return created_bathroom
+        created_bathroom = await BathroomService.create_bathroom(db, bathroom)
+        if DEDUP_CHECK_ON_CREATE:
+            # Checked once the response is sent, so creating stays as fast as before
+            background_tasks.add_task(DedupService.check_inserted, db, created_bathroom)
+        return json_response(created_bathroom, Bathroom, status_code=201)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.put("/{bathroom_id}")
-async def update_bathroom(bathroom_id: int, bathroom: BathroomUpdate):
+@router.put("/{bathroom_id}", response_model=Bathroom)
+async def update_bathroom(bathroom_id: int, bathroom: BathroomUpdate, db: Database = Depends(get_database)):
     """Update a bathroom."""
     try:
-        updated_bathroom = await BathroomService.update_bathroom(bathroom_id, bathroom)
-        return updated_bathroom
+        updated_bathroom = await BathroomService.update_bathroom(db, bathroom_id, bathroom)
+        return json_response(updated_bathroom, Bathroom)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/{bathroom_id}", status_code=204)
-async def delete_bathroom(bathroom_id: int):
+async def delete_bathroom(bathroom_id: int, db: Database = Depends(get_database)):
     """Delete a bathroom."""
     try:
-        await BathroomService.delete_bathroom(bathroom_id)
+        await BathroomService.delete_bathroom(db, bathroom_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,27 +1,54 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import List
-from models.review import Review, ReviewCreate
+from models.review import Review, ReviewCreate, ReviewSummaryRequest
+import services.review_service as review_service
 from services.review_service import ReviewService
+from services.write_behind import QueueFull
+from config.database import Database
+from api.dependencies import get_database
+from api.formats import json_response
 
 router = APIRouter(prefix="/reviews", tags=["reviews"])
 
-@router.get("/{bathroom_id}")
+@router.get("/{bathroom_id}", response_model=List[Review])
 async def get_reviews_by_bathroom(
     bathroom_id: int,
-    limit: int = Query(10, description="Maximum number of reviews to return")
+    limit: int = Query(10, description="Maximum number of reviews to return"),
+    db: Database = Depends(get_database)
 ):
     """Get reviews for a bathroom."""
     try:
-        reviews = await ReviewService.get_reviews_by_bathroom(bathroom_id, limit)
-        return reviews
+        reviews = await ReviewService.get_reviews_by_bathroom(db, bathroom_id, limit)
+        return json_response(reviews, List[Review])
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/", status_code=201)
-async def create_review(review: ReviewCreate):
-    """Create a new review."""
+@router.post("/summaries")
+async def get_review_summaries(request: ReviewSummaryRequest, db: Database = Depends(get_database)):
+    """Get review count, average rating, rating histogram and latest reviews for many bathrooms."""
     try:
-        created_review = await ReviewService.create_review(review)
-        return created_review
+        return json_response(await ReviewService.get_summaries(db, request.bathroom_ids, request.latest))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/queue/stats")
+async def get_queue_stats():
+    """Counters of the write-behind review queue."""
+    return await ReviewService.queue_stats()
+
+@router.post("/", status_code=201, response_model=Review,
+             responses={202: {"description": "Queued by write-behind; the review has no id yet"}})
+async def create_review(review: ReviewCreate, db: Database = Depends(get_database)):
+    """Create a new review; 202 once spooled when write-behind is on."""
+    queue = review_service.review_queue
+    try:
+        if queue is not None and queue.running:
+            return json_response(await ReviewService.submit_review(review), status_code=202)
+        created_review = await ReviewService.create_review(db, review)
+        return json_response(created_review, Review, status_code=201)
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
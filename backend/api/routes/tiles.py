@@ -0,0 +1,102 @@
+import gzip
+from fastapi import APIRouter, HTTPException, Query, Header, Response
+from fastapi.responses import JSONResponse
+from typing import Optional
+from config.settings import TILES_MAX_AGE_SECONDS
+import services.tile_service as tile_service
+
+router = APIRouter(prefix="/tiles", tags=["tiles"])
+
+# A tile asked for by its hash never changes
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+def get_store():
+    store = tile_service.tile_store
+    if store is None:
+        raise HTTPException(status_code=404, detail="Tile packs are not configured")
+    store.refresh()
+    if store.manifest is None:
+        raise HTTPException(status_code=503, detail="No tile packs have been built yet")
+    return store
+
+def matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """Whether an Accept-Encoding header allows gzip: listed (or covered by ``*``) with a q-value above 0."""
+    qualities = {}
+    for part in (accept_encoding or "").split(","):
+        coding, *params = [piece.strip() for piece in part.split(";")]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+@router.get("/manifest")
+async def get_tile_manifest(if_none_match: Optional[str] = Header(None)):
+    """Zoom level and hash of every non-empty tile of the current build."""
+    store = get_store()
+    etag = f'"{store.etag}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    manifest = store.manifest
+    return JSONResponse({
+        "zoom": manifest["zoom"],
+        "built_at": manifest["built_at"],
+        "tiles": {key: entry["hash"] for key, entry in manifest["tiles"].items()},
+    }, headers=headers)
+
+@router.get("/{zoom}/{x}/{y}")
+async def get_tile(
+    zoom: int,
+    x: int,
+    y: int,
+    v: Optional[str] = Query(None, description="Tile hash from the manifest; makes the response cacheable forever"),
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None)
+):
+    """Bathrooms in a slippy-map tile as a JSON array, gzipped when the client accepts it."""
+    store = get_store()
+    if zoom != store.zoom:
+        raise HTTPException(status_code=404, detail=f"Tiles are built for zoom {store.zoom} only")
+    if not (0 <= x < 1 << zoom and 0 <= y < 1 << zoom):
+        raise HTTPException(status_code=404, detail="No such tile")
+    try:
+        found = store.get(zoom, x, y)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if found is None:
+        # A build at another zoom was published since the check above
+        raise HTTPException(status_code=404, detail="No such tile")
+    digest, body = found
+
+    gzipped = accepts_gzip(accept_encoding)
+    # Strong ETags name one representation, so the identity body gets its own
+    etag = f'"{digest}"' if gzipped else f'"{digest}-identity"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": IMMUTABLE if v == digest else f"public, max-age={TILES_MAX_AGE_SECONDS}",
+        "Vary": "Accept-Encoding",
+    }
+    if matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    if gzipped:
+        headers["Content-Encoding"] = "gzip"
+    else:
+        body = gzip.decompress(body)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,65 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from config.settings import TRANSFER_PAGE_SIZE, TRANSFER_BATCH_SIZE, TRANSFER_IMPORT_ENABLED
+from services.transfer_service import TransferService
+from config.database import Database
+from api.dependencies import get_database
+
+router = APIRouter(prefix="/transfer", tags=["transfer"])
+
+@router.get("/{table}")
+async def export_table(
+    table: str,
+    gzip: bool = Query(False, description="Gzip the stream (sent with Content-Encoding: gzip)"),
+    page_size: int = Query(TRANSFER_PAGE_SIZE, ge=1, le=10000, description="Rows per database query"),
+    after_id: Optional[int] = Query(None, description="Only export rows with a larger id, to resume an export"),
+    db: Database = Depends(get_database)
+):
+    """Stream a whole table as NDJSON, one row per line in id order."""
+    if table not in TransferService.TABLES:
+        raise HTTPException(status_code=404, detail=f"Unknown table {table}")
+    pages = TransferService.export_pages(db, table, page_size, after_id)
+    # Read the first page before responding, so a failing database is still a 500
+    try:
+        first = await pages.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def all_pages():
+        if first is not None:
+            yield first
+            async for page in pages:
+                yield page
+
+    headers = {"Content-Disposition": f'attachment; filename="{table}.ndjson"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(TransferService.encode_ndjson(all_pages(), compress=gzip),
+                             media_type="application/x-ndjson", headers=headers)
+
+@router.post("/{table}")
+async def import_table(
+    table: str,
+    request: Request,
+    batch_size: int = Query(TRANSFER_BATCH_SIZE, ge=1, le=10000, description="Initial rows per upsert"),
+    db: Database = Depends(get_database)
+):
+    """
+    Upsert NDJSON rows (plain or gzip) from the request body, as it streams in.
+
+    Disabled unless ``TRANSFER_IMPORT_ENABLED`` is set, since it overwrites rows by id.
+    """
+    if not TRANSFER_IMPORT_ENABLED:
+        raise HTTPException(status_code=403, detail="Imports are disabled (set TRANSFER_IMPORT_ENABLED=true)")
+    if table not in TransferService.TABLES:
+        raise HTTPException(status_code=404, detail=f"Unknown table {table}")
+    try:
+        report = await TransferService.import_ndjson(db, table, request.stream(), batch_size)
+        return report.as_dict()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,5 +1,8 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, JSONResponse
+import asyncio
 import logging
 
 # Configure logging
@@ -7,13 +10,59 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(level
 logger = logging.getLogger(__name__)
 
 # Import API routes
-from api.routes import bathrooms, reviews
+from api.routes import bathrooms, reviews, transfer, tiles
 from config.settings import API_TITLE, API_VERSION, API_PREFIX
+from config.database import database
+from config.resources import resources
+import services.bathroom_service as bathroom_service
+import services.review_service as review_service
+from services.bathroom_service import BathroomService, maintain_index
+from services.snapshot import SnapshotIndex
+from services.metrics import registry
+from api.middleware import RequestMetricsMiddleware, profiler
+from api.cursors import NEXT_CURSOR_HEADER
+
+async def warm_spatial_index():
+    # Nearby queries use the RPC until the first load finishes; snapshot workers only map a file
+    if not isinstance(bathroom_service.bathroom_index, SnapshotIndex):
+        await database.connect()
+    await BathroomService.load_index(database)
+    app.state.index_task = asyncio.create_task(maintain_index(database))
+
+def stop_spatial_index():
+    task = getattr(app.state, "index_task", None)
+    if task is not None:
+        task.cancel()
+
+resources.register("database", warm=database.warm, close=database.close)
+if bathroom_service.bathroom_index is not None or bathroom_service.text_index is not None:
+    resources.register("spatial_index", warm=warm_spatial_index, close=stop_spatial_index, required=False)
+if review_service.review_queue is not None:
+    async def start_review_queue():
+        # Spooled reviews left by a previous run are checked against the database before replaying
+        await database.connect()
+        await review_service.review_queue.start(database)
+    resources.register("review_queue", warm=start_review_queue, close=review_service.review_queue.stop,
+                       required=False)
+if profiler is not None:
+    async def start_profiler():
+        profiler.start()
+    resources.register("profiler", warm=start_profiler, close=profiler.stop, required=False)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm-up runs in the background, so the worker serves /healthz right away and /readyz once warm
+    resources.start()
+    try:
+        yield
+    finally:
+        await resources.stop()
 
 # Initialize FastAPI app
 app = FastAPI(
     title=API_TITLE,
-    version=API_VERSION
+    version=API_VERSION,
+    lifespan=lifespan
 )
 
 # Enable CORS for all routes
@@ -23,11 +72,33 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
+# Per-route latency histograms, slow request breakdowns
+app.add_middleware(RequestMetricsMiddleware)
+
 # Include API routes
 app.include_router(bathrooms.router, prefix=API_PREFIX)
 app.include_router(reviews.router, prefix=API_PREFIX)
+app.include_router(transfer.router, prefix=API_PREFIX)
+app.include_router(tiles.router, prefix=API_PREFIX)
+
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    """Liveness: the worker is up and its event loop responsive."""
+    return {"status": "ok"}
+
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    """Readiness: required resources are warmed up; 503 with their state until then."""
+    status = resources.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Latency histograms in the Prometheus text format."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/")
 async def root():
@@ -36,10 +107,13 @@ async def root():
         "version": API_VERSION,
         "endpoints": {
             "bathrooms": f"{API_PREFIX}/bathrooms",
-            "reviews": f"{API_PREFIX}/reviews"
+            "reviews": f"{API_PREFIX}/reviews",
+            "transfer": f"{API_PREFIX}/transfer",
+            "tiles": f"{API_PREFIX}/tiles"
         }
     }
 
 if __name__ == "__main__":
+    # Single process; serve.py runs several workers sharing one bathrooms snapshot
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,157 @@
+"""
+Benchmark the bulk bathroom endpoints against looping the single-row routes.
+
+For each operation (create, update, delete) the same rows are written three
+ways through the FastAPI app against the in-memory Supabase stand-in: one
+request at a time, ``--concurrency`` single-row requests in flight, and
+bulk requests of up to ``BULK_MAX_ITEMS`` items. Each reports rows per
+second and backend round trips.
+
+``--reject-every`` makes the backend refuse every n-th created row, to show
+the cost of isolating bad rows inside bulk batches.
+
+Usage (from the backend directory):
+    python -m benchmarks.bulk_benchmark --rows 2000 --latency-ms 5
+"""
+import os
+import sys
+import time
+import json
+import random
+import asyncio
+import logging
+import argparse
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from app import app
+from api.dependencies import get_database
+from config.database import Database
+from config.settings import BULK_MAX_ITEMS
+from benchmarks.fakes import FakeSupabase
+from benchmarks.common import synthetic_bathrooms
+
+MODES = ("sequential", "concurrent", "bulk")
+
+
+def new_bathrooms(count: int, seed: int):
+    return [{key: row[key] for key in ("name", "address", "latitude", "longitude", "is_unisex", "is_accessible",
+                                       "has_changing_table")}
+            for row in synthetic_bathrooms(count, seed)]
+
+
+async def run_single(client: httpx.AsyncClient, requests, concurrency: int) -> int:
+    """Send (method, url, body) requests with ``concurrency`` in flight; returns the number that failed."""
+    slots = asyncio.Semaphore(concurrency)
+    failed = 0
+
+    async def one(method, url, body):
+        nonlocal failed
+        async with slots:
+            response = await client.request(method, url, json=body)
+            if response.status_code >= 300:
+                failed += 1
+
+    await asyncio.gather(*(one(*request) for request in requests))
+    return failed
+
+
+async def run_bulk(client: httpx.AsyncClient, method: str, url: str, items, wrap=None) -> int:
+    failed = 0
+    for start in range(0, len(items), BULK_MAX_ITEMS):
+        chunk = items[start:start + BULK_MAX_ITEMS]
+        response = await client.request(method, url, json=wrap(chunk) if wrap else chunk)
+        response.raise_for_status()
+        failed += response.json()["failed"]
+    return failed
+
+
+async def run_mode(mode: str, rows: int, args):
+    backend = FakeSupabase(latency_ms=args.latency_ms, seed=args.seed)
+    if args.reject_every:
+        rejected = {f"Restroom {i}" for i in range(args.reject_every, rows + 1, args.reject_every)}
+        backend.reject = lambda values: values.get("name") in rejected
+    db = Database(backend, args.max_workers)
+    app.dependency_overrides[get_database] = lambda: db
+    bodies = new_bathrooms(rows, args.seed)
+    rng = random.Random(args.seed)
+    results = []
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            for operation in ("create", "update", "delete"):
+                ids = sorted(backend.table_data("bathrooms").rows)
+                if operation == "create":
+                    single = [("POST", "/api/bathrooms/", body) for body in bodies]
+                    bulk = lambda: run_bulk(client, "POST", "/api/bathrooms/bulk", bodies)
+                elif operation == "update":
+                    # Mixed shapes, like a partner feed: some rows change a flag, others a name or a location
+                    changes = []
+                    for bathroom_id in ids:
+                        pick = rng.random()
+                        if pick < 0.4:
+                            change = {"is_accessible": rng.random() < 0.5}
+                        elif pick < 0.8:
+                            change = {"name": f"Renamed {bathroom_id}"}
+                        else:
+                            change = {"latitude": 42.3 + rng.random() / 10, "longitude": -71.1 + rng.random() / 10}
+                        changes.append({"id": bathroom_id, **change})
+                    single = [("PUT", f"/api/bathrooms/{c['id']}", {k: v for k, v in c.items() if k != "id"})
+                              for c in changes]
+                    bulk = lambda: run_bulk(client, "PUT", "/api/bathrooms/bulk", changes)
+                else:
+                    single = [("DELETE", f"/api/bathrooms/{bathroom_id}", None) for bathroom_id in ids]
+                    bulk = lambda: run_bulk(client, "POST", "/api/bathrooms/bulk/delete", ids,
+                                            wrap=lambda chunk: {"ids": chunk})
+                count = len(single)
+                calls = backend.calls
+                started = time.perf_counter()
+                if mode == "bulk":
+                    failed = await bulk()
+                else:
+                    failed = await run_single(client, single, 1 if mode == "sequential" else args.concurrency)
+                elapsed = time.perf_counter() - started
+                results.append({
+                    "operation": operation,
+                    "mode": mode,
+                    "rows": count,
+                    "failed": failed,
+                    "seconds": elapsed,
+                    "rows_per_second": count / elapsed,
+                    "db_calls": backend.calls - calls,
+                })
+    finally:
+        app.dependency_overrides.clear()
+        db.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Artificial Supabase round trip")
+    parser.add_argument("--concurrency", type=int, default=16, help="Single-row requests in flight")
+    parser.add_argument("--max-workers", type=int, default=32, help="Database worker threads")
+    parser.add_argument("--reject-every", type=int, default=0, help="Backend rejects every n-th created row")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    results = []
+    for mode in MODES:
+        results.extend(asyncio.run(run_mode(mode, args.rows, args)))
+    print(f"{args.rows} rows, {args.latency_ms:.0f}ms backend round trip")
+    for operation in ("create", "update", "delete"):
+        for result in (r for r in results if r["operation"] == operation):
+            print(f"  {operation:<7} {result['mode']:<11} {result['rows_per_second']:9.1f} rows/s  "
+                  f"{result['seconds']:7.2f}s  {result['db_calls']:>6} db calls  {result['failed']} failed")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
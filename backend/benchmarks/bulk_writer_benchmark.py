@@ -0,0 +1,121 @@
+"""
+Benchmark bathroom upserts through ``BulkWriter`` against the previous
+sequential fixed-size batches, on a ``FakeSupabase`` with configurable
+latency, failure rate and rejected ("poison") rows.
+
+Usage (from the backend directory):
+    python -m benchmarks.bulk_writer_benchmark --rows 20000 --latency-ms 20 --failure-rate 0.05 --poison 10
+"""
+import os
+import sys
+import time
+import json
+import random
+import asyncio
+import argparse
+import logging
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.database import Database
+from services.bulk_writer import BulkWriter, upsert_writer
+from benchmarks.common import synthetic_bathrooms
+from benchmarks.fakes import FakeSupabase
+
+ON_CONFLICT = "external_id, external_source"
+
+
+def build_rows(count: int, poison: int, seed: int = 11):
+    rows = [{k: v for k, v in row.items() if k != "id"} for row in synthetic_bathrooms(count)]
+    for i in random.Random(seed).sample(range(count), poison):
+        rows[i]["name"] = "POISON"
+    return rows
+
+
+def build_backend(args) -> FakeSupabase:
+    return FakeSupabase(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        failure_rate=args.failure_rate,
+        latency_per_row_ms=args.per_row_ms,
+        reject=lambda row: row.get("name") == "POISON",
+    )
+
+
+async def sequential(db: Database, rows, batch_size: int = 100):
+    """The previous behaviour: one fixed-size batch at a time, failed batches dropped."""
+    write = upsert_writer(db, "bathrooms", on_conflict=ON_CONFLICT)
+    written = failed = 0
+    for i in range(0, len(rows), batch_size):
+        batch = rows[i:i + batch_size]
+        try:
+            await write(batch)
+            written += len(batch)
+        except Exception:
+            failed += len(batch)
+    return {"written": written, "failed": failed}
+
+
+async def pipelined(db: Database, rows, args):
+    writer = BulkWriter(
+        upsert_writer(db, "bathrooms", on_conflict=ON_CONFLICT),
+        max_in_flight=args.in_flight,
+        target_seconds=args.target_seconds,
+        backoff_seconds=args.backoff_seconds,
+    )
+    await writer.add_many(rows)
+    report = await writer.close()
+    summary = report.summary()
+    summary["final_batch_size"] = writer.batch_size
+    return summary
+
+
+async def run(args):
+    rows = build_rows(args.rows, args.poison)
+    results = {}
+    for name in ("sequential", "pipelined"):
+        backend = build_backend(args)
+        db = Database(backend, max_workers=args.in_flight * 2)
+        started = time.perf_counter()
+        if name == "sequential":
+            result = await sequential(db, rows)
+        else:
+            result = await pipelined(db, rows, args)
+        elapsed = time.perf_counter() - started
+        stored = len(backend.table_data("bathrooms").rows)
+        db.close()
+        result.update({
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(result["written"] / elapsed, 1),
+            "rows_stored": stored,
+            "calls": backend.calls,
+        })
+        results[name] = {k: round(v, 4) if isinstance(v, float) else v for k, v in result.items()}
+        print(f"{name:>10}: {results[name]}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Fixed latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--per-row-ms", type=float, default=0.05, help="Extra latency per written row")
+    parser.add_argument("--failure-rate", type=float, default=0.05, help="Fraction of calls failing transiently")
+    parser.add_argument("--poison", type=int, default=10, help="Rows the backend always rejects")
+    parser.add_argument("--in-flight", type=int, default=4)
+    parser.add_argument("--target-seconds", type=float, default=0.25)
+    parser.add_argument("--backoff-seconds", type=float, default=0.05)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    results = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
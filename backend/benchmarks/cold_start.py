@@ -0,0 +1,110 @@
+"""
+Measure worker cold start: how long a fresh interpreter takes to import the
+app, and how long from launching uvicorn until the first HTTP response.
+
+Each measurement runs in a new process. Supabase is pointed at an unused
+local port, so nothing is actually reached; ``--without-env`` also checks
+whether the app imports at all with the Supabase settings missing.
+
+Usage (from the backend directory):
+    python -m benchmarks.cold_start --runs 5
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import urllib.request
+import urllib.error
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = "import time; started = time.perf_counter(); import app; print(time.perf_counter() - started)"
+
+
+def environment(with_supabase: bool):
+    env = dict(os.environ)
+    env.pop("SUPABASE_URL", None)
+    env.pop("SUPABASE_SERVICE_ROLE", None)
+    if with_supabase:
+        env["SUPABASE_URL"] = "http://127.0.0.1:9"
+        env["SUPABASE_SERVICE_ROLE"] = "benchmark"
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    return env
+
+
+def import_seconds(with_supabase: bool = True):
+    """Seconds to ``import app`` in a fresh interpreter, or None if the import fails."""
+    result = subprocess.run([sys.executable, "-W", "ignore", "-c", IMPORT_SNIPPET], cwd=BACKEND_DIR,
+                            env=environment(with_supabase), capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def first_response_seconds(path: str = "/", timeout: float = 60.0):
+    """Seconds from launching uvicorn until ``path`` answers, and the status it answered with."""
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-W", "ignore", "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=environment(True), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=1) as response:
+                    return time.perf_counter() - started, response.status
+            except urllib.error.HTTPError as e:
+                return time.perf_counter() - started, e.code
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                if process.poll() is not None:
+                    return None, None
+                time.sleep(0.005)
+        return None, None
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def median(values):
+    values = [v for v in values if v is not None]
+    return statistics.median(values) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--path", default="/", help="Path polled for the first response")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    imports = [import_seconds() for _ in range(args.runs)]
+    responses = [first_response_seconds(args.path) for _ in range(args.runs)]
+    results = {
+        "import_seconds_median": median(imports),
+        "import_seconds": imports,
+        "first_response_seconds_median": median(seconds for seconds, _ in responses),
+        "first_response": [{"seconds": seconds, "status": status} for seconds, status in responses],
+        "imports_without_supabase_env": import_seconds(with_supabase=False) is not None,
+    }
+    print(f"import app:           median {results['import_seconds_median']:.3f}s  {imports}")
+    print(f"first response {args.path:<6} median {results['first_response_seconds_median']:.3f}s  "
+          f"statuses {[status for _, status in responses]}")
+    print(f"imports without SUPABASE_URL/SUPABASE_SERVICE_ROLE: {results['imports_without_supabase_env']}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import math
+import random
+from typing import List, Dict, Any, Sequence
+
+# (latitude, longitude, relative weight) of metro areas the synthetic data clusters around
+METROS = [
+    (42.3601, -71.0589, 5), (40.7128, -74.0060, 10), (39.9526, -75.1652, 4),
+    (38.9072, -77.0369, 4), (33.7490, -84.3880, 4), (25.7617, -80.1918, 4),
+    (41.8781, -87.6298, 7), (44.9778, -93.2650, 3), (29.7604, -95.3698, 5),
+    (32.7767, -96.7970, 5), (39.7392, -104.9903, 3), (33.4484, -112.0740, 4),
+    (34.0522, -118.2437, 9), (37.7749, -122.4194, 5), (47.6062, -122.3321, 4),
+    (45.5152, -122.6784, 3),
+]
+
+# Continental US, used for the uniformly scattered share of the data
+US_BOUNDS = (24.5, -124.8, 49.4, -66.9)
+
+
+def synthetic_bathrooms(count: int, seed: int = 42) -> List[Dict[str, Any]]:
+    """
+    Generate bathroom rows shaped like the ``bathrooms`` table.
+
+    90% of the rows are scattered around major metro areas and the rest are
+    spread uniformly over the continental US, which gives both dense urban
+    queries and sparse rural ones.
+    """
+    rng = random.Random(seed)
+    weights = [w for _, _, w in METROS]
+    min_lat, min_lng, max_lat, max_lng = US_BOUNDS
+    rows = []
+    for i in range(1, count + 1):
+        if rng.random() < 0.9:
+            lat0, lng0, _ = rng.choices(METROS, weights)[0]
+            spread_km = rng.expovariate(1 / 12)
+            bearing = rng.uniform(0, 2 * math.pi)
+            lat = lat0 + spread_km / 111.2 * math.cos(bearing)
+            lng = lng0 + spread_km / (111.2 * math.cos(math.radians(lat0))) * math.sin(bearing)
+        else:
+            lat = rng.uniform(min_lat, max_lat)
+            lng = rng.uniform(min_lng, max_lng)
+        total_ratings = rng.randint(0, 40)
+        rows.append({
+            "id": i,
+            "name": f"Restroom {i}",
+            "address": f"{i} Main St",
+            "latitude": lat,
+            "longitude": lng,
+            "is_unisex": rng.random() < 0.4,
+            "is_accessible": rng.random() < 0.6,
+            "has_changing_table": rng.random() < 0.25,
+            "average_rating": round(rng.uniform(1, 5), 2) if total_ratings else 0,
+            "total_ratings": total_ratings,
+            "external_id": str(i),
+            "external_source": "synthetic",
+            "updated_at": "2024-01-01T00:00:00+00:00",
+        })
+    return rows
+
+
+def query_points(count: int, seed: int = 7) -> List[Dict[str, float]]:
+    """Generate map-pan query centers, mostly inside metro areas."""
+    rng = random.Random(seed)
+    weights = [w for _, _, w in METROS]
+    min_lat, min_lng, max_lat, max_lng = US_BOUNDS
+    points = []
+    for _ in range(count):
+        if rng.random() < 0.85:
+            lat0, lng0, _ = rng.choices(METROS, weights)[0]
+            points.append({
+                "latitude": lat0 + rng.gauss(0, 0.08),
+                "longitude": lng0 + rng.gauss(0, 0.08),
+            })
+        else:
+            points.append({
+                "latitude": rng.uniform(min_lat, max_lat),
+                "longitude": rng.uniform(min_lng, max_lng),
+            })
+    return points
+
+
+def percentile(samples: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of samples."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, int(math.ceil(pct / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def summarize(samples: Sequence[float]) -> Dict[str, float]:
+    """p50/p95/p99/mean of latency samples given in seconds, reported in microseconds."""
+    return {
+        "p50_us": percentile(samples, 50) * 1e6,
+        "p95_us": percentile(samples, 95) * 1e6,
+        "p99_us": percentile(samples, 99) * 1e6,
+        "mean_us": (sum(samples) / len(samples)) * 1e6 if samples else 0.0,
+    }
+
+
+def synthetic_restrooms(count: int, seed: int = 42) -> List[Dict[str, Any]]:
+    """Generate items shaped like Refuge Restrooms API responses."""
+    restrooms = []
+    for row in synthetic_bathrooms(count, seed):
+        restrooms.append({
+            "id": row["id"],
+            "name": row["name"],
+            "street": row["address"],
+            "city": "Springfield",
+            "state": "MA",
+            "accessible": row["is_accessible"],
+            "unisex": row["is_unisex"],
+            "changing_table": row["has_changing_table"],
+            "directions": "",
+            "comment": "",
+            "latitude": row["latitude"],
+            "longitude": row["longitude"],
+            "created_at": "2024-01-01T00:00:00.000Z",
+            "updated_at": "2024-01-01T00:00:00.000Z",
+        })
+    return restrooms
@@ -0,0 +1,138 @@
+"""
+Benchmark duplicate detection on a large synthetic bathrooms table.
+
+Business-like bathrooms (see search_benchmark) get duplicates injected the
+way users add them next to synced rows: a few meters off, with the name
+re-typed (case, "Restroom" added, a letter swapped) and the street spelled
+out. The whole-table pass is timed and its decisions scored against the
+injected pairs. Then each duplicate is checked as a single insert against its
+neighbours from the spatial index, as the create route does.
+
+Usage (from the backend directory):
+    python -m benchmarks.dedup_benchmark --rows 1000000
+"""
+import os
+import sys
+import time
+import math
+import json
+import random
+import logging
+import argparse
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.dedup import DuplicateMatcher, ADDRESS_ABBREVIATIONS
+from services.spatial_index import SpatialIndex
+from benchmarks.common import summarize
+from benchmarks.search_benchmark import text_bathrooms
+
+SPELLED_OUT = {short: long for long, short in ADDRESS_ABBREVIATIONS.items()}
+
+
+def retype(name: str, rng: random.Random) -> str:
+    """A name as a different person might enter it."""
+    pick = rng.random()
+    if pick < 0.3:
+        return name.lower()
+    if pick < 0.6:
+        return f"{name} Restroom"
+    if pick < 0.8 and len(name) > 4:
+        i = rng.randrange(1, len(name) - 2)
+        return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+    return name.replace("'", "")
+
+
+def respell(address: str) -> str:
+    words = address.split()
+    return " ".join(SPELLED_OUT.get(word.lower(), word) if i == len(words) - 1 else word
+                    for i, word in enumerate(words))
+
+
+def with_duplicates(count: int, rate: float, max_offset_m: float, seed: int):
+    """Synced rows plus user-entered duplicates of a share of them, and the set of duplicate id pairs."""
+    rng = random.Random(seed)
+    rows = text_bathrooms(count, seed)
+    for row in rows:
+        row["external_source"] = "refuge_restrooms"
+    duplicates, truth = [], set()
+    next_id = count + 1
+    for original in rng.sample(rows, int(count * rate)):
+        offset = rng.uniform(1, max_offset_m)
+        bearing = rng.uniform(0, 2 * math.pi)
+        lat = original["latitude"] + offset * math.cos(bearing) / 111195
+        lng = original["longitude"] + offset * math.sin(bearing) / (111195 * math.cos(math.radians(lat)))
+        duplicates.append({
+            **original,
+            "id": next_id,
+            "name": retype(original["name"], rng),
+            "address": respell(original["address"]) if rng.random() < 0.5 else original["address"],
+            "latitude": lat,
+            "longitude": lng,
+            "external_id": None,
+            "external_source": None,
+            "total_ratings": rng.randint(0, 3),
+        })
+        truth.add((original["id"], next_id))
+        next_id += 1
+    return rows + duplicates, duplicates, truth
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--duplicate-rate", type=float, default=0.03, help="Share of rows entered twice")
+    parser.add_argument("--max-offset-m", type=float, default=20.0, help="How far off duplicates are placed")
+    parser.add_argument("--max-meters", type=float, default=25.0)
+    parser.add_argument("--single-inserts", type=int, default=2000, help="Duplicates checked one at a time")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    started = time.perf_counter()
+    rows, duplicates, truth = with_duplicates(args.rows, args.duplicate_rate, args.max_offset_m, args.seed)
+    print(f"{len(rows)} bathrooms ({len(duplicates)} injected duplicates) generated in "
+          f"{time.perf_counter() - started:.1f}s")
+
+    matcher = DuplicateMatcher(args.max_meters)
+    started = time.perf_counter()
+    decisions = matcher.find_decisions(rows)
+    seconds = time.perf_counter() - started
+    found = {(decision.keep_id, decision.drop_id) for decision in decisions}
+    true_positives = len(found & truth)
+    precision = true_positives / len(found) if found else 1.0
+    recall = true_positives / len(truth) if truth else 1.0
+    print(f"  full pass: {seconds:.1f}s ({len(rows) / seconds:,.0f} rows/s), {len(decisions)} decisions, "
+          f"precision {precision:.3f}, recall {recall:.3f}")
+
+    index = SpatialIndex()
+    index.load(rows)
+    latencies = []
+    hits = 0
+    for row in duplicates[:args.single_inserts]:
+        started = time.perf_counter()
+        nearby = index.query(row["latitude"], row["longitude"], args.max_meters / 1000, 20)
+        hits += bool(matcher.decide(row, nearby))
+        latencies.append(time.perf_counter() - started)
+    single = summarize(latencies)
+    print(f"  single insert: p50 {single['p50_us']:.0f}us  p99 {single['p99_us']:.0f}us, "
+          f"{hits}/{len(latencies)} flagged")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "rows": len(rows),
+                "duplicates": len(duplicates),
+                "full_pass_seconds": seconds,
+                "decisions": len(decisions),
+                "precision": precision,
+                "recall": recall,
+                "single_insert": single,
+                "single_insert_flagged": hits / len(latencies) if latencies else 0.0,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
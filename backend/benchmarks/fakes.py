@@ -0,0 +1,489 @@
+"""
+In-memory stand-ins for external services, for benchmarks and local runs.
+
+``FakeSupabase`` implements the subset of the supabase-py client this backend
+uses (table queries and the ``nearby_bathrooms``, ``add_bathroom_ratings`` and
+``refresh_bathroom_rating`` RPCs) with configurable artificial latency. Like
+the real client, ``execute()`` blocks the calling thread for the duration of
+the round trip.
+
+``FakeRefugeAPI`` serves the Refuge Restrooms ``by_location`` endpoint from a
+list of restrooms through an ``httpx.MockTransport``.
+"""
+import json
+import asyncio
+import bisect
+import hashlib
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Callable
+
+import httpx
+
+from services.spatial_index import SpatialIndex, haversine_km
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class FakeResponse:
+    def __init__(self, data: List[Dict[str, Any]], count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+class FakeBackendError(Exception):
+    """Raised by ``execute()`` for injected failures."""
+
+
+class FakeTable:
+    """Rows of one table, kept by id with a sorted id list for keyset paging."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.rows: Dict[int, Dict[str, Any]] = {}
+        self.ids: List[int] = []
+        self.next_id = 1
+        self.index = SpatialIndex() if name == "bathrooms" else None
+        # Upsert conflict columns -> {column values: id}, built on first use
+        self.unique: Dict[tuple, Dict[tuple, int]] = {}
+        # Column -> {value: ids} for equality filters, built on first use
+        self.lookups: Dict[str, Dict[Any, set]] = {}
+
+    def put(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        if row.get("id") is None:
+            row["id"] = self.next_id
+        bathroom_id = row["id"]
+        self.next_id = max(self.next_id, bathroom_id + 1)
+        if bathroom_id not in self.rows:
+            if not self.ids or bathroom_id > self.ids[-1]:
+                self.ids.append(bathroom_id)
+            else:
+                bisect.insort(self.ids, bathroom_id)
+        previous = self.rows.get(bathroom_id)
+        self.rows[bathroom_id] = row
+        for keys, ids in self.unique.items():
+            if previous is not None:
+                ids.pop(tuple(previous.get(k) for k in keys), None)
+            ids[tuple(row.get(k) for k in keys)] = bathroom_id
+        for column, lookup in self.lookups.items():
+            if previous is not None:
+                lookup.get(previous.get(column), set()).discard(bathroom_id)
+            lookup.setdefault(row.get(column), set()).add(bathroom_id)
+        if self.index is not None:
+            self.index.upsert(row)
+        return row
+
+    def rows_where(self, column: str, values) -> List[Dict[str, Any]]:
+        """Rows whose ``column`` equals one of ``values``, like an index scan."""
+        lookup = self.lookups.get(column)
+        if lookup is None:
+            lookup = self.lookups[column] = {}
+            for row_id, row in self.rows.items():
+                lookup.setdefault(row.get(column), set()).add(row_id)
+        return [self.rows[row_id] for value in values for row_id in lookup.get(value, ())]
+
+    def find_unique(self, keys: tuple, values: tuple) -> Optional[Dict[str, Any]]:
+        if keys not in self.unique:
+            self.unique[keys] = {tuple(r.get(k) for k in keys): r["id"] for r in self.rows.values()}
+        row_id = self.unique[keys].get(values)
+        return None if row_id is None else self.rows[row_id]
+
+    def drop(self, row_id: int) -> None:
+        row = self.rows[row_id]
+        for keys, ids in self.unique.items():
+            ids.pop(tuple(row.get(k) for k in keys), None)
+        for column, lookup in self.lookups.items():
+            lookup.get(row.get(column), set()).discard(row_id)
+        del self.rows[row_id]
+        del self.ids[bisect.bisect_left(self.ids, row_id)]
+        if self.index is not None:
+            self.index.remove(row_id)
+
+
+class FakeRequest:
+    """The ``request`` attribute of postgrest-py builders, as far as metrics labels need it."""
+
+    def __init__(self, path: str, http_method: str):
+        self.path = path
+        self.http_method = http_method
+
+
+_HTTP_METHODS = {"select": "GET", "insert": "POST", "upsert": "POST", "update": "PATCH", "delete": "DELETE"}
+
+
+class FakeQuery:
+    """Chainable query builder mirroring postgrest-py's request builders."""
+
+    def __init__(self, backend: "FakeSupabase", table: str):
+        self._backend = backend
+        self._table = table
+        self._op = "select"
+        self._columns = "*"
+        self._count = None
+        self._payload: Any = None
+        self._on_conflict: Optional[str] = None
+        self._filters = []
+        self._order = []
+        self._limit: Optional[int] = None
+        self._offset = 0
+
+    @property
+    def request(self) -> FakeRequest:
+        return FakeRequest(f"/rest/v1/{self._table}", _HTTP_METHODS[self._op])
+
+    # Operations
+    def select(self, columns: str = "*", count: Optional[str] = None) -> "FakeQuery":
+        self._columns = columns
+        self._count = count
+        return self
+
+    def insert(self, rows) -> "FakeQuery":
+        self._op, self._payload = "insert", rows
+        return self
+
+    def upsert(self, rows, on_conflict: str = "") -> "FakeQuery":
+        self._op, self._payload, self._on_conflict = "upsert", rows, on_conflict
+        return self
+
+    def update(self, values: Dict[str, Any]) -> "FakeQuery":
+        self._op, self._payload = "update", values
+        return self
+
+    def delete(self) -> "FakeQuery":
+        self._op = "delete"
+        return self
+
+    # Filters and modifiers
+    def _filter(self, column: str, op: str, value: Any) -> "FakeQuery":
+        self._filters.append((column, op, value))
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, "eq", value)
+
+    def neq(self, column, value):
+        return self._filter(column, "neq", value)
+
+    def gt(self, column, value):
+        return self._filter(column, "gt", value)
+
+    def gte(self, column, value):
+        return self._filter(column, "gte", value)
+
+    def lt(self, column, value):
+        return self._filter(column, "lt", value)
+
+    def lte(self, column, value):
+        return self._filter(column, "lte", value)
+
+    def in_(self, column, values):
+        return self._filter(column, "in", set(values))
+
+    def order(self, column: str, desc: bool = False) -> "FakeQuery":
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, size: int) -> "FakeQuery":
+        self._limit = size
+        return self
+
+    def range(self, start: int, end: int) -> "FakeQuery":
+        self._offset = start
+        self._limit = end - start + 1
+        return self
+
+    # Execution
+    @staticmethod
+    def _matches(row: Dict[str, Any], filters) -> bool:
+        for column, op, value in filters:
+            actual = row.get(column)
+            if op == "eq":
+                ok = actual == value
+            elif op == "neq":
+                ok = actual != value
+            elif op == "in":
+                ok = actual in value
+            elif actual is None:
+                ok = False
+            elif op == "gt":
+                ok = actual > value
+            elif op == "gte":
+                ok = actual >= value
+            elif op == "lt":
+                ok = actual < value
+            else:
+                ok = actual <= value
+            if not ok:
+                return False
+        return True
+
+    def _candidates(self, table: FakeTable) -> List[Dict[str, Any]]:
+        """Rows matching the filters, using the id ordering when it allows early exit."""
+        filters = self._filters
+        if self._order in ([], [("id", False)]):
+            start = 0
+            for column, op, value in filters:
+                if column == "id" and op in ("gt", "gte"):
+                    find = bisect.bisect_right if op == "gt" else bisect.bisect_left
+                    start = max(start, find(table.ids, value))
+                elif column == "id" and op == "eq":
+                    row = table.rows.get(value)
+                    return [row] if row is not None and self._matches(row, filters) else []
+            wanted = None if self._limit is None or self._count else self._offset + self._limit
+            found = []
+            for row_id in table.ids[start:]:
+                row = table.rows[row_id]
+                if self._matches(row, filters):
+                    found.append(row)
+                    if wanted is not None and len(found) >= wanted:
+                        break
+            return found
+        rows = table.rows.values()
+        for column, op, value in filters:
+            if column != "id" and op in ("eq", "in"):
+                rows = table.rows_where(column, value if op == "in" else (value,))
+                break
+        found = [row for row in rows if self._matches(row, filters)]
+        for column, desc in reversed(self._order):
+            found.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=desc)
+        return found
+
+    def _project(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        if self._columns.strip() == "*":
+            return dict(row)
+        return {c.strip(): row.get(c.strip()) for c in self._columns.split(",")}
+
+    def execute(self) -> FakeResponse:
+        written = len(self._rows_payload()) if self._op in ("insert", "upsert") else 0
+        self._backend._round_trip(written)
+        if written and self._backend.reject is not None:
+            # Like a constraint violation, one bad row fails the whole statement
+            for values in self._rows_payload():
+                if self._backend.reject(values):
+                    raise FakeBackendError(f"Row rejected: {values.get('name')!r}")
+        with self._backend.lock:
+            table = self._backend.table_data(self._table)
+            return getattr(self, f"_execute_{self._op}")(table)
+
+    def _execute_select(self, table: FakeTable) -> FakeResponse:
+        found = self._candidates(table)
+        count = len(found) if self._count else None
+        end = None if self._limit is None else self._offset + self._limit
+        return FakeResponse([self._project(r) for r in found[self._offset:end]], count)
+
+    def _rows_payload(self) -> List[Dict[str, Any]]:
+        return [self._payload] if isinstance(self._payload, dict) else list(self._payload)
+
+    def _execute_insert(self, table: FakeTable) -> FakeResponse:
+        created = []
+        for values in self._rows_payload():
+            row = dict(values)
+            row.setdefault("created_at", _now())
+            row["updated_at"] = _now()
+            created.append(dict(table.put(row)))
+        return FakeResponse(created)
+
+    def _execute_upsert(self, table: FakeTable) -> FakeResponse:
+        keys = tuple(k.strip() for k in (self._on_conflict or "id").split(","))
+        written = []
+        for values in self._rows_payload():
+            if keys == ("id",):
+                current = table.rows.get(values.get("id"))
+            else:
+                current = table.find_unique(keys, tuple(values.get(k) for k in keys))
+            row = dict(current) if current is not None else {"created_at": _now()}
+            row.update(values)
+            row["updated_at"] = _now()
+            written.append(dict(table.put(row)))
+        return FakeResponse(written)
+
+    def _execute_update(self, table: FakeTable) -> FakeResponse:
+        updated = []
+        for row in self._candidates(table):
+            row = dict(row)
+            row.update(self._payload)
+            row["updated_at"] = _now()
+            updated.append(dict(table.put(row)))
+        return FakeResponse(updated)
+
+    def _execute_delete(self, table: FakeTable) -> FakeResponse:
+        deleted = self._candidates(table)
+        for row in deleted:
+            table.drop(row["id"])
+        return FakeResponse([dict(r) for r in deleted])
+
+
+class FakeRpc:
+    def __init__(self, backend: "FakeSupabase", name: str, params: Dict[str, Any]):
+        self._backend = backend
+        self._name = name
+        self._params = params
+
+    @property
+    def request(self) -> FakeRequest:
+        return FakeRequest(f"/rest/v1/rpc/{self._name}", "POST")
+
+    def execute(self) -> FakeResponse:
+        self._backend._round_trip()
+        p = self._params
+        if self._name == "nearby_bathrooms":
+            with self._backend.lock:
+                index = self._backend.table_data("bathrooms").index
+                rows = index.query(p["lat"], p["lng"], p["radius_km"], p["limit_val"])
+                if not self._backend.rpc_distance:
+                    rows = [{k: v for k, v in row.items() if k != "distance"} for row in rows]
+                return FakeResponse(rows)
+        if self._name == "refresh_bathroom_rating":
+            # sql/refresh_bathroom_rating.sql: the recount and update happen under one lock
+            with self._backend.lock:
+                bathrooms = self._backend.table_data("bathrooms")
+                row = bathrooms.rows.get(p["p_bathroom_id"])
+                if row is None:
+                    return FakeResponse([])
+                ratings = [r["rating"] for r in self._backend.table_data("reviews").rows.values()
+                           if r.get("bathroom_id") == p["p_bathroom_id"]]
+                row = dict(row, total_ratings=len(ratings), rating_sum=sum(ratings), updated_at=_now(),
+                           average_rating=round(sum(ratings) / len(ratings), 2) if ratings else 0)
+                return FakeResponse([dict(bathrooms.put(row))])
+        if self._name == "add_bathroom_ratings":
+            # sql/add_bathroom_ratings.sql: each row is incremented under the row lock
+            with self._backend.lock:
+                bathrooms = self._backend.table_data("bathrooms")
+                updated = []
+                for bathroom_id, count, total in zip(p["p_bathroom_ids"], p["p_counts"], p["p_sums"]):
+                    row = bathrooms.rows.get(bathroom_id)
+                    if row is None:
+                        continue
+                    # Seeded rows predate the column; the migration backfills it the same way
+                    rating_sum = row.get("rating_sum", round((row.get("average_rating") or 0)
+                                                             * (row.get("total_ratings") or 0))) + total
+                    total_ratings = (row.get("total_ratings") or 0) + count
+                    row = dict(row, total_ratings=total_ratings, rating_sum=rating_sum, updated_at=_now(),
+                               average_rating=round(rating_sum / total_ratings, 2) if total_ratings else 0)
+                    updated.append(dict(bathrooms.put(row)))
+                return FakeResponse(updated)
+        raise FakeBackendError(f"Unknown function {self._name}")
+
+
+class FakeSupabase:
+    """
+    In-memory Supabase client.
+
+    Args:
+        latency_ms: Artificial round-trip time added to every ``execute()``
+        jitter_ms: Uniform random extra latency
+        failure_rate: Fraction of calls that raise ``FakeBackendError``
+        seed: Seed for jitter and failure injection
+        latency_per_row_ms: Extra latency per row inserted or upserted
+        reject: Predicate marking rows that make any write containing them fail
+        rpc_distance: Whether ``nearby_bathrooms`` rows carry their ``distance``;
+            deployments of the function that predate the column leave it out
+    """
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 failure_rate: float = 0.0, seed: int = 0, latency_per_row_ms: float = 0.0,
+                 reject: Optional[Callable[[Dict[str, Any]], bool]] = None, rpc_distance: bool = True):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.latency_per_row_ms = latency_per_row_ms
+        self.reject = reject
+        self.rpc_distance = rpc_distance
+        self.calls = 0
+        self.lock = threading.Lock()
+        self._tables: Dict[str, FakeTable] = {}
+        self._rng = random.Random(seed)
+
+    def _round_trip(self, rows: int = 0) -> None:
+        with self.lock:
+            self.calls += 1
+            delay = self.latency_ms + (self._rng.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0)
+            delay += rows * self.latency_per_row_ms
+            fail = self.failure_rate and self._rng.random() < self.failure_rate
+        if delay:
+            time.sleep(delay / 1000)
+        if fail:
+            raise FakeBackendError("Injected backend failure")
+
+    def table_data(self, name: str) -> FakeTable:
+        if name not in self._tables:
+            self._tables[name] = FakeTable(name)
+        return self._tables[name]
+
+    def seed(self, name: str, rows: List[Dict[str, Any]]) -> None:
+        """Load rows directly, without latency."""
+        table = self.table_data(name)
+        for row in rows:
+            table.put(dict(row))
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def rpc(self, name: str, params: Dict[str, Any]) -> FakeRpc:
+        return FakeRpc(self, name, params)
+
+
+class FakeRefugeAPI:
+    """
+    In-process stand-in for the Refuge Restrooms API.
+
+    Args:
+        restrooms: Items to serve, shaped like Refuge responses
+        latency_ms: Artificial latency per request
+        throttle_every: Answer every n-th request with HTTP 429 (0 disables)
+
+    Pages carry an ETag, and a request whose If-None-Match still matches
+    gets 304 Not Modified, like the real API.
+    """
+
+    def __init__(self, restrooms: List[Dict[str, Any]], latency_ms: float = 0.0, throttle_every: int = 0):
+        self.restrooms = restrooms
+        self.latency_ms = latency_ms
+        self.throttle_every = throttle_every
+        self.requests = 0
+        self.not_modified = 0
+        self._ordered: Dict[Any, List[Dict[str, Any]]] = {}
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    def _by_distance(self, lat: float, lng: float, filters) -> List[Dict[str, Any]]:
+        key = (lat, lng, filters)
+        if key not in self._ordered:
+            ada, unisex = filters
+            ranked = []
+            for item in self.restrooms:
+                if ada is not None and item["accessible"] != ada:
+                    continue
+                if unisex is not None and item["unisex"] != unisex:
+                    continue
+                miles = haversine_km(lat, lng, item["latitude"], item["longitude"]) / 1.609344
+                ranked.append((miles, item["id"], item))
+            ranked.sort(key=lambda r: (r[0], r[1]))
+            self._ordered[key] = [dict(item, distance=miles) for miles, _, item in ranked]
+        return self._ordered[key]
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        if self.throttle_every and self.requests % self.throttle_every == 0:
+            return httpx.Response(429, json={"error": "rate limited"})
+        if not request.url.path.endswith("/by_location.json"):
+            return httpx.Response(404, json={"error": "not found"})
+        params = request.url.params
+        flag = lambda name: None if name not in params else params[name] == "true"
+        ordered = self._by_distance(float(params["lat"]), float(params["lng"]), (flag("ada"), flag("unisex")))
+        page = int(params.get("page", 1))
+        per_page = int(params.get("per_page", 10))
+        start = (page - 1) * per_page
+        body = json.dumps(ordered[start:start + per_page]).encode("utf-8")
+        etag = f'W/"{hashlib.sha1(body).hexdigest()}"'
+        if request.headers.get("If-None-Match") == etag:
+            self.not_modified += 1
+            return httpx.Response(304, headers={"ETag": etag})
+        return httpx.Response(200, content=body, headers={"ETag": etag, "Content-Type": "application/json"})
@@ -0,0 +1,160 @@
+"""
+Measure payload size and encoding time of the bathroom list formats against
+the current one (FastAPI's generic encoder over full row dicts).
+
+Every encoding is decoded again and checked against the source rows.
+
+Usage (from the backend directory):
+    python -m benchmarks.format_benchmark --sizes 100 1000 5000
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import struct
+import argparse
+from array import array
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from api.formats import (
+    PACKED_MAGIC,
+    PACKED_TYPES,
+    COLUMNS_MEDIA_TYPE,
+    PACKED_MEDIA_TYPE,
+    JSON_MEDIA_TYPE,
+    bathrooms_response,
+)
+from benchmarks.common import synthetic_bathrooms
+
+# What the map list view needs
+MAP_FIELDS = ["id", "name", "latitude", "longitude", "is_unisex", "is_accessible",
+              "has_changing_table", "average_rating", "distance"]
+
+
+def realistic_rows(count: int):
+    rows = synthetic_bathrooms(count)
+    for row in rows:
+        row["directions"] = "Through the lobby, past the elevators, second door on the left."
+        row["comment"] = "Clean, usually has soap. Ask the front desk for the key after 8pm."
+        row["created_at"] = "2024-01-01T00:00:00+00:00"
+        row["distance"] = (row["id"] % 500) / 100
+    return rows
+
+
+def decode_packed(body: bytes):
+    """Decode the packed format back into row dicts."""
+    assert body[:4] == PACKED_MAGIC
+    (header_length,) = struct.unpack_from("<I", body, 4)
+    header = json.loads(body[8:8 + header_length])
+    base = 8 + header_length
+    count = header["count"]
+    columns = {}
+    for column in header["columns"]:
+        buffer = body[base + column["offset"]:base + column["offset"] + column["length"]]
+        kind = column["type"]
+        if kind == "bits":
+            values = [bool(buffer[i >> 3] >> (i & 7) & 1) for i in range(count)]
+        elif kind == "utf8":
+            offsets = array("I")
+            offsets.frombytes(buffer[:4 * (count + 1)])
+            data = buffer[4 * (count + 1):]
+            values = [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(count)]
+            if "nulls" in column:
+                nulls = body[base + column["nulls"]["offset"]:]
+                values = [None if nulls[i >> 3] >> (i & 7) & 1 else v for i, v in enumerate(values)]
+        else:
+            values = array({"int64": "q", "int32": "i", "float32": "f", "e6": "i"}[kind])
+            values.frombytes(buffer)
+            values = [v / 1e6 for v in values] if kind == "e6" else list(values)
+        columns[column["name"]] = values
+    return [{name: values[i] for name, values in columns.items()} for i in range(count)]
+
+
+def check(rows, fields, media_type, body):
+    expected = [{k: row.get(k) for k in (fields or row)} for row in rows]
+    if media_type == PACKED_MEDIA_TYPE:
+        decoded = decode_packed(body)
+        for want, got in zip(expected, decoded):
+            for key, value in want.items():
+                kind = PACKED_TYPES.get(key, "utf8")
+                if kind in ("e6", "float32"):
+                    assert abs(got[key] - (value or 0)) < 1e-5 * max(1, abs(value or 0)), key
+                elif kind == "bits":
+                    assert got[key] == bool(value), key
+                elif kind == "utf8":
+                    assert got[key] == (None if value is None else str(value)), key
+                else:
+                    assert got[key] == (value or 0), key
+        return
+    payload = json.loads(body)
+    if media_type == COLUMNS_MEDIA_TYPE:
+        names = list(payload["columns"])
+        payload = [{n: payload["columns"][n][i] for n in names} for i in range(payload["count"])]
+    assert payload == expected
+
+
+def timed(fn, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return result, best
+
+
+def run(sizes, repeat):
+    results = []
+    for size in sizes:
+        rows = realistic_rows(size)
+        baseline, baseline_seconds = timed(lambda: JSONResponse(jsonable_encoder(rows)).body, repeat)
+        variants = [
+            ("current (jsonable_encoder)", None, None, baseline, baseline_seconds),
+        ]
+        for label, fields, media_type in [
+            ("json, all fields", None, JSON_MEDIA_TYPE),
+            ("json, map fields", MAP_FIELDS, JSON_MEDIA_TYPE),
+            ("columns, all fields", None, COLUMNS_MEDIA_TYPE),
+            ("columns, map fields", MAP_FIELDS, COLUMNS_MEDIA_TYPE),
+            ("packed, all fields", None, PACKED_MEDIA_TYPE),
+            ("packed, map fields", MAP_FIELDS, PACKED_MEDIA_TYPE),
+        ]:
+            body, seconds = timed(lambda: bathrooms_response(rows, fields, media_type).body, repeat)
+            check(rows, fields, media_type, body)
+            variants.append((label, fields, media_type, body, seconds))
+
+        print(f"\n{size} rows")
+        print(f"{'format':<28}{'bytes':>10}{'gzip':>10}{'encode ms':>11}{'size x':>8}{'speed x':>9}")
+        for label, fields, media_type, body, seconds in variants:
+            compressed = len(gzip.compress(body, 6))
+            result = {
+                "rows": size, "format": label, "bytes": len(body), "gzip_bytes": compressed,
+                "encode_ms": seconds * 1000,
+                "size_ratio": len(baseline) / len(body), "speedup": baseline_seconds / seconds,
+            }
+            results.append(result)
+            print(f"{label:<28}{len(body):>10}{compressed:>10}{seconds * 1000:>11.2f}"
+                  f"{result['size_ratio']:>8.1f}{result['speedup']:>9.1f}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--repeat", type=int, default=5, help="Encodings per format; the fastest is reported")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Load test the API against an in-memory Supabase stand-in with artificial latency.
+
+Compares the thread-pool ``Database`` with the old behaviour of executing
+queries directly on the event loop, at increasing client concurrency.
+
+Usage (from the backend directory):
+    python -m benchmarks.load_test --latency-ms 20 --concurrency 1 4 16 64
+"""
+import os
+import sys
+import time
+import json
+import random
+import asyncio
+import logging
+import argparse
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from app import app
+from api.dependencies import get_database
+from config.database import Database
+from benchmarks.common import synthetic_bathrooms, query_points, summarize
+from benchmarks.fakes import FakeSupabase
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+class InlineDatabase(Database):
+    """Executes queries on the event loop thread, as the services did before."""
+
+    async def execute(self, query):
+        return query.execute()
+
+
+def build_backend(latency_ms: float, bathrooms: int) -> FakeSupabase:
+    backend = FakeSupabase(latency_ms=latency_ms)
+    backend.seed("bathrooms", synthetic_bathrooms(bathrooms))
+    rng = random.Random(3)
+    backend.seed("reviews", [
+        {"bathroom_id": rng.randint(1, bathrooms), "rating": rng.randint(1, 5),
+         "comment": "ok", "created_at": f"2024-01-{rng.randint(1, 28):02d}T00:00:00+00:00"}
+        for _ in range(bathrooms)
+    ])
+    return backend
+
+
+async def run_level(client: httpx.AsyncClient, concurrency: int, requests: int, bathrooms: int):
+    points = query_points(requests)
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = []
+
+    async def one(i: int):
+        if i % 4 == 3:
+            url = f"/api/reviews/{(i * 7919) % bathrooms + 1}"
+            params = {"limit": 10}
+        else:
+            url = "/api/bathrooms/"
+            params = {**points[i], "radius": 5, "limit": 50}
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.get(url, params=params)
+            samples.append(time.perf_counter() - started)
+            response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    return {"concurrency": concurrency, "requests": requests, "throughput_rps": requests / elapsed,
+            "latency": summarize(samples)}
+
+
+def override(db: Database):
+    def get_override() -> Database:
+        return db
+    return get_override
+
+
+async def run(latency_ms: float, levels, requests: int, bathrooms: int, max_workers: int):
+    backend = build_backend(latency_ms, bathrooms)
+    results = {}
+    for mode, db in (("event_loop", InlineDatabase(backend)), ("thread_pool", Database(backend, max_workers))):
+        app.dependency_overrides[get_database] = override(db)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            results[mode] = []
+            for concurrency in levels:
+                result = await run_level(client, concurrency, requests, bathrooms)
+                results[mode].append(result)
+                print(f"{mode:>11} | concurrency {concurrency:>3} | {result['throughput_rps']:8.1f} req/s | "
+                      f"p50 {result['latency']['p50_us'] / 1000:7.1f}ms p99 {result['latency']['p99_us'] / 1000:7.1f}ms")
+        db.close()
+    app.dependency_overrides.clear()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Artificial backend round trip")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=400, help="Requests per concurrency level")
+    parser.add_argument("--bathrooms", type=int, default=5000)
+    parser.add_argument("--max-workers", type=int, default=64)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.latency_ms, args.concurrency, args.requests, args.bathrooms, args.max_workers))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
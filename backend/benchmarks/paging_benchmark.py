@@ -0,0 +1,116 @@
+"""
+Benchmark the cost of a nearby page as a function of its depth.
+
+For each query center the page at each ``--depths`` is fetched three ways
+from the grid index and the mapped snapshot:
+
+- ``limit``: ask for ``depth * page`` rows and keep the last page, what
+  clients had to do before cursors
+- ``cursor``: continue ``after`` the last row of the previous page
+- ``nearest``: the same cursor in k-nearest mode, searching expanding rings
+  instead of a fixed radius
+
+The cursor pages are checked against the tail of the ``limit`` result.
+Reports the p50/p99 time of one page at each depth.
+
+Usage (from the backend directory):
+    python -m benchmarks.paging_benchmark --rows 200000 --depths 1 5 20 50
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import logging
+import tempfile
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.spatial_index import SpatialIndex
+from services.snapshot import SnapshotIndex
+from benchmarks.common import synthetic_bathrooms, query_points, summarize
+
+MODES = ("limit", "cursor", "nearest")
+
+
+def page_at(index, mode: str, point, depth: int, args):
+    """Fetch pages up to ``depth``; returns the last one and the seconds it took."""
+    lat, lng = point["latitude"], point["longitude"]
+    if mode == "limit":
+        started = time.perf_counter()
+        rows = index.query(lat, lng, args.radius_km, depth * args.page)
+        return rows[(depth - 1) * args.page:], time.perf_counter() - started
+    after = None
+    for i in range(depth):
+        started = time.perf_counter()
+        if mode == "cursor":
+            rows = index.query(lat, lng, args.radius_km, args.page, after=after)
+        else:
+            rows = index.nearest(lat, lng, args.page, after=after, ring_km=args.ring_km,
+                                 max_radius_km=args.radius_km)
+        elapsed = time.perf_counter() - started
+        if len(rows) < args.page and i < depth - 1:
+            # Ran out before the page asked for; a client would have stopped here
+            return [], elapsed
+        if rows:
+            after = (rows[-1]["distance"], rows[-1]["id"])
+    return rows, elapsed
+
+
+def run(args):
+    rows = synthetic_bathrooms(args.rows, args.seed)
+    directory = tempfile.TemporaryDirectory()
+    grid = SpatialIndex()
+    grid.load(rows)
+    snapshot = SnapshotIndex(os.path.join(directory.name, "bathrooms.snapshot"))
+    snapshot.load(rows)
+    points = query_points(args.queries, args.seed)
+    results = []
+    try:
+        for name, index in (("grid", grid), ("snapshot", snapshot)):
+            for depth in args.depths:
+                pages = {}
+                for mode in MODES:
+                    samples = []
+                    pages[mode] = []
+                    for point in points:
+                        page, seconds = page_at(index, mode, point, depth, args)
+                        pages[mode].append([row["id"] for row in page])
+                        samples.append(seconds)
+                    results.append({"index": name, "depth": depth, "mode": mode, "latency": summarize(samples)})
+                for mode in ("cursor", "nearest"):
+                    if pages[mode] != pages["limit"]:
+                        raise AssertionError(f"{mode} pages differ from limit pages at depth {depth}")
+    finally:
+        directory.cleanup()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=200, help="Query centers per depth")
+    parser.add_argument("--page", type=int, default=50, help="Rows per page")
+    parser.add_argument("--depths", type=int, nargs="+", default=[1, 5, 20, 50])
+    parser.add_argument("--radius-km", type=float, default=50.0, help="Radius, and k-nearest search limit")
+    parser.add_argument("--ring-km", type=float, default=1.0, help="Width of the first k-nearest ring")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    results = run(args)
+    print(f"{args.rows} bathrooms, {args.queries} centers, {args.page} rows per page, {args.radius_km:g}km radius")
+    for result in results:
+        latency = result["latency"]
+        print(f"  {result['index']:<9} page {result['depth']:>3}  {result['mode']:<8} "
+              f"p50 {latency['p50_us'] / 1000:7.2f}ms  p99 {latency['p99_us'] / 1000:7.2f}ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark review submission with and without write-behind batching.
+
+A burst of reviews, most of them for a few popular bathrooms, is posted
+through the FastAPI app against the in-memory Supabase stand-in with
+``--concurrency`` requests in flight. Synchronously every review is an
+insert plus a rating update; with write-behind the route answers 202 once the
+review is spooled, and the queue inserts batches and updates each bathroom's
+rating once per batch. Reports acknowledgement latency, rows per second
+until everything is in the database, and backend round trips.
+
+Usage (from the backend directory):
+    python -m benchmarks.review_write_benchmark --reviews 3000 --latency-ms 30
+"""
+import os
+import sys
+import time
+import json
+import random
+import asyncio
+import logging
+import tempfile
+import argparse
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from app import app
+from api.dependencies import get_database
+from config.database import Database
+import services.review_service as review_service
+from services.review_service import ReviewService
+from services.write_behind import WriteBehindQueue
+from benchmarks.fakes import FakeSupabase
+from benchmarks.common import summarize
+
+MODES = ("sync", "write-behind")
+
+
+def review_bodies(count: int, bathrooms: int, seed: int):
+    """Reviews skewed towards a few bathrooms, the way a busy venue collects them."""
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(bathrooms)]
+    ids = rng.choices(range(1, bathrooms + 1), weights=weights, k=count)
+    return [{"bathroom_id": bathroom_id, "rating": rng.randint(1, 5), "comment": "ok" if rng.random() < 0.3 else None}
+            for bathroom_id in ids]
+
+
+async def run_mode(mode: str, args):
+    backend = FakeSupabase(latency_ms=args.latency_ms, seed=args.seed)
+    backend.seed("bathrooms", [{"id": i, "name": f"Restroom {i}", "latitude": 42.36, "longitude": -71.06,
+                                "total_ratings": 0, "average_rating": 0} for i in range(1, args.bathrooms + 1)])
+    db = Database(backend, args.max_workers)
+    app.dependency_overrides[get_database] = lambda: db
+    bodies = review_bodies(args.reviews, args.bathrooms, args.seed)
+    slots = asyncio.Semaphore(args.concurrency)
+    latencies, statuses = [], {}
+    spool_dir = tempfile.TemporaryDirectory()
+    queue = None
+    if mode == "write-behind":
+        queue = WriteBehindQueue(
+            spool_dir.name,
+            "reviews",
+            write=lambda db, rows: ReviewService._insert_reviews(db, rows),
+            on_written=lambda db, rows: ReviewService._apply_reviews(db, rows),
+            already_written=lambda db, rows: ReviewService._inserted_before(db, rows),
+            max_queued=args.queue_max,
+            batch_size=args.batch_size,
+            wait_seconds=60
+        )
+        await queue.start(db)
+    review_service.review_queue = queue
+
+    async def one(client: httpx.AsyncClient, body):
+        async with slots:
+            started = time.perf_counter()
+            response = await client.post("/api/reviews/", json=body)
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            started = time.perf_counter()
+            await asyncio.gather(*(one(client, body) for body in bodies))
+            acked = time.perf_counter() - started
+            if queue is not None:
+                await queue.stop(drain_seconds=600)
+            elapsed = time.perf_counter() - started
+    finally:
+        review_service.review_queue = None
+        # Summaries are per process; the next mode starts from an empty backend
+        for bathroom_id in range(1, args.bathrooms + 1):
+            review_service.review_summaries.discard(bathroom_id)
+        app.dependency_overrides.clear()
+        db.close()
+        spool_dir.cleanup()
+
+    written = len(backend.table_data("reviews").rows)
+    return {
+        "mode": mode,
+        "reviews": len(bodies),
+        "written": written,
+        "statuses": statuses,
+        "ack": summarize(latencies),
+        "ack_seconds": acked,
+        "seconds": elapsed,
+        "rows_per_second": written / elapsed,
+        "db_calls": backend.calls,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reviews", type=int, default=3000)
+    parser.add_argument("--bathrooms", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="Artificial Supabase round trip")
+    parser.add_argument("--concurrency", type=int, default=16, help="Submissions in flight")
+    parser.add_argument("--max-workers", type=int, default=32, help="Database worker threads")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--queue-max", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    results = [asyncio.run(run_mode(mode, args)) for mode in MODES]
+    print(f"{args.reviews} reviews over {args.bathrooms} bathrooms, {args.latency_ms:.0f}ms backend round trip, "
+          f"{args.concurrency} in flight")
+    for result in results:
+        ack = result["ack"]
+        print(f"  {result['mode']:<12} ack p50 {ack['p50_us'] / 1000:7.1f}ms  p99 {ack['p99_us'] / 1000:7.1f}ms  "
+              f"{result['rows_per_second']:8.1f} rows/s  {result['db_calls']:>6} db calls  "
+              f"{result['written']}/{result['reviews']} written  {result['statuses']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""
+Benchmark suite: the FastAPI app and the ingestion pipeline against in-memory
+stand-ins for Supabase and the Refuge Restrooms API.
+
+For each dataset size the ``bathrooms`` and ``reviews`` tables are filled
+with synthetic rows and these workloads run in turn:
+
+- ``nearby``: map-pan sessions of GET /api/bathrooms/ with mixed filters
+- ``reviews``: 80% review reads, 20% review writes
+- ``create``: concurrent POST /api/bathrooms/
+- ``ingestion``: a full ``data_ingestion.main()`` run over the continental
+  US against a fake Refuge API, then an unchanged re-sync served from the
+  Refuge response cache, and one with every cached page revalidated
+
+Each workload reports throughput, p50/p95/p99 latency, backend calls and
+process memory. Results are written as JSON (by default to
+``benchmarks/results/<commit>.json``); ``--compare`` prints the change
+against an earlier results file.
+
+Usage (from the backend directory):
+    python -m benchmarks.run --sizes 1000 100000 1000000
+    python -m benchmarks.run --sizes 1000 --compare benchmarks/results/<commit>.json
+"""
+import os
+import sys
+import gc
+import json
+import time
+import random
+import asyncio
+import logging
+import platform
+import argparse
+import tempfile
+import resource
+import subprocess
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from app import app
+from api.dependencies import get_database
+from config.database import Database
+from config.settings import SPATIAL_INDEX_CELL_DEGREES, CLUSTER_LEVELS
+import services.bathroom_service as bathroom_service
+import services.review_service as review_service
+from services.bathroom_service import BathroomService
+from services.spatial_index import SpatialIndex
+from services.clustering import ClusterGrid
+from scripts import data_ingestion
+from benchmarks.common import synthetic_bathrooms, synthetic_restrooms, query_points, summarize
+from benchmarks.fakes import FakeSupabase, FakeRefugeAPI
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+WORKLOADS = ("nearby", "reviews", "create", "ingestion")
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# Filter combinations a map client sends, roughly by how often
+FILTER_MIX = [
+    ({}, 6),
+    ({"is_accessible": True}, 2),
+    ({"is_unisex": True}, 1),
+    ({"rating_min": 4.0}, 1),
+    ({"is_accessible": True, "has_changing_table": True}, 1),
+]
+
+
+def rss_mb() -> float:
+    """Current resident set size of the process."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def build_backend(size: int, latency_ms: float, seed: int) -> FakeSupabase:
+    backend = FakeSupabase(latency_ms=latency_ms, seed=seed)
+    backend.seed("bathrooms", synthetic_bathrooms(size, seed))
+    rng = random.Random(seed)
+    backend.seed("reviews", [
+        {"bathroom_id": rng.randint(1, size), "rating": rng.randint(1, 5), "comment": "ok",
+         "created_at": f"2024-01-{rng.randint(1, 28):02d}T00:00:00+00:00"}
+        for _ in range(min(size, 200000))
+    ])
+    return backend
+
+
+def pan_requests(count: int, seed: int):
+    """Map-pan sessions: a start point, then small steps in one direction with one filter set."""
+    rng = random.Random(seed)
+    filters, weights = zip(*FILTER_MIX)
+    starts = query_points(count // 8 + 1, seed)
+    requests = []
+    for start in starts:
+        chosen = rng.choices(filters, weights)[0]
+        step_lat, step_lng = rng.gauss(0, 0.003), rng.gauss(0, 0.003)
+        for step in range(8):
+            requests.append(("GET", "/api/bathrooms/", {
+                "latitude": start["latitude"] + step * step_lat,
+                "longitude": start["longitude"] + step * step_lng,
+                "radius": 5, "limit": 50, **chosen
+            }, None))
+    return requests[:count]
+
+
+def review_requests(count: int, size: int, seed: int):
+    rng = random.Random(seed)
+    requests = []
+    for _ in range(count):
+        bathroom_id = rng.randint(1, size)
+        if rng.random() < 0.8:
+            requests.append(("GET", f"/api/reviews/{bathroom_id}", {"limit": 10}, None))
+        else:
+            requests.append(("POST", "/api/reviews/", None,
+                             {"bathroom_id": bathroom_id, "rating": rng.randint(1, 5), "comment": "benchmark"}))
+    return requests
+
+
+def create_requests(count: int, seed: int):
+    requests = []
+    for row in synthetic_bathrooms(count, seed + 1):
+        body = {k: row[k] for k in ("name", "address", "latitude", "longitude",
+                                    "is_unisex", "is_accessible", "has_changing_table")}
+        requests.append(("POST", "/api/bathrooms/", None, body))
+    return requests
+
+
+async def run_requests(client: httpx.AsyncClient, requests, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = []
+    errors = 0
+
+    async def one(method, url, params, body):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.request(method, url, params=params, json=body)
+            samples.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(*request) for request in requests))
+    return samples, errors, time.perf_counter() - started
+
+
+async def run_ingestion(db: Database, backend: FakeSupabase, args):
+    """Ingest the fake Refuge dataset: a first sync, then unchanged re-syncs with a fresh and an expired cache."""
+    refuge = FakeRefugeAPI(synthetic_restrooms(args.ingest_restrooms, args.seed), latency_ms=args.refuge_latency_ms)
+    bbox = ",".join(str(v) for v in data_ingestion.REGIONS["us"])
+    runs = []
+    with tempfile.TemporaryDirectory() as tmp:
+        argv = ["--bbox", bbox, "--tile-degrees", str(args.ingest_tile_degrees), "--rate", "1000",
+                "--concurrency", "8", "--checkpoint", os.path.join(tmp, "checkpoint.json"),
+                "--state", os.path.join(tmp, "state.sqlite3"), "--http-cache", os.path.join(tmp, "http.sqlite3")]
+        for label, extra in (("first_sync", []), ("resync", []), ("revalidate", ["--http-cache-ttl", "0"])):
+            calls = backend.calls
+            requests, not_modified = refuge.requests, refuge.not_modified
+            async with httpx.AsyncClient(transport=refuge.transport(), base_url="https://refuge.test/api/v1/restrooms") \
+                    as client:
+                started = time.perf_counter()
+                report = await data_ingestion.main(argv + extra, db=db, client=client)
+                elapsed = time.perf_counter() - started
+            runs.append({
+                "run": label,
+                "seconds": elapsed,
+                "rows_per_second": args.ingest_restrooms / elapsed,
+                "report": report.as_dict() if report is not None else None,
+                "db_calls": backend.calls - calls,
+                "refuge_requests": refuge.requests - requests,
+                "refuge_not_modified": refuge.not_modified - not_modified,
+            })
+    return runs
+
+
+def configure_index(enabled: bool) -> None:
+    bathroom_service.bathroom_index = SpatialIndex(SPATIAL_INDEX_CELL_DEGREES) if enabled else None
+    bathroom_service.cluster_grid = ClusterGrid(SPATIAL_INDEX_CELL_DEGREES, CLUSTER_LEVELS) if enabled else None
+
+
+def reset_caches() -> None:
+    if bathroom_service.nearby_cache is not None:
+        bathroom_service.nearby_cache.clear()
+    review_service.review_summaries = type(review_service.review_summaries)(
+        latest_size=review_service.REVIEW_SUMMARY_LATEST,
+        ttl_seconds=review_service.REVIEW_SUMMARY_TTL_SECONDS,
+        max_entries=review_service.REVIEW_SUMMARY_MAX_ENTRIES
+    )
+
+
+async def run_size(size: int, args):
+    started = time.perf_counter()
+    backend = build_backend(size, args.latency_ms, args.seed)
+    db = Database(backend, args.max_workers)
+    configure_index(args.index)
+    if args.index:
+        await BathroomService.load_index(db)
+    setup_seconds = time.perf_counter() - started
+    print(f"\n{size} bathrooms: set up in {setup_seconds:.1f}s, rss {rss_mb():.0f} MB"
+          f"{' (spatial index)' if args.index else ''}")
+
+    app.dependency_overrides[get_database] = lambda: db
+    results = []
+    workloads = {
+        "nearby": lambda: pan_requests(args.requests, args.seed),
+        "reviews": lambda: review_requests(args.requests, size, args.seed),
+        "create": lambda: create_requests(args.requests, args.seed),
+    }
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            for name in args.workloads:
+                if name not in workloads:
+                    continue
+                reset_caches()
+                requests = workloads[name]()
+                gc.collect()
+                calls = backend.calls
+                samples, errors, elapsed = await run_requests(client, requests, args.concurrency)
+                result = {
+                    "size": size, "workload": name, "requests": len(requests), "errors": errors,
+                    "concurrency": args.concurrency, "seconds": elapsed,
+                    "throughput_rps": len(requests) / elapsed, "latency": summarize(samples),
+                    "db_calls": backend.calls - calls, "rss_mb": rss_mb(), "peak_rss_mb": peak_rss_mb(),
+                }
+                results.append(result)
+                latency = result["latency"]
+                print(f"  {name:<10} {result['throughput_rps']:9.1f} req/s  p50 {latency['p50_us'] / 1000:7.2f}ms  "
+                      f"p95 {latency['p95_us'] / 1000:7.2f}ms  p99 {latency['p99_us'] / 1000:7.2f}ms  "
+                      f"{result['db_calls']:>6} db calls  {errors} errors  rss {result['rss_mb']:.0f} MB")
+
+        if "ingestion" in args.workloads:
+            gc.collect()
+            for run in await run_ingestion(db, backend, args):
+                result = {"size": size, "workload": f"ingestion:{run['run']}", **run,
+                          "rss_mb": rss_mb(), "peak_rss_mb": peak_rss_mb()}
+                results.append(result)
+                print(f"  {result['workload']:<20} {run['seconds']:6.2f}s  {run['rows_per_second']:9.1f} rows/s  "
+                      f"{run['db_calls']:>6} db calls  {run['refuge_requests']:>5} refuge requests "
+                      f"({run['refuge_not_modified']} not modified)  {run['report']}")
+    finally:
+        app.dependency_overrides.clear()
+        db.close()
+    return {"size": size, "setup_seconds": setup_seconds, "workloads": results}
+
+
+def compare(current, baseline_path: str) -> None:
+    """Print the change of each workload against an earlier results file."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    before = {(w["size"], w["workload"]): w for s in baseline["sizes"] for w in s["workloads"]}
+    print(f"\nCompared with {baseline.get('commit')} ({baseline_path}):")
+    for size in current["sizes"]:
+        for workload in size["workloads"]:
+            old = before.get((workload["size"], workload["workload"]))
+            if old is None:
+                continue
+            change = lambda new_value, old_value: f"{(new_value / old_value - 1) * 100:+6.1f}%" if old_value else "   n/a"
+            if "latency" in workload:
+                print(f"  {workload['size']:>8} {workload['workload']:<20} "
+                      f"throughput {change(workload['throughput_rps'], old['throughput_rps'])}  "
+                      f"p50 {change(workload['latency']['p50_us'], old['latency']['p50_us'])}  "
+                      f"p95 {change(workload['latency']['p95_us'], old['latency']['p95_us'])}  "
+                      f"p99 {change(workload['latency']['p99_us'], old['latency']['p99_us'])}")
+            else:
+                print(f"  {workload['size']:>8} {workload['workload']:<20} "
+                      f"time {change(workload['seconds'], old['seconds'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000], help="Bathrooms per dataset")
+    parser.add_argument("--workloads", nargs="+", choices=WORKLOADS, default=list(WORKLOADS))
+    parser.add_argument("--requests", type=int, default=400, help="Requests per HTTP workload")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Artificial Supabase round trip")
+    parser.add_argument("--max-workers", type=int, default=32, help="Database worker threads")
+    parser.add_argument("--index", action="store_true", help="Serve nearby queries from the spatial index")
+    parser.add_argument("--ingest-restrooms", type=int, default=5000, help="Restrooms served by the fake Refuge API")
+    parser.add_argument("--ingest-tile-degrees", type=float, default=4.0)
+    parser.add_argument("--refuge-latency-ms", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    # Slow requests are expected under load here; the results carry the latencies
+    logging.getLogger("api.middleware").setLevel(logging.ERROR)
+    commit = git_commit()
+    results = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "args": vars(args),
+        "sizes": [],
+    }
+    for size in args.sizes:
+        results["sizes"].append(asyncio.run(run_size(size, args)))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Benchmark text search over the in-memory text index.
+
+Synthetic bathrooms get business-like names, street addresses and
+directions, then the index is built and queried with exact words, partially
+typed words, misspellings and multi-word queries, with and without a radius
+around a metro area. A naive scan (every query word a substring of the
+bathroom's text) is timed on the exact queries for reference.
+
+Also reported: build time and the rate of incremental updates and deletes.
+
+Usage (from the backend directory):
+    python -m benchmarks.search_benchmark --rows 100000 --queries 500
+"""
+import os
+import sys
+import time
+import json
+import random
+import logging
+import argparse
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.text_index import TextIndex, tokenize, FIELD_WEIGHTS
+from benchmarks.common import synthetic_bathrooms, summarize, METROS
+
+BRANDS = ["Starbucks", "McDonald's", "Whole Foods", "Target", "Walgreens", "CVS", "Dunkin'", "Panera Bread",
+          "Barnes & Noble", "Trader Joe's", "Chipotle", "Shake Shack", "Apple Store", "Macy's", "Café Nero",
+          "Peet's Coffee", "Public Library", "City Hall", "Union Station", "Community Center", "YMCA",
+          "Central Park", "Museum of Science", "Children's Hospital", "Convention Center"]
+KINDS = ["", "", "Restroom", "Lobby", "Food Court", "Mall", "Downtown", "Plaza", "Terminal B", "North"]
+STREETS = ["Main", "Washington", "Massachusetts", "Broadway", "Market", "Mission", "Lincoln", "Jefferson",
+           "Madison", "Beacon", "Commonwealth", "Boylston", "Tremont", "Cambridge", "Harrison", "Columbus",
+           "Michigan", "Wilshire", "Peachtree", "Pennsylvania", "Sunset", "Lexington", "Atlantic", "Pacific"]
+SUFFIXES = ["St", "Ave", "Blvd", "Rd", "Way", "Pl"]
+DIRECTIONS = ["Ask the cashier for the code", "Second floor past the elevators", "Behind the counter on the left",
+              "Key at the front desk", "Down the stairs next to the fitting rooms", "Near the back exit",
+              "Customers only", "Open during business hours", "Family restroom by the food court", ""]
+TYPOS = {"starbucks": "strabucks", "library": "libary", "walgreens": "walgreen", "massachusetts": "massachusets",
+         "chipotle": "chipolte", "station": "staton", "museum": "musuem", "hospital": "hosptial",
+         "commonwealth": "comonwealth", "peachtree": "peachtre"}
+
+
+def text_bathrooms(count: int, seed: int):
+    rng = random.Random(seed)
+    rows = synthetic_bathrooms(count, seed)
+    for row in rows:
+        row["name"] = f"{rng.choice(BRANDS)} {rng.choice(KINDS)}".strip()
+        row["address"] = f"{rng.randint(1, 2500)} {rng.choice(STREETS)} {rng.choice(SUFFIXES)}"
+        row["directions"] = rng.choice(DIRECTIONS) or None
+    return rows
+
+
+def make_queries(count: int, seed: int):
+    """(kind, text) pairs covering exact words, partial words, misspellings and multi-word queries."""
+    rng = random.Random(seed)
+    words = sorted({word for text in BRANDS + STREETS for word in tokenize(text) if len(word) > 3})
+    queries = []
+    for i in range(count):
+        kind = ("exact", "prefix", "typo", "multi")[i % 4]
+        if kind == "exact":
+            text = rng.choice(words)
+        elif kind == "prefix":
+            word = rng.choice(words)
+            text = word[:rng.randint(3, max(3, len(word) - 1))]
+        elif kind == "typo":
+            text = rng.choice(sorted(TYPOS.values()))
+        else:
+            text = f"{rng.choice(BRANDS)} {rng.choice(STREETS)}"
+        queries.append((kind, text))
+    return queries
+
+
+def naive_search(rows, text: str, limit: int):
+    """Rank rows whose text contains every query word, by weighted occurrences."""
+    words = tokenize(text)
+    found = []
+    for row in rows:
+        score = 0.0
+        for word in words:
+            hits = sum(weight for column, weight in FIELD_WEIGHTS if word in (row.get(column) or "").lower())
+            if not hits:
+                break
+            score += hits
+        else:
+            found.append((score, row["id"]))
+    found.sort(key=lambda pair: (-pair[0], pair[1]))
+    return found[:limit]
+
+
+def timed(fn, queries):
+    latencies, hits = [], 0
+    for query in queries:
+        started = time.perf_counter()
+        results = fn(query)
+        latencies.append(time.perf_counter() - started)
+        hits += bool(results)
+    return latencies, hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=400)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--radius-km", type=float, default=10.0)
+    parser.add_argument("--naive-queries", type=int, default=40, help="Exact queries timed with the naive scan")
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    rows = text_bathrooms(args.rows, args.seed)
+    started = time.perf_counter()
+    index = TextIndex.from_rows(rows)
+    build_seconds = time.perf_counter() - started
+
+    queries = make_queries(args.queries, args.seed)
+    rng = random.Random(args.seed)
+    results = {"rows": args.rows, "build_seconds": build_seconds, "queries": {}}
+    print(f"{args.rows} bathrooms, index built in {build_seconds:.2f}s")
+    for located in (False, True):
+        for kind in ("exact", "prefix", "typo", "multi"):
+            texts = [text for k, text in queries if k == kind]
+            if located:
+                centers = [rng.choice(METROS)[:2] for _ in texts]
+                batch = list(zip(texts, centers))
+                run = lambda q: index.search(q[0], args.limit, q[1][0], q[1][1], args.radius_km)
+            else:
+                batch = texts
+                run = lambda q: index.search(q, args.limit)
+            latencies, hits = timed(run, batch)
+            name = f"{kind}{' +radius' if located else ''}"
+            summary = summarize(latencies)
+            results["queries"][name] = {**summary, "with_results": hits / len(batch)}
+            print(f"  {name:<14} p50 {summary['p50_us'] / 1000:7.2f}ms  p95 {summary['p95_us'] / 1000:7.2f}ms  "
+                  f"p99 {summary['p99_us'] / 1000:7.2f}ms  {hits}/{len(batch)} with results")
+
+    naive = [text for kind, text in queries if kind == "exact"][:args.naive_queries]
+    latencies, _ = timed(lambda q: naive_search(rows, q, args.limit), naive)
+    summary = summarize(latencies)
+    results["queries"]["naive exact"] = summary
+    print(f"  {'naive exact':<14} p50 {summary['p50_us'] / 1000:7.2f}ms  p95 {summary['p95_us'] / 1000:7.2f}ms  "
+          f"p99 {summary['p99_us'] / 1000:7.2f}ms")
+
+    changed = text_bathrooms(args.updates, args.seed + 1)
+    started = time.perf_counter()
+    for row in changed:
+        row["id"] = rng.randint(1, args.rows)
+        index.upsert(row)
+    upsert_rate = len(changed) / (time.perf_counter() - started)
+    started = time.perf_counter()
+    for row in changed:
+        index.remove(row["id"])
+    remove_rate = len(changed) / (time.perf_counter() - started)
+    results.update(upserts_per_second=upsert_rate, removes_per_second=remove_rate)
+    print(f"  incremental: {upsert_rate:,.0f} upserts/s, {remove_rate:,.0f} removes/s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Measure the CPU cost of rendering bathroom and review responses as JSON.
+
+Each way of encoding the same rows is timed per 1,000 rows:
+
+- ``generic``: FastAPI's ``jsonable_encoder`` then ``JSONResponse``, what
+  routes returning plain dicts used to go through
+- ``stdlib``: ``json.dumps`` of the rows, the old bathroom list path
+- ``validated``: the response model's compiled validator and serializer
+  (``RESPONSE_VALIDATION=true``)
+- ``trusted``: the rows rendered as they are (orjson when installed)
+
+The rendered bodies are decoded again and checked against the generic one.
+
+Usage (from the backend directory):
+    python -m benchmarks.serialize_benchmark --sizes 100 1000 5000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+from typing import List
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import api.formats as formats
+from api.formats import render_json
+from models.bathroom import BathroomResult
+from models.review import Review
+from benchmarks.format_benchmark import realistic_rows
+
+ENCODERS = {
+    "generic": lambda rows, model: JSONResponse(jsonable_encoder(rows)).body,
+    "stdlib": lambda rows, model: json.dumps(rows, separators=(",", ":"), default=str).encode("utf-8"),
+    "validated": lambda rows, model: render_json(rows, model, validate=True),
+    "trusted": lambda rows, model: render_json(rows, model, validate=False),
+}
+
+
+def review_rows(count: int):
+    return [{
+        "id": i,
+        "bathroom_id": i % 500 + 1,
+        "rating": i % 5 + 1,
+        "comment": "Clean, usually has soap. Ask the front desk for the key after 8pm." if i % 3 else None,
+        "directions": None,
+        "user_id": None,
+        "created_at": "2024-01-01T00:00:00+00:00",
+    } for i in range(1, count + 1)]
+
+
+def comparable(rows):
+    """Decoded rows without nulls and with UTC as Z, since validated bodies add the model's defaults."""
+    def normal(value):
+        return value.replace("+00:00", "Z") if isinstance(value, str) else value
+    return [{key: normal(value) for key, value in row.items() if value is not None} for row in rows]
+
+
+def time_encoder(encode, rows, model, min_seconds: float) -> float:
+    """Best seconds per call over repeated runs of at least ``min_seconds`` in total."""
+    best = float("inf")
+    spent = 0.0
+    while spent < min_seconds:
+        started = time.perf_counter()
+        encode(rows, model)
+        elapsed = time.perf_counter() - started
+        best = min(best, elapsed)
+        spent += elapsed
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--min-seconds", type=float, default=0.5, help="Time spent per encoder and size")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    print(f"orjson {'installed' if formats.orjson is not None else 'not installed'}")
+    results = []
+    for kind, make_rows, model in (("bathrooms", realistic_rows, List[BathroomResult]),
+                                   ("reviews", review_rows, List[Review])):
+        for size in args.sizes:
+            rows = make_rows(size)
+            expected = comparable(json.loads(ENCODERS["generic"](rows, model)))
+            baseline = None
+            for name, encode in ENCODERS.items():
+                body = encode(rows, model)
+                assert comparable(json.loads(body)) == expected, f"{name} renders {kind} differently"
+                seconds = time_encoder(encode, rows, model, args.min_seconds)
+                per_thousand_us = seconds / size * 1000 * 1e6
+                baseline = baseline or per_thousand_us
+                results.append({"kind": kind, "rows": size, "encoder": name, "bytes": len(body),
+                                "us_per_1000_rows": per_thousand_us})
+                print(f"  {kind:<9} {size:>6} rows  {name:<9} {per_thousand_us:9.0f}us per 1,000 rows  "
+                      f"{baseline / per_thousand_us:5.1f}x")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Compare worker memory and nearby query latency with a per-process spatial
+index against the shared, memory-mapped snapshot used by serve.py.
+
+For each mode, ``--workers`` fresh processes load the same synthetic
+dataset (their own ``SpatialIndex`` copy, or a mapping of one snapshot file)
+and run nearby queries, then report their memory from
+/proc/self/smaps_rollup while all of them are alive. PSS splits shared
+pages between the processes mapping them, so the sum over workers is what
+the group really costs.
+
+Usage (from the backend directory):
+    python -m benchmarks.snapshot_benchmark --sizes 100000 1000000 --workers 4
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import tempfile
+import multiprocessing
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.spatial_index import SpatialIndex
+from services.snapshot import SnapshotIndex
+from benchmarks.common import synthetic_bathrooms, query_points, summarize
+
+
+def memory_mb():
+    """Rss, Pss and private (clean + dirty) memory of this process in MB."""
+    fields = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss_mb": fields.get("Rss", 0.0),
+        "pss_mb": fields.get("Pss", 0.0),
+        "private_mb": fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0),
+    }
+
+
+def worker(mode: str, size: int, path: str, queries: int, radius: float, limit: int, barrier, results) -> None:
+    baseline = memory_mb()
+    started = time.perf_counter()
+    if mode == "snapshot":
+        index = SnapshotIndex(path)
+        index.refresh()
+    else:
+        index = SpatialIndex()
+        index.load(synthetic_bathrooms(size))
+    setup_seconds = time.perf_counter() - started
+
+    samples = []
+    for point in query_points(queries):
+        started = time.perf_counter()
+        index.query(point["latitude"], point["longitude"], radius, limit)
+        samples.append(time.perf_counter() - started)
+
+    barrier.wait()
+    memory = memory_mb()
+    results.put({
+        "setup_seconds": setup_seconds,
+        **summarize(samples),
+        **memory,
+        "private_delta_mb": memory["private_mb"] - baseline["private_mb"],
+    })
+    barrier.wait()
+
+
+def run_mode(mode: str, size: int, path: str, workers: int, queries: int, radius: float, limit: int):
+    # Spawned, not forked, so no worker starts out sharing the parent's pages
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(mode, size, path, queries, radius, limit, barrier, results))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    mean = lambda key: sum(report[key] for report in reports) / len(reports)
+    return {
+        "mode": mode,
+        "size": size,
+        "workers": workers,
+        "setup_seconds": mean("setup_seconds"),
+        "p50_us": mean("p50_us"),
+        "p99_us": mean("p99_us"),
+        "rss_mb_per_worker": mean("rss_mb"),
+        "private_delta_mb_per_worker": mean("private_delta_mb"),
+        "pss_mb_total": sum(report["pss_mb"] for report in reports),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--radius", type=float, default=5.0)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    results = []
+    for size in args.sizes:
+        path = os.path.join(directory, f"saferoute-benchmark-{os.getpid()}.snapshot")
+        started = time.perf_counter()
+        SnapshotIndex(path).write(synthetic_bathrooms(size))
+        write_seconds = time.perf_counter() - started
+        print(f"{size} bathrooms: snapshot {os.path.getsize(path) / 1e6:.1f} MB written in {write_seconds:.2f}s")
+        try:
+            for mode in ("process", "snapshot"):
+                result = run_mode(mode, size, path, args.workers, args.queries, args.radius, args.limit)
+                result["snapshot_mb"] = os.path.getsize(path) / 1e6
+                result["snapshot_write_seconds"] = write_seconds
+                results.append(result)
+                print(f"  {mode:<8} x{args.workers}: setup {result['setup_seconds']:.2f}s  "
+                      f"p50 {result['p50_us']:.0f}us  p99 {result['p99_us']:.0f}us  "
+                      f"rss/worker {result['rss_mb_per_worker']:.0f} MB  "
+                      f"private/worker +{result['private_delta_mb_per_worker']:.0f} MB  "
+                      f"pss total {result['pss_mb_total']:.0f} MB")
+        finally:
+            os.remove(path)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmark nearby queries served by the in-memory spatial index against a
+stubbed ``nearby_bathrooms`` RPC round trip.
+
+Usage (from the backend directory):
+    python -m benchmarks.spatial_index_benchmark --sizes 10000 100000 1000000
+"""
+import os
+import sys
+import time
+import json
+import argparse
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.spatial_index import SpatialIndex, haversine_km, attribute_flags, filter_mask
+from benchmarks.common import synthetic_bathrooms, query_points, summarize
+
+
+def stub_rpc(rtt_seconds: float):
+    """A stand-in for ``supabase.rpc('nearby_bathrooms', ...).execute()`` that only pays the round trip."""
+    def call(latitude, longitude, radius, limit):
+        time.sleep(rtt_seconds)
+        return []
+    return call
+
+
+# A typical filtered map query: accessible, rated 3 or better
+FILTERED_QUERY = {"rating_min": 3.0, "is_accessible": True}
+
+
+def check_ordering(index: SpatialIndex, rows, points, radius: float, limit: int, filters=None) -> None:
+    """Compare index results against a brute-force haversine scan."""
+    filters = filters or {}
+    mask, value = filter_mask(filters.get("is_unisex"), filters.get("is_accessible"),
+                              filters.get("has_changing_table"))
+    rating_min = filters.get("rating_min")
+    for point in points:
+        expected = sorted(
+            (haversine_km(point["latitude"], point["longitude"], r["latitude"], r["longitude"]), r["id"])
+            for r in rows
+            if attribute_flags(r) & mask == value and (rating_min is None or r["average_rating"] >= rating_min)
+        )
+        expected = [i for d, i in expected if d <= radius][:limit]
+        got = [r["id"] for r in index.query(point["latitude"], point["longitude"], radius, limit,
+                                            rating_min=rating_min, flag_mask=mask, flag_value=value)]
+        if got != expected:
+            raise AssertionError(f"Index result differs from brute force at {point}")
+
+
+def run(sizes, queries: int, radius: float, limit: int, rtt_ms: float, rpc_queries: int):
+    results = []
+    points = query_points(queries)
+    rpc = stub_rpc(rtt_ms / 1000)
+    rpc_samples = []
+    for point in points[:rpc_queries]:
+        started = time.perf_counter()
+        rpc(point["latitude"], point["longitude"], radius, limit)
+        rpc_samples.append(time.perf_counter() - started)
+    rpc_stats = summarize(rpc_samples)
+
+    for size in sizes:
+        rows = synthetic_bathrooms(size)
+        index = SpatialIndex()
+        started = time.perf_counter()
+        index.load(rows)
+        load_seconds = time.perf_counter() - started
+        if size <= 100000:
+            check_ordering(index, rows, points[:5], radius, limit)
+            check_ordering(index, rows, points[:5], radius, limit, FILTERED_QUERY)
+
+        mask, value = filter_mask(is_accessible=FILTERED_QUERY["is_accessible"])
+        samples = []
+        filtered_samples = []
+        for point in points:
+            started = time.perf_counter()
+            index.query(point["latitude"], point["longitude"], radius, limit)
+            samples.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            index.query(point["latitude"], point["longitude"], radius, limit,
+                        rating_min=FILTERED_QUERY["rating_min"], flag_mask=mask, flag_value=value)
+            filtered_samples.append(time.perf_counter() - started)
+        stats = summarize(samples)
+        filtered_stats = summarize(filtered_samples)
+        results.append({"size": size, "load_seconds": load_seconds, "index": stats,
+                        "index_filtered": filtered_stats, "stub_rpc": rpc_stats})
+        print(f"{size:>9} rows | load {load_seconds:6.2f}s | index p50 {stats['p50_us']:8.1f}us "
+              f"p99 {stats['p99_us']:8.1f}us | filtered p50 {filtered_stats['p50_us']:8.1f}us "
+              f"p99 {filtered_stats['p99_us']:8.1f}us | stub RPC p50 {rpc_stats['p50_us']:8.1f}us "
+              f"p99 {rpc_stats['p99_us']:8.1f}us")
+        del rows, index
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--radius", type=float, default=5.0, help="Search radius in kilometers")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--rtt-ms", type=float, default=15.0, help="Simulated RPC round trip in milliseconds")
+    parser.add_argument("--rpc-queries", type=int, default=200)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.queries, args.radius, args.limit, args.rtt_ms, args.rpc_queries)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Benchmark serving map viewports from static tile packs against the dynamic route.
+
+Tiles of the synthetic table are built into a temporary directory through the
+in-memory Supabase stand-in, then each viewport (a point and a radius) is
+answered three ways through the FastAPI app:
+
+- ``dynamic``: GET /api/bathrooms/, one ``nearby_bathrooms`` RPC per viewport
+- ``tiles``: GET /api/tiles/{z}/{x}/{y} for every tile covering the viewport
+- ``tiles-304``: the same requests revalidated with If-None-Match, as a
+  client or HTTP cache holding the tiles would send them
+
+Reports viewports per second, per-viewport latency, bytes sent and backend
+round trips, plus the cost of a full build and of an incremental one after
+``--changes`` rows changed.
+
+Usage (from the backend directory):
+    python -m benchmarks.tile_benchmark --rows 100000 --latency-ms 5
+"""
+import os
+import sys
+import time
+import math
+import json
+import random
+import asyncio
+import logging
+import tempfile
+import argparse
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from app import app
+from api.dependencies import get_database
+from config.database import Database
+import services.tile_service as tile_service
+from services.tile_service import TileService
+from services.tiles import TileStore, tiles_covering
+from benchmarks.fakes import FakeSupabase
+from benchmarks.common import synthetic_bathrooms, query_points, summarize
+
+MODES = ("dynamic", "tiles", "tiles-304")
+
+KM_PER_DEGREE = 111.2
+
+
+def viewport_tiles(point, radius_km: float, zoom: int):
+    lat, lng = point["latitude"], point["longitude"]
+    dlat = radius_km / KM_PER_DEGREE
+    dlng = radius_km / (KM_PER_DEGREE * max(0.01, math.cos(math.radians(lat))))
+    return tiles_covering(lat - dlat, lng - dlng, lat + dlat, lng + dlng, zoom)
+
+
+async def run_mode(mode: str, client: httpx.AsyncClient, backend: FakeSupabase, points, args, etags):
+    slots = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    sent = 0
+    requests = 0
+
+    async def one(point):
+        nonlocal sent, requests
+        async with slots:
+            started = time.perf_counter()
+            if mode == "dynamic":
+                response = await client.get("/api/bathrooms/", params={
+                    **point, "radius": args.radius_km, "limit": args.limit
+                }, headers={"accept-encoding": "gzip"})
+                response.raise_for_status()
+                sent += int(response.headers.get("content-length", 0))
+                requests += 1
+            else:
+                for x, y in viewport_tiles(point, args.radius_km, args.zoom):
+                    url = f"/api/tiles/{args.zoom}/{x}/{y}"
+                    headers = {"accept-encoding": "gzip"}
+                    if mode == "tiles-304" and url in etags:
+                        headers["if-none-match"] = etags[url]
+                    response = await client.get(url, headers=headers)
+                    if response.status_code != 304:
+                        response.raise_for_status()
+                        etags[url] = response.headers["etag"]
+                    # Tile bodies go out gzipped, 304s empty: count what crosses the wire
+                    sent += int(response.headers.get("content-length", 0))
+                    requests += 1
+            latencies.append(time.perf_counter() - started)
+
+    calls = backend.calls
+    started = time.perf_counter()
+    await asyncio.gather(*(one(point) for point in points))
+    elapsed = time.perf_counter() - started
+    return {
+        "mode": mode,
+        "viewports": len(points),
+        "requests": requests,
+        "seconds": elapsed,
+        "viewports_per_second": len(points) / elapsed,
+        "latency": summarize(latencies),
+        "bytes_per_viewport": sent / len(points),
+        "db_calls": backend.calls - calls,
+    }
+
+
+async def run(args):
+    backend = FakeSupabase(latency_ms=args.latency_ms, seed=args.seed)
+    backend.seed("bathrooms", synthetic_bathrooms(args.rows, args.seed))
+    db = Database(backend, args.max_workers)
+    app.dependency_overrides[get_database] = lambda: db
+    directory = tempfile.TemporaryDirectory()
+    builds = {}
+    try:
+        started = time.perf_counter()
+        await TileService.build(db, directory.name, args.zoom)
+        builds["full_seconds"] = time.perf_counter() - started
+
+        rng = random.Random(args.seed)
+        for bathroom_id in rng.sample(range(1, args.rows + 1), args.changes):
+            backend.table("bathrooms").update({"name": f"Renamed {bathroom_id}"}).eq("id", bathroom_id).execute()
+        started = time.perf_counter()
+        incremental = await TileService.build(db, directory.name, args.zoom)
+        builds["incremental_seconds"] = time.perf_counter() - started
+        builds["incremental_tiles_written"] = incremental["tiles_written"]
+
+        tile_service.tile_store = TileStore(directory.name, check_seconds=60)
+        tile_service.tile_store.refresh()
+        builds["tiles"] = len(tile_service.tile_store.manifest["tiles"])
+        points = query_points(args.viewports, args.seed)
+        etags = {}
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            results = [await run_mode(mode, client, backend, points, args, etags) for mode in MODES]
+    finally:
+        tile_service.tile_store = None
+        app.dependency_overrides.clear()
+        db.close()
+        directory.cleanup()
+    return builds, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--viewports", type=int, default=2000)
+    parser.add_argument("--radius-km", type=float, default=2.0, help="Half the width of a viewport")
+    parser.add_argument("--limit", type=int, default=50, help="Rows per dynamic response")
+    parser.add_argument("--zoom", type=int, default=12)
+    parser.add_argument("--changes", type=int, default=100, help="Rows changed before the incremental build")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Artificial Supabase round trip")
+    parser.add_argument("--concurrency", type=int, default=16, help="Viewports in flight")
+    parser.add_argument("--max-workers", type=int, default=32, help="Database worker threads")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    builds, results = asyncio.run(run(args))
+    print(f"{args.rows} bathrooms, zoom {args.zoom}: {builds['tiles']} tiles, full build {builds['full_seconds']:.1f}s, "
+          f"incremental after {args.changes} changes {builds['incremental_seconds']:.2f}s "
+          f"({builds['incremental_tiles_written']} tiles written)")
+    print(f"{args.viewports} viewports of {args.radius_km:g}km, {args.latency_ms:.0f}ms backend round trip, "
+          f"{args.concurrency} in flight")
+    for result in results:
+        latency = result["latency"]
+        print(f"  {result['mode']:<10} {result['viewports_per_second']:8.1f} viewports/s  "
+              f"p50 {latency['p50_us'] / 1000:6.1f}ms  p99 {latency['p99_us'] / 1000:6.1f}ms  "
+              f"{result['requests'] / result['viewports']:4.1f} requests and {result['bytes_per_viewport'] / 1024:6.1f}KB "
+              f"per viewport  {result['db_calls']:>5} db calls")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"builds": builds, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Benchmark the NumPy query engine (``VectorIndex``) against the dict-based
+grid index (``SpatialIndex``) for single nearby queries, filtered queries,
+batches of locations and route corridors.
+
+The dict path answers a batch one point at a time and a route by merging
+the per-sample results, as ``BathroomService`` does without NumPy. Results
+of both paths are compared before timing.
+
+Usage (from the backend directory):
+    python -m benchmarks.vector_benchmark --sizes 100000 1000000
+"""
+import os
+import sys
+import time
+import json
+import argparse
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.spatial_index import SpatialIndex, filter_mask, densify_path
+from services.vector_index import VectorIndex
+from benchmarks.common import synthetic_bathrooms, query_points, summarize
+
+# A typical filtered map query: accessible, rated 3 or better
+FILTERED_QUERY = {"rating_min": 3.0, "flag_mask": filter_mask(is_accessible=True)[0],
+                  "flag_value": filter_mask(is_accessible=True)[1]}
+
+# New York to Boston by road, roughly
+ROUTE = [(40.7128, -74.0060), (40.9176, -73.7004), (41.3083, -72.9279), (41.7658, -72.6734),
+         (42.1015, -72.5898), (42.2626, -71.8023), (42.3601, -71.0589)]
+
+
+def corridor_by_points(index: SpatialIndex, samples, radius: float, limit: int):
+    nearest = {}
+    for lat, lng in samples:
+        for row in index.query(lat, lng, radius, limit):
+            known = nearest.get(row["id"])
+            if known is None or row["distance"] < known["distance"]:
+                nearest[row["id"]] = row
+    return sorted(nearest.values(), key=lambda row: (row["distance"], row["id"]))[:limit]
+
+
+def same_results(a, b) -> bool:
+    return [(row["id"], round(row["distance"], 9)) for row in a] == [(row["id"], round(row["distance"], 9)) for row in b]
+
+
+def timed(fn, repeat: int = 1) -> float:
+    """Best wall time of ``repeat`` calls, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def per_query(fn, points):
+    samples = []
+    for point in points:
+        started = time.perf_counter()
+        fn(point)
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def run(size: int, queries: int, batch: int, radius: float, limit: int, route_radius: float):
+    rows = synthetic_bathrooms(size)
+    grid = SpatialIndex()
+    grid.load(rows)
+    started = time.perf_counter()
+    vector = VectorIndex.from_rows(grid.rows())
+    build_seconds = time.perf_counter() - started
+    points = query_points(queries)
+    lats = [point["latitude"] for point in points]
+    lngs = [point["longitude"] for point in points]
+
+    for point in points[:200]:
+        for kwargs in ({}, FILTERED_QUERY):
+            expected = grid.query(point["latitude"], point["longitude"], radius, limit, **kwargs)
+            if not same_results(vector.query(point["latitude"], point["longitude"], radius, limit, **kwargs), expected):
+                raise AssertionError(f"VectorIndex result differs from SpatialIndex at {point}")
+
+    result = {"size": size, "build_seconds": build_seconds}
+    for name, kwargs in (("single", {}), ("filtered", FILTERED_QUERY)):
+        result[name] = {
+            "dict": per_query(lambda p: grid.query(p["latitude"], p["longitude"], radius, limit, **kwargs), points),
+            "vector": per_query(lambda p: vector.query(p["latitude"], p["longitude"], radius, limit, **kwargs), points),
+        }
+
+    batch_lats, batch_lngs = lats[:batch], lngs[:batch]
+    dict_seconds = timed(lambda: [grid.query(lat, lng, radius, 10) for lat, lng in zip(batch_lats, batch_lngs)], 3)
+    vector_seconds = timed(lambda: vector.query_many(batch_lats, batch_lngs, radius, 10), 3)
+    result["batch"] = {"points": len(batch_lats), "dict_ms": dict_seconds * 1000, "vector_ms": vector_seconds * 1000,
+                       "speedup": dict_seconds / vector_seconds}
+
+    samples = densify_path(ROUTE, route_radius / 2)
+    route_lats, route_lngs = [lat for lat, _ in samples], [lng for _, lng in samples]
+    if not same_results(vector.corridor(route_lats, route_lngs, route_radius, 50),
+                        corridor_by_points(grid, samples, route_radius, 50)):
+        raise AssertionError("VectorIndex corridor differs from merged per-point results")
+    dict_seconds = timed(lambda: corridor_by_points(grid, samples, route_radius, 50), 3)
+    vector_seconds = timed(lambda: vector.corridor(route_lats, route_lngs, route_radius, 50), 3)
+    result["corridor"] = {"samples": len(samples), "dict_ms": dict_seconds * 1000,
+                          "vector_ms": vector_seconds * 1000, "speedup": dict_seconds / vector_seconds}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000])
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=1000, help="Locations per batch query")
+    parser.add_argument("--radius", type=float, default=5.0)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--route-radius", type=float, default=1.0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        result = run(size, args.queries, args.batch, args.radius, args.limit, args.route_radius)
+        results.append(result)
+        print(f"{size} bathrooms (VectorIndex built in {result['build_seconds']:.2f}s)")
+        for name in ("single", "filtered"):
+            d, v = result[name]["dict"], result[name]["vector"]
+            print(f"  {name:<9} dict p50 {d['p50_us']:7.0f}us p99 {d['p99_us']:7.0f}us   "
+                  f"vector p50 {v['p50_us']:7.0f}us p99 {v['p99_us']:7.0f}us")
+        for name, unit in (("batch", "points"), ("corridor", "samples")):
+            r = result[name]
+            print(f"  {name:<9} {r[unit]:>5} {unit:<7} dict {r['dict_ms']:8.1f}ms   vector {r['vector_ms']:8.1f}ms   "
+                  f"{r['speedup']:.1f}x")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Benchmark the viewport endpoint's service call across zoom levels: latency
+and JSON response size of clustered results, against returning every
+bathroom in the viewport as individual markers.
+
+Viewports are 1280x720 px map views centered on the query points from
+``benchmarks.common``.
+
+Usage (from the backend directory):
+    python -m benchmarks.viewport_benchmark --size 1000000 --zooms 3 5 7 9 11 13 15 16
+"""
+import os
+import sys
+import time
+import json
+import math
+import asyncio
+import argparse
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import services.bathroom_service as bathroom_service
+from config.settings import SPATIAL_INDEX_CELL_DEGREES, CLUSTER_LEVELS
+from services.bathroom_service import BathroomService
+from services.spatial_index import SpatialIndex
+from services.clustering import ClusterGrid, TILE_PIXELS
+from benchmarks.common import synthetic_bathrooms, query_points, summarize
+
+VIEW_WIDTH_PX = 1280
+VIEW_HEIGHT_PX = 720
+
+
+def viewport(latitude: float, longitude: float, zoom: int):
+    """Bounding box of a map view centered on a point."""
+    degrees_per_px = 360.0 / (TILE_PIXELS * 2 ** zoom)
+    half_width = min(180.0, VIEW_WIDTH_PX / 2 * degrees_per_px)
+    half_height = min(90.0, VIEW_HEIGHT_PX / 2 * degrees_per_px * math.cos(math.radians(latitude)))
+    min_lng = longitude - half_width
+    max_lng = longitude + half_width
+    if half_width >= 180.0:
+        min_lng, max_lng = -180.0, 180.0
+    else:
+        min_lng = (min_lng + 180) % 360 - 180
+        max_lng = (max_lng + 180) % 360 - 180
+    return (max(-90.0, latitude - half_height), min_lng, min(90.0, latitude + half_height), max_lng)
+
+
+# Viewports per zoom level used for the all-markers baseline, which is slow at low zoom
+BASELINE_QUERIES = 10
+
+
+async def run_zoom(zoom: int, points, index: SpatialIndex, filters):
+    latencies, sizes, items, all_sizes, all_counts = [], [], [], [], []
+    for i, point in enumerate(points):
+        bbox = viewport(point["latitude"], point["longitude"], zoom)
+        started = time.perf_counter()
+        result = await BathroomService.get_bathrooms_in_viewport(None, *bbox, zoom, **filters)
+        body = json.dumps(result)
+        latencies.append(time.perf_counter() - started)
+        sizes.append(len(body))
+        items.append(len(result["clusters"]) + len(result["bathrooms"]))
+
+        # Baseline: every bathroom in the viewport as a marker, size estimated from a sample
+        if i < BASELINE_QUERIES:
+            everything, _ = index.within_bbox(*bbox, limit=10 ** 9)
+            all_counts.append(len(everything))
+            sample = everything[:200]
+            all_sizes.append(round(len(json.dumps(sample)) / len(sample) * len(everything)) if sample else 2)
+    mean = lambda values: sum(values) / len(values)
+    return {
+        "zoom": zoom,
+        "latency_us": summarize(latencies),
+        "mean_items": round(mean(items), 1),
+        "mean_response_bytes": round(mean(sizes)),
+        "max_response_bytes": max(sizes),
+        "baseline_mean_markers": round(mean(all_counts), 1),
+        "baseline_mean_bytes": round(mean(all_sizes)),
+        "baseline_max_bytes": max(all_sizes),
+    }
+
+
+async def run(args):
+    rows = synthetic_bathrooms(args.size)
+    index = SpatialIndex(SPATIAL_INDEX_CELL_DEGREES)
+    grid = ClusterGrid(SPATIAL_INDEX_CELL_DEGREES, CLUSTER_LEVELS)
+    started = time.perf_counter()
+    index.load(rows)
+    index_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    grid.load(rows)
+    grid_seconds = time.perf_counter() - started
+    print(f"{args.size} bathrooms: index load {index_seconds:.2f}s, cluster grid load {grid_seconds:.2f}s")
+    del rows
+
+    bathroom_service.bathroom_index = index
+    bathroom_service.cluster_grid = grid
+    points = query_points(args.queries)
+    filters = {"is_accessible": True, "rating_min": 3.0} if args.filtered else {}
+    results = []
+    for zoom in args.zooms:
+        result = await run_zoom(zoom, points, index, filters)
+        results.append(result)
+        latency = result["latency_us"]
+        print(f"zoom {zoom:>2}: p50 {latency['p50_us']:>9.1f}us p95 {latency['p95_us']:>9.1f}us "
+              f"{result['mean_items']:>7.1f} items {result['mean_response_bytes']:>9} B | "
+              f"all markers {result['baseline_mean_markers']:>9.1f} {result['baseline_mean_bytes']:>11} B")
+    return {"size": args.size, "index_load_seconds": index_seconds,
+            "grid_load_seconds": grid_seconds, "filtered": args.filtered, "zooms": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=1000000)
+    parser.add_argument("--zooms", type=int, nargs="+", default=[3, 5, 7, 9, 11, 13, 15, 16])
+    parser.add_argument("--queries", type=int, default=50, help="Viewports per zoom level")
+    parser.add_argument("--filtered", action="store_true", help="Only accessible bathrooms rated 3+")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
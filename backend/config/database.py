@@ -1,17 +1,106 @@
-import os
-from supabase import create_client, Client
-from dotenv import load_dotenv
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Callable, TYPE_CHECKING
+from config.settings import DB_MAX_WORKERS, SUPABASE_URL, SUPABASE_KEY
+from services.metrics import db_seconds, record_time
 
-load_dotenv()
+if TYPE_CHECKING:
+    from supabase import Client
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE")
-
-def get_supabase_client() -> Client:
+def get_supabase_client() -> "Client":
     """Get a Supabase client instance."""
     if not SUPABASE_URL or not SUPABASE_KEY:
         raise ValueError("Supabase URL and key must be set in environment variables")
     
+    # Imported on first use; supabase and its dependencies are a large part of worker start-up
+    from supabase import create_client
     return create_client(SUPABASE_URL, SUPABASE_KEY)
 
-supabase = get_supabase_client()
+def describe_query(query) -> tuple:
+    """Table or ``rpc/<function>`` and HTTP method of a postgrest query, for metrics labels."""
+    request = getattr(query, 'request', query)
+    path = str(getattr(request, 'path', '') or '')
+    method = getattr(request, 'http_method', None)
+    target = path.split('/rest/v1/', 1)[-1].split('?', 1)[0] if path else 'unknown'
+    return target or 'unknown', getattr(method, 'value', method) or 'unknown'
+
+class Database:
+    """
+    Non-blocking access to a synchronous Supabase client.
+    
+    Queries are built on the event loop as usual, but ``execute`` runs the
+    blocking HTTP round trip on a bounded thread pool, so concurrent requests
+    on a worker no longer serialize behind each other. The client's own HTTP
+    connection pool is shared by all threads.
+    
+    The client is created on first use, or ahead of time by ``warm``, so
+    importing this module neither needs the Supabase settings nor pays for
+    building the client.
+    """
+    
+    def __init__(self, client: Optional["Client"] = None, max_workers: int = DB_MAX_WORKERS,
+                 client_factory: Callable[[], "Client"] = get_supabase_client):
+        self._client = client
+        self._client_factory = client_factory
+        self._client_lock = threading.Lock()
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="supabase")
+    
+    @property
+    def client(self) -> "Client":
+        """The Supabase client, created on first use."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._client_factory()
+        return self._client
+    
+    async def connect(self) -> None:
+        """Create the client on a worker thread, so the event loop is not blocked by it."""
+        if self._client is None:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._executor, lambda: self.client)
+    
+    async def warm(self) -> None:
+        """Create the client and make one round trip, opening a pooled connection."""
+        await self.connect()
+        response = await self.execute(self.table('bathrooms').select('id').limit(1))
+        
+        if hasattr(response, 'error') and response.error:
+            raise Exception(f"Error reaching the database: {response.error}")
+    
+    def table(self, name: str):
+        """Start a query on a table."""
+        return self.client.table(name)
+    
+    def rpc(self, fn: str, params: Dict[str, Any]):
+        """Start a stored procedure call."""
+        return self.client.rpc(fn, params)
+    
+    async def execute(self, query) -> Any:
+        """
+        Execute a query built from ``table`` or ``rpc`` without blocking the event loop.
+        
+        The round trip, including any wait for a free worker thread, is
+        recorded in ``saferoute_db_call_duration_seconds``.
+        """
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            response = await loop.run_in_executor(self._executor, query.execute)
+            outcome = 'error' if getattr(response, 'error', None) else 'ok'
+            return response
+        finally:
+            elapsed = time.perf_counter() - started
+            target, method = describe_query(query)
+            db_seconds.observe(elapsed, target, method, outcome)
+            record_time(f"db:{target}", elapsed)
+    
+    def close(self) -> None:
+        """Stop the worker threads."""
+        self._executor.shutdown(wait=False)
+
+database = Database()
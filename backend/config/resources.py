@@ -0,0 +1,129 @@
+import time
+import asyncio
+import inspect
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from config.settings import RESOURCE_RETRY_SECONDS, RESOURCE_MAX_RETRY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+
+class Resource:
+    """A process-wide resource warmed up in the background at start-up."""
+
+    def __init__(self, name: str, warm: Optional[Callable[[], Awaitable[Any]]],
+                 close: Optional[Callable[[], Any]], required: bool):
+        self.name = name
+        self.warm = warm
+        self.close = close
+        self.required = required
+        self.state = PENDING
+        self.error: Optional[str] = None
+        self.attempts = 0
+        self.ready_seconds: Optional[float] = None
+
+class ResourceRegistry:
+    """
+    Start-up and shutdown of the app's resources.
+
+    ``start`` launches every resource's warm-up as a background task and
+    returns at once, so a worker accepts connections (and answers liveness
+    checks) while clients are created and caches and indexes load. Failed
+    warm-ups are logged and retried with backoff instead of stopping the
+    worker. The worker is ready once every required resource is.
+    """
+
+    def __init__(self, retry_seconds: float = RESOURCE_RETRY_SECONDS,
+                 max_retry_seconds: float = RESOURCE_MAX_RETRY_SECONDS):
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        self._resources: Dict[str, Resource] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._started_at: Optional[float] = None
+
+    def register(self, name: str, warm: Optional[Callable[[], Awaitable[Any]]] = None,
+                 close: Optional[Callable[[], Any]] = None, required: bool = True) -> None:
+        """
+        Add a resource.
+
+        Args:
+            name: Name reported by ``status``
+            warm: Coroutine function preparing the resource; retried until it succeeds
+            close: Function (or coroutine function) releasing it at shutdown
+            required: Whether the worker is not ready until the resource is
+        """
+        self._resources[name] = Resource(name, warm, close, required)
+
+    def start(self) -> None:
+        """Warm up every resource in the background."""
+        self._started_at = time.perf_counter()
+        for resource in self._resources.values():
+            if resource.warm is None:
+                resource.state = READY
+                resource.ready_seconds = 0.0
+            else:
+                self._tasks.append(asyncio.create_task(self._warm(resource), name=f"warm-{resource.name}"))
+
+    async def _warm(self, resource: Resource) -> None:
+        delay = self.retry_seconds
+        while True:
+            resource.attempts += 1
+            try:
+                await resource.warm()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                resource.state = FAILED
+                resource.error = str(e)
+                logger.error(f"Warming up {resource.name} failed (attempt {resource.attempts}), "
+                             f"retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_retry_seconds)
+                continue
+            resource.state = READY
+            resource.error = None
+            resource.ready_seconds = time.perf_counter() - self._started_at
+            logger.info(f"{resource.name} ready {resource.ready_seconds:.2f}s after start-up")
+            return
+
+    async def stop(self) -> None:
+        """Cancel pending warm-ups and close resources in reverse order of registration."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for resource in reversed(list(self._resources.values())):
+            if resource.close is None:
+                continue
+            try:
+                result = resource.close()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Error closing {resource.name}: {e}")
+
+    @property
+    def ready(self) -> bool:
+        return all(r.state == READY for r in self._resources.values() if r.required)
+
+    def status(self) -> Dict[str, Any]:
+        """Readiness and the state of every resource."""
+        return {
+            "ready": self.ready,
+            "resources": {
+                r.name: {
+                    "state": r.state,
+                    "required": r.required,
+                    "attempts": r.attempts,
+                    "ready_seconds": r.ready_seconds,
+                    "error": r.error,
+                }
+                for r in self._resources.values()
+            },
+        }
+
+# Process-wide registry, started and stopped by the app's lifespan
+resources = ResourceRegistry()
@@ -9,12 +9,136 @@ API_PREFIX = "/api"
 API_TITLE = "SafeRoute API"
 API_VERSION = "1.0.0"
 
+# Supabase project; the client is created on first use, so these are only needed once the database is used
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE")
+
+# Upper bound on Supabase calls in flight at once per worker process
+DB_MAX_WORKERS = int(os.getenv("DB_MAX_WORKERS", "32"))
+
 # Refuge Restrooms API
 REFUGE_RESTROOMS_API_BASE_URL = "https://www.refugerestrooms.org/api/v1/restrooms"
+REFUGE_RATE_LIMIT_PER_SECOND = float(os.getenv("REFUGE_RATE_LIMIT_PER_SECOND", "2"))
+# On-disk cache of Refuge responses (SQLite file; empty disables it outside the ingestion script)
+REFUGE_CACHE_PATH = os.getenv("REFUGE_CACHE_PATH", "")
+REFUGE_CACHE_TTL_SECONDS = float(os.getenv("REFUGE_CACHE_TTL_SECONDS", str(24 * 3600)))
+REFUGE_CACHE_MAX_BYTES = int(os.getenv("REFUGE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
 
 # Default location (Boston, MA)
 DEFAULT_LATITUDE = 42.3601
 DEFAULT_LONGITUDE = -71.0589
 
+# In-memory spatial index for nearby queries (falls back to the nearby_bathrooms RPC when disabled)
+SPATIAL_INDEX_ENABLED = os.getenv("SPATIAL_INDEX_ENABLED", "false").lower() == "true"
+SPATIAL_INDEX_CELL_DEGREES = float(os.getenv("SPATIAL_INDEX_CELL_DEGREES", "0.01"))
+SPATIAL_INDEX_REFRESH_SECONDS = float(os.getenv("SPATIAL_INDEX_REFRESH_SECONDS", "30"))
+SPATIAL_INDEX_FULL_RELOAD_SECONDS = float(os.getenv("SPATIAL_INDEX_FULL_RELOAD_SECONDS", "3600"))
+SPATIAL_INDEX_PAGE_SIZE = int(os.getenv("SPATIAL_INDEX_PAGE_SIZE", "1000"))
+
+# Shared snapshot mode (serve.py): workers map the bathrooms snapshot at this path instead of loading their own index
+SPATIAL_SNAPSHOT_PATH = os.getenv("SPATIAL_SNAPSHOT_PATH", "")
+SPATIAL_SNAPSHOT_CHECK_SECONDS = float(os.getenv("SPATIAL_SNAPSHOT_CHECK_SECONDS", "2"))
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", str(os.cpu_count() or 1)))
+
+# Batch nearest/route queries: NumPy engine (when installed) rebuilt from the index at most this often after changes
+VECTOR_INDEX_ENABLED = os.getenv("VECTOR_INDEX_ENABLED", "true").lower() == "true"
+VECTOR_INDEX_REBUILD_SECONDS = float(os.getenv("VECTOR_INDEX_REBUILD_SECONDS", "10"))
+BATCH_MAX_POINTS = int(os.getenv("BATCH_MAX_POINTS", "1000"))
+ROUTE_MAX_SAMPLES = int(os.getenv("ROUTE_MAX_SAMPLES", "5000"))
+
+# Bulk create/update/delete: items per request, rows per backend call and calls in flight
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "5000"))
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "500"))
+BULK_MAX_IN_FLIGHT = int(os.getenv("BULK_MAX_IN_FLIGHT", "4"))
+
+# Opt-in text search: in-memory index kept alongside the spatial index (or loaded on its own when that is disabled).
+# It is not part of the shared snapshot: every worker holds its own copy of the whole table's postings, so budget
+# its memory once per worker. Snapshot workers rebuild theirs from the mapped rows at most every
+# SEARCH_INDEX_REBUILD_SECONDS after changes.
+SEARCH_INDEX_ENABLED = os.getenv("SEARCH_INDEX_ENABLED", "false").lower() == "true"
+SEARCH_INDEX_REBUILD_SECONDS = float(os.getenv("SEARCH_INDEX_REBUILD_SECONDS", "30"))
+SEARCH_FUZZY_THRESHOLD = float(os.getenv("SEARCH_FUZZY_THRESHOLD", "0.4"))
+SEARCH_MAX_EXPANSIONS = int(os.getenv("SEARCH_MAX_EXPANSIONS", "32"))
+SEARCH_DISTANCE_SCALE_KM = float(os.getenv("SEARCH_DISTANCE_SCALE_KM", "1.0"))
+
+# Duplicate detection: bathrooms this close with similar names (or streets) are merge candidates.
+# New bathrooms are checked on create; decisions are kept in memory, at most DEDUP_PENDING_MAX.
+DEDUP_MAX_METERS = float(os.getenv("DEDUP_MAX_METERS", "25"))
+DEDUP_NAME_THRESHOLD = float(os.getenv("DEDUP_NAME_THRESHOLD", "0.5"))
+DEDUP_ADDRESS_THRESHOLD = float(os.getenv("DEDUP_ADDRESS_THRESHOLD", "0.7"))
+DEDUP_CHECK_ON_CREATE = os.getenv("DEDUP_CHECK_ON_CREATE", "true").lower() == "true"
+DEDUP_PENDING_MAX = int(os.getenv("DEDUP_PENDING_MAX", "1000"))
+
+# Static tile packs (scripts/build_tiles.py): one gzipped JSON file per slippy-map tile of TILES_ZOOM in TILES_DIR.
+# Served with strong ETags; clients revalidate after TILES_MAX_AGE_SECONDS, or never when asking for a tile by hash.
+TILES_DIR = os.getenv("TILES_DIR", "")
+TILES_ZOOM = int(os.getenv("TILES_ZOOM", "12"))
+TILES_MAX_AGE_SECONDS = int(os.getenv("TILES_MAX_AGE_SECONDS", "60"))
+TILES_CHECK_SECONDS = float(os.getenv("TILES_CHECK_SECONDS", "2"))
+
+# Filtered nearby queries without the index: initial RPC over-fetch factor and hard cap on rows requested
+NEARBY_FILTER_OVERFETCH = int(os.getenv("NEARBY_FILTER_OVERFETCH", "4"))
+NEARBY_RPC_MAX_FETCH = int(os.getenv("NEARBY_RPC_MAX_FETCH", "2000"))
+
+# k-nearest queries (no radius) search a ring NEAREST_RING_KM wide past the center or paging cursor, then rings
+# twice as wide each time until enough matches are found, giving up at NEAREST_MAX_RADIUS_KM from the center
+NEAREST_RING_KM = float(os.getenv("NEAREST_RING_KM", "1.0"))
+NEAREST_MAX_RADIUS_KM = float(os.getenv("NEAREST_MAX_RADIUS_KM", "100"))
+
+# Cache of nearby-bathroom results keyed by quantized center/radius
+NEARBY_CACHE_ENABLED = os.getenv("NEARBY_CACHE_ENABLED", "true").lower() == "true"
+NEARBY_CACHE_TTL_SECONDS = float(os.getenv("NEARBY_CACHE_TTL_SECONDS", "60"))
+NEARBY_CACHE_MAX_BYTES = int(os.getenv("NEARBY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+NEARBY_CACHE_COORD_STEP_DEGREES = float(os.getenv("NEARBY_CACHE_COORD_STEP_DEGREES", "0.0005"))
+NEARBY_CACHE_RADIUS_STEP_KM = float(os.getenv("NEARBY_CACHE_RADIUS_STEP_KM", "0.25"))
+
+# Viewport endpoint: clusters below CLUSTER_MAX_ZOOM, individual bathrooms (at most VIEWPORT_MAX_BATHROOMS) from it on
+CLUSTER_MAX_ZOOM = int(os.getenv("CLUSTER_MAX_ZOOM", "15"))
+CLUSTER_CELL_PIXELS = int(os.getenv("CLUSTER_CELL_PIXELS", "64"))
+CLUSTER_LEVELS = int(os.getenv("CLUSTER_LEVELS", "6"))
+VIEWPORT_MAX_BATHROOMS = int(os.getenv("VIEWPORT_MAX_BATHROOMS", "1000"))
+# Rows read from the database per viewport when the spatial index is not loaded
+VIEWPORT_MAX_FETCH = int(os.getenv("VIEWPORT_MAX_FETCH", "20000"))
+
+# Review summaries (count, average, histogram, latest reviews) kept per bathroom in memory
+REVIEW_SUMMARY_LATEST = int(os.getenv("REVIEW_SUMMARY_LATEST", "10"))
+REVIEW_SUMMARY_TTL_SECONDS = float(os.getenv("REVIEW_SUMMARY_TTL_SECONDS", "300"))
+REVIEW_SUMMARY_MAX_ENTRIES = int(os.getenv("REVIEW_SUMMARY_MAX_ENTRIES", "100000"))
+REVIEW_SUMMARY_MAX_IDS = int(os.getenv("REVIEW_SUMMARY_MAX_IDS", "500"))
+
+# Write-behind reviews: acknowledged once spooled to a local SQLite file (one per worker in REVIEW_SPOOL_DIR),
+# then inserted in batches. Submitters wait up to REVIEW_QUEUE_WAIT_SECONDS while REVIEW_QUEUE_MAX are pending.
+REVIEW_WRITE_BEHIND = os.getenv("REVIEW_WRITE_BEHIND", "false").lower() == "true"
+REVIEW_SPOOL_DIR = os.getenv("REVIEW_SPOOL_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".review_spool"))
+REVIEW_QUEUE_MAX = int(os.getenv("REVIEW_QUEUE_MAX", "10000"))
+REVIEW_QUEUE_WAIT_SECONDS = float(os.getenv("REVIEW_QUEUE_WAIT_SECONDS", "1.0"))
+REVIEW_BATCH_SIZE = int(os.getenv("REVIEW_BATCH_SIZE", "200"))
+REVIEW_BATCH_LINGER_SECONDS = float(os.getenv("REVIEW_BATCH_LINGER_SECONDS", "0.05"))
+REVIEW_MAX_ATTEMPTS = int(os.getenv("REVIEW_MAX_ATTEMPTS", "5"))
+
+# Validate rows against the route's response model before sending them; off, rows from the database and
+# the indexes are trusted and rendered as they are. On by default so development, tests and benchmarks
+# check every response; serve.py turns it off in production workers unless it is set explicitly
+RESPONSE_VALIDATION = os.getenv("RESPONSE_VALIDATION", "true").lower() == "true"
+
+# Requests slower than this log their time breakdown (0 disables)
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))
+
+# Opt-in sampling profiler: folded stacks of slow requests are written to PROFILER_OUTPUT_DIR
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false").lower() == "true"
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "5"))
+PROFILER_OUTPUT_DIR = os.getenv("PROFILER_OUTPUT_DIR", "profiles")
+
+# Retry delays for start-up resources (database client, spatial index) that fail to warm up
+RESOURCE_RETRY_SECONDS = float(os.getenv("RESOURCE_RETRY_SECONDS", "1"))
+RESOURCE_MAX_RETRY_SECONDS = float(os.getenv("RESOURCE_MAX_RETRY_SECONDS", "30"))
+
+# NDJSON export/import: rows per export query, initial rows per import upsert, longest accepted line
+TRANSFER_PAGE_SIZE = int(os.getenv("TRANSFER_PAGE_SIZE", "1000"))
+TRANSFER_BATCH_SIZE = int(os.getenv("TRANSFER_BATCH_SIZE", "500"))
+TRANSFER_MAX_LINE_BYTES = int(os.getenv("TRANSFER_MAX_LINE_BYTES", str(1024 * 1024)))
+# The HTTP import overwrites rows by id, so it is off unless explicitly enabled (scripts/transfer.py is not affected)
+TRANSFER_IMPORT_ENABLED = os.getenv("TRANSFER_IMPORT_ENABLED", "false").lower() == "true"
+
 # Logging
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
@@ -17,6 +17,10 @@ class BathroomCreate(BathroomBase):
     external_id: Optional[str] = None
     external_source: Optional[str] = None
 
+class BathroomImportItem(BathroomCreate):
+    """One line of an NDJSON import: a bathroom to create or overwrite by id."""
+    id: int
+
 class BathroomUpdate(BaseModel):
     name: Optional[str] = None
     address: Optional[str] = None
@@ -28,6 +32,32 @@ class BathroomUpdate(BaseModel):
     directions: Optional[str] = None
     comment: Optional[str] = None
 
+class BathroomUpdateItem(BathroomUpdate):
+    """One item of a bulk update: the bathroom's id and the fields to change."""
+    id: int
+
+class BulkDelete(BaseModel):
+    ids: List[int]
+
+class Location(BaseModel):
+    latitude: float = Field(..., ge=-90, le=90)
+    longitude: float = Field(..., ge=-180, le=180)
+
+class NearestQuery(BaseModel):
+    """Many locations searched at once, each with the filters of the nearby endpoint."""
+    points: List[Location]
+    radius: float = Field(5.0, ge=0, description="Search radius in kilometers")
+    limit: int = Field(10, ge=1, description="Maximum number of results per point")
+    rating_min: Optional[float] = None
+    is_unisex: Optional[bool] = None
+    is_accessible: Optional[bool] = None
+    has_changing_table: Optional[bool] = None
+
+class RouteQuery(NearestQuery):
+    """A route as a polyline; bathrooms within ``radius`` of it are returned."""
+    radius: float = Field(1.0, ge=0, description="Distance from the route in kilometers")
+    limit: int = Field(50, ge=1, description="Maximum number of results")
+
 class Bathroom(BathroomBase):
     id: int
     average_rating: float = 0
@@ -39,3 +69,8 @@ class Bathroom(BathroomBase):
 
     class Config:
         orm_mode = True
+
+class BathroomResult(Bathroom):
+    """A bathroom in a list: nearby results carry their distance in km, search results their score."""
+    distance: Optional[float] = None
+    score: Optional[float] = None
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Optional, List
 from datetime import datetime
 
 class ReviewBase(BaseModel):
@@ -11,6 +11,10 @@ class ReviewBase(BaseModel):
 class ReviewCreate(ReviewBase):
     pass
 
+class ReviewImportItem(ReviewCreate):
+    """One line of an NDJSON import: a review to create or overwrite by id."""
+    id: int
+
 class Review(ReviewBase):
     id: int
     created_at: datetime
@@ -18,3 +22,7 @@ class Review(ReviewBase):
 
     class Config:
         orm_mode = True
+
+class ReviewSummaryRequest(BaseModel):
+    bathroom_ids: List[int]
+    latest: int = Field(3, ge=0, description="Number of most recent reviews to include per bathroom")
@@ -0,0 +1,66 @@
+"""
+Build the static tile packs served by /api/tiles.
+
+The bathrooms table is cut into slippy-map tiles of one zoom level, each
+written as a gzipped, content-hashed JSON file (see ``services.tiles``).
+Runs after the first only regenerate the tiles holding rows changed since the
+previous run; run with --full now and then (e.g. nightly) to also drop rows
+deleted from tiles nothing else changed in. --watch keeps running, building
+incrementally every SECONDS and fully every --full-every seconds.
+
+Usage (from the backend directory):
+    python scripts/build_tiles.py -o tiles
+    python scripts/build_tiles.py -o tiles --full
+    python scripts/build_tiles.py -o tiles --watch 60
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+from typing import List, Optional, Dict, Any
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.database import Database, database
+from config.settings import TILES_DIR, TILES_ZOOM, SPATIAL_INDEX_FULL_RELOAD_SECONDS
+from services.tile_service import TileService
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-o", "--output", default=TILES_DIR, help="Tile directory (default TILES_DIR)")
+    parser.add_argument("--zoom", type=int, default=TILES_ZOOM, help="Zoom level; changing it rebuilds everything")
+    parser.add_argument("--full", action="store_true", help="Re-read the whole table")
+    parser.add_argument("--watch", type=float, metavar="SECONDS", help="Keep building every SECONDS")
+    parser.add_argument("--full-every", type=float, default=SPATIAL_INDEX_FULL_RELOAD_SECONDS,
+                        help="With --watch, seconds between full builds")
+    args = parser.parse_args(argv)
+    if not args.output:
+        parser.error("no tile directory: pass -o or set TILES_DIR")
+    return args
+
+async def main(argv: Optional[List[str]] = None, db: Database = database) -> Dict[str, Any]:
+    """Run one build, or keep building with --watch."""
+    args = parse_args(argv)
+    result = await TileService.build(db, args.output, args.zoom, full=args.full)
+    full_built_at = time.monotonic()
+    while args.watch:
+        await asyncio.sleep(args.watch)
+        full = time.monotonic() - full_built_at >= args.full_every
+        try:
+            result = await TileService.build(db, args.output, args.zoom, full=full)
+        except Exception as e:
+            logger.error(f"Error building tiles: {e}")
+            continue
+        if full:
+            full_built_at = time.monotonic()
+    return result
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,76 +1,496 @@
 import os
+import json
+import math
+import uuid
 import logging
 import asyncio
-from typing import List, Dict, Any
+import argparse
+from typing import List, Dict, Any, Optional, NamedTuple, Set, Iterable
+from itertools import islice
 import sys
 
 # Add the parent directory to the path so we can import our modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from config.database import supabase
-from config.settings import DEFAULT_LATITUDE, DEFAULT_LONGITUDE
-from services.external_api import get_refuge_restrooms, transform_refuge_restroom
+import httpx
+
+from config.database import Database, database
+from config.settings import (
+    DEFAULT_LATITUDE,
+    DEFAULT_LONGITUDE,
+    REFUGE_RATE_LIMIT_PER_SECOND,
+    REFUGE_CACHE_PATH,
+    REFUGE_CACHE_TTL_SECONDS,
+)
+from services.external_api import (
+    TokenBucket,
+    refuge_cache,
+    refuge_client,
+    fetch_refuge_page,
+    transform_refuge_restroom,
+)
+from services.spatial_index import haversine_km
+from services.bulk_writer import BulkWriter, upsert_writer
+from services.http_cache import HttpCache
+from services.sync_state import SyncState, SyncReport, content_hash
 from models.bathroom import BathroomCreate
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-async def transform_and_store_bathrooms(restrooms: List[Dict[str, Any]]) -> None:
+# Named bounding boxes (min_lat, min_lng, max_lat, max_lng) for --region
+REGIONS = {
+    "boston": (DEFAULT_LATITUDE - 0.25, DEFAULT_LONGITUDE - 0.35, DEFAULT_LATITUDE + 0.25, DEFAULT_LONGITUDE + 0.35),
+    "us": (24.5, -124.8, 49.4, -66.9),
+    "alaska": (51.2, -179.9, 71.4, -129.9),
+    "hawaii": (18.9, -160.3, 22.3, -154.8),
+}
+
+DEFAULT_CHECKPOINT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".ingestion_checkpoint.json")
+DEFAULT_STATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".ingestion_state.sqlite3")
+DEFAULT_HTTP_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".refuge_cache.sqlite3")
+
+REFUGE_SOURCE = "refuge_restrooms"
+
+# Columns produced by transform_refuge_restroom, used to seed the sync state from the database
+TRANSFORMED_COLUMNS = (
+    "id, name, address, latitude, longitude, is_unisex, is_accessible, has_changing_table, "
+    "directions, comment, external_id, external_source"
+)
+
+# Refuge returns distances in miles
+KM_PER_MILE = 1.609344
+
+# Safety stop for a single tile; denser areas need a smaller --tile-degrees
+MAX_PAGES_PER_TILE = 200
+
+class Tile(NamedTuple):
+    min_lat: float
+    min_lng: float
+    max_lat: float
+    max_lng: float
+
+    @property
+    def key(self) -> str:
+        return f"{self.min_lat:.4f},{self.min_lng:.4f},{self.max_lat:.4f},{self.max_lng:.4f}"
+
+    @property
+    def center(self):
+        return (self.min_lat + self.max_lat) / 2, (self.min_lng + self.max_lng) / 2
+
+    @property
+    def radius_km(self) -> float:
+        """Distance from the center to the farthest corner."""
+        lat, lng = self.center
+        return max(haversine_km(lat, lng, corner_lat, corner_lng)
+                   for corner_lat in (self.min_lat, self.max_lat)
+                   for corner_lng in (self.min_lng, self.max_lng))
+
+    def contains(self, lat: float, lng: float) -> bool:
+        # Half-open so a restroom on a shared edge belongs to exactly one tile
+        return self.min_lat <= lat < self.max_lat and self.min_lng <= lng < self.max_lng
+
+def tile_bbox(bbox, tile_degrees: float) -> List[Tile]:
+    """Split a (min_lat, min_lng, max_lat, max_lng) box into square tiles."""
+    min_lat, min_lng, max_lat, max_lng = bbox
+    tiles = []
+    rows = max(1, math.ceil((max_lat - min_lat) / tile_degrees))
+    cols = max(1, math.ceil((max_lng - min_lng) / tile_degrees))
+    for row in range(rows):
+        for col in range(cols):
+            tiles.append(Tile(
+                min_lat + row * tile_degrees,
+                min_lng + col * tile_degrees,
+                min(max_lat, min_lat + (row + 1) * tile_degrees),
+                min(max_lng, min_lng + (col + 1) * tile_degrees),
+            ))
+    return tiles
+
+class Checkpoint:
+    """
+    Set of completed tiles, persisted as JSON after every tile.
+
+    A tile is only recorded once all of its rows have been upserted, so an
+    interrupted run resumes by skipping completed tiles and redoing the rest.
+    ``run_id`` survives resumes, so every tile of one logical run marks the
+    rows it sees with the same id.
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.completed: Set[str] = set()
+        self.run_id = uuid.uuid4().hex
+        if path and os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            self.completed = set(saved.get("completed", []))
+            self.run_id = saved.get("run_id", self.run_id)
+
+    def done(self, tile: Tile) -> bool:
+        return tile.key in self.completed
+
+    def mark(self, tile: Tile) -> None:
+        self.completed.add(tile.key)
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"run_id": self.run_id, "completed": sorted(self.completed)}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        self.completed = set()
+        self.run_id = uuid.uuid4().hex
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+class DeltaWriter:
+    """
+    Upserts only new or modified rows through a ``BulkWriter``.
+
+    Rows are compared with their content hash in the sync state; unchanged
+    rows are counted and skipped. Every row is marked as seen by the run up
+    front, so a failed write never gets a live row deleted as stale; hashes
+    are stored only once a row's batch is written, so rows that could not be
+    written are retried by the next run.
+    """
+
+    def __init__(self, db: Database, state: SyncState, run_id: str, batch_size: int = 100,
+                 max_in_flight: int = 4):
+        self.state = state
+        self.run_id = run_id
+        self.report = SyncReport()
+        self._upsert = upsert_writer(db, 'bathrooms', on_conflict='external_id, external_source')
+        self.bulk = BulkWriter(
+            self._write,
+            max_in_flight=max_in_flight,
+            batch_size=batch_size,
+            on_written=self._written,
+            on_failed=self._failed
+        )
+
+    async def add(self, rows: List[Dict[str, Any]]) -> None:
+        await self.bulk.add_many(self.state.classify(rows, self.run_id, self.report))
+
+    async def barrier(self) -> "asyncio.Future":
+        """Future resolving once every row added so far has been written or given up on."""
+        return await self.bulk.barrier()
+
+    async def flush(self) -> None:
+        await self.bulk.flush()
+
+    async def close(self) -> SyncReport:
+        bulk_report = await self.bulk.close()
+        logger.info(f"Upsert batches: {bulk_report.summary()}")
+        return self.report
+
+    async def _write(self, batch) -> None:
+        await self._upsert([row for row, _, _ in batch])
+
+    def _written(self, batch) -> None:
+        self.state.record(batch, self.run_id)
+        inserted = sum(1 for _, _, is_new in batch if is_new)
+        self.report.inserted += inserted
+        self.report.updated += len(batch) - inserted
+
+    def _failed(self, item, error: Exception) -> None:
+        self.report.failed += 1
+
+async def delete_stale(db: Database, state: SyncState, bbox, run_id: str, report: SyncReport,
+                       source: str = REFUGE_SOURCE) -> None:
+    """Delete rows inside a fully synced region that the run no longer saw upstream."""
+    stale = state.stale(source, bbox, run_id)
+    for i in range(0, len(stale), 100):
+        chunk = stale[i:i+100]
+        try:
+            await db.execute(db.table('bathrooms').delete().eq('external_source', source).in_('external_id', chunk))
+        except Exception as e:
+            logger.error(f"Error deleting stale bathrooms: {e}")
+            report.failed += len(chunk)
+            continue
+        state.forget(source, chunk)
+        report.deleted += len(chunk)
+
+async def seed_sync_state(db: Database, state: SyncState, source: str = REFUGE_SOURCE, page_size: int = 1000) -> int:
     """
-    Transform restroom data and store it in Supabase.
-    
+    Fill the sync state from rows already in the database.
+
+    Lets the first delta run against an existing table skip rows that are
+    already up to date instead of rewriting all of them.
+
+    Returns:
+        Number of rows recorded
+    """
+    recorded = 0
+    last_id = None
+    while True:
+        query = db.table('bathrooms').select(TRANSFORMED_COLUMNS).eq('external_source', source).order('id').limit(page_size)
+        if last_id is not None:
+            query = query.gt('id', last_id)
+        response = await db.execute(query)
+        rows = response.data
+        if not rows:
+            break
+        last_id = rows[-1]['id']
+        transformed = [{k: v for k, v in row.items() if k != 'id'} for row in rows]
+        # Recorded as not yet seen, so rows gone upstream are still deleted
+        state.record([(row, content_hash(row), False) for row in transformed], run_id=None)
+        recorded += len(rows)
+        if len(rows) < page_size:
+            break
+    logger.info(f"Seeded sync state with {recorded} existing rows")
+    return recorded
+
+async def transform_and_store_bathrooms(restrooms: Iterable[Dict[str, Any]], db: Database = database,
+                                        state: Optional[SyncState] = None, run_id: Optional[str] = None,
+                                        chunk_size: int = 500) -> SyncReport:
+    """
+    Transform restroom data and store the new or changed rows in Supabase.
+
+    Restrooms are transformed and handed to the writer ``chunk_size`` at a
+    time, so upserts start before the input has been fully read.
+
     Args:
-        restrooms: List of restroom data from Refuge Restrooms API
+        restrooms: Restroom data from Refuge Restrooms API, as a list or any iterable
+        db: Database handle
+        state: Content hashes of previously synced rows
+        run_id: Id of the sync run, recorded as the last run to see each row
+        chunk_size: Restrooms transformed and compared per step
+
+    Returns:
+        Inserted/updated/unchanged counts
+    """
+    state = state if state is not None else SyncState(DEFAULT_STATE_PATH)
+    writer = DeltaWriter(db, state, run_id or uuid.uuid4().hex)
+
+    items = iter(restrooms)
+    while True:
+        chunk = list(islice(items, chunk_size))
+        if not chunk:
+            break
+        await writer.add([transform_refuge_restroom(item) for item in chunk])
+    return await writer.close()
+
+async def fetch_tile(client: httpx.AsyncClient, tile: Tile, rows: asyncio.Queue,
+                     rate_limiter: TokenBucket, per_page: int, cache: Optional[HttpCache] = None) -> bool:
+    """
+    Page outward from a tile's center and stream the restrooms inside it.
+
+    Refuge orders by_location results by distance, so paging stops once a
+    page reaches past the tile's corner or comes back short.
+
+    Returns:
+        False if the tile was cut off at ``MAX_PAGES_PER_TILE``
+    """
+    lat, lng = tile.center
+    radius_km = tile.radius_km
+    seen = set()
+    for page in range(1, MAX_PAGES_PER_TILE + 1):
+        items = await fetch_refuge_page(client, lat, lng, page, per_page, rate_limiter=rate_limiter, cache=cache)
+        inside = []
+        for item in items:
+            try:
+                item_lat = float(item.get("latitude"))
+                item_lng = float(item.get("longitude"))
+            except (TypeError, ValueError):
+                continue
+            if tile.contains(item_lat, item_lng) and item.get("id") not in seen:
+                seen.add(item.get("id"))
+                inside.append(transform_refuge_restroom(item))
+        if inside:
+            await rows.put(inside)
+
+        if len(items) < per_page:
+            return True
+        last = items[-1]
+        if last.get("distance") is not None:
+            farthest_km = float(last["distance"]) * KM_PER_MILE
+        else:
+            farthest_km = haversine_km(lat, lng, float(last["latitude"]), float(last["longitude"]))
+        if farthest_km > radius_km:
+            return True
+    logger.warning(f"Tile {tile.key} hit {MAX_PAGES_PER_TILE} pages; use a smaller --tile-degrees")
+    return False
+
+async def ingest_tiles(
+    tiles: List[Tile],
+    db: Database = database,
+    checkpoint: Optional[Checkpoint] = None,
+    concurrency: int = 4,
+    rate: float = REFUGE_RATE_LIMIT_PER_SECOND,
+    per_page: int = 100,
+    batch_size: int = 100,
+    client: Optional[httpx.AsyncClient] = None,
+    state: Optional[SyncState] = None,
+    write_concurrency: int = 4,
+    cache: Optional[HttpCache] = None
+) -> SyncReport:
     """
-    bathrooms_to_insert = []
-    
-    for item in restrooms:
-        # Transform the restroom data
-        bathroom_data = transform_refuge_restroom(item)
-        bathrooms_to_insert.append(bathroom_data)
-    
-    # Insert bathrooms in batches to avoid hitting API limits
-    batch_size = 100
-    for i in range(0, len(bathrooms_to_insert), batch_size):
-        batch = bathrooms_to_insert[i:i+batch_size]
-        
+    Fetch tiles concurrently and upsert their new or changed restrooms as they arrive.
+
+    ``concurrency`` fetchers share one pooled client and one token bucket.
+    Each fetched page is streamed through a bounded queue to a single
+    ``DeltaWriter``, which skips unchanged rows and upserts the rest with
+    ``write_concurrency`` adaptive batches in flight. A tile is marked
+    complete in the checkpoint once every row queued before it has been
+    written, without holding back rows of later tiles. Tiles cut off at
+    ``MAX_PAGES_PER_TILE`` are not marked complete.
+
+    Args:
+        tiles: Tiles to ingest; tiles already in the checkpoint are skipped
+        db: Database handle
+        checkpoint: Progress store for resuming interrupted runs
+        concurrency: Number of tiles fetched at once
+        rate: Refuge requests per second across all fetchers
+        per_page: Refuge page size
+        batch_size: Initial rows per upsert
+        client: HTTP client to use instead of a new ``refuge_client``
+        state: Content hashes of previously synced rows
+        write_concurrency: Upsert batches in flight
+        cache: Refuge response cache, so re-runs only revalidate pages
+
+    Returns:
+        Inserted/updated/unchanged counts for the tiles ingested
+    """
+    checkpoint = checkpoint if checkpoint is not None else Checkpoint(None)
+    delta = DeltaWriter(db, state if state is not None else SyncState(), checkpoint.run_id, batch_size,
+                        max_in_flight=write_concurrency)
+    pending = [tile for tile in tiles if not checkpoint.done(tile)]
+    logger.info(f"Ingesting {len(pending)} tiles ({len(tiles) - len(pending)} already done)")
+    if not pending:
+        return delta.report
+
+    tile_queue: asyncio.Queue = asyncio.Queue()
+    for tile in pending:
+        tile_queue.put_nowait(tile)
+    # Items are lists of rows, or a Tile once all of its rows have been queued
+    rows: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 4)
+    rate_limiter = TokenBucket(rate)
+
+    async def fetcher(http: httpx.AsyncClient):
+        while True:
+            try:
+                tile = tile_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                if await fetch_tile(http, tile, rows, rate_limiter, per_page, cache):
+                    await rows.put(tile)
+            except httpx.HTTPError as e:
+                # Left out of the checkpoint, so the next run retries it
+                logger.error(f"Error fetching tile {tile.key}: {e}")
+
+    completed = 0
+
+    async def mark_when_written(written: asyncio.Future, tile: Tile):
+        nonlocal completed
         try:
-            # Use upsert to update existing bathrooms or insert new ones
-            response = supabase.table('bathrooms').upsert(
-                batch, 
-                on_conflict='external_id, external_source'
-            ).execute()
-            
-            if hasattr(response, 'error') and response.error:
-                logger.error(f"Error upserting bathrooms: {response.error}")
-            else:
-                logger.info(f"Successfully upserted {len(batch)} bathrooms")
-        
+            await written
         except Exception as e:
-            logger.error(f"Error upserting bathrooms: {e}")
+            logger.error(f"Error writing tile {tile.key}: {e}")
+            return
+        checkpoint.mark(tile)
+        completed += 1
+        logger.info(f"Completed tile {tile.key} ({completed}/{len(pending)})")
 
-async def main():
+    async def writer():
+        marks = []
+        while True:
+            item = await rows.get()
+            if item is None:
+                break
+            if isinstance(item, Tile):
+                marks.append(asyncio.create_task(mark_when_written(await delta.barrier(), item)))
+                continue
+            await delta.add(item)
+        await delta.close()
+        await asyncio.gather(*marks)
+
+    own_client = client is None
+    http = refuge_client(max_connections=concurrency) if own_client else client
+    writer_task = asyncio.create_task(writer())
+    try:
+        await asyncio.gather(*(fetcher(http) for _ in range(concurrency)))
+        await rows.put(None)
+        await writer_task
+    finally:
+        writer_task.cancel()
+        if own_client:
+            await http.aclose()
+    return delta.report
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Ingest Refuge Restrooms data into Supabase")
+    area = parser.add_mutually_exclusive_group()
+    area.add_argument("--region", choices=sorted(REGIONS), default="boston", help="Named region to ingest")
+    area.add_argument("--bbox", help="min_lat,min_lng,max_lat,max_lng to ingest")
+    parser.add_argument("--tile-degrees", type=float, default=0.5, help="Tile edge length in degrees")
+    parser.add_argument("--concurrency", type=int, default=4, help="Tiles fetched at once")
+    parser.add_argument("--rate", type=float, default=REFUGE_RATE_LIMIT_PER_SECOND, help="Refuge requests per second")
+    parser.add_argument("--per-page", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=100, help="Initial rows per upsert; adapts to latency")
+    parser.add_argument("--write-concurrency", type=int, default=4, help="Upsert batches in flight")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT_PATH, help="Progress file for resuming")
+    parser.add_argument("--reset", action="store_true", help="Ignore and clear existing progress")
+    parser.add_argument("--state", default=DEFAULT_STATE_PATH, help="Sync state database for change detection")
+    parser.add_argument("--seed-state", action="store_true", help="Load content hashes of existing rows first")
+    parser.add_argument("--no-delete", action="store_true", help="Keep rows that disappeared upstream")
+    parser.add_argument("--http-cache", default=REFUGE_CACHE_PATH or DEFAULT_HTTP_CACHE_PATH,
+                        help="On-disk cache of Refuge responses")
+    parser.add_argument("--http-cache-ttl", type=float, default=REFUGE_CACHE_TTL_SECONDS,
+                        help="Seconds a cached page is used before it is revalidated")
+    parser.add_argument("--no-http-cache", action="store_true", help="Always fetch pages from Refuge")
+    return parser.parse_args(argv)
+
+async def main(argv: Optional[List[str]] = None, db: Database = database,
+               client: Optional[httpx.AsyncClient] = None):
     """Main function to fetch and store bathroom data."""
+    args = parse_args(argv)
     try:
-        # Use a default location (e.g., Boston, MA) for initial data load
-        default_lat = DEFAULT_LATITUDE
-        default_lng = DEFAULT_LONGITUDE
-        
-        logger.info("Starting bathroom data ingestion")
-        
-        # Fetch restrooms from Refuge Restrooms API
-        restrooms = await get_refuge_restrooms(default_lat, default_lng, per_page=100, max_results=1000)
-        
-        if restrooms:
-            # Transform and store bathrooms
-            await transform_and_store_bathrooms(restrooms)
-            logger.info(f"Successfully processed {len(restrooms)} restrooms")
+        bbox = tuple(float(v) for v in args.bbox.split(",")) if args.bbox else REGIONS[args.region]
+        tiles = tile_bbox(bbox, args.tile_degrees)
+        checkpoint = Checkpoint(args.checkpoint)
+        if args.reset:
+            checkpoint.clear()
+        state = SyncState(args.state)
+        cache = None if args.no_http_cache else refuge_cache(args.http_cache, args.http_cache_ttl)
+        if args.seed_state:
+            await seed_sync_state(db, state)
+
+        logger.info(f"Starting bathroom data ingestion for {bbox} in {len(tiles)} tiles")
+
+        report = await ingest_tiles(
+            tiles,
+            db=db,
+            checkpoint=checkpoint,
+            concurrency=args.concurrency,
+            rate=args.rate,
+            per_page=args.per_page,
+            batch_size=args.batch_size,
+            client=client,
+            state=state,
+            write_concurrency=args.write_concurrency,
+            cache=cache
+        )
+        if cache is not None:
+            logger.info(f"Refuge response cache: {cache.stats()}")
+            cache.close()
+
+        remaining = sum(1 for tile in tiles if not checkpoint.done(tile))
+        if not remaining:
+            # Every tile of the region was seen by this run, so anything it missed is gone upstream
+            if not args.no_delete:
+                await delete_stale(db, state, bbox, checkpoint.run_id, report)
+            # Finished; the next run starts from scratch
+            checkpoint.clear()
+            logger.info(f"Bathroom data ingestion completed: {report.as_dict()}")
         else:
-            logger.warning("No restrooms fetched from Refuge Restrooms API")
-        
-        logger.info("Bathroom data ingestion completed")
-    
+            logger.warning(f"Ingestion incomplete ({remaining}/{len(tiles)} tiles left); rerun to resume. "
+                           f"So far: {report.as_dict()}")
+        state.close()
+        return report
+
     except Exception as e:
         logger.error(f"Error in bathroom data ingestion: {e}")
 
@@ -0,0 +1,81 @@
+"""
+Find bathrooms listed more than once (e.g. by a user and by Refuge) and merge them.
+
+The whole table is compared with grid blocking, so only bathrooms within
+DEDUP_MAX_METERS of each other are ever compared. Merge decisions are written
+as NDJSON, one {keep_id, drop_id, distance_m, name_similarity,
+address_similarity} object per line; with --apply they are merged right away.
+A reviewed decisions file can be applied later with --input.
+
+Usage (from the backend directory):
+    python scripts/dedup.py -o duplicates.ndjson
+    python scripts/dedup.py --apply
+    python scripts/dedup.py --apply -i duplicates.ndjson
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+from typing import List, Optional, Dict, Any
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.database import Database, database
+from services.dedup import MergeDecision
+from services.dedup_service import DedupService
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def read_decisions(path: str) -> List[MergeDecision]:
+    f = sys.stdin if path == "-" else open(path)
+    try:
+        return [MergeDecision(**json.loads(line)) for line in f if line.strip()]
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def write_decisions(path: str, decisions: List[MergeDecision]) -> None:
+    f = sys.stdout if path == "-" else open(path, "w")
+    try:
+        for decision in decisions:
+            f.write(json.dumps(decision.as_dict()) + "\n")
+    finally:
+        if f is not sys.stdout:
+            f.close()
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-i", "--input", help="Apply the decisions in this NDJSON file instead of finding them")
+    parser.add_argument("-o", "--output", help="Write the decisions found to this NDJSON file; - for stdout")
+    parser.add_argument("--apply", action="store_true", help="Merge the duplicates")
+    parser.add_argument("--concurrency", type=int, default=4, help="Bathrooms merged into at once")
+    return parser.parse_args(argv)
+
+async def main(argv: Optional[List[str]] = None, db: Database = database) -> Dict[str, Any]:
+    """Run one dedup pass."""
+    args = parse_args(argv)
+    if args.input and not args.apply:
+        raise SystemExit("--input only makes sense with --apply")
+    started = time.perf_counter()
+    if args.input:
+        decisions = read_decisions(args.input)
+    else:
+        decisions = await DedupService.find_duplicates(db)
+        logger.info(f"Found {len(decisions)} duplicate bathrooms in {time.perf_counter() - started:.1f}s")
+        if args.output:
+            write_decisions(args.output, decisions)
+
+    result: Dict[str, Any] = {"decisions": len(decisions)}
+    if args.apply:
+        result.update(await DedupService.merge_all(db, decisions, concurrency=args.concurrency))
+        logger.info(f"Applied merges in {time.perf_counter() - started:.1f}s: {result}")
+    return result
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+"""
+Export tables to NDJSON files and import them back, straight against the database.
+
+Files ending in .gz are gzipped on export; imports detect gzip by content.
+"-" reads stdin or writes stdout. Both directions stream, so memory use does
+not grow with the table.
+
+Usage (from the backend directory):
+    python scripts/transfer.py export bathrooms -o backups/bathrooms.ndjson.gz
+    python scripts/transfer.py import bathrooms -i backups/bathrooms.ndjson.gz
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+from typing import List, Optional, AsyncIterator, BinaryIO
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.database import Database, database
+from config.settings import TRANSFER_PAGE_SIZE, TRANSFER_BATCH_SIZE
+from services.transfer_service import TransferService
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Bytes read from the input file at a time
+READ_CHUNK_BYTES = 1024 * 1024
+
+async def read_chunks(f: BinaryIO) -> AsyncIterator[bytes]:
+    while True:
+        chunk = f.read(READ_CHUNK_BYTES)
+        if not chunk:
+            return
+        yield chunk
+        # Let the upserts in flight make progress between reads
+        await asyncio.sleep(0)
+
+async def export_table(db: Database, table: str, output: str, page_size: int, after_id: Optional[int]) -> int:
+    """
+    Write a table to an NDJSON file.
+
+    Returns:
+        Bytes written
+    """
+    compress = output.endswith(".gz")
+    f = sys.stdout.buffer if output == "-" else open(output, "wb")
+    written = 0
+    try:
+        pages = TransferService.export_pages(db, table, page_size, after_id)
+        async for chunk in TransferService.encode_ndjson(pages, compress=compress):
+            f.write(chunk)
+            written += len(chunk)
+    finally:
+        if f is not sys.stdout.buffer:
+            f.close()
+    return written
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Write a table to an NDJSON file")
+    export.add_argument("table", choices=sorted(TransferService.TABLES))
+    export.add_argument("-o", "--output", default="-", help="Output file; .gz to compress, - for stdout")
+    export.add_argument("--page-size", type=int, default=TRANSFER_PAGE_SIZE, help="Rows per database query")
+    export.add_argument("--after-id", type=int, help="Only export rows with a larger id")
+    load = commands.add_parser("import", help="Upsert rows from an NDJSON file into a table")
+    load.add_argument("table", choices=sorted(TransferService.TABLES))
+    load.add_argument("-i", "--input", default="-", help="Input file, plain or gzip; - for stdin")
+    load.add_argument("--batch-size", type=int, default=TRANSFER_BATCH_SIZE, help="Initial rows per upsert")
+    load.add_argument("--write-concurrency", type=int, default=4, help="Upsert batches in flight")
+    return parser.parse_args(argv)
+
+async def main(argv: Optional[List[str]] = None, db: Database = database):
+    """Run one export or import."""
+    args = parse_args(argv)
+    started = time.perf_counter()
+    if args.command == "export":
+        size = await export_table(db, args.table, args.output, args.page_size, args.after_id)
+        logger.info(f"Exported {args.table} ({size / 1e6:.1f} MB) in {time.perf_counter() - started:.1f}s")
+        return size
+
+    f = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    try:
+        report = await TransferService.import_ndjson(db, args.table, read_chunks(f), args.batch_size,
+                                                     max_in_flight=args.write_concurrency)
+    finally:
+        if f is not sys.stdin.buffer:
+            f.close()
+    logger.info(f"Imported {args.table} in {time.perf_counter() - started:.1f}s: {report.as_dict()}")
+    return report
+
+if __name__ == "__main__":
+    asyncio.run(main())
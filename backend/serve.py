@@ -0,0 +1,142 @@
+"""
+Production entry point: several uvicorn workers sharing one bathrooms snapshot.
+
+This process reads the bathrooms table, writes it to a columnar snapshot file
+(see ``services.snapshot``) and keeps rewriting it as rows change, the same
+way ``maintain_index`` keeps a single process's index fresh. Every worker
+maps that file read-only instead of loading its own copy of the table, so
+adding workers adds CPU for nearby queries without multiplying memory. Put
+the snapshot on a tmpfs such as /dev/shm so it never touches disk.
+
+Workers serve nearby queries from the database RPC until the first snapshot
+is published, and switch to each newer one within
+``SPATIAL_SNAPSHOT_CHECK_SECONDS``.
+
+Usage (from the backend directory):
+    python serve.py --workers 4 --port 8000
+"""
+import os
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+from typing import Dict, Any, Optional
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("serve")
+
+from config.settings import (
+    SERVE_WORKERS,
+    SPATIAL_SNAPSHOT_PATH,
+    SPATIAL_INDEX_CELL_DEGREES,
+    SPATIAL_INDEX_REFRESH_SECONDS,
+    SPATIAL_INDEX_FULL_RELOAD_SECONDS,
+)
+from config.database import Database
+from services.bathroom_service import BathroomService
+from services.snapshot import SnapshotIndex
+
+
+def default_snapshot_path() -> str:
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, "saferoute-bathrooms.snapshot")
+
+
+class SnapshotPublisher:
+    """
+    Keeps the shared snapshot in step with the bathrooms table.
+
+    The rows live only in this process; a new snapshot is written whenever
+    they change.
+    """
+
+    def __init__(self, db: Database, path: str, cell_degrees: float = SPATIAL_INDEX_CELL_DEGREES):
+        self.db = db
+        self.writer = SnapshotIndex(path, cell_degrees)
+        self.rows: Dict[int, Dict[str, Any]] = {}
+        self.last_updated_at: Optional[str] = None
+        self.full_fetched_at: Optional[float] = None
+        self.published = threading.Event()
+
+    def _track_updated_at(self, row: Dict[str, Any]) -> None:
+        updated_at = row.get("updated_at")
+        if updated_at and (self.last_updated_at is None or str(updated_at) > self.last_updated_at):
+            self.last_updated_at = str(updated_at)
+
+    def _publish(self, fetched_at: float) -> None:
+        started = time.perf_counter()
+        count = self.writer.write(self.rows.values(), fetched_at=fetched_at, full_fetched_at=self.full_fetched_at)
+        self.published.set()
+        logger.info(f"Published snapshot of {count} bathrooms to {self.writer.path} "
+                    f"in {time.perf_counter() - started:.2f}s")
+
+    async def publish_full(self) -> None:
+        """Read the whole table and publish it."""
+        fetched_at = time.time()
+        rows = await BathroomService.fetch_index_rows(self.db)
+        self.rows = {row["id"]: row for row in rows}
+        self.last_updated_at = None
+        for row in rows:
+            self._track_updated_at(row)
+        self.full_fetched_at = fetched_at
+        self._publish(fetched_at)
+
+    async def publish_changes(self) -> int:
+        """
+        Publish rows updated since the last read, if there are any.
+
+        Returns:
+            Number of changed rows
+        """
+        fetched_at = time.time()
+        rows = await BathroomService.fetch_changed_rows(self.db, self.last_updated_at)
+        for row in rows:
+            self.rows[row["id"]] = row
+            self._track_updated_at(row)
+        if rows:
+            self._publish(fetched_at)
+        return len(rows)
+
+    async def run(self) -> None:
+        """Publish the full table every ``SPATIAL_INDEX_FULL_RELOAD_SECONDS`` and changes in between."""
+        while True:
+            try:
+                stale = self.full_fetched_at is None or \
+                    time.time() - self.full_fetched_at >= SPATIAL_INDEX_FULL_RELOAD_SECONDS
+                if stale:
+                    await self.publish_full()
+                else:
+                    await self.publish_changes()
+            except Exception as e:
+                logger.error(f"Error publishing bathrooms snapshot: {e}")
+            await asyncio.sleep(SPATIAL_INDEX_REFRESH_SECONDS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS)
+    parser.add_argument("--snapshot", default=SPATIAL_SNAPSHOT_PATH or default_snapshot_path(),
+                        help="Snapshot file shared with the workers")
+    parser.add_argument("--wait", type=float, default=120.0,
+                        help="Seconds to wait for the first snapshot before starting workers anyway")
+    args = parser.parse_args()
+
+    publisher = SnapshotPublisher(Database(), args.snapshot)
+    threading.Thread(target=lambda: asyncio.run(publisher.run()), name="snapshot-publisher", daemon=True).start()
+    if not os.path.exists(args.snapshot) and not publisher.published.wait(args.wait):
+        logger.warning(f"No snapshot after {args.wait:.0f}s, starting workers without it")
+
+    # Inherited by the worker processes, which read it when importing the settings
+    os.environ["SPATIAL_SNAPSHOT_PATH"] = args.snapshot
+    # Production workers trust their rows and skip response validation, unless asked otherwise
+    os.environ.setdefault("RESPONSE_VALIDATION", "false")
+    import uvicorn
+    uvicorn.run("app:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,79 +1,661 @@
-from typing import List, Optional, Dict, Any
-from config.database import supabase
-from models.bathroom import Bathroom, BathroomCreate, BathroomUpdate
+import time
+import asyncio
+import logging
+from typing import List, Optional, Dict, Any, Tuple, Sequence
+from config.database import Database
+from config.settings import (
+    SPATIAL_INDEX_ENABLED,
+    SPATIAL_INDEX_CELL_DEGREES,
+    SPATIAL_INDEX_REFRESH_SECONDS,
+    SPATIAL_INDEX_FULL_RELOAD_SECONDS,
+    SPATIAL_INDEX_PAGE_SIZE,
+    SPATIAL_SNAPSHOT_PATH,
+    SPATIAL_SNAPSHOT_CHECK_SECONDS,
+    NEARBY_FILTER_OVERFETCH,
+    NEARBY_RPC_MAX_FETCH,
+    NEAREST_RING_KM,
+    NEAREST_MAX_RADIUS_KM,
+    NEARBY_CACHE_ENABLED,
+    NEARBY_CACHE_TTL_SECONDS,
+    NEARBY_CACHE_MAX_BYTES,
+    NEARBY_CACHE_COORD_STEP_DEGREES,
+    NEARBY_CACHE_RADIUS_STEP_KM,
+    CLUSTER_MAX_ZOOM,
+    CLUSTER_CELL_PIXELS,
+    CLUSTER_LEVELS,
+    VIEWPORT_MAX_BATHROOMS,
+    VIEWPORT_MAX_FETCH,
+    VECTOR_INDEX_ENABLED,
+    VECTOR_INDEX_REBUILD_SECONDS,
+    ROUTE_MAX_SAMPLES,
+    BULK_BATCH_SIZE,
+    BULK_MAX_IN_FLIGHT,
+    SEARCH_INDEX_ENABLED,
+    SEARCH_INDEX_REBUILD_SECONDS,
+    SEARCH_FUZZY_THRESHOLD,
+    SEARCH_MAX_EXPANSIONS,
+    SEARCH_DISTANCE_SCALE_KM,
+)
+from pydantic import ValidationError
+from models.bathroom import Bathroom, BathroomCreate, BathroomUpdate, BathroomUpdateItem
+from services.spatial_index import SpatialIndex, INDEX_COLUMNS, attribute_flags, filter_mask, densify_path, haversine_km
+from services.snapshot import SnapshotIndex
+from services.vector_index import VectorIndex, NUMPY_AVAILABLE
+from services.text_index import TextIndex
+from services.query_cache import NearbyQueryCache
+from services.clustering import ClusterGrid, lng_ranges, half_star_floor
+from services.metrics import span
+from services.bulk_writer import BulkWriter
+
+logger = logging.getLogger(__name__)
+
+# Columns an upsert must carry for rows that already exist (NOT NULL in the bathrooms table)
+BULK_REQUIRED_COLUMNS = ('name', 'latitude', 'longitude')
+
+# Relative slack past the radius and before the cursor when asking the index, whose
+# distances differ from haversine_km's in the last digits; see BathroomService._nearby_page
+DISTANCE_SLACK = 1e-9
+# Rows fetched past a page's limit to make up for those the slack lets back in
+NEARBY_PAGE_SLACK_ROWS = 8
+
+# Process-wide index of the bathrooms table, or None when disabled. Workers
+# started by serve.py map the shared snapshot instead of loading their own.
+bathroom_index: Optional[SpatialIndex] = None
+if SPATIAL_SNAPSHOT_PATH:
+    bathroom_index = SnapshotIndex(SPATIAL_SNAPSHOT_PATH, SPATIAL_INDEX_CELL_DEGREES)
+elif SPATIAL_INDEX_ENABLED:
+    bathroom_index = SpatialIndex(SPATIAL_INDEX_CELL_DEGREES)
+
+# Pre-aggregated viewport clusters, maintained alongside an in-process index.
+# Snapshot workers cluster the mapped points per request instead.
+cluster_grid: Optional[ClusterGrid] = ClusterGrid(SPATIAL_INDEX_CELL_DEGREES, CLUSTER_LEVELS) \
+    if bathroom_index is not None and not isinstance(bathroom_index, SnapshotIndex) else None
+
+# NumPy engine for batch queries, built from bathroom_index on demand; see BathroomService._vector_index
+vector_index: Optional[VectorIndex] = None
+vector_index_version: Optional[int] = None
+vector_index_built_at = 0.0
+vector_index_lock = asyncio.Lock()
+
+# Text index for search when SEARCH_INDEX_ENABLED, loaded and updated along with
+# the spatial index (or on its own when that is disabled). Snapshot workers build
+# it from the mapped rows on demand instead, one private copy per worker; see
+# BathroomService._text_index
+TEXT_INDEX_OPTIONS = {
+    "fuzzy_threshold": SEARCH_FUZZY_THRESHOLD,
+    "max_expansions": SEARCH_MAX_EXPANSIONS,
+    "distance_scale_km": SEARCH_DISTANCE_SCALE_KM,
+}
+text_index: Optional[TextIndex] = TextIndex(**TEXT_INDEX_OPTIONS) \
+    if SEARCH_INDEX_ENABLED and not isinstance(bathroom_index, SnapshotIndex) else None
+# When the snapshot the text index was built from was mapped
+text_index_snapshot: Optional[float] = None
+text_index_built_at = 0.0
+text_index_lock = asyncio.Lock()
+
+# Process-wide cache of nearby query results, or None when disabled
+nearby_cache: Optional[NearbyQueryCache] = NearbyQueryCache(
+    ttl_seconds=NEARBY_CACHE_TTL_SECONDS,
+    max_bytes=NEARBY_CACHE_MAX_BYTES,
+    coord_step_degrees=NEARBY_CACHE_COORD_STEP_DEGREES,
+    radius_step_km=NEARBY_CACHE_RADIUS_STEP_KM
+) if NEARBY_CACHE_ENABLED else None
 
 class BathroomService:
     @staticmethod
     async def get_bathrooms_by_location(
+        db: Database,
         latitude: float, 
         longitude: float, 
-        radius: float = 5.0, 
+        radius: Optional[float] = 5.0, 
         limit: int = 50,
         rating_min: Optional[float] = None,
         is_unisex: Optional[bool] = None,
         is_accessible: Optional[bool] = None,
-        has_changing_table: Optional[bool] = None
+        has_changing_table: Optional[bool] = None,
+        after: Optional[Tuple[float, int]] = None
     ) -> List[Dict[str, Any]]:
         """
-        Get bathrooms within a radius of a location.
+        Get bathrooms within a radius of a location, nearest first.
         
         Args:
+            db: Database handle
             latitude: User's latitude
             longitude: User's longitude
-            radius: Search radius in kilometers
+            radius: Search radius in kilometers; None for the ``limit`` nearest
+                matches at any distance up to ``NEAREST_MAX_RADIUS_KM``
             limit: Maximum number of results to return
             rating_min: Minimum rating filter
             is_unisex: Filter for unisex bathrooms
             is_accessible: Filter for accessible bathrooms
             has_changing_table: Filter for bathrooms with changing tables
+            after: (distance, id) of the last row of the previous page
             
         Returns:
-            List of bathrooms within the radius
+            List of bathrooms within the radius, ordered by (distance, id)
         """
-        # Log the filter parameters for debugging
-        print(f"Fetching bathrooms with filters: rating_min={rating_min}, is_unisex={is_unisex}, is_accessible={is_accessible}, has_changing_table={has_changing_table}")
+        logger.debug(
+            f"Fetching bathrooms with filters: rating_min={rating_min}, is_unisex={is_unisex}, "
+            f"is_accessible={is_accessible}, has_changing_table={has_changing_table}"
+        )
+        flag_mask, flag_value = filter_mask(is_unisex, is_accessible, has_changing_table)
+        # Deep pages are rarely asked for twice; only first pages go through the cache
+        if nearby_cache is None or after is not None:
+            return await BathroomService._nearby_page(
+                db, latitude, longitude, radius, limit, rating_min, flag_mask, flag_value, after
+            )
         
-        # First, get bathrooms within the radius using the stored procedure
-        response = supabase.rpc('nearby_bathrooms', {
-            'lat': latitude,
-            'lng': longitude,
-            'radius_km': radius,
-            'limit_val': limit
-        }).execute()
+        # Nearly identical map pans share one entry, fetched around the snapped center
+        reach = radius if radius is not None else NEAREST_MAX_RADIUS_KM
+        snapped_lat, snapped_lng, snapped_radius = nearby_cache.quantize(latitude, longitude, reach)
+        cache_key = (snapped_lat, snapped_lng, snapped_radius if radius is not None else None, limit,
+                     rating_min, is_unisex, is_accessible, has_changing_table)
+        cached = nearby_cache.lookup(cache_key, latitude, longitude, reach, limit)
+        if cached is not None:
+            return cached
         
-        if hasattr(response, 'error') and response.error:
-            raise Exception(f"Error fetching bathrooms: {response.error}")
+        # Reach past the snapped radius by the snapping error, and past the limit, so the
+        # entry answers every center that snaps to it
+        fetch_radius = snapped_radius + nearby_cache.snap_error_km
+        fetch_limit = limit * 2
+        rows = await BathroomService._run_nearby(
+            db, snapped_lat, snapped_lng, fetch_radius if radius is not None else None, fetch_limit,
+            rating_min, flag_mask, flag_value, max_radius_km=fetch_radius
+        )
+        complete_km = rows[-1]['distance'] if len(rows) == fetch_limit else fetch_radius
+        nearby_cache.put(cache_key, snapped_lat, snapped_lng, fetch_radius, rows, complete_km)
+        bathrooms = nearby_cache.resolve(rows, complete_km, latitude, longitude, reach, limit)
+        if bathrooms is None:
+            # Too many matches crowd the snapped center's limit; run at the real one
+            bathrooms = await BathroomService._nearby_page(
+                db, latitude, longitude, radius, limit, rating_min, flag_mask, flag_value
+            )
+        return bathrooms
+
+    @staticmethod
+    async def _nearby_page(
+        db: Database,
+        latitude: float,
+        longitude: float,
+        radius: Optional[float],
+        limit: int,
+        rating_min: Optional[float],
+        flag_mask: int,
+        flag_value: int,
+        after: Optional[Tuple[float, int]] = None,
+        max_radius_km: float = NEAREST_MAX_RADIUS_KM
+    ) -> List[Dict[str, Any]]:
+        """
+        Run a nearby query with every distance measured by ``haversine_km`` from the center.
+        
+        Cached pages are measured that way (see ``NearbyQueryCache.resolve``),
+        so uncached pages and cursors have to be too: the index's distances
+        differ in the last digits, and a row at a page boundary would be
+        returned twice or skipped. The index is asked ``DISTANCE_SLACK`` past
+        the radius and before the cursor, and its rows re-checked here.
+        """
+        reach = radius if radius is not None else max_radius_km
+        loose_radius = radius * (1 + DISTANCE_SLACK) + DISTANCE_SLACK if radius is not None else None
+        loose_after = (after[0] * (1 - DISTANCE_SLACK) - DISTANCE_SLACK, -1) if after is not None else None
+        fetch = limit + NEARBY_PAGE_SLACK_ROWS
+        while True:
+            rows = await BathroomService._run_nearby(
+                db, latitude, longitude, loose_radius, fetch, rating_min, flag_mask, flag_value, loose_after,
+                max_radius_km=reach * (1 + DISTANCE_SLACK) + DISTANCE_SLACK
+            )
+            page = []
+            for row in rows:
+                row['distance'] = haversine_km(latitude, longitude, row['latitude'], row['longitude'])
+                if row['distance'] <= reach and (after is None or (row['distance'], row['id']) > after):
+                    page.append(row)
+            page.sort(key=lambda b: (b['distance'], b['id']))
+            if len(page) >= limit or len(rows) < fetch:
+                return page[:limit]
+            fetch *= 2
+
+    @staticmethod
+    async def _run_nearby(
+        db: Database,
+        latitude: float,
+        longitude: float,
+        radius: Optional[float],
+        limit: int,
+        rating_min: Optional[float],
+        flag_mask: int,
+        flag_value: int,
+        after: Optional[Tuple[float, int]] = None,
+        max_radius_km: float = NEAREST_MAX_RADIUS_KM
+    ) -> List[Dict[str, Any]]:
+        """
+        Run a nearby query, from the in-memory index when it is loaded, otherwise the stored procedure.
+        
+        A radius of None asks for the ``limit`` nearest matches out to ``max_radius_km``.
+        """
+        started = time.perf_counter()
+        if bathroom_index is not None and bathroom_index.ready:
+            with span("nearby.index"):
+                if radius is None:
+                    bathrooms = bathroom_index.nearest(
+                        latitude, longitude, limit,
+                        rating_min=rating_min, flag_mask=flag_mask, flag_value=flag_value, after=after,
+                        ring_km=NEAREST_RING_KM, max_radius_km=max_radius_km
+                    )
+                else:
+                    bathrooms = bathroom_index.query(
+                        latitude, longitude, radius, limit,
+                        rating_min=rating_min, flag_mask=flag_mask, flag_value=flag_value, after=after
+                    )
+            source = "index"
+        elif radius is None:
+            bathrooms = await BathroomService._nearest_from_rpc(
+                db, latitude, longitude, limit, rating_min, flag_mask, flag_value, after, max_radius_km
+            )
+            source = "rpc"
+        else:
+            bathrooms = await BathroomService._nearby_from_rpc(
+                db, latitude, longitude, radius, limit, rating_min, flag_mask, flag_value, after
+            )
+            source = "rpc"
+        
+        logger.debug(f"Found {len(bathrooms)} bathrooms via {source} in {(time.perf_counter() - started) * 1000:.1f}ms")
+        return bathrooms
+
+    @staticmethod
+    async def _nearby_from_rpc(
+        db: Database,
+        latitude: float,
+        longitude: float,
+        radius: float,
+        limit: int,
+        rating_min: Optional[float],
+        flag_mask: int,
+        flag_value: int,
+        after: Optional[Tuple[float, int]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Run the nearby_bathrooms RPC and apply filters before the limit.
+        
+        The RPC itself does not filter, so when filters are set it is asked
+        for more rows than ``limit`` and the request is widened until ``limit``
+        matches are found or the RPC runs out of rows in the radius. It has
+        no lower distance bound either, so a page ``after`` a cursor is found
+        the same way, re-reading the rows of earlier pages. Rows are measured
+        again with ``haversine_km``, the distance every page and cursor uses,
+        whatever the function returned (older deployments return none).
+        """
+        filtered = rating_min is not None or flag_mask != 0 or after is not None
+        fetch = min(limit * NEARBY_FILTER_OVERFETCH, NEARBY_RPC_MAX_FETCH) if filtered else limit
+        while True:
+            response = await db.execute(db.rpc('nearby_bathrooms', {
+                'lat': latitude,
+                'lng': longitude,
+                'radius_km': radius,
+                'limit_val': fetch
+            }))
+            
+            if hasattr(response, 'error') and response.error:
+                raise Exception(f"Error fetching bathrooms: {response.error}")
+            
+            rows = BathroomService._with_distance(response.data or [], latitude, longitude)
+            if not filtered:
+                return rows
+            
+            with span("nearby.filter"):
+                matches = [
+                    b for b in rows
+                    if attribute_flags(b) & flag_mask == flag_value
+                    and (rating_min is None or (b.get('average_rating') or 0) >= rating_min)
+                    and (after is None or (b['distance'], b['id']) > after)
+                ]
+                if after is not None:
+                    # Pages follow (distance, id), whatever order the RPC breaks ties in
+                    matches.sort(key=lambda b: (b['distance'], b['id']))
+            logger.debug(f"RPC returned {len(rows)} bathrooms, {len(matches)} match filters (fetch={fetch})")
+            if len(matches) >= limit or len(rows) < fetch or fetch >= NEARBY_RPC_MAX_FETCH:
+                return matches[:limit]
+            fetch = min(fetch * 2, NEARBY_RPC_MAX_FETCH)
+
+    @staticmethod
+    def _with_distance(rows: List[Dict[str, Any]], latitude: float, longitude: float) -> List[Dict[str, Any]]:
+        """Set the ``haversine_km`` distance of RPC rows and sort them by (distance, id)."""
+        for row in rows:
+            row['distance'] = haversine_km(latitude, longitude, row['latitude'], row['longitude'])
+        return sorted(rows, key=lambda b: (b['distance'], b['id']))
+
+    @staticmethod
+    async def _nearest_from_rpc(
+        db: Database,
+        latitude: float,
+        longitude: float,
+        limit: int,
+        rating_min: Optional[float],
+        flag_mask: int,
+        flag_value: int,
+        after: Optional[Tuple[float, int]] = None,
+        max_radius_km: float = NEAREST_MAX_RADIUS_KM
+    ) -> List[Dict[str, Any]]:
+        """
+        Find the ``limit`` nearest matches through the nearby_bathrooms RPC.
+        
+        The radius starts ``NEAREST_RING_KM`` past the cursor and doubles its
+        reach until ``limit`` matches are found or it reaches
+        ``max_radius_km``, one RPC call per ring.
+        """
+        inner = after[0] if after is not None else 0.0
+        width = NEAREST_RING_KM
+        while True:
+            radius = min(inner + width, max_radius_km)
+            bathrooms = await BathroomService._nearby_from_rpc(
+                db, latitude, longitude, radius, limit, rating_min, flag_mask, flag_value, after
+            )
+            if len(bathrooms) >= limit or radius >= max_radius_km:
+                return bathrooms
+            width *= 2
+
+    @staticmethod
+    async def _vector_index() -> Optional[VectorIndex]:
+        """
+        Get the NumPy engine over the spatial index, or None when it is unavailable.
+        
+        It is rebuilt off the event loop once the index has changed and the
+        current engine is ``VECTOR_INDEX_REBUILD_SECONDS`` old, so batch
+        queries can miss changes made since the last rebuild. Snapshot
+        workers wrap the mapped columns instead of copying the rows.
+        """
+        global vector_index, vector_index_version, vector_index_built_at
+        if not (VECTOR_INDEX_ENABLED and NUMPY_AVAILABLE) or bathroom_index is None or not bathroom_index.ready:
+            return None
+        async with vector_index_lock:
+            fresh = vector_index_version == bathroom_index.version or \
+                time.time() - vector_index_built_at < VECTOR_INDEX_REBUILD_SECONDS
+            if vector_index is None or not fresh:
+                version = bathroom_index.version
+                if isinstance(bathroom_index, SnapshotIndex):
+                    engine = bathroom_index.vector_index()
+                else:
+                    engine = await asyncio.get_running_loop().run_in_executor(
+                        None, VectorIndex.from_rows, bathroom_index.rows(), bathroom_index.cell_degrees
+                    )
+                vector_index, vector_index_version, vector_index_built_at = engine, version, time.time()
+            return vector_index
+
+    @staticmethod
+    async def get_nearest_bathrooms(
+        db: Database,
+        points: Sequence[Tuple[float, float]],
+        radius: float = 5.0,
+        limit: int = 10,
+        rating_min: Optional[float] = None,
+        is_unisex: Optional[bool] = None,
+        is_accessible: Optional[bool] = None,
+        has_changing_table: Optional[bool] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Get the bathrooms nearest to each of many locations.
+        
+        Args:
+            db: Database handle
+            points: (latitude, longitude) pairs
+            radius: Search radius in kilometers
+            limit: Maximum number of results per point
+            rating_min, is_unisex, is_accessible, has_changing_table: Filters, as for nearby queries
+            
+        Returns:
+            Per point, the bathrooms a nearby query for it returns
+        """
+        engine = await BathroomService._vector_index()
+        if engine is not None:
+            flag_mask, flag_value = filter_mask(is_unisex, is_accessible, has_changing_table)
+            with span("nearest.vector"):
+                return engine.query_many(
+                    [lat for lat, _ in points], [lng for _, lng in points], radius, limit,
+                    rating_min=rating_min, flag_mask=flag_mask, flag_value=flag_value
+                )
+        
+        # One nearby query per point, through the grid index, cache or RPC
+        return list(await asyncio.gather(*(
+            BathroomService.get_bathrooms_by_location(
+                db, lat, lng, radius, limit, rating_min, is_unisex, is_accessible, has_changing_table
+            )
+            for lat, lng in points
+        )))
+
+    @staticmethod
+    async def get_bathrooms_along_route(
+        db: Database,
+        points: Sequence[Tuple[float, float]],
+        radius: float = 1.0,
+        limit: int = 50,
+        rating_min: Optional[float] = None,
+        is_unisex: Optional[bool] = None,
+        is_accessible: Optional[bool] = None,
+        has_changing_table: Optional[bool] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Get the bathrooms within ``radius`` of a route.
         
-        # If we have filters, apply them to the results in Python
-        # This is a workaround if the RPC doesn't support filtering directly
-        bathrooms = response.data
-        filtered_bathrooms = bathrooms
+        The route is sampled every ``radius / 2`` and each bathroom's
+        ``distance`` is to the nearest sample. Raises ValueError when that
+        takes more than ``ROUTE_MAX_SAMPLES`` samples.
         
-        # Apply filters if provided
-        if rating_min is not None:
-            filtered_bathrooms = [b for b in filtered_bathrooms if b.get('average_rating', 0) >= rating_min]
-            print(f"After rating_min filter: {len(filtered_bathrooms)} bathrooms")
+        Args:
+            db: Database handle
+            points: The route's (latitude, longitude) vertices
+            radius: Distance from the route in kilometers
+            limit: Maximum number of results to return
+            rating_min, is_unisex, is_accessible, has_changing_table: Filters, as for nearby queries
             
-        if is_unisex is not None:
-            filtered_bathrooms = [b for b in filtered_bathrooms if b.get('is_unisex') == is_unisex]
-            print(f"After is_unisex filter: {len(filtered_bathrooms)} bathrooms")
+        Returns:
+            Bathrooms nearest to the route first
+        """
+        samples = densify_path(points, radius / 2, max_points=ROUTE_MAX_SAMPLES)
+        engine = await BathroomService._vector_index()
+        if engine is not None:
+            flag_mask, flag_value = filter_mask(is_unisex, is_accessible, has_changing_table)
+            with span("route.vector"):
+                return engine.corridor(
+                    [lat for lat, _ in samples], [lng for _, lng in samples], radius, limit,
+                    rating_min=rating_min, flag_mask=flag_mask, flag_value=flag_value
+                )
+        
+        # The overall top ``limit`` are each among the top ``limit`` of their nearest sample
+        nearest: Dict[int, Dict[str, Any]] = {}
+        per_point = await BathroomService.get_nearest_bathrooms(
+            db, samples, radius, limit, rating_min, is_unisex, is_accessible, has_changing_table
+        )
+        for bathrooms in per_point:
+            for bathroom in bathrooms:
+                known = nearest.get(bathroom['id'])
+                if known is None or bathroom['distance'] < known['distance']:
+                    nearest[bathroom['id']] = bathroom
+        return sorted(nearest.values(), key=lambda b: (b['distance'], b['id']))[:limit]
+
+    @staticmethod
+    async def _text_index() -> Optional[TextIndex]:
+        """
+        Get the text index, or None when search is disabled or not loaded yet.
+        
+        Snapshot workers build theirs off the event loop from the mapped rows,
+        again once a newer snapshot is mapped and the current index is
+        ``SEARCH_INDEX_REBUILD_SECONDS`` old. Changes made by this process
+        are applied to it directly, but ones made while it is being rebuilt
+        are only seen once the next snapshot is. The index lives in this
+        worker's heap, not the shared snapshot, so each worker pays for its
+        own copy.
+        """
+        global text_index, text_index_snapshot, text_index_built_at
+        if not SEARCH_INDEX_ENABLED:
+            return None
+        if not isinstance(bathroom_index, SnapshotIndex):
+            return text_index if text_index.ready else None
+        if not bathroom_index.ready:
+            return None
+        async with text_index_lock:
+            fresh = text_index_snapshot == bathroom_index.loaded_at or \
+                time.time() - text_index_built_at < SEARCH_INDEX_REBUILD_SECONDS
+            if text_index is None or not fresh:
+                snapshot = bathroom_index.loaded_at
+                started = time.perf_counter()
+                index = await asyncio.get_running_loop().run_in_executor(
+                    None, lambda: TextIndex.from_rows(bathroom_index.rows(), **TEXT_INDEX_OPTIONS)
+                )
+                text_index, text_index_snapshot, text_index_built_at = index, snapshot, time.time()
+                logger.info(f"Built this worker's text index of {len(index)} bathrooms in {time.perf_counter() - started:.2f}s")
+            return text_index
+
+    @staticmethod
+    async def search_bathrooms(
+        query: str,
+        limit: int = 20,
+        latitude: Optional[float] = None,
+        longitude: Optional[float] = None,
+        radius: Optional[float] = None,
+        fuzzy: bool = True
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Search bathroom names, addresses and directions.
+        
+        Args:
+            query: Free text; every word has to match, the last one possibly by prefix
+            limit: Maximum number of results
+            latitude, longitude: Location to rank matches by distance from
+            radius: Only return bathrooms within this many kilometers of the location
+            fuzzy: Tolerate misspelled words
             
-        if is_accessible is not None:
-            filtered_bathrooms = [b for b in filtered_bathrooms if b.get('is_accessible') == is_accessible]
-            print(f"After is_accessible filter: {len(filtered_bathrooms)} bathrooms")
+        Returns:
+            Matching bathrooms with a ``score`` (and ``distance`` when a location
+            is given), best first, or None if the text index is not loaded
+        """
+        index = await BathroomService._text_index()
+        if index is None:
+            return None
+        with span("search.text"):
+            return index.search(query, limit, latitude, longitude, radius, fuzzy=fuzzy)
+
+    @staticmethod
+    async def get_bathrooms_in_viewport(
+        db: Database,
+        min_lat: float,
+        min_lng: float,
+        max_lat: float,
+        max_lng: float,
+        zoom: int,
+        rating_min: Optional[float] = None,
+        is_unisex: Optional[bool] = None,
+        is_accessible: Optional[bool] = None,
+        has_changing_table: Optional[bool] = None
+    ) -> Dict[str, Any]:
+        """
+        Get the bathrooms in a map viewport, clustered below ``CLUSTER_MAX_ZOOM``.
+        
+        Args:
+            db: Database handle
+            min_lat, min_lng, max_lat, max_lng: Viewport; min_lng > max_lng crosses the antimeridian
+            zoom: Map zoom level
+            rating_min: Minimum rating filter
+            is_unisex: Filter for unisex bathrooms
+            is_accessible: Filter for accessible bathrooms
+            has_changing_table: Filter for bathrooms with changing tables
             
-        if has_changing_table is not None:
-            filtered_bathrooms = [b for b in filtered_bathrooms if b.get('has_changing_table') == has_changing_table]
-            print(f"After has_changing_table filter: {len(filtered_bathrooms)} bathrooms")
+        Returns:
+            ``clusters`` (count, centroid, attribute counts, cell bounds) per
+            grid cell of ``cell_degrees``, or individual ``bathrooms`` at high
+            zoom; ``truncated`` is set when not every bathroom was included
+        """
+        flag_mask, flag_value = filter_mask(is_unisex, is_accessible, has_changing_table)
+        result = {"zoom": zoom, "cell_degrees": None, "clusters": [], "bathrooms": [], "truncated": False}
         
-        print(f"Original bathrooms: {len(bathrooms)}, Filtered bathrooms: {len(filtered_bathrooms)}")
+        indexed = bathroom_index is not None and bathroom_index.ready
+        if indexed and (zoom >= CLUSTER_MAX_ZOOM or cluster_grid is not None):
+            if zoom >= CLUSTER_MAX_ZOOM:
+                with span("viewport.index"):
+                    result["bathrooms"], result["truncated"] = bathroom_index.within_bbox(
+                        min_lat, min_lng, max_lat, max_lng, VIEWPORT_MAX_BATHROOMS,
+                        rating_min=rating_min, flag_mask=flag_mask, flag_value=flag_value
+                    )
+            else:
+                with span("viewport.clusters"):
+                    result["clusters"], result["cell_degrees"] = cluster_grid.clusters(
+                        min_lat, min_lng, max_lat, max_lng, zoom,
+                        rating_min=rating_min, flag_mask=flag_mask, flag_value=flag_value,
+                        cluster_pixels=CLUSTER_CELL_PIXELS
+                    )
+            return result
         
-        return filtered_bathrooms
+        # Without the index (or its cluster pyramid), read the viewport and cluster it on the fly
+        filters = {'is_unisex': is_unisex, 'is_accessible': is_accessible, 'has_changing_table': has_changing_table}
+        if zoom >= CLUSTER_MAX_ZOOM:
+            result["bathrooms"], result["truncated"] = await BathroomService._rows_in_bbox(
+                db, min_lat, min_lng, max_lat, max_lng, VIEWPORT_MAX_BATHROOMS, rating_min, filters
+            )
+        else:
+            grid = ClusterGrid(SPATIAL_INDEX_CELL_DEGREES, CLUSTER_LEVELS)
+            # Read whole edge clusters, so they match what the index would return
+            bounds = grid.cluster_bounds(min_lat, min_lng, max_lat, max_lng, zoom, CLUSTER_CELL_PIXELS)
+            rating_floor = None if rating_min is None else half_star_floor(rating_min)
+            if indexed:
+                rows, result["truncated"] = bathroom_index.points_in_bbox(
+                    *bounds, VIEWPORT_MAX_FETCH,
+                    rating_min=rating_floor, flag_mask=flag_mask, flag_value=flag_value
+                )
+            else:
+                rows, result["truncated"] = await BathroomService._rows_in_bbox(
+                    db, *bounds, VIEWPORT_MAX_FETCH, rating_floor, filters
+                )
+            with span("viewport.clusters"):
+                grid.load(rows)
+                result["clusters"], result["cell_degrees"] = grid.clusters(
+                    min_lat, min_lng, max_lat, max_lng, zoom, cluster_pixels=CLUSTER_CELL_PIXELS
+                )
+        return result
 
     @staticmethod
-    async def get_bathroom(bathroom_id: int) -> Dict[str, Any]:
+    async def _rows_in_bbox(
+        db: Database,
+        min_lat: float,
+        min_lng: float,
+        max_lat: float,
+        max_lng: float,
+        max_rows: int,
+        rating_min: Optional[float],
+        filters: Dict[str, Optional[bool]]
+    ):
+        """
+        Read up to ``max_rows`` filtered bathrooms inside a bounding box, paging by id.
+        
+        Returns:
+            The rows, and whether more rows matched
+        """
+        rows = []
+        for lo, hi in lng_ranges(min_lng, max_lng):
+            last_id = None
+            while len(rows) <= max_rows:
+                page = min(SPATIAL_INDEX_PAGE_SIZE, max_rows + 1 - len(rows))
+                query = db.table('bathrooms').select(INDEX_COLUMNS) \
+                    .gte('latitude', min_lat).lte('latitude', max_lat) \
+                    .gte('longitude', lo).lte('longitude', hi)
+                for column, wanted in filters.items():
+                    if wanted is not None:
+                        query = query.eq(column, wanted)
+                if rating_min is not None:
+                    query = query.gte('average_rating', rating_min)
+                if last_id is not None:
+                    query = query.gt('id', last_id)
+                response = await db.execute(query.order('id').limit(page))
+                
+                if hasattr(response, 'error') and response.error:
+                    raise Exception(f"Error fetching bathrooms: {response.error}")
+                
+                rows.extend(response.data)
+                if len(response.data) < page:
+                    break
+                last_id = response.data[-1]['id']
+        return rows[:max_rows], len(rows) > max_rows
+
+    @staticmethod
+    async def get_bathroom(db: Database, bathroom_id: int) -> Dict[str, Any]:
         """Get a bathroom by ID."""
-        response = supabase.table('bathrooms').select('*').eq('id', bathroom_id).execute()
+        response = await db.execute(db.table('bathrooms').select('*').eq('id', bathroom_id))
         
         if hasattr(response, 'error') and response.error:
             raise Exception(f"Error fetching bathroom: {response.error}")
@@ -84,35 +666,458 @@ class BathroomService:
         return response.data[0]
 
     @staticmethod
-    async def create_bathroom(bathroom: BathroomCreate) -> Dict[str, Any]:
+    async def create_bathroom(db: Database, bathroom: BathroomCreate) -> Dict[str, Any]:
         """Create a new bathroom."""
-        response = supabase.table('bathrooms').insert(bathroom.dict()).execute()
+        response = await db.execute(db.table('bathrooms').insert(bathroom.dict()))
         
         if hasattr(response, 'error') and response.error:
             raise Exception(f"Error creating bathroom: {response.error}")
+        
+        BathroomService.apply_change(response.data[0])
             
         return response.data[0]
 
     @staticmethod
-    async def update_bathroom(bathroom_id: int, bathroom: BathroomUpdate) -> Dict[str, Any]:
+    async def update_bathroom(db: Database, bathroom_id: int, bathroom: BathroomUpdate) -> Dict[str, Any]:
         """Update a bathroom."""
         # Only include non-None values
         update_data = {k: v for k, v in bathroom.dict().items() if v is not None}
         
-        response = supabase.table('bathrooms').update(update_data).eq('id', bathroom_id).execute()
+        response = await db.execute(db.table('bathrooms').update(update_data).eq('id', bathroom_id))
         
         if hasattr(response, 'error') and response.error:
             raise Exception(f"Error updating bathroom: {response.error}")
             
         if not response.data:
             raise ValueError(f"Bathroom with ID {bathroom_id} not found")
+        
+        BathroomService.apply_change(response.data[0])
             
         return response.data[0]
 
     @staticmethod
-    async def delete_bathroom(bathroom_id: int) -> None:
+    async def delete_bathroom(db: Database, bathroom_id: int) -> None:
         """Delete a bathroom."""
-        response = supabase.table('bathrooms').delete().eq('id', bathroom_id).execute()
+        response = await db.execute(db.table('bathrooms').delete().eq('id', bathroom_id))
         
         if hasattr(response, 'error') and response.error:
             raise Exception(f"Error deleting bathroom: {response.error}")
+        
+        BathroomService.apply_delete(bathroom_id)
+
+    @staticmethod
+    def _validate(model, item: Any) -> Tuple[Optional[Any], Optional[str]]:
+        """Validate one bulk item; returns the model instance, or None and the reason."""
+        if not isinstance(item, dict):
+            return None, "Expected an object"
+        try:
+            return model(**item), None
+        except ValidationError as e:
+            return None, "; ".join(f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+                                   for error in e.errors())
+
+    @staticmethod
+    async def _write_bulk(write, items: List[Tuple[int, Any]], results: List[Optional[Dict[str, Any]]]) -> None:
+        """
+        Write (item index, payload) pairs in batches with a ``BulkWriter``.
+        
+        Batches are not retried as a whole: a failing batch is split until the
+        rows that fail on their own are found, and only those get status 500.
+        """
+        def failed(item: Tuple[int, Any], error: Exception) -> None:
+            index, payload = item
+            bathroom_id = payload if isinstance(payload, int) else payload.get('id')
+            results[index] = {"status": 500, **({"id": bathroom_id} if bathroom_id is not None else {}),
+                              "error": str(error)}
+        
+        writer = BulkWriter(write, max_in_flight=BULK_MAX_IN_FLIGHT, batch_size=BULK_BATCH_SIZE,
+                            max_batch_size=max(BULK_BATCH_SIZE, 1000), max_retries=0, on_failed=failed)
+        await writer.add_many(items)
+        await writer.close()
+
+    @staticmethod
+    async def bulk_create(db: Database, items: List[Any]) -> List[Dict[str, Any]]:
+        """
+        Create many bathrooms with a few batched inserts.
+        
+        Args:
+            db: Database handle
+            items: Unvalidated ``BathroomCreate`` bodies; invalid ones are skipped
+        
+        Returns:
+            Per item, in order: ``status`` 201 with the new ``id``, or 422/500 with an ``error``
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        rows = []
+        for index, item in enumerate(items):
+            bathroom, error = BathroomService._validate(BathroomCreate, item)
+            if error is not None:
+                results[index] = {"status": 422, "error": error}
+            else:
+                rows.append((index, bathroom.dict()))
+        
+        async def write(batch: List[Tuple[int, Dict[str, Any]]]) -> None:
+            response = await db.execute(db.table('bathrooms').insert([row for _, row in batch]))
+        
+            if hasattr(response, 'error') and response.error:
+                raise Exception(f"Error creating bathrooms: {response.error}")
+        
+            for (index, _), created in zip(batch, response.data):
+                results[index] = {"status": 201, "id": created['id']}
+                BathroomService.apply_change(created)
+        
+        await BathroomService._write_bulk(write, rows, results)
+        return results
+
+    @staticmethod
+    async def _rows_by_id(db: Database, ids: List[int], columns: str) -> Dict[int, Dict[str, Any]]:
+        """Read some columns of many bathrooms, ``BULK_BATCH_SIZE`` ids per query."""
+        async def read(chunk: List[int]) -> List[Dict[str, Any]]:
+            response = await db.execute(db.table('bathrooms').select(columns).in_('id', chunk))
+        
+            if hasattr(response, 'error') and response.error:
+                raise Exception(f"Error fetching bathrooms: {response.error}")
+        
+            return response.data
+        
+        pages = await asyncio.gather(*(read(ids[i:i + BULK_BATCH_SIZE]) for i in range(0, len(ids), BULK_BATCH_SIZE)))
+        return {row['id']: row for page in pages for row in page}
+
+    @staticmethod
+    async def bulk_update(db: Database, items: List[Any]) -> List[Dict[str, Any]]:
+        """
+        Update many bathrooms with a few batched upserts.
+        
+        A multi-row update can only set the same values on every row, so
+        changes are written as upserts on id instead, one per set of changed
+        columns in a batch. Each upserted row also carries the required
+        columns (name and location) as read just before; a concurrent change
+        to those in that window is overwritten.
+        
+        Args:
+            db: Database handle
+            items: Unvalidated ``BathroomUpdateItem`` bodies; invalid ones are skipped
+        
+        Returns:
+            Per item, in order: ``status`` 200 with the ``id``, or 404/422/500 with an ``error``
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        changes: Dict[int, Tuple[int, Dict[str, Any]]] = {}
+        for index, item in enumerate(items):
+            update, error = BathroomService._validate(BathroomUpdateItem, item)
+            if error is not None:
+                results[index] = {"status": 422, "error": error}
+                continue
+            values = {k: v for k, v in update.dict().items() if v is not None and k != 'id'}
+            if not values:
+                results[index] = {"status": 422, "id": update.id, "error": "No fields to update"}
+            elif update.id in changes:
+                results[index] = {"status": 422, "id": update.id, "error": "Duplicate id in request"}
+            else:
+                changes[update.id] = (index, values)
+        
+        current = await BathroomService._rows_by_id(db, list(changes), "id, " + ", ".join(BULK_REQUIRED_COLUMNS))
+        payloads = []
+        for bathroom_id, (index, values) in changes.items():
+            row = current.get(bathroom_id)
+            if row is None:
+                results[index] = {"status": 404, "id": bathroom_id, "error": f"Bathroom with ID {bathroom_id} not found"}
+                continue
+            payloads.append((index, {**row, **values}))
+        
+        async def write(batch: List[Tuple[int, Dict[str, Any]]]) -> None:
+            # Rows of one upsert must have the same columns
+            shapes: Dict[frozenset, List[Tuple[int, Dict[str, Any]]]] = {}
+            for index, payload in batch:
+                shapes.setdefault(frozenset(payload), []).append((index, payload))
+            for group in shapes.values():
+                response = await db.execute(
+                    db.table('bathrooms').upsert([payload for _, payload in group], on_conflict='id')
+                )
+        
+                if hasattr(response, 'error') and response.error:
+                    raise Exception(f"Error updating bathrooms: {response.error}")
+        
+                for (index, _), updated in zip(group, response.data):
+                    results[index] = {"status": 200, "id": updated['id']}
+                    BathroomService.apply_change(updated)
+        
+        await BathroomService._write_bulk(write, payloads, results)
+        return results
+
+    @staticmethod
+    async def bulk_delete(db: Database, ids: List[int]) -> List[Dict[str, Any]]:
+        """
+        Delete many bathrooms with a few batched deletes.
+        
+        Returns:
+            Per id, in order: ``status`` 204, or 404/422/500 with an ``error``
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(ids)
+        pending = []
+        seen = set()
+        for index, bathroom_id in enumerate(ids):
+            if bathroom_id in seen:
+                results[index] = {"status": 422, "id": bathroom_id, "error": "Duplicate id in request"}
+                continue
+            seen.add(bathroom_id)
+            pending.append((index, bathroom_id))
+        
+        async def write(batch: List[Tuple[int, int]]) -> None:
+            response = await db.execute(db.table('bathrooms').delete().in_('id', [i for _, i in batch]))
+        
+            if hasattr(response, 'error') and response.error:
+                raise Exception(f"Error deleting bathrooms: {response.error}")
+        
+            deleted = {row['id'] for row in response.data}
+            for index, bathroom_id in batch:
+                if bathroom_id in deleted:
+                    results[index] = {"status": 204, "id": bathroom_id}
+                    BathroomService.apply_delete(bathroom_id)
+                else:
+                    results[index] = {"status": 404, "id": bathroom_id,
+                                      "error": f"Bathroom with ID {bathroom_id} not found"}
+        
+        await BathroomService._write_bulk(write, pending, results)
+        return results
+
+    @staticmethod
+    async def add_ratings(db: Database, deltas: Dict[int, Tuple[int, int]]) -> None:
+        """
+        Count new reviews into bathrooms' ratings and reflect them in the index and cache.
+        
+        One ``add_bathroom_ratings`` call (sql/add_bathroom_ratings.sql) adds
+        each bathroom's (review count, rating sum) delta to its stored totals
+        under the row lock, so concurrent reviews, from this process or any
+        other, add up without any bathroom's reviews being read again.
+        
+        Args:
+            db: Database handle
+            deltas: (review count, rating sum) of the new reviews per bathroom id
+        """
+        bathroom_ids = list(deltas)
+        response = await db.execute(db.rpc('add_bathroom_ratings', {
+            'p_bathroom_ids': bathroom_ids,
+            'p_counts': [deltas[bathroom_id][0] for bathroom_id in bathroom_ids],
+            'p_sums': [deltas[bathroom_id][1] for bathroom_id in bathroom_ids],
+        }))
+        
+        if hasattr(response, 'error') and response.error:
+            raise Exception(f"Error updating bathroom ratings: {response.error}")
+        
+        for row in response.data or []:
+            BathroomService.apply_change(row)
+
+    @staticmethod
+    async def refresh_rating(db: Database, bathroom_id: int) -> None:
+        """
+        Recount a bathroom's rating from its reviews in the database and reflect it in the index and cache.
+        
+        For when reviews move or arrive in bulk, or an ``add_ratings`` may
+        have been lost; new reviews go through ``add_ratings``. The
+        ``refresh_bathroom_rating`` function (sql/refresh_bathroom_rating.sql)
+        locks the row and recounts in one transaction, so concurrent reviews,
+        from this process or any other, can't overwrite each other's counts.
+        """
+        response = await db.execute(db.rpc('refresh_bathroom_rating', {'p_bathroom_id': bathroom_id}))
+        
+        if hasattr(response, 'error') and response.error:
+            raise Exception(f"Error updating bathroom rating: {response.error}")
+        
+        if response.data:
+            BathroomService.apply_change(response.data[0])
+
+    @staticmethod
+    def apply_change(row: Dict[str, Any]) -> None:
+        """
+        Reflect a created or updated bathroom in the in-process index and cache.
+        
+        Cached results that contained the bathroom are dropped, as are results
+        whose search area covers its current location, since it may now match
+        (or rank into) them.
+        """
+        if bathroom_index is not None:
+            previous = bathroom_index.get(row['id'])
+            bathroom_index.upsert(row)
+            if cluster_grid is not None:
+                cluster_grid.update(previous, row)
+        if text_index is not None:
+            text_index.upsert(row)
+        if nearby_cache is not None:
+            nearby_cache.invalidate_bathroom(row['id'])
+            if row.get('latitude') is not None and row.get('longitude') is not None:
+                nearby_cache.invalidate_point(row['latitude'], row['longitude'])
+
+    @staticmethod
+    def apply_delete(bathroom_id: int) -> None:
+        """Reflect a deleted bathroom in the in-process index and cache."""
+        if bathroom_index is not None:
+            if cluster_grid is not None:
+                cluster_grid.update(bathroom_index.get(bathroom_id), None)
+            bathroom_index.remove(bathroom_id)
+        if text_index is not None:
+            text_index.remove(bathroom_id)
+        if nearby_cache is not None:
+            nearby_cache.invalidate_bathroom(bathroom_id)
+
+    @staticmethod
+    def invalidate_cached(bathroom_id: int) -> None:
+        """
+        Drop cached results a change to a bathroom's reviews can affect.
+        
+        The location comes from the spatial index when it is loaded, so
+        rating-filtered results the bathroom may now qualify for are dropped
+        too; without it only results containing the bathroom are dropped.
+        """
+        if nearby_cache is None:
+            return
+        nearby_cache.invalidate_bathroom(bathroom_id)
+        row = bathroom_index.get(bathroom_id) if bathroom_index is not None else None
+        if row is not None:
+            nearby_cache.invalidate_point(row['latitude'], row['longitude'])
+
+    @staticmethod
+    def cache_stats() -> Dict[str, Any]:
+        """Hit/miss/eviction counters of the nearby query cache."""
+        if nearby_cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **nearby_cache.stats()}
+
+    @staticmethod
+    async def fetch_index_rows(db: Database) -> List[Dict[str, Any]]:
+        """Read the indexed columns of the whole bathrooms table, paging by id."""
+        rows = []
+        last_id = None
+        while True:
+            query = db.table('bathrooms').select(INDEX_COLUMNS).order('id').limit(SPATIAL_INDEX_PAGE_SIZE)
+            if last_id is not None:
+                query = query.gt('id', last_id)
+            response = await db.execute(query)
+            
+            if hasattr(response, 'error') and response.error:
+                raise Exception(f"Error loading bathrooms: {response.error}")
+            
+            rows.extend(response.data)
+            if len(response.data) < SPATIAL_INDEX_PAGE_SIZE:
+                break
+            last_id = response.data[-1]['id']
+        return rows
+
+    @staticmethod
+    async def fetch_changed_rows(db: Database, since: Optional[str]) -> List[Dict[str, Any]]:
+        """Read the indexed columns of the bathrooms updated after ``since``, oldest first."""
+        rows = []
+        offset = 0
+        while True:
+            query = db.table('bathrooms').select(INDEX_COLUMNS)
+            if since is not None:
+                query = query.gt('updated_at', since)
+            query = query.order('updated_at').order('id') \
+                .range(offset, offset + SPATIAL_INDEX_PAGE_SIZE - 1)
+            response = await db.execute(query)
+            
+            if hasattr(response, 'error') and response.error:
+                raise Exception(f"Error refreshing bathrooms: {response.error}")
+            
+            rows.extend(response.data)
+            if len(response.data) < SPATIAL_INDEX_PAGE_SIZE:
+                break
+            offset += SPATIAL_INDEX_PAGE_SIZE
+        return rows
+
+    @staticmethod
+    async def load_index(db: Database) -> None:
+        """
+        Load the full bathrooms table into the spatial and text indexes.
+        
+        Snapshot workers map the latest shared snapshot instead, and fail
+        until serve.py has published one.
+        """
+        global text_index
+        if bathroom_index is None and text_index is None:
+            return
+        if isinstance(bathroom_index, SnapshotIndex):
+            if not BathroomService._remap_snapshot() and not bathroom_index.ready:
+                raise Exception(f"No bathrooms snapshot at {bathroom_index.path} yet")
+            return
+        started = time.perf_counter()
+        rows = await BathroomService.fetch_index_rows(db)
+        
+        if bathroom_index is not None:
+            bathroom_index.load(rows)
+            cluster_grid.load(rows)
+            if nearby_cache is not None:
+                nearby_cache.clear()
+            logger.info(f"Loaded {len(bathroom_index)} bathrooms into spatial index in {time.perf_counter() - started:.2f}s")
+        if text_index is not None:
+            # Built off the event loop and swapped in whole, so searches use the old index meanwhile
+            started = time.perf_counter()
+            text_index = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: TextIndex.from_rows(rows, **TEXT_INDEX_OPTIONS)
+            )
+            logger.info(f"Loaded {len(text_index)} bathrooms into text index in {time.perf_counter() - started:.2f}s")
+
+    @staticmethod
+    async def refresh_index(db: Database) -> int:
+        """
+        Apply rows changed since the last load or refresh to the spatial and text indexes.
+        
+        Snapshot workers map a newer shared snapshot if one was published.
+        
+        Returns:
+            Number of rows applied
+        """
+        index = _maintained_index()
+        if index is None or not index.ready:
+            return 0
+        if isinstance(index, SnapshotIndex):
+            BathroomService._remap_snapshot()
+            return 0
+        rows = await BathroomService.fetch_changed_rows(db, index.last_updated_at)
+        for row in rows:
+            BathroomService.apply_change(row)
+        
+        if rows:
+            logger.info(f"Applied {len(rows)} changed bathrooms to the indexes")
+        return len(rows)
+
+    @staticmethod
+    def _remap_snapshot() -> bool:
+        """Map a newly published snapshot; cached results may predate it, so they are dropped."""
+        if not bathroom_index.refresh():
+            return False
+        if nearby_cache is not None:
+            nearby_cache.clear()
+        return True
+
+
+def _maintained_index():
+    """The index whose load time and ``updated_at`` watermark drive reloads and refreshes."""
+    return bathroom_index if bathroom_index is not None else text_index
+
+
+async def maintain_index(db: Database) -> None:
+    """
+    Keep the spatial and text indexes fresh for the lifetime of the app.
+    
+    Changed rows are picked up incrementally via ``updated_at``. Deletes made
+    outside this process are not visible that way, so the whole table is
+    reloaded every ``SPATIAL_INDEX_FULL_RELOAD_SECONDS``. Snapshot workers
+    only check for a newer snapshot, every ``SPATIAL_SNAPSHOT_CHECK_SECONDS``.
+    """
+    if _maintained_index() is None:
+        return
+    interval = SPATIAL_SNAPSHOT_CHECK_SECONDS if isinstance(bathroom_index, SnapshotIndex) \
+        else SPATIAL_INDEX_REFRESH_SECONDS
+    while True:
+        try:
+            index = _maintained_index()
+            stale = index.loaded_at is None or \
+                time.time() - index.loaded_at >= SPATIAL_INDEX_FULL_RELOAD_SECONDS
+            if stale:
+                await BathroomService.load_index(db)
+            else:
+                await BathroomService.refresh_index(db)
+        except Exception as e:
+            logger.error(f"Error refreshing indexes: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,237 @@
+import json
+import time
+import random
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Callable, Awaitable, Set
+
+from config.database import Database
+
+logger = logging.getLogger(__name__)
+
+# Rows sampled per batch to estimate the payload size
+_SIZE_SAMPLE = 8
+
+
+@dataclass
+class BatchStat:
+    """Timing of one attempted batch."""
+    size: int
+    payload_bytes: int
+    seconds: float
+    attempts: int
+    ok: bool
+
+
+@dataclass
+class BulkWriteReport:
+    """Outcome of a ``BulkWriter`` run."""
+    written: int = 0
+    failed: int = 0
+    batches: List[BatchStat] = field(default_factory=list)
+    failed_rows: List[Dict[str, Any]] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        """Aggregate batch timings."""
+        seconds = sorted(b.seconds for b in self.batches)
+        pick = lambda pct: seconds[min(len(seconds) - 1, int(pct / 100 * len(seconds)))] if seconds else 0.0
+        return {
+            "written": self.written,
+            "failed": self.failed,
+            "batches": len(self.batches),
+            "retried_batches": sum(1 for b in self.batches if b.attempts > 1),
+            "mean_batch_size": sum(b.size for b in self.batches) / len(self.batches) if self.batches else 0,
+            "batch_seconds_p50": pick(50),
+            "batch_seconds_p95": pick(95),
+            "batch_seconds_max": seconds[-1] if seconds else 0.0,
+            "elapsed_seconds": self.elapsed,
+            "rows_per_second": self.written / self.elapsed if self.elapsed else 0.0,
+        }
+
+
+class BulkWriter:
+    """
+    Streaming batch writer with several batches in flight.
+
+    Rows are buffered with ``add`` and handed to ``write`` in batches. Up to
+    ``max_in_flight`` batches run at once; ``add`` waits when all slots are
+    busy, so producers are throttled to the backend's pace.
+
+    The batch size adapts after every successful batch: it grows while
+    batches finish well under ``target_seconds`` and halves when they run
+    over, and is always capped so the estimated payload stays under
+    ``max_payload_bytes``. Failed batches are retried with exponential
+    backoff; a batch that still fails is split in half and each half retried,
+    down to single rows, so one bad row only costs itself.
+
+    Args:
+        write: Coroutine writing one batch; raises on failure
+        max_in_flight: Batches written concurrently
+        batch_size: Initial rows per batch
+        min_batch_size: Lower bound for the adaptive batch size
+        max_batch_size: Upper bound for the adaptive batch size
+        target_seconds: Batch latency the size adapts towards
+        max_payload_bytes: Upper bound on the estimated JSON size of a batch
+        max_retries: Retries of a full batch before it is split
+        backoff_seconds: First retry delay, doubled per attempt
+        on_written: Called with the rows of every successful batch
+        on_failed: Called with each row that could not be written and the error
+    """
+
+    def __init__(
+        self,
+        write: Callable[[List[Any]], Awaitable[None]],
+        max_in_flight: int = 4,
+        batch_size: int = 100,
+        min_batch_size: int = 10,
+        max_batch_size: int = 1000,
+        target_seconds: float = 1.0,
+        max_payload_bytes: int = 2 * 1024 * 1024,
+        max_retries: int = 3,
+        backoff_seconds: float = 0.5,
+        on_written: Optional[Callable[[List[Any]], None]] = None,
+        on_failed: Optional[Callable[[Any, Exception], None]] = None
+    ):
+        self._write = write
+        self.max_in_flight = max_in_flight
+        self.batch_size = batch_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.target_seconds = target_seconds
+        self.max_payload_bytes = max_payload_bytes
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.on_written = on_written
+        self.on_failed = on_failed
+        self.report = BulkWriteReport()
+        self._buffer: List[Any] = []
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._tasks: Set[asyncio.Task] = set()
+        self._bytes_per_row: Optional[float] = None
+        self._started = time.perf_counter()
+
+    async def __aenter__(self) -> "BulkWriter":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def add(self, row: Any) -> None:
+        """Buffer a row, starting a batch once enough rows are buffered."""
+        self._buffer.append(row)
+        if len(self._buffer) >= self.batch_size:
+            await self._submit()
+
+    async def add_many(self, rows: List[Any]) -> None:
+        for row in rows:
+            await self.add(row)
+
+    async def _submit(self) -> None:
+        if not self._buffer:
+            return
+        batch = self._buffer[:self.batch_size]
+        self._buffer = self._buffer[self.batch_size:]
+        await self._slots.acquire()
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def barrier(self) -> "asyncio.Future":
+        """
+        Start batches for everything buffered so far.
+
+        Returns:
+            Future that resolves once every row added before the call has been
+            written or given up on; later rows are not waited for
+        """
+        while self._buffer:
+            await self._submit()
+        return asyncio.ensure_future(asyncio.gather(*list(self._tasks)))
+
+    async def flush(self) -> None:
+        """Write everything buffered and wait for all batches in flight."""
+        await (await self.barrier())
+
+    async def close(self) -> BulkWriteReport:
+        """Flush and return the report."""
+        await self.flush()
+        self.report.elapsed = time.perf_counter() - self._started
+        return self.report
+
+    def _estimate_bytes(self, batch: List[Any]) -> int:
+        sample = batch[:_SIZE_SAMPLE]
+        per_row = len(json.dumps(sample, default=str)) / len(sample)
+        self._bytes_per_row = per_row if self._bytes_per_row is None else 0.8 * self._bytes_per_row + 0.2 * per_row
+        return int(per_row * len(batch))
+
+    def _adapt(self, stat: BatchStat) -> None:
+        if stat.seconds > self.target_seconds:
+            size = self.batch_size // 2
+        elif stat.seconds < self.target_seconds / 2 and stat.size >= self.batch_size:
+            size = int(self.batch_size * 1.5) + 1
+        else:
+            size = self.batch_size
+        if self._bytes_per_row:
+            size = min(size, int(self.max_payload_bytes / self._bytes_per_row))
+        self.batch_size = max(self.min_batch_size, min(self.max_batch_size, size))
+
+    async def _attempt(self, batch: List[Any], retries: int):
+        """Write a batch with retries; returns the last error or None."""
+        payload_bytes = self._estimate_bytes(batch)
+        started = time.perf_counter()
+        error = None
+        attempts = 0
+        for attempt in range(retries + 1):
+            attempts += 1
+            try:
+                await self._write(batch)
+                error = None
+                break
+            except Exception as e:
+                error = e
+                if attempt < retries:
+                    delay = self.backoff_seconds * 2 ** attempt
+                    await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+        stat = BatchStat(len(batch), payload_bytes, time.perf_counter() - started, attempts, error is None)
+        self.report.batches.append(stat)
+        return stat, error
+
+    async def _run(self, batch: List[Any]) -> None:
+        try:
+            await self._write_or_split(batch, self.max_retries)
+        finally:
+            self._slots.release()
+
+    async def _write_or_split(self, batch: List[Any], retries: int) -> None:
+        stat, error = await self._attempt(batch, retries)
+        if error is None:
+            self._adapt(stat)
+            self.report.written += len(batch)
+            if self.on_written is not None:
+                self.on_written(batch)
+            return
+        if len(batch) > 1:
+            logger.warning(f"Batch of {len(batch)} rows failed ({error}); splitting to isolate bad rows")
+            middle = len(batch) // 2
+            # The whole batch was already retried, so halves are split again on their first
+            # failure; only a single row gets another retry before it is given up on
+            for half in (batch[:middle], batch[middle:]):
+                await self._write_or_split(half, 0 if len(half) > 1 else min(self.max_retries, 1))
+            return
+        logger.error(f"Row could not be written: {error}")
+        self.report.failed += 1
+        row = batch[0]
+        self.report.failed_rows.append(row if isinstance(row, dict) else {"row": row})
+        if self.on_failed is not None:
+            self.on_failed(row, error)
+
+
+def upsert_writer(db: Database, table: str, on_conflict: str = "id") -> Callable[[List[Dict[str, Any]]], Awaitable[None]]:
+    """Batch write function upserting rows into a table, for use with ``BulkWriter``."""
+    async def write(batch: List[Dict[str, Any]]) -> None:
+        response = await db.execute(db.table(table).upsert(batch, on_conflict=on_conflict))
+        if hasattr(response, 'error') and response.error:
+            raise Exception(f"Error upserting into {table}: {response.error}")
+    return write
@@ -0,0 +1,259 @@
+import math
+import logging
+from typing import List, Optional, Dict, Any, Tuple, Iterable
+
+from services.spatial_index import FLAG_UNISEX, FLAG_ACCESSIBLE, FLAG_CHANGING_TABLE, attribute_flags
+
+logger = logging.getLogger(__name__)
+
+# Web map tiles are 256px wide and zoom level z shows 360 / 2^z degrees per tile
+TILE_PIXELS = 256
+
+# Ratings are aggregated in half-star buckets: 0 (unrated) .. 10 (5 stars)
+RATING_BUCKETS = 11
+
+# Bucket key of a cell's totals over all attribute/rating combinations
+TOTAL = None
+
+
+def cluster_cell_degrees(zoom: int, cluster_pixels: int = 64) -> float:
+    """Edge length in degrees of a ``cluster_pixels`` wide square at a zoom level."""
+    return 360.0 / (TILE_PIXELS * 2 ** zoom) * cluster_pixels
+
+
+def rating_bucket(rating: Optional[float]) -> int:
+    return max(0, min(RATING_BUCKETS - 1, int(math.floor((rating or 0) * 2))))
+
+
+def half_star_floor(rating_min: float) -> float:
+    """``rating_min`` rounded up to the half-star resolution clusters are filtered at."""
+    return math.ceil(rating_min * 2 - 1e-9) / 2
+
+
+def lng_ranges(min_lng: float, max_lng: float) -> List[Tuple[float, float]]:
+    """Split a longitude span crossing the antimeridian (min_lng > max_lng) in two."""
+    if min_lng <= max_lng:
+        return [(min_lng, max_lng)]
+    return [(min_lng, 180.0), (-180.0, max_lng)]
+
+
+class ClusterGrid:
+    """
+    Pre-aggregated bathroom counts on a pyramid of lat/lng grids.
+
+    Level 0 has cells of ``base_degrees``; every further level is ``factor``
+    times coarser. Each cell keeps, per (attribute flags, half-star rating)
+    combination and in total, the count, coordinate/rating sums and
+    attribute counts of its bathrooms, so a cluster can be summed from a few
+    cells: unfiltered from the totals, filtered from the matching
+    combinations. Cells are updated incrementally as bathrooms change.
+    """
+
+    def __init__(self, base_degrees: float = 0.01, levels: int = 6, factor: int = 4):
+        self.base_degrees = base_degrees
+        self.factor = factor
+        self.level_degrees = [base_degrees * factor ** level for level in range(levels)]
+        self._lng_cells = int(round(360 / base_degrees))
+        # level -> cell -> (flags, rating bucket) or TOTAL ->
+        #   [count, sum_lat, sum_lng, sum_rating, unisex, accessible, changing_table, rated]
+        self._levels: List[Dict[Tuple[int, int], Dict[Tuple[int, int], List[float]]]] = [{} for _ in range(levels)]
+
+    def __len__(self) -> int:
+        """Number of bathrooms aggregated."""
+        return int(sum(cell[TOTAL][0] for cell in self._levels[-1].values()))
+
+    def _base_cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return (int(math.floor((latitude + 90) / self.base_degrees)),
+                int(math.floor((longitude + 180) / self.base_degrees)) % self._lng_cells)
+
+    def _apply(self, levels, row: Dict[str, Any], sign: int) -> None:
+        latitude, longitude = row.get("latitude"), row.get("longitude")
+        if latitude is None or longitude is None:
+            return
+        rating = float(row.get("average_rating") or 0)
+        flags = attribute_flags(row)
+        bucket = rating_bucket(rating)
+        d_lat, d_lng, d_rating = sign * latitude, sign * longitude, sign * rating
+        d_unisex = sign if flags & FLAG_UNISEX else 0
+        d_accessible = sign if flags & FLAG_ACCESSIBLE else 0
+        d_changing = sign if flags & FLAG_CHANGING_TABLE else 0
+        d_rated = sign if bucket > 0 else 0
+        keys = ((flags, bucket), TOTAL)
+        base_row, base_col = self._base_cell(latitude, longitude)
+        divisor = 1
+        for cells in levels:
+            cell = (base_row // divisor, base_col // divisor)
+            divisor *= self.factor
+            buckets = cells.get(cell)
+            if buckets is None:
+                buckets = cells[cell] = {}
+            for key in keys:
+                stats = buckets.get(key)
+                if stats is None:
+                    stats = buckets[key] = [0, 0.0, 0.0, 0.0, 0, 0, 0, 0]
+                stats[0] += sign
+                stats[1] += d_lat
+                stats[2] += d_lng
+                stats[3] += d_rating
+                stats[4] += d_unisex
+                stats[5] += d_accessible
+                stats[6] += d_changing
+                stats[7] += d_rated
+                if stats[0] <= 0:
+                    del buckets[key]
+            if not buckets:
+                del cells[cell]
+
+    def load(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """
+        Replace the contents, building the new pyramid off to the side.
+
+        Only the finest level is built from the rows; each coarser level is
+        summed from the cells of the one below.
+        """
+        levels = [{}]
+        for row in rows:
+            self._apply(levels, row, 1)
+        factor = self.factor
+        for _ in self._levels[1:]:
+            parents: Dict[Tuple[int, int], Dict[Any, List[float]]] = {}
+            for (row, col), buckets in levels[-1].items():
+                parent = parents.setdefault((row // factor, col // factor), {})
+                for key, stats in buckets.items():
+                    total = parent.get(key)
+                    if total is None:
+                        parent[key] = list(stats)
+                    else:
+                        for i, value in enumerate(stats):
+                            total[i] += value
+            levels.append(parents)
+        self._levels = levels
+
+    def update(self, previous: Optional[Dict[str, Any]], row: Optional[Dict[str, Any]]) -> None:
+        """Replace a bathroom's previous state with its new one; either may be None."""
+        if previous is not None:
+            self._apply(self._levels, previous, -1)
+        if row is not None:
+            self._apply(self._levels, row, 1)
+
+    def _choose_level(self, target_degrees: float) -> Tuple[int, int]:
+        """Coarsest level no larger than the cluster size, and how many of its cells make one cluster."""
+        level = 0
+        for candidate, degrees in enumerate(self.level_degrees):
+            if degrees <= target_degrees:
+                level = candidate
+        return level, max(1, int(target_degrees / self.level_degrees[level]))
+
+    def _ranges(self, level: int, merge: int, min_lat: float, min_lng: float, max_lat: float, max_lng: float):
+        """Row range and column ranges of a level covering the viewport, widened to whole clusters of ``merge`` cells."""
+        divisor = self.factor ** level
+        row_lo = self._base_cell(max(-90.0, min_lat), 0)[0] // divisor // merge * merge
+        row_hi = (self._base_cell(min(90.0, max_lat), 0)[0] // divisor // merge + 1) * merge - 1
+        col_ranges = []
+        for lo, hi in lng_ranges(min_lng, max_lng):
+            col_lo = int(math.floor((lo + 180) / self.base_degrees)) // divisor // merge * merge
+            col_hi = min(self._lng_cells - 1, int(math.floor((hi + 180) / self.base_degrees))) // divisor
+            col_ranges.append((col_lo, (col_hi // merge + 1) * merge - 1))
+        return row_lo, row_hi, col_ranges
+
+    def cluster_bounds(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float,
+                       zoom: int, cluster_pixels: int = 64) -> Tuple[float, float, float, float]:
+        """The viewport widened to the whole clusters ``clusters`` would return for it."""
+        level, merge = self._choose_level(cluster_cell_degrees(zoom, cluster_pixels))
+        row_lo, row_hi, col_ranges = self._ranges(level, merge, min_lat, min_lng, max_lat, max_lng)
+        degrees = self.level_degrees[level]
+        lng_lo = max(-180.0, col_ranges[0][0] * degrees - 180)
+        lng_hi = min(180.0, (col_ranges[-1][1] + 1) * degrees - 180)
+        return (max(-90.0, row_lo * degrees - 90), lng_lo, min(90.0, (row_hi + 1) * degrees - 90), lng_hi)
+
+    def _cells_in_bbox(self, level: int, merge: int, min_lat: float, min_lng: float, max_lat: float, max_lng: float):
+        """Occupied cells of a level in the viewport, widened to whole clusters."""
+        cells = self._levels[level]
+        row_lo, row_hi, col_ranges = self._ranges(level, merge, min_lat, min_lng, max_lat, max_lng)
+        for col_lo, col_hi in col_ranges:
+            span = (row_hi - row_lo + 1) * (col_hi - col_lo + 1)
+            if span > len(cells):
+                # Viewport covers more cells than exist; walk the occupied ones instead
+                for (row, col), buckets in list(cells.items()):
+                    if row_lo <= row <= row_hi and col_lo <= col <= col_hi:
+                        yield (row, col), buckets
+            else:
+                for row in range(row_lo, row_hi + 1):
+                    for col in range(col_lo, col_hi + 1):
+                        buckets = cells.get((row, col))
+                        if buckets:
+                            yield (row, col), buckets
+
+    def clusters(
+        self,
+        min_lat: float,
+        min_lng: float,
+        max_lat: float,
+        max_lng: float,
+        zoom: int,
+        rating_min: Optional[float] = None,
+        flag_mask: int = 0,
+        flag_value: int = 0,
+        cluster_pixels: int = 64
+    ) -> Tuple[List[Dict[str, Any]], float]:
+        """
+        Aggregate the bathrooms in a viewport into grid clusters.
+
+        The viewport is widened to whole cells, so clusters on its edges are
+        complete and stable while panning. ``rating_min`` is applied at
+        half-star resolution, rounded up.
+
+        Args:
+            min_lat, min_lng, max_lat, max_lng: Viewport; min_lng > max_lng crosses the antimeridian
+            zoom: Map zoom level
+            rating_min: Minimum average rating
+            flag_mask: Attribute bits to filter on, see ``filter_mask``
+            flag_value: Required values of the bits in ``flag_mask``
+            cluster_pixels: On-screen size of a cluster cell
+
+        Returns:
+            Clusters with count, centroid, attribute counts, average rating of
+            the rated bathrooms and cell bounds, and the cluster cell size in
+            degrees
+        """
+        level, merge = self._choose_level(cluster_cell_degrees(zoom, cluster_pixels))
+        degrees = self.level_degrees[level] * merge
+        min_bucket = None if rating_min is None else int(half_star_floor(rating_min) * 2)
+
+        filtered = flag_mask != 0 or min_bucket is not None
+
+        totals: Dict[Tuple[int, int], List[float]] = {}
+        for (row, col), buckets in self._cells_in_bbox(level, merge, min_lat, min_lng, max_lat, max_lng):
+            if filtered:
+                matching = [stats for key, stats in buckets.items() if key is not TOTAL
+                            and key[0] & flag_mask == flag_value
+                            and (min_bucket is None or key[1] >= min_bucket)]
+                if not matching:
+                    continue
+            else:
+                matching = (buckets[TOTAL],)
+            key = (row // merge, col // merge)
+            cluster = totals.get(key)
+            if cluster is None:
+                cluster = totals[key] = [0, 0.0, 0.0, 0.0, 0, 0, 0, 0]
+            for stats in matching:
+                for i, value in enumerate(stats):
+                    cluster[i] += value
+
+        results = []
+        for (row, col), (count, sum_lat, sum_lng, sum_rating, unisex, accessible, changing, rated) in totals.items():
+            if count <= 0:
+                continue
+            cell_lat = row * degrees - 90
+            cell_lng = col * degrees - 180
+            results.append({
+                "count": int(count),
+                "latitude": sum_lat / count,
+                "longitude": sum_lng / count,
+                "unisex": int(unisex),
+                "accessible": int(accessible),
+                "changing_table": int(changing),
+                "average_rating": round(sum_rating / rated, 2) if rated else 0,
+                "bounds": [cell_lat, cell_lng, min(90.0, cell_lat + degrees), min(180.0, cell_lng + degrees)],
+            })
+        return results, degrees
@@ -0,0 +1,264 @@
+import math
+from dataclasses import dataclass, asdict
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Set
+
+from services.spatial_index import EARTH_RADIUS_KM
+from services.text_index import tokenize, trigrams, max_edits, edit_distance
+
+# Words that say nothing about which place a bathroom is
+GENERIC_WORDS = frozenset({
+    "restroom", "restrooms", "bathroom", "bathrooms", "toilet", "toilets", "washroom", "washrooms",
+    "wc", "public", "the", "a", "an", "of", "and", "at", "in", "mens", "womens", "unisex", "family",
+})
+
+# Spelled-out street words and their usual abbreviations
+ADDRESS_ABBREVIATIONS = {
+    "street": "st", "avenue": "ave", "av": "ave", "boulevard": "blvd", "road": "rd", "drive": "dr",
+    "lane": "ln", "place": "pl", "court": "ct", "square": "sq", "highway": "hwy", "parkway": "pkwy",
+    "terrace": "ter", "circle": "cir", "plaza": "plz", "north": "n", "south": "s", "east": "e",
+    "west": "w", "suite": "ste", "floor": "fl",
+}
+
+_METERS_PER_DEGREE = EARTH_RADIUS_KM * 1000 * math.pi / 180
+
+
+def name_words(name: Optional[str]) -> List[str]:
+    """Words of a bathroom name, without generic ones like "restroom" unless nothing else is left."""
+    words = tokenize(name)
+    specific = [word for word in words if word not in GENERIC_WORDS]
+    return specific or words
+
+
+def street_words(address: Optional[str]) -> Tuple[Optional[str], List[str]]:
+    """
+    House number and remaining words of an address's street part (before the first comma).
+
+    Refuge addresses carry city and state after the street; user-entered ones
+    often do not, so only the street is compared.
+    """
+    if not address or address == "Unknown Address":
+        return None, []
+    words = [ADDRESS_ABBREVIATIONS.get(word, word) for word in tokenize(address.split(",")[0])]
+    if words and words[0].isdigit():
+        return words[0], words[1:]
+    return None, words
+
+
+def word_trigrams(words: Iterable[str]) -> Set[str]:
+    """Union of the padded trigrams of each word, as pg_trgm builds them for a phrase."""
+    found: Set[str] = set()
+    for word in words:
+        found |= trigrams(word)
+    return found
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared)
+
+
+def distance_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Equirectangular distance in meters; exact enough at the few tens of meters compared here."""
+    dlng = (lng2 - lng1 + 180) % 360 - 180
+    x = dlng * math.cos(math.radians((lat1 + lat2) / 2))
+    return math.hypot(lat2 - lat1, x) * _METERS_PER_DEGREE
+
+
+@dataclass
+class MergeDecision:
+    """One bathroom found to duplicate another, with the evidence."""
+    keep_id: int
+    drop_id: int
+    distance_m: float
+    name_similarity: float
+    address_similarity: float
+
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class DuplicateMatcher:
+    """
+    Finds bathrooms listed more than once, e.g. by a user and by Refuge.
+
+    Two bathrooms match when they are within ``max_meters`` of each other,
+    their house numbers (when both have one) agree, and either their names
+    are at least ``name_threshold`` similar or their streets are at least
+    ``address_threshold`` similar while their names are not unrelated (half
+    as similar, or a typo or two apart).
+    Similarities are trigram Jaccard indexes of the normalized words.
+
+    Whole tables are compared with grid blocking: rows are bucketed into
+    cells at least ``max_meters`` wide, so only rows in neighbouring cells
+    are ever compared and the cost grows with the row count, not its square.
+    """
+
+    def __init__(self, max_meters: float = 25.0, name_threshold: float = 0.5, address_threshold: float = 0.7):
+        self.max_meters = max_meters
+        self.name_threshold = name_threshold
+        self.address_threshold = address_threshold
+        self._cell_degrees = max_meters / _METERS_PER_DEGREE
+        self._features: Dict[int, Tuple[str, Set[str], Optional[str], Set[str]]] = {}
+
+    def _features_of(self, row: Dict[str, Any]) -> Tuple[str, Set[str], Optional[str], Set[str]]:
+        """Name, name trigrams, house number and street trigrams of a row, computed once per row."""
+        features = self._features.get(row["id"])
+        if features is None:
+            words = name_words(row.get("name"))
+            number, street = street_words(row.get("address"))
+            features = ("".join(words), word_trigrams(words), number, word_trigrams(street))
+            self._features[row["id"]] = features
+        return features
+
+    def compare(self, a: Dict[str, Any], b: Dict[str, Any]) -> Optional[Tuple[float, float, float]]:
+        """
+        Check whether two bathrooms are the same place.
+
+        Returns:
+            (distance in meters, name similarity, address similarity) if they
+            match, otherwise None
+        """
+        distance = distance_m(a["latitude"], a["longitude"], b["latitude"], b["longitude"])
+        if distance > self.max_meters:
+            return None
+        name_a, trigrams_a, number_a, street_a = self._features_of(a)
+        name_b, trigrams_b, number_b, street_b = self._features_of(b)
+        if number_a and number_b and number_a != number_b:
+            return None
+        name_similarity = jaccard(trigrams_a, trigrams_b)
+        if name_similarity >= self.name_threshold:
+            return distance, name_similarity, jaccard(street_a, street_b)
+        address_similarity = jaccard(street_a, street_b)
+        if address_similarity < self.address_threshold:
+            return None
+        # Same street: short names are related if they are a typo or two apart ("Macy's", "Mcay's")
+        edits = max_edits(min(name_a, name_b, key=len))
+        if name_similarity >= self.name_threshold / 2 or \
+                (edits and edit_distance(name_a, name_b, edits) <= edits):
+            return distance, name_similarity, address_similarity
+        return None
+
+    @staticmethod
+    def survivor_key(row: Dict[str, Any]):
+        """
+        Sort key putting the row to keep first.
+
+        Rows synced from an external source come first, so the next sync
+        keeps updating the survivor instead of re-adding the duplicate;
+        then the row with the most ratings, then the oldest.
+        """
+        return (not row.get("external_source"), -(row.get("total_ratings") or 0), row["id"])
+
+    def decide(self, row: Dict[str, Any], candidates: Iterable[Dict[str, Any]]) -> List[MergeDecision]:
+        """
+        Match one bathroom against nearby ones, e.g. right after it was created.
+
+        Returns:
+            A decision per matching candidate, merging the two into whichever
+            ``survivor_key`` prefers
+        """
+        decisions = []
+        for other in candidates:
+            if other["id"] == row["id"] or other.get("latitude") is None or other.get("longitude") is None:
+                continue
+            match = self.compare(row, other)
+            if match is None:
+                continue
+            keep, drop = sorted((row, other), key=self.survivor_key)
+            decisions.append(MergeDecision(keep["id"], drop["id"], *match))
+        self._features.clear()
+        return decisions
+
+    def _cell_row(self, latitude: float) -> int:
+        return int(math.floor((latitude + 90) / self._cell_degrees))
+
+    def _lng_cell_degrees(self, cell_row: int) -> float:
+        # Cells span max_meters one row beyond the row's pole-most edge, so they are never narrower
+        # than that for rows in this or a neighbouring row
+        edge = max(abs(cell_row * self._cell_degrees - 90), abs((cell_row + 1) * self._cell_degrees - 90))
+        edge = min(89.9, edge + self._cell_degrees)
+        return self._cell_degrees / math.cos(math.radians(edge))
+
+    def find_pairs(self, rows: List[Dict[str, Any]]) -> List[Tuple[int, int, Tuple[float, float, float]]]:
+        """
+        Find every matching pair among ``rows``.
+
+        Returns:
+            (index, index, match) triples, the first index the smaller
+        """
+        grid: Dict[Tuple[int, int], List[int]] = {}
+        widths: Dict[int, float] = {}
+        located = []
+        for i, row in enumerate(rows):
+            if row.get("latitude") is None or row.get("longitude") is None:
+                continue
+            cell_row = self._cell_row(row["latitude"])
+            width = widths.get(cell_row)
+            if width is None:
+                width = widths[cell_row] = self._lng_cell_degrees(cell_row)
+            grid.setdefault((cell_row, int(math.floor((row["longitude"] + 180) / width))), []).append(i)
+            located.append(i)
+
+        pairs = []
+        for i in located:
+            row = rows[i]
+            cell_row = self._cell_row(row["latitude"])
+            for other_row in (cell_row - 1, cell_row, cell_row + 1):
+                width = widths.get(other_row)
+                if width is None:
+                    continue
+                col = int(math.floor((row["longitude"] + 180) / width))
+                for other_col in (col - 1, col, col + 1):
+                    for j in grid.get((other_row, other_col), ()):
+                        if j <= i:
+                            continue
+                        match = self.compare(row, rows[j])
+                        if match is not None:
+                            pairs.append((i, j, match))
+        return pairs
+
+    def find_decisions(self, rows: List[Dict[str, Any]]) -> List[MergeDecision]:
+        """
+        Find the duplicates in a whole table.
+
+        Matching pairs are grouped transitively and each group keeps the row
+        ``survivor_key`` prefers. Only rows matching that survivor directly
+        are merged into it, so a chain of near matches cannot pull together
+        places farther apart than ``max_meters``; the rest are reconsidered
+        by the next run.
+
+        Returns:
+            A decision per row to merge away, ordered by the row kept
+        """
+        pairs = self.find_pairs(rows)
+        parent: Dict[int, int] = {}
+
+        def root(i: int) -> int:
+            parent.setdefault(i, i)
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for i, j, _ in pairs:
+            a, b = root(i), root(j)
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+        groups: Dict[int, List[int]] = {}
+        for i in parent:
+            groups.setdefault(root(i), []).append(i)
+
+        decisions = []
+        for members in groups.values():
+            keep = min((rows[i] for i in members), key=self.survivor_key)
+            for i in members:
+                if rows[i] is keep:
+                    continue
+                match = self.compare(keep, rows[i])
+                if match is not None:
+                    decisions.append(MergeDecision(keep["id"], rows[i]["id"], *match))
+        decisions.sort(key=lambda decision: (decision.keep_id, decision.drop_id))
+        self._features.clear()
+        return decisions
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+from collections import deque
+from typing import List, Dict, Any, Deque
+from config.database import Database
+from config.settings import (
+    DEDUP_MAX_METERS,
+    DEDUP_NAME_THRESHOLD,
+    DEDUP_ADDRESS_THRESHOLD,
+    DEDUP_PENDING_MAX,
+)
+from services.dedup import DuplicateMatcher, MergeDecision
+from services.bathroom_service import BathroomService
+from services.review_service import review_summaries
+
+logger = logging.getLogger(__name__)
+
+# Columns a dropped bathroom fills in on the kept one when the kept one has none
+MERGE_FILL_COLUMNS = ('address', 'directions', 'comment')
+
+duplicate_matcher = DuplicateMatcher(DEDUP_MAX_METERS, DEDUP_NAME_THRESHOLD, DEDUP_ADDRESS_THRESHOLD)
+
+# Merge decisions found as bathrooms are created in this process, newest last
+pending_merges: Deque[MergeDecision] = deque(maxlen=DEDUP_PENDING_MAX)
+
+class DedupService:
+    @staticmethod
+    async def check_inserted(db: Database, row: Dict[str, Any]) -> List[MergeDecision]:
+        """
+        Match a newly created bathroom against the bathrooms around it.
+
+        Neighbours come from a nearby query, so the spatial index answers it
+        when loaded. Decisions are logged and kept in ``pending_merges`` for
+        the dedup job or an operator to act on; nothing is merged here.
+        """
+        if row.get('latitude') is None or row.get('longitude') is None:
+            return []
+        try:
+            nearby = await BathroomService.get_bathrooms_by_location(
+                db, row['latitude'], row['longitude'], radius=DEDUP_MAX_METERS / 1000, limit=20
+            )
+        except Exception as e:
+            logger.error(f"Error checking bathroom {row.get('id')} for duplicates: {e}")
+            return []
+
+        decisions = duplicate_matcher.decide(row, nearby)
+        for decision in decisions:
+            logger.info(f"Bathroom {decision.drop_id} looks like a duplicate of {decision.keep_id} "
+                        f"({decision.distance_m:.1f}m apart, name similarity {decision.name_similarity:.2f})")
+            pending_merges.append(decision)
+        return decisions
+
+    @staticmethod
+    def pending() -> List[Dict[str, Any]]:
+        """Merge decisions found on create that have not been merged since."""
+        return [decision.as_dict() for decision in pending_merges]
+
+    @staticmethod
+    async def find_duplicates(db: Database) -> List[MergeDecision]:
+        """Compare the whole bathrooms table; see ``DuplicateMatcher.find_decisions``."""
+        rows = await BathroomService.fetch_index_rows(db)
+        return duplicate_matcher.find_decisions(rows)
+
+    @staticmethod
+    async def merge(db: Database, decision: MergeDecision) -> bool:
+        """
+        Merge one bathroom into another.
+
+        The dropped bathroom's reviews move to the kept one, which also takes
+        over its address, directions and comment where it has none; then the
+        dropped bathroom is deleted and the kept one's rating recounted.
+
+        Returns:
+            Whether the merge was applied; False if either bathroom is gone,
+            e.g. because it was already merged
+        """
+        response = await db.execute(
+            db.table('bathrooms').select('*').in_('id', [decision.keep_id, decision.drop_id])
+        )
+
+        if hasattr(response, 'error') and response.error:
+            raise Exception(f"Error fetching bathrooms to merge: {response.error}")
+
+        rows = {row['id']: row for row in response.data}
+        keep, drop = rows.get(decision.keep_id), rows.get(decision.drop_id)
+        if keep is None or drop is None:
+            return False
+
+        response = await db.execute(
+            db.table('reviews').update({'bathroom_id': decision.keep_id}).eq('bathroom_id', decision.drop_id)
+        )
+
+        if hasattr(response, 'error') and response.error:
+            raise Exception(f"Error moving reviews: {response.error}")
+        moved = len(response.data)
+
+        fill = {column: drop[column] for column in MERGE_FILL_COLUMNS
+                if not keep.get(column) and drop.get(column)}
+        if fill:
+            response = await db.execute(db.table('bathrooms').update(fill).eq('id', decision.keep_id))
+
+            if hasattr(response, 'error') and response.error:
+                raise Exception(f"Error updating bathroom: {response.error}")
+
+            if response.data:
+                BathroomService.apply_change(response.data[0])
+
+        response = await db.execute(db.table('bathrooms').delete().eq('id', decision.drop_id))
+
+        if hasattr(response, 'error') and response.error:
+            raise Exception(f"Error deleting bathroom: {response.error}")
+
+        BathroomService.apply_delete(decision.drop_id)
+        review_summaries.discard(decision.drop_id)
+        if moved:
+            review_summaries.discard(decision.keep_id)
+            await BathroomService.refresh_rating(db, decision.keep_id)
+
+        for pending in [d for d in pending_merges if decision.drop_id in (d.keep_id, d.drop_id)]:
+            pending_merges.remove(pending)
+        logger.info(f"Merged bathroom {decision.drop_id} into {decision.keep_id} ({moved} reviews moved)")
+        return True
+
+    @staticmethod
+    async def merge_all(db: Database, decisions: List[MergeDecision], concurrency: int = 4) -> Dict[str, int]:
+        """
+        Apply merge decisions, ``concurrency`` kept bathrooms at a time.
+
+        Merges into the same bathroom run one after another, since each
+        recounts its rating.
+
+        Returns:
+            Merged, skipped and failed counts
+        """
+        by_keep: Dict[int, List[MergeDecision]] = {}
+        for decision in decisions:
+            by_keep.setdefault(decision.keep_id, []).append(decision)
+        counts = {"merged": 0, "skipped": 0, "failed": 0}
+        slots = asyncio.Semaphore(concurrency)
+
+        async def merge_group(group: List[MergeDecision]) -> None:
+            async with slots:
+                for decision in group:
+                    try:
+                        merged = await DedupService.merge(db, decision)
+                        counts["merged" if merged else "skipped"] += 1
+                    except Exception as e:
+                        logger.error(f"Error merging bathroom {decision.drop_id} into {decision.keep_id}: {e}")
+                        counts["failed"] += 1
+
+        await asyncio.gather(*(merge_group(group) for group in by_keep.values()))
+        return counts
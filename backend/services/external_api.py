@@ -1,14 +1,156 @@
+import time
 import logging
-import requests
 import asyncio
+import httpx
 from typing import List, Dict, Any, Optional
 from datetime import datetime
-from config.settings import REFUGE_RESTROOMS_API_BASE_URL
+from config.settings import (
+    REFUGE_RESTROOMS_API_BASE_URL,
+    REFUGE_RATE_LIMIT_PER_SECOND,
+    REFUGE_CACHE_PATH,
+    REFUGE_CACHE_TTL_SECONDS,
+    REFUGE_CACHE_MAX_BYTES,
+)
+from services.metrics import external_seconds, record_time
+from services.http_cache import HttpCache, cache_key
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Status codes worth retrying with backoff
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Process-wide response cache, opened on first use when REFUGE_CACHE_PATH is set
+_refuge_cache: Optional[HttpCache] = None
+
+class TokenBucket:
+    """
+    Async token-bucket rate limiter.
+    
+    Allows bursts of up to ``capacity`` calls and a sustained ``rate`` calls
+    per second, shared by every coroutine that acquires from it.
+    """
+    
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+def refuge_cache(path: Optional[str] = None, ttl_seconds: float = REFUGE_CACHE_TTL_SECONDS,
+                 max_bytes: int = REFUGE_CACHE_MAX_BYTES) -> Optional[HttpCache]:
+    """
+    Open the on-disk cache of Refuge Restrooms responses.
+    
+    Without a ``path``, returns the process-wide cache at ``REFUGE_CACHE_PATH``,
+    or None if that is not set.
+    """
+    global _refuge_cache
+    if path is not None:
+        return HttpCache(path, ttl_seconds, max_bytes)
+    if _refuge_cache is None and REFUGE_CACHE_PATH:
+        _refuge_cache = HttpCache(REFUGE_CACHE_PATH, ttl_seconds, max_bytes)
+    return _refuge_cache
+
+def refuge_client(base_url: str = REFUGE_RESTROOMS_API_BASE_URL, max_connections: int = 10,
+                  transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    """Create a pooled async HTTP client for the Refuge Restrooms API."""
+    return httpx.AsyncClient(
+        base_url=base_url,
+        timeout=httpx.Timeout(30.0),
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        transport=transport
+    )
+
+async def fetch_refuge_page(client: httpx.AsyncClient, lat: float, lng: float, page: int, per_page: int = 100,
+                            ada: Optional[bool] = None, unisex: Optional[bool] = None,
+                            rate_limiter: Optional[TokenBucket] = None, retries: int = 3,
+                            cache: Optional[HttpCache] = None) -> List[Dict[str, Any]]:
+    """
+    Fetch one page of restrooms ordered by distance from a point.
+    
+    Rate-limited and server errors are retried with exponential backoff;
+    other HTTP errors are raised. With a ``cache``, a fresh stored page is
+    returned without a request (or a rate-limiter token), a stale one is
+    revalidated with If-None-Match/If-Modified-Since, and is returned as a
+    last resort if the retries run out.
+    
+    Args:
+        client: Client from ``refuge_client``
+        lat: Latitude
+        lng: Longitude
+        page: Page number, starting at 1
+        per_page: Number of results per page
+        ada: Filter for ADA accessible restrooms
+        unisex: Filter for unisex restrooms
+        rate_limiter: Shared rate limiter to acquire from before each request
+        retries: Number of retries after the first attempt
+        cache: Response cache from ``refuge_cache``
+        
+    Returns:
+        List of restroom locations on the page
+    """
+    params = {"lat": lat, "lng": lng, "page": page, "per_page": per_page}
+    if ada is not None:
+        params["ada"] = "true" if ada else "false"
+    if unisex is not None:
+        params["unisex"] = "true" if unisex else "false"
+    
+    url = str(client.base_url).rstrip("/") + "/by_location.json"
+    key = cache_key(url, params)
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None and cached.fresh(cache.ttl_seconds):
+        return cached.json()
+    headers = cached.validators() if cached is not None else {}
+    
+    for attempt in range(retries + 1):
+        if rate_limiter is not None:
+            await rate_limiter.acquire()
+        started = time.perf_counter()
+        outcome = "transport_error"
+        try:
+            response = await client.get("/by_location.json", params=params, headers=headers)
+            outcome = str(response.status_code)
+            if response.status_code == 304 and cached is not None:
+                cache.touch(key)
+                return cached.json()
+            if response.status_code not in RETRYABLE_STATUS:
+                response.raise_for_status()
+                data = response.json()
+                if cache is not None:
+                    cache.put(key, url, response.content, response.headers.get("ETag"),
+                              response.headers.get("Last-Modified"))
+                return data
+            error = f"HTTP {response.status_code}"
+        except httpx.TransportError as e:
+            error = str(e)
+        finally:
+            elapsed = time.perf_counter() - started
+            external_seconds.observe(elapsed, "refuge", outcome)
+            record_time("external:refuge", elapsed)
+        if attempt == retries:
+            if cached is not None:
+                logger.warning(f"Refuge Restrooms request failed ({error}), using the stale cached page {params}")
+                return cached.json()
+            raise httpx.HTTPError(f"Giving up on Refuge Restrooms page {params} after {retries + 1} attempts: {error}")
+        delay = min(30.0, 0.5 * 2 ** attempt)
+        logger.warning(f"Refuge Restrooms request failed ({error}), retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
 async def get_refuge_restrooms(lat: float, lng: float, page: int = 1, per_page: int = 100, 
                               max_results: int = 1000, ada: Optional[bool] = None, 
                               unisex: Optional[bool] = None) -> List[Dict[str, Any]]:
@@ -27,52 +169,34 @@ async def get_refuge_restrooms(lat: float, lng: float, page: int = 1, per_page:
     Returns:
         List of restroom locations
     """
-    # Prepare base parameters
-    base_params = {
-        "lat": lat,
-        "lng": lng,
-        "per_page": per_page
-    }
-    
-    # Add optional filters if provided
-    if ada is not None:
-        base_params["ada"] = "true" if ada else "false"
-    if unisex is not None:
-        base_params["unisex"] = "true" if unisex else "false"
-    
     # Fetch data with multiple API calls if needed
     all_data = []
     current_page = page
     max_pages = (max_results + per_page - 1) // per_page  # Ceiling division
+    rate_limiter = TokenBucket(REFUGE_RATE_LIMIT_PER_SECOND)
+    cache = refuge_cache()
     
     try:
-        while len(all_data) < max_results:
-            # Update page parameter
-            params = base_params.copy()
-            params["page"] = current_page
-            
-            logger.info(f"Fetching data from Refuge Restrooms API with params: {params} (Page {current_page}/{max_pages})")
-            response = requests.get(f"{REFUGE_RESTROOMS_API_BASE_URL}/by_location.json", params=params)
-            response.raise_for_status()
-            
-            page_data = response.json()
-            
-            logger.info(f"Received {len(page_data)} restrooms from Refuge Restrooms API (page {current_page})")
-            
-            # If we got an empty response or fewer items than requested, we've reached the end
-            if not page_data or len(page_data) < per_page:
+        async with refuge_client() as client:
+            while len(all_data) < max_results:
+                logger.info(f"Fetching data from Refuge Restrooms API at ({lat}, {lng}) (Page {current_page}/{max_pages})")
+                page_data = await fetch_refuge_page(client, lat, lng, current_page, per_page,
+                                                    ada=ada, unisex=unisex, rate_limiter=rate_limiter,
+                                                    cache=cache)
+                
+                logger.info(f"Received {len(page_data)} restrooms from Refuge Restrooms API (page {current_page})")
+                
                 all_data.extend(page_data)
-                break
                 
-            all_data.extend(page_data)
-            current_page += 1
-            
-            # If we've fetched enough pages or reached the max_pages limit, stop
-            if len(all_data) >= max_results or current_page > max_pages:
-                break
+                # If we got an empty response or fewer items than requested, we've reached the end
+                if len(page_data) < per_page:
+                    break
+                
+                current_page += 1
                 
-            # Add a small delay to avoid rate limiting
-            await asyncio.sleep(0.5)
+                # If we've reached the max_pages limit, stop
+                if current_page > max_pages:
+                    break
         
         # Trim to max_results if we got more
         if len(all_data) > max_results:
@@ -82,7 +206,7 @@ async def get_refuge_restrooms(lat: float, lng: float, page: int = 1, per_page:
         
         return all_data
     
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Error fetching data from Refuge Restrooms API: {e}")
         return []
 
@@ -0,0 +1,177 @@
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import Dict, Any, Optional
+from urllib.parse import urlencode
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(url: str, params: Dict[str, Any]) -> str:
+    """
+    Key of a GET request, independent of parameter order and number formatting.
+
+    Floats are rounded to 7 decimals (about a centimetre of latitude) and
+    booleans spelled "true"/"false", so equal requests built different ways
+    share an entry.
+    """
+    normalized = []
+    for name, value in sorted(params.items()):
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            value = "true" if value else "false"
+        elif isinstance(value, float):
+            value = repr(round(value, 7))
+        normalized.append((name, str(value)))
+    return hashlib.sha1(f"{url.rstrip('/')}?{urlencode(normalized)}".encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CachedResponse:
+    """A stored response body with the validators it was served with."""
+    body: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    stored_at: float
+
+    def json(self) -> Any:
+        return json.loads(self.body)
+
+    def fresh(self, ttl_seconds: float) -> bool:
+        return time.time() - self.stored_at < ttl_seconds
+
+    def validators(self) -> Dict[str, str]:
+        """Headers that make a request conditional on this response having changed."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class HttpCache:
+    """
+    On-disk cache of HTTP GET responses, kept in a local SQLite file.
+
+    Bodies are stored zlib-compressed with their ETag and Last-Modified
+    headers. Entries younger than ``ttl_seconds`` are served without a
+    request; older ones are revalidated with a conditional request, and a
+    304 keeps the stored body. Once the compressed bodies exceed
+    ``max_bytes``, the least recently used entries are evicted.
+    """
+
+    def __init__(self, path: str = ":memory:", ttl_seconds: float = 86400.0, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._conn = sqlite3.connect(path)
+        # Concurrent runs can share the file; WAL keeps readers off the writer's lock
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS http_cache ("
+            " key TEXT PRIMARY KEY,"
+            " url TEXT NOT NULL,"
+            " etag TEXT,"
+            " last_modified TEXT,"
+            " stored_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " body BLOB NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS http_cache_accessed ON http_cache (accessed_at)")
+        self._conn.commit()
+        self.bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM http_cache").fetchone()[0]
+        self.hits = 0
+        self.stale = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM http_cache").fetchone()[0]
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """
+        Get the stored response for a key, or None on a miss.
+
+        Check ``fresh`` before using it: a stale response only serves to
+        revalidate (see ``touch``) or as a fallback when the server fails.
+        """
+        found = self._conn.execute(
+            "SELECT body, etag, last_modified, stored_at FROM http_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if found is None:
+            self.misses += 1
+            return None
+        body, etag, last_modified, stored_at = found
+        self._conn.execute("UPDATE http_cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        self._conn.commit()
+        cached = CachedResponse(zlib.decompress(body), etag, last_modified, stored_at)
+        if cached.fresh(self.ttl_seconds):
+            self.hits += 1
+        else:
+            self.stale += 1
+        return cached
+
+    def put(self, key: str, url: str, body: bytes, etag: Optional[str] = None,
+            last_modified: Optional[str] = None) -> None:
+        """Store a response body, then evict down to ``max_bytes``."""
+        compressed = zlib.compress(body, 6)
+        now = time.time()
+        previous = self._conn.execute("SELECT size FROM http_cache WHERE key = ?", (key,)).fetchone()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO http_cache (key, url, etag, last_modified, stored_at, accessed_at, size, body) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, url, etag, last_modified, now, now, len(compressed), compressed)
+        )
+        self.bytes += len(compressed) - (previous[0] if previous else 0)
+        self._evict()
+        self._conn.commit()
+
+    def touch(self, key: str) -> None:
+        """Restart an entry's TTL after the server answered 304 Not Modified."""
+        now = time.time()
+        self._conn.execute("UPDATE http_cache SET stored_at = ?, accessed_at = ? WHERE key = ?", (now, now, key))
+        self._conn.commit()
+        self.revalidated += 1
+
+    def _evict(self) -> None:
+        while self.bytes > self.max_bytes:
+            oldest = self._conn.execute(
+                "SELECT key, size FROM http_cache ORDER BY accessed_at LIMIT 64"
+            ).fetchall()
+            if not oldest:
+                self.bytes = 0
+                return
+            for key, size in oldest:
+                if self.bytes <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM http_cache WHERE key = ?", (key,))
+                self.bytes -= size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        self._conn.execute("DELETE FROM http_cache")
+        self._conn.commit()
+        self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "stale": self.stale,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def close(self) -> None:
+        self._conn.close()
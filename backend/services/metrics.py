@@ -0,0 +1,210 @@
+import time
+import bisect
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import List, Optional, Dict, Tuple, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, fine enough at the low end for in-memory work
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+# Seconds spent per span name in the current request, set by the request middleware
+_request_spans: contextvars.ContextVar[Optional[Dict[str, float]]] = \
+    contextvars.ContextVar("request_spans", default=None)
+
+
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram with labels, rendered in the Prometheus text format.
+
+    Each label combination keeps one count per bucket plus the sum and count
+    of all observations.
+    """
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        """Record an observation for a label combination, given in the order of ``labels``."""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # One slot per bucket, then +Inf, sum and count
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def snapshot(self) -> Dict[Tuple[str, ...], Dict[str, float]]:
+        """Count, sum and approximate p50/p95/p99 per label combination."""
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        result = {}
+        for labels, values in series.items():
+            count = values[-1]
+            result[labels] = {
+                "count": count,
+                "sum": values[-2],
+                "p50": self._quantile(values, count, 0.5),
+                "p95": self._quantile(values, count, 0.95),
+                "p99": self._quantile(values, count, 0.99),
+            }
+        return result
+
+    def _quantile(self, values: List[float], count: int, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile."""
+        rank = q * count
+        seen = 0
+        for bound, observed in zip(self.buckets, values):
+            seen += observed
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, list(values)) for labels, values in self._series.items())
+        for label_values, values in series:
+            cumulative = 0
+            for bound, observed in zip(self.buckets + (float("inf"),), values):
+                cumulative += observed
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(values[-2])}")
+            lines.append(f"{self.name}_count{labels} {values[-1]}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter with labels, rendered in the Prometheus text format."""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """Named metrics of the process, rendered together for the /metrics endpoint."""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        if name not in self._metrics:
+            self._metrics[name] = Histogram(name, help, labels, buckets)
+        return self._metrics[name]
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        if name not in self._metrics:
+            self._metrics[name] = Counter(name, help, labels)
+        return self._metrics[name]
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry and the metrics recorded by the app
+registry = MetricsRegistry()
+
+request_seconds = registry.histogram(
+    "saferoute_http_request_duration_seconds",
+    "Time to handle an HTTP request, by route template",
+    ("method", "route", "status")
+)
+db_seconds = registry.histogram(
+    "saferoute_db_call_duration_seconds",
+    "Supabase round trip time, including waiting for a worker thread",
+    ("target", "method", "outcome")
+)
+external_seconds = registry.histogram(
+    "saferoute_external_call_duration_seconds",
+    "External API request time per attempt",
+    ("api", "outcome")
+)
+span_seconds = registry.histogram(
+    "saferoute_span_duration_seconds",
+    "Time spent in named in-process steps (index lookups, filtering, serialization)",
+    ("span",)
+)
+slow_requests = registry.counter(
+    "saferoute_slow_requests_total",
+    "Requests slower than SLOW_REQUEST_MS",
+    ("route",)
+)
+
+
+def record_time(name: str, seconds: float) -> None:
+    """Add time to the current request's breakdown, if a request is being timed."""
+    spans = _request_spans.get()
+    if spans is not None:
+        spans[name] = spans.get(name, 0.0) + seconds
+
+
+@contextmanager
+def span(name: str):
+    """Time a block into ``saferoute_span_duration_seconds`` and the current request's breakdown."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        span_seconds.observe(elapsed, name)
+        record_time(name, elapsed)
+
+
+def start_request() -> Tuple[Dict[str, float], contextvars.Token]:
+    """Begin collecting the span breakdown of a request."""
+    spans: Dict[str, float] = {}
+    return spans, _request_spans.set(spans)
+
+
+def end_request(token: contextvars.Token) -> None:
+    _request_spans.reset(token)
@@ -0,0 +1,98 @@
+import os
+import sys
+import time
+import logging
+import threading
+from collections import deque, Counter
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler for finding where slow requests spend time.
+
+    A daemon thread records the stack of every other thread each
+    ``interval_seconds`` into a ring buffer covering ``window_seconds``.
+    ``dump`` writes the samples taken during a time range as folded stacks
+    (``thread;outer;...;inner count`` per line), the input format of
+    flamegraph.pl, speedscope and inferno.
+
+    Requests on one event loop run interleaved, so a dump for one slow
+    request also contains samples of whatever else ran at the time.
+    """
+
+    def __init__(self, output_dir: str, interval_seconds: float = 0.005, window_seconds: float = 60.0,
+                 max_depth: int = 64):
+        self.output_dir = output_dir
+        self.interval_seconds = interval_seconds
+        self.max_depth = max_depth
+        self._samples: deque = deque(maxlen=max(1, int(window_seconds / interval_seconds)))
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._code_names = {}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        logger.info(f"Sampling profiler started ({self.interval_seconds * 1000:.1f}ms interval), "
+                    f"writing to {self.output_dir}")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _frame_name(self, code) -> str:
+        name = self._code_names.get(code)
+        if name is None:
+            name = self._code_names[code] = \
+                f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return name
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval_seconds):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            now = time.perf_counter()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    stack.append(self._frame_name(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self._samples.append((now, tuple(reversed(stack))))
+
+    def folded(self, started: float, finished: float) -> List[Tuple[str, int]]:
+        """Folded stacks sampled between two ``time.perf_counter`` readings, most frequent first."""
+        counts = Counter(";".join(stack) for at, stack in list(self._samples) if started <= at <= finished)
+        return counts.most_common()
+
+    def dump(self, label: str, started: float, finished: float) -> Optional[str]:
+        """
+        Write the stacks sampled between ``started`` and ``finished`` to a file.
+
+        Returns:
+            The file written, or None when nothing was sampled
+        """
+        stacks = self.folded(started, finished)
+        if not stacks:
+            return None
+        safe_label = "".join(c if c.isalnum() else "_" for c in label).strip("_")
+        path = os.path.join(self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{int(finished * 1000) % 1000:03d}-{safe_label}.folded")
+        with open(path, "w") as f:
+            for stack, count in stacks:
+                f.write(f"{stack} {count}\n")
+        return path
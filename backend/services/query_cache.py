@@ -0,0 +1,268 @@
+import math
+import time
+import logging
+from collections import OrderedDict
+from typing import List, Optional, Dict, Any, Tuple, Set, FrozenSet
+
+from services.spatial_index import EARTH_RADIUS_KM, haversine_km
+
+logger = logging.getLogger(__name__)
+
+# Rough per-row and per-entry bookkeeping cost used for the memory bound
+ROW_OVERHEAD_BYTES = 240
+ENTRY_OVERHEAD_BYTES = 512
+
+
+def estimate_size(rows: List[Dict[str, Any]]) -> int:
+    """Approximate the memory held by a list of result rows."""
+    size = ENTRY_OVERHEAD_BYTES
+    for row in rows:
+        size += ROW_OVERHEAD_BYTES
+        for value in row.values():
+            size += len(value) if isinstance(value, str) else 8
+    return size
+
+
+class _Entry:
+    __slots__ = ("rows", "complete_km", "expires_at", "size", "cells", "ids")
+
+    def __init__(self, rows, complete_km, expires_at, size, cells, ids):
+        self.rows = rows
+        self.complete_km = complete_km
+        self.expires_at = expires_at
+        self.size = size
+        self.cells = cells
+        self.ids = ids
+
+
+class NearbyQueryCache:
+    """
+    TTL + LRU cache of nearby-bathroom results.
+
+    Query centers are snapped to a ``coord_step_degrees`` grid and radii
+    rounded up to ``radius_step_km``, so map pans a few metres apart share
+    one entry. An entry holds the rows around the snapped center out to
+    ``complete_km``; ``lookup`` re-measures them from the caller's own center
+    and only answers when they are certain to hold the caller's result, so
+    snapping never changes what a query returns. Each entry is registered under
+    the coarse ``cell_degrees`` cells its search circle covers and under the
+    ids it returned, which lets writes invalidate exactly the entries they
+    can affect. Entries are evicted least-recently-used once the estimated
+    size exceeds ``max_bytes``.
+    """
+
+    # Circles covering more cells than this are tracked as "wide" and dropped on any write
+    MAX_TRACKED_CELLS = 256
+
+    def __init__(
+        self,
+        ttl_seconds: float = 60.0,
+        max_bytes: int = 64 * 1024 * 1024,
+        coord_step_degrees: float = 0.0005,
+        radius_step_km: float = 0.25,
+        cell_degrees: float = 0.05
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.coord_step_degrees = coord_step_degrees
+        self.radius_step_km = radius_step_km
+        self.cell_degrees = cell_degrees
+        self._lng_cells = int(round(360 / cell_degrees))
+        self._entries: "OrderedDict[Tuple, _Entry]" = OrderedDict()
+        self._by_cell: Dict[Tuple[int, int], Set[Tuple]] = {}
+        self._by_bathroom: Dict[int, Set[Tuple]] = {}
+        self._wide: Set[Tuple] = set()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def quantize(self, latitude: float, longitude: float, radius: float) -> Tuple[float, float, float]:
+        """Snap a query center to the cache grid and round its radius up to the next step."""
+        step = self.coord_step_degrees
+        lat = round(round(latitude / step) * step, 7)
+        lng = round(round(longitude / step) * step, 7)
+        steps = math.ceil(round(radius / self.radius_step_km, 9))
+        radius = max(self.radius_step_km, steps * self.radius_step_km)
+        return lat, lng, round(radius, 3)
+
+    @property
+    def snap_error_km(self) -> float:
+        """Upper bound on the distance between a query center and its snapped one."""
+        return math.radians(self.coord_step_degrees / 2) * EARTH_RADIUS_KM * math.sqrt(2)
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return (int(math.floor(latitude / self.cell_degrees)),
+                int(math.floor((longitude + 180) / self.cell_degrees)) % self._lng_cells)
+
+    def _cells_for(self, latitude: float, longitude: float, radius: float) -> Optional[FrozenSet[Tuple[int, int]]]:
+        """Cells overlapping the bounding box of a search circle, or None if there are too many."""
+        dlat = math.degrees(radius / EARTH_RADIUS_KM)
+        cos_lat = math.cos(math.radians(min(89.0, abs(latitude) + dlat)))
+        dlng = min(180.0, dlat / max(cos_lat, 1e-6))
+        rows = range(self._cell(latitude - dlat, 0)[0], self._cell(latitude + dlat, 0)[0] + 1)
+        first = int(math.floor((longitude - dlng + 180) / self.cell_degrees))
+        last = int(math.floor((longitude + dlng + 180) / self.cell_degrees))
+        if len(rows) * (last - first + 1) > self.MAX_TRACKED_CELLS:
+            return None
+        return frozenset((row, col % self._lng_cells) for row in rows for col in range(first, last + 1))
+
+    def _live(self, key: Tuple) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= time.monotonic():
+            self._drop(key)
+            self.expirations += 1
+            return None
+        return entry
+
+    def get(self, key: Tuple) -> Optional[List[Dict[str, Any]]]:
+        """Get the cached rows for a key as they were stored, or None on a miss."""
+        entry = self._live(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry.rows
+
+    def resolve(self, rows: List[Dict[str, Any]], complete_km: float, latitude: float, longitude: float,
+                radius: float, limit: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Answer a query at its own center from rows fetched around the snapped one.
+
+        The fetched rows hold every match out to ``complete_km`` from the
+        snapped center, so every match out to ``complete_km - snap_error_km``
+        from the real one. Distances are measured again from the real center.
+
+        Returns:
+            The first ``limit`` rows within ``radius`` by (distance, id), or
+            None when the rows can't be sure to hold them
+        """
+        reach = complete_km - self.snap_error_km + 1e-9
+        found = []
+        for row in rows:
+            distance = haversine_km(latitude, longitude, row["latitude"], row["longitude"])
+            if distance <= radius and distance <= reach:
+                found.append(dict(row, distance=distance))
+        if len(found) < limit and reach < radius:
+            return None
+        found.sort(key=lambda row: (row["distance"], row["id"]))
+        return found[:limit]
+
+    def lookup(self, key: Tuple, latitude: float, longitude: float, radius: float,
+               limit: int) -> Optional[List[Dict[str, Any]]]:
+        """Answer a query from the entry for its key, see ``resolve``; None on a miss."""
+        entry = self._live(key)
+        found = self.resolve(entry.rows, entry.complete_km, latitude, longitude, radius, limit) \
+            if entry is not None else None
+        if found is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return found
+
+    def put(self, key: Tuple, latitude: float, longitude: float, radius: float,
+            rows: List[Dict[str, Any]], complete_km: Optional[float] = None) -> None:
+        """
+        Store the rows for a query run at the given (quantized) center and radius.
+
+        ``complete_km`` is how far from the center the rows hold every match,
+        by default ``radius``; writes beyond it don't invalidate the entry.
+        """
+        complete_km = radius if complete_km is None else complete_km
+        if key in self._entries:
+            self._drop(key)
+        size = estimate_size(rows)
+        if size > self.max_bytes:
+            return
+        cells = self._cells_for(latitude, longitude, min(radius, complete_km))
+        ids = frozenset(row["id"] for row in rows if "id" in row)
+        self._entries[key] = _Entry(rows, complete_km, time.monotonic() + self.ttl_seconds, size, cells, ids)
+        self.bytes += size
+        if cells is None:
+            self._wide.add(key)
+        else:
+            for cell in cells:
+                self._by_cell.setdefault(cell, set()).add(key)
+        for bathroom_id in ids:
+            self._by_bathroom.setdefault(bathroom_id, set()).add(key)
+        while self.bytes > self.max_bytes and self._entries:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def _drop(self, key: Tuple) -> None:
+        entry = self._entries.pop(key)
+        self.bytes -= entry.size
+        if entry.cells is None:
+            self._wide.discard(key)
+        else:
+            for cell in entry.cells:
+                keys = self._by_cell.get(cell)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._by_cell[cell]
+        for bathroom_id in entry.ids:
+            keys = self._by_bathroom.get(bathroom_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_bathroom[bathroom_id]
+
+    def _invalidate(self, keys) -> int:
+        dropped = 0
+        for key in list(keys):
+            if key in self._entries:
+                self._drop(key)
+                dropped += 1
+        self.invalidations += dropped
+        return dropped
+
+    def invalidate_point(self, latitude: float, longitude: float) -> int:
+        """
+        Drop every entry whose search area covers a location.
+
+        Used when a bathroom appears at, or moves to, a location.
+
+        Returns:
+            Number of entries dropped
+        """
+        keys = set(self._by_cell.get(self._cell(latitude, longitude), ())) | self._wide
+        return self._invalidate(keys)
+
+    def invalidate_bathroom(self, bathroom_id: int) -> int:
+        """
+        Drop every entry that returned a bathroom.
+
+        Used when a bathroom is changed or removed.
+
+        Returns:
+            Number of entries dropped
+        """
+        return self._invalidate(self._by_bathroom.get(bathroom_id, ()))
+
+    def clear(self) -> None:
+        """Drop all entries."""
+        self._invalidate(list(self._entries))
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for sizing the cache."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
@@ -1,17 +1,63 @@
-from typing import List, Dict, Any
-from config.database import supabase
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Tuple
+from config.database import Database
+from config.settings import (
+    REVIEW_SUMMARY_LATEST,
+    REVIEW_SUMMARY_TTL_SECONDS,
+    REVIEW_SUMMARY_MAX_ENTRIES,
+    REVIEW_SUMMARY_MAX_IDS,
+    REVIEW_WRITE_BEHIND,
+    REVIEW_SPOOL_DIR,
+    REVIEW_QUEUE_MAX,
+    REVIEW_QUEUE_WAIT_SECONDS,
+    REVIEW_BATCH_SIZE,
+    REVIEW_BATCH_LINGER_SECONDS,
+    REVIEW_MAX_ATTEMPTS,
+)
 from models.review import ReviewCreate
+from services.bathroom_service import BathroomService
+from services.review_summary import ReviewSummaryStore, RatingSummary
+from services.write_behind import WriteBehindQueue
+
+logger = logging.getLogger(__name__)
+
+# Process-wide review aggregates, built on first read and maintained as reviews are created
+review_summaries = ReviewSummaryStore(
+    latest_size=REVIEW_SUMMARY_LATEST,
+    ttl_seconds=REVIEW_SUMMARY_TTL_SECONDS,
+    max_entries=REVIEW_SUMMARY_MAX_ENTRIES
+)
+
+# Bathroom ids per reviews query when building summaries, and rows per page
+SUMMARY_LOAD_CHUNK = 100
+SUMMARY_LOAD_PAGE_SIZE = 1000
+
+# Write-behind queue for review submissions, or None when each review is inserted before responding
+review_queue: Optional[WriteBehindQueue] = WriteBehindQueue(
+    REVIEW_SPOOL_DIR,
+    "reviews",
+    write=lambda db, rows: ReviewService._insert_reviews(db, rows),
+    on_written=lambda db, rows: ReviewService._apply_reviews(db, rows),
+    already_written=lambda db, rows: ReviewService._inserted_before(db, rows),
+    max_queued=REVIEW_QUEUE_MAX,
+    batch_size=REVIEW_BATCH_SIZE,
+    linger_seconds=REVIEW_BATCH_LINGER_SECONDS,
+    wait_seconds=REVIEW_QUEUE_WAIT_SECONDS,
+    max_attempts=REVIEW_MAX_ATTEMPTS
+) if REVIEW_WRITE_BEHIND else None
 
 class ReviewService:
     @staticmethod
-    async def get_reviews_by_bathroom(bathroom_id: int, limit: int = 10) -> List[Dict[str, Any]]:
+    async def get_reviews_by_bathroom(db: Database, bathroom_id: int, limit: int = 10) -> List[Dict[str, Any]]:
         """Get reviews for a bathroom."""
-        response = supabase.table('reviews') \
+        query = db.table('reviews') \
             .select('*') \
             .eq('bathroom_id', bathroom_id) \
             .order('created_at', desc=True) \
-            .limit(limit) \
-            .execute()
+            .limit(limit)
+        response = await db.execute(query)
         
         if hasattr(response, 'error') and response.error:
             raise Exception(f"Error fetching reviews: {response.error}")
@@ -19,11 +65,188 @@ class ReviewService:
         return response.data
 
     @staticmethod
-    async def create_review(review: ReviewCreate) -> Dict[str, Any]:
-        """Create a new review."""
-        response = supabase.table('reviews').insert(review.dict()).execute()
+    async def create_review(db: Database, review: ReviewCreate) -> Dict[str, Any]:
+        """
+        Create a new review.
+        
+        The review is then added to the bathroom's ``average_rating`` and
+        ``total_ratings`` in the database and to its cached summary, in O(1)
+        without reading its other reviews; see ``_count_reviews``.
+        """
+        response = await db.execute(db.table('reviews').insert(review.dict()))
         
         if hasattr(response, 'error') and response.error:
             raise Exception(f"Error creating review: {response.error}")
+        
+        created = response.data[0]
+        await ReviewService._count_reviews(db, [created])
+        return created
+
+    @staticmethod
+    async def _count_reviews(db: Database, created: List[Dict[str, Any]]) -> None:
+        """
+        Count inserted reviews into their bathrooms' summaries and stored ratings.
+        
+        The reviews are grouped into one (count, rating sum) delta per
+        bathroom, applied in a single ``BathroomService.add_ratings`` call.
+        If that fails the increment may or may not have landed, so the
+        bathrooms are recounted instead.
+        """
+        deltas: Dict[int, Tuple[int, int]] = {}
+        by_bathroom: Dict[int, List[Dict[str, Any]]] = {}
+        for review in created:
+            count, total = deltas.get(review['bathroom_id'], (0, 0))
+            deltas[review['bathroom_id']] = (count + 1, total + int(review['rating']))
+            by_bathroom.setdefault(review['bathroom_id'], []).append(review)
+        for bathroom_id, reviews in by_bathroom.items():
+            review_summaries.add(bathroom_id, sorted(reviews, key=lambda r: str(r.get('created_at') or '')))
+        try:
+            await BathroomService.add_ratings(db, deltas)
+        except Exception as e:
+            logger.error(f"Error adding {len(created)} reviews to ratings, recounting: {e}")
+            await asyncio.gather(*(ReviewService._recount(db, bathroom_id) for bathroom_id in deltas))
+
+    @staticmethod
+    async def _recount(db: Database, bathroom_id: int) -> None:
+        try:
+            await BathroomService.refresh_rating(db, bathroom_id)
+        except Exception as e:
+            # The reviews themselves were stored; the rating catches up with the next recount
+            logger.error(f"Error updating rating of bathroom {bathroom_id}: {e}")
+            BathroomService.invalidate_cached(bathroom_id)
+
+    @staticmethod
+    async def submit_review(review: ReviewCreate) -> Dict[str, Any]:
+        """
+        Accept a review for write-behind insertion.
+        
+        The review is stamped with its ``created_at`` and spooled to disk
+        before this returns; it reaches the database, and the bathroom's
+        rating, with the next batch.
+        
+        Raises:
+            QueueFull: If too many reviews are waiting to be written
+        """
+        row = {**review.dict(), 'created_at': datetime.now(timezone.utc).isoformat()}
+        await review_queue.submit(row)
+        return {**row, 'status': 'queued'}
+
+    @staticmethod
+    async def _insert_reviews(db: Database, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insert a batch of spooled reviews in one call."""
+        response = await db.execute(db.table('reviews').insert(rows))
+        
+        if hasattr(response, 'error') and response.error:
+            raise Exception(f"Error creating reviews: {response.error}")
+        
+        return response.data
+
+    @staticmethod
+    async def _apply_reviews(db: Database, created: List[Dict[str, Any]]) -> None:
+        """
+        Count a batch of inserted reviews into their bathrooms' ratings and summaries.
+        
+        The batch is grouped into one (count, rating sum) delta per bathroom
+        and applied with a single ``add_bathroom_ratings`` call, however many
+        bathrooms and reviews it holds; see ``_count_reviews``.
+        """
+        await ReviewService._count_reviews(db, created)
+
+    @staticmethod
+    async def _inserted_before(db: Database, rows: List[Dict[str, Any]]) -> set:
+        """
+        Find replayed spool rows that were inserted before the process stopped.
+        
+        A review is identified by its bathroom and the ``created_at`` stamped
+        when it was accepted.
+        
+        Returns:
+            Indexes of the rows already in the reviews table
+        """
+        found = set()
+        for i in range(0, len(rows), SUMMARY_LOAD_CHUNK):
+            chunk = rows[i:i + SUMMARY_LOAD_CHUNK]
+            response = await db.execute(
+                db.table('reviews').select('bathroom_id, created_at, rating')
+                .in_('created_at', list({row['created_at'] for row in chunk}))
+            )
+            
+            if hasattr(response, 'error') and response.error:
+                raise Exception(f"Error fetching reviews: {response.error}")
             
-        return response.data[0]
+            stored = {(r['bathroom_id'], ReviewService._instant(r['created_at']), r['rating']) for r in response.data}
+            found.update(i + j for j, row in enumerate(chunk)
+                         if (row['bathroom_id'], ReviewService._instant(row['created_at']), row['rating']) in stored)
+        return found
+
+    @staticmethod
+    def _instant(value: Any) -> Optional[datetime]:
+        """A timestamp as an aware datetime, so the database's formatting does not matter."""
+        try:
+            parsed = value if isinstance(value, datetime) else datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+    @staticmethod
+    async def queue_stats() -> Dict[str, Any]:
+        """Counters of the write-behind queue."""
+        if review_queue is None:
+            return {"enabled": False}
+        return {"enabled": True, **await review_queue.stats()}
+
+    @staticmethod
+    async def get_summaries(db: Database, bathroom_ids: List[int], latest: int = 3) -> List[Dict[str, Any]]:
+        """
+        Get review summaries for several bathrooms at once.
+        
+        Args:
+            db: Database handle
+            bathroom_ids: Bathrooms to summarize
+            latest: Number of most recent reviews to include per bathroom
+        
+        Returns:
+            Count, average rating, rating histogram and latest reviews per
+            bathroom, in the order requested
+        """
+        bathroom_ids = list(dict.fromkeys(bathroom_ids))
+        if len(bathroom_ids) > REVIEW_SUMMARY_MAX_IDS:
+            raise ValueError(f"At most {REVIEW_SUMMARY_MAX_IDS} bathroom IDs can be summarized at once")
+        latest = min(latest, REVIEW_SUMMARY_LATEST)
+        
+        summaries = {bathroom_id: review_summaries.get(bathroom_id) for bathroom_id in bathroom_ids}
+        missing = [bathroom_id for bathroom_id, summary in summaries.items() if summary is None]
+        if missing:
+            summaries.update(await ReviewService._load_summaries(db, missing))
+        
+        return [summaries[bathroom_id].as_dict(bathroom_id, latest) for bathroom_id in bathroom_ids]
+
+    @staticmethod
+    async def _load_summaries(db: Database, bathroom_ids: List[int]) -> Dict[int, RatingSummary]:
+        """Build summaries from the reviews table, a chunk of bathrooms per query."""
+        loaded = {}
+        for i in range(0, len(bathroom_ids), SUMMARY_LOAD_CHUNK):
+            chunk = bathroom_ids[i:i + SUMMARY_LOAD_CHUNK]
+            mark = review_summaries.mark()
+            reviews: Dict[int, List[Dict[str, Any]]] = {bathroom_id: [] for bathroom_id in chunk}
+            start = 0
+            while True:
+                query = db.table('reviews') \
+                    .select('*') \
+                    .in_('bathroom_id', chunk) \
+                    .order('created_at', desc=True) \
+                    .range(start, start + SUMMARY_LOAD_PAGE_SIZE - 1)
+                response = await db.execute(query)
+                
+                if hasattr(response, 'error') and response.error:
+                    raise Exception(f"Error fetching reviews: {response.error}")
+                
+                for row in response.data:
+                    reviews[row['bathroom_id']].append(row)
+                if len(response.data) < SUMMARY_LOAD_PAGE_SIZE:
+                    break
+                start += SUMMARY_LOAD_PAGE_SIZE
+            for bathroom_id, rows in reviews.items():
+                loaded[bathroom_id] = review_summaries.load(bathroom_id, rows, mark)
+        logger.debug(f"Loaded review summaries for {len(loaded)} bathrooms")
+        return loaded
@@ -0,0 +1,138 @@
+import time
+import logging
+from collections import OrderedDict, deque
+from typing import List, Dict, Any, Optional, Iterable
+
+logger = logging.getLogger(__name__)
+
+RATINGS = (1, 2, 3, 4, 5)
+
+
+class RatingSummary:
+    """Running review aggregate for one bathroom."""
+
+    __slots__ = ("count", "total", "histogram", "latest", "loaded_at")
+
+    def __init__(self, latest_size: int):
+        self.count = 0
+        self.total = 0
+        # histogram[i] counts reviews rated i + 1
+        self.histogram = [0] * len(RATINGS)
+        # Newest first
+        self.latest: deque = deque(maxlen=latest_size)
+        self.loaded_at = time.monotonic()
+
+    @property
+    def average(self) -> float:
+        return round(self.total / self.count, 2) if self.count else 0
+
+    def add(self, review: Dict[str, Any]) -> None:
+        """Count a new review; O(1)."""
+        rating = int(review["rating"])
+        self.count += 1
+        self.total += rating
+        self.histogram[rating - 1] += 1
+        self.latest.appendleft(review)
+
+    def as_dict(self, bathroom_id: int, latest: int) -> Dict[str, Any]:
+        return {
+            "bathroom_id": bathroom_id,
+            "count": self.count,
+            "average_rating": self.average,
+            "histogram": {str(r): n for r, n in zip(RATINGS, self.histogram)},
+            "latest": list(self.latest)[:latest],
+        }
+
+
+class ReviewSummaryStore:
+    """
+    LRU map of bathroom id to ``RatingSummary``.
+
+    A summary is built from the bathroom's reviews on first read, and the
+    reviews this process writes afterwards are counted into it with ``add``.
+    Summaries older than ``ttl_seconds`` are treated as missing and rebuilt,
+    which picks up reviews written by other processes. The stored
+    ``average_rating`` and ``total_ratings`` are never derived from it; see
+    ``BathroomService.add_ratings``.
+
+    A summary whose reviews were read before a write to the bathroom landed
+    may or may not include it, so ``load`` only keeps summaries with no write
+    since their ``mark``.
+    """
+
+    def __init__(self, latest_size: int = 10, ttl_seconds: float = 300.0, max_entries: int = 100_000):
+        self.latest_size = latest_size
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._summaries: "OrderedDict[int, RatingSummary]" = OrderedDict()
+        # Sequence number of the last write per bathroom, most recent last
+        self._writes = 0
+        self._written: "OrderedDict[int, int]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._summaries)
+
+    def get(self, bathroom_id: int) -> Optional[RatingSummary]:
+        summary = self._summaries.get(bathroom_id)
+        if summary is None:
+            return None
+        if time.monotonic() - summary.loaded_at > self.ttl_seconds:
+            del self._summaries[bathroom_id]
+            return None
+        self._summaries.move_to_end(bathroom_id)
+        return summary
+
+    def missing(self, bathroom_ids: Iterable[int]) -> List[int]:
+        """Ids without a current summary."""
+        return [bathroom_id for bathroom_id in bathroom_ids if self.get(bathroom_id) is None]
+
+    def mark(self) -> int:
+        """The write sequence to pass to ``load``, taken before reading the reviews."""
+        return self._writes
+
+    def load(self, bathroom_id: int, reviews: List[Dict[str, Any]], mark: Optional[int] = None) -> RatingSummary:
+        """
+        Build a summary from all of a bathroom's reviews.
+
+        Args:
+            bathroom_id: Bathroom the reviews belong to
+            reviews: The bathroom's reviews, newest first
+            mark: ``mark()`` from before the reviews were read; the summary
+                is returned but not kept if the bathroom was written since
+        """
+        summary = RatingSummary(self.latest_size)
+        for review in reversed(reviews):
+            summary.add(review)
+        if mark is not None and self._written.get(bathroom_id, 0) > mark:
+            return summary
+        self._summaries[bathroom_id] = summary
+        self._summaries.move_to_end(bathroom_id)
+        while len(self._summaries) > self.max_entries:
+            self._summaries.popitem(last=False)
+        return summary
+
+    def _wrote(self, bathroom_id: int) -> None:
+        self._writes += 1
+        self._written[bathroom_id] = self._writes
+        self._written.move_to_end(bathroom_id)
+        while len(self._written) > self.max_entries:
+            self._written.popitem(last=False)
+
+    def add(self, bathroom_id: int, reviews: List[Dict[str, Any]]) -> None:
+        """
+        Count newly written reviews into the bathroom's summary, if one is kept; O(1) per review.
+
+        Args:
+            bathroom_id: Bathroom the reviews belong to
+            reviews: The new reviews, oldest first
+        """
+        self._wrote(bathroom_id)
+        summary = self.get(bathroom_id)
+        if summary is not None:
+            for review in reviews:
+                summary.add(review)
+
+    def discard(self, bathroom_id: int) -> None:
+        """Drop a summary whose reviews changed other than by ``add``, e.g. moved to another bathroom."""
+        self._wrote(bathroom_id)
+        self._summaries.pop(bathroom_id, None)
@@ -0,0 +1,465 @@
+import os
+import sys
+import json
+import math
+import mmap
+import marshal
+import time
+import heapq
+import array
+import struct
+import logging
+from bisect import bisect_left, bisect_right
+from typing import List, Optional, Dict, Any, Tuple, Iterable
+
+from services.spatial_index import SpatialIndex, EARTH_RADIUS_KM, attribute_flags, after_bounds, h_distance, \
+    FLAG_UNISEX, FLAG_ACCESSIBLE, FLAG_CHANGING_TABLE
+from services.vector_index import VectorIndex
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SRS1"
+
+# (name, typecode) of each column, in file order. Rows are sorted by grid
+# cell, so every cell is one contiguous run of positions.
+COLUMNS = (
+    ("ids", "q"),            # bathroom id per position
+    ("latitude", "d"),
+    ("longitude", "d"),
+    ("flags", "B"),          # attribute_flags bitmask
+    ("rating", "d"),         # average_rating, 0 when unrated
+    ("cell_keys", "q"),      # occupied cells as row * lng_cells + col, ascending
+    ("cell_starts", "I"),    # first position of each cell, plus the row count
+    ("sorted_ids", "q"),     # ids ascending, for lookups by id
+    ("id_positions", "I"),   # position of each of sorted_ids
+    ("row_offsets", "Q"),    # start of each row in row_data, plus its length
+    ("row_data", "B"),       # the indexed rows, marshalled
+)
+
+_RADIANS = math.pi / 180
+
+_PLAIN_TYPES = (str, int, float, bool, type(None))
+
+
+def _plain(row: Dict[str, Any]) -> Dict[str, Any]:
+    """The row with values marshal can't store (dates and the like) as strings, as JSON would render them."""
+    return {key: value if isinstance(value, _PLAIN_TYPES) else str(value) for key, value in row.items()}
+
+
+class _Snapshot:
+    """One mapped snapshot file; columns are zero-copy views into the mapping."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if self.mapping[:4] != MAGIC:
+            raise ValueError(f"{path} is not a bathrooms snapshot")
+        header_length, = struct.unpack_from("<I", self.mapping, 4)
+        self.meta = json.loads(self.mapping[8:8 + header_length])
+        if self.meta["byteorder"] != sys.byteorder or self.meta["marshal_version"] != marshal.version:
+            raise ValueError(f"{path} was written by an incompatible machine or Python version")
+        view = memoryview(self.mapping)
+        for name, typecode in COLUMNS:
+            offset, length = self.meta["columns"][name]
+            setattr(self, name, view[offset:offset + length].cast(typecode))
+        self.count = len(self.ids)
+
+
+class SnapshotIndex(SpatialIndex):
+    """
+    Spatial index over a read-only, memory-mapped snapshot of the bathrooms table.
+
+    Meant for running several worker processes: one process writes the
+    snapshot (``write``) and every worker maps the same file, so the pages
+    live once in the OS page cache instead of once per worker. A refreshed
+    snapshot is written to a temporary file and renamed over the old one;
+    workers pick it up with ``refresh`` and keep using the old mapping until
+    then, so a query never sees a half-written file.
+
+    Changes a worker makes itself are kept in a small overlay on top of the
+    snapshot until a snapshot fetched after them replaces it.
+    """
+
+    def __init__(self, path: str, cell_degrees: float = 0.01):
+        super().__init__(cell_degrees)
+        self.path = path
+        self._snapshot: Optional[_Snapshot] = None
+        # bathroom_id -> (row, or None when deleted; time.time() of the change)
+        self._overlay: Dict[int, Tuple[Optional[Dict[str, Any]], float]] = {}
+
+    def __len__(self) -> int:
+        snapshot = self._snapshot
+        count = snapshot.count if snapshot is not None else 0
+        for bathroom_id, (row, _) in self._overlay.items():
+            in_snapshot = snapshot is not None and self._position(snapshot, bathroom_id) is not None
+            count += (row is not None) - in_snapshot
+        return count
+
+    def write(self, rows: Iterable[Dict[str, Any]], fetched_at: Optional[float] = None,
+              full_fetched_at: Optional[float] = None) -> int:
+        """
+        Write rows as a new snapshot, atomically replacing the current file.
+
+        Args:
+            rows: Bathroom rows with at least ``INDEX_COLUMNS``
+            fetched_at: When the read that produced the rows started; worker
+                changes made before it are dropped from their overlays
+            full_fetched_at: When the last full read of the table started;
+                deletes made before it are dropped from worker overlays
+
+        Returns:
+            Number of rows written
+        """
+        entries = []
+        for row in rows:
+            if row.get("latitude") is None or row.get("longitude") is None:
+                continue
+            cell_row, cell_col = self._cell(row["latitude"], row["longitude"])
+            entries.append((cell_row * self._lng_cells + cell_col, row["id"], row))
+        entries.sort(key=lambda entry: entry[:2])
+
+        columns = {name: array.array(typecode) for name, typecode in COLUMNS}
+        row_data = bytearray()
+        for position, (key, bathroom_id, row) in enumerate(entries):
+            if not columns["cell_keys"] or columns["cell_keys"][-1] != key:
+                columns["cell_keys"].append(key)
+                columns["cell_starts"].append(position)
+            columns["ids"].append(bathroom_id)
+            columns["latitude"].append(row["latitude"])
+            columns["longitude"].append(row["longitude"])
+            columns["flags"].append(attribute_flags(row))
+            columns["rating"].append(float(row.get("average_rating") or 0))
+            columns["row_offsets"].append(len(row_data))
+            # marshal decodes about twice as fast as json, and only the same deployment reads the file
+            row_data += marshal.dumps(_plain(row))
+        columns["cell_starts"].append(len(entries))
+        columns["row_offsets"].append(len(row_data))
+        by_id = sorted(range(len(entries)), key=lambda position: entries[position][1])
+        columns["sorted_ids"].extend(entries[position][1] for position in by_id)
+        columns["id_positions"].extend(by_id)
+
+        # Column offsets are relative to the file start and 8-byte aligned
+        header = {
+            "byteorder": sys.byteorder,
+            "marshal_version": marshal.version,
+            "cell_degrees": self.cell_degrees,
+            "count": len(entries),
+            "last_updated_at": max((str(row["updated_at"]) for _, _, row in entries if row.get("updated_at")),
+                                   default=None),
+            "written_at": time.time(),
+            "fetched_at": fetched_at,
+            "full_fetched_at": full_fetched_at,
+        }
+        sizes = [(name, len(row_data) if name == "row_data" else len(columns[name]) * columns[name].itemsize)
+                 for name, _ in COLUMNS]
+        data_start = 0
+        while True:
+            offsets, offset = {}, data_start
+            for name, size in sizes:
+                offsets[name] = [offset, size]
+                offset += -size % 8 + size
+            encoded = json.dumps({**header, "columns": offsets}).encode()
+            needed = 8 + len(encoded) + -(8 + len(encoded)) % 8
+            if needed <= data_start:
+                break
+            data_start = needed
+
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(temporary, "wb") as f:
+                f.write(MAGIC + struct.pack("<I", len(encoded)) + encoded)
+                f.write(b"\0" * (data_start - f.tell()))
+                for name, size in sizes:
+                    f.write(row_data if name == "row_data" else columns[name].tobytes())
+                    f.write(b"\0" * (-size % 8))
+            os.replace(temporary, self.path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return len(entries)
+
+    def load(self, rows: List[Dict[str, Any]]) -> None:
+        """Write rows as the new snapshot and map it."""
+        self.write(rows, fetched_at=time.time(), full_fetched_at=time.time())
+        self.refresh()
+
+    def refresh(self) -> bool:
+        """
+        Map the snapshot file if it was replaced since it was last mapped.
+
+        Returns:
+            Whether a new snapshot was mapped
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        current = self._snapshot
+        if current is not None and current.key == (stat.st_ino, stat.st_mtime_ns, stat.st_size):
+            return False
+        snapshot = _Snapshot(self.path)
+        # Keep the overlay entries the new snapshot may not reflect yet
+        fetched_at = snapshot.meta.get("fetched_at") or 0
+        full_fetched_at = snapshot.meta.get("full_fetched_at") or 0
+        self._overlay = {
+            bathroom_id: (row, changed_at) for bathroom_id, (row, changed_at) in self._overlay.items()
+            if changed_at >= (fetched_at if row is not None else full_fetched_at)
+        }
+        self.cell_degrees = snapshot.meta["cell_degrees"]
+        self._lng_cells = int(round(360 / self.cell_degrees))
+        self.last_updated_at = snapshot.meta["last_updated_at"]
+        self._snapshot = snapshot
+        self.loaded_at = time.time()
+        self.version += 1
+        logger.info(f"Mapped bathrooms snapshot {self.path} ({snapshot.count} rows, "
+                    f"{snapshot.mapping.size() / 1e6:.1f} MB)")
+        return True
+
+    def upsert(self, row: Dict[str, Any]) -> None:
+        """Insert a bathroom or replace the snapshot's copy of it, in this process only."""
+        if row.get("latitude") is None or row.get("longitude") is None:
+            return
+        self._overlay[row["id"]] = (row, time.time())
+        self.version += 1
+
+    def remove(self, bathroom_id: int) -> None:
+        """Hide a bathroom from this process until a snapshot without it is mapped."""
+        self._overlay[bathroom_id] = (None, time.time())
+        self.version += 1
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """Get every row, decoding the whole snapshot; prefer ``vector_index`` for bulk work."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self._overlay_rows()
+        overlay = self._overlay
+        decoded = [self._decode(snapshot, position) for position in range(snapshot.count)
+                   if snapshot.ids[position] not in overlay]
+        return decoded + self._overlay_rows()
+
+    def vector_index(self) -> VectorIndex:
+        """A VectorIndex over the mapped columns, without copying them, plus this process's changes."""
+        snapshot = self._snapshot
+        changed = self._overlay_rows()
+        return VectorIndex(
+            self.cell_degrees, snapshot.ids, snapshot.latitude, snapshot.longitude, snapshot.flags,
+            snapshot.rating, snapshot.cell_keys, snapshot.cell_starts,
+            lambda position: self._decode(snapshot, position),
+            hidden=self._overlay.keys(),
+            extra=VectorIndex.from_rows(changed, self.cell_degrees) if changed else None
+        )
+
+    @staticmethod
+    def _position(snapshot: _Snapshot, bathroom_id: int) -> Optional[int]:
+        i = bisect_left(snapshot.sorted_ids, bathroom_id)
+        if i < snapshot.count and snapshot.sorted_ids[i] == bathroom_id:
+            return snapshot.id_positions[i]
+        return None
+
+    @staticmethod
+    def _decode(snapshot: _Snapshot, position: int) -> Dict[str, Any]:
+        offsets = snapshot.row_offsets
+        return marshal.loads(snapshot.row_data[offsets[position]:offsets[position + 1]])
+
+    def get(self, bathroom_id: int) -> Optional[Dict[str, Any]]:
+        """Get the current copy of a bathroom."""
+        changed = self._overlay.get(bathroom_id)
+        if changed is not None:
+            return changed[0]
+        snapshot = self._snapshot
+        position = self._position(snapshot, bathroom_id) if snapshot is not None else None
+        return self._decode(snapshot, position) if position is not None else None
+
+    def _row_buckets(self, row: int, col_terms: List[Tuple[int, float]]) -> List[Tuple[float, Tuple[int, int]]]:
+        """Occupied cells of one grid row as (longitude term, (start, end) positions), two bisections per run."""
+        snapshot = self._snapshot
+        keys, starts, lng_cells = snapshot.cell_keys, snapshot.cell_starts, self._lng_cells
+        first_col = col_terms[0][0]
+        last_col = first_col + len(col_terms)
+        base = row * lng_cells
+        runs = [(first_col, min(last_col, lng_cells))]
+        if last_col > lng_cells:
+            runs.append((0, last_col - lng_cells))
+        found = []
+        for lo, hi in runs:
+            first = bisect_left(keys, base + lo)
+            for i in range(first, bisect_left(keys, base + hi, first)):
+                found.append((col_terms[(keys[i] - base - first_col) % lng_cells][1], (starts[i], starts[i + 1])))
+        return found
+
+    def _overlay_rows(self):
+        return [row for row, _ in self._overlay.values() if row is not None]
+
+    def _in_bbox(
+        self,
+        min_lat: float,
+        min_lng: float,
+        max_lat: float,
+        max_lng: float,
+        rating_min: Optional[float],
+        flag_mask: int,
+        flag_value: int
+    ):
+        """
+        Yield the snapshot positions, then the overlay rows, inside a bounding box.
+
+        Cells of one grid row and column range have consecutive keys, so each
+        grid row of the box is a single run of positions found by bisection.
+        """
+        snapshot = self._snapshot
+        keys, starts = snapshot.cell_keys, snapshot.cell_starts
+        ids, lats, lngs, flags, ratings = (snapshot.ids, snapshot.latitude, snapshot.longitude,
+                                           snapshot.flags, snapshot.rating)
+        overlay = self._overlay
+        ranges = [(min_lng, max_lng)] if min_lng <= max_lng else [(min_lng, 180.0), (-180.0, max_lng)]
+        row_lo = self._cell(max(-90.0, min_lat), 0)[0]
+        row_hi = self._cell(min(90.0, max_lat), 0)[0]
+        for lo, hi in ranges:
+            col_lo = int(math.floor((lo + 180) / self.cell_degrees))
+            col_hi = min(self._lng_cells - 1, int(math.floor((hi + 180) / self.cell_degrees)))
+            for cell_row in range(row_lo, row_hi + 1):
+                base = cell_row * self._lng_cells
+                first = bisect_left(keys, base + col_lo)
+                last = bisect_right(keys, base + col_hi, first)
+                for position in range(starts[first], starts[last]):
+                    if flags[position] & flag_mask != flag_value or \
+                            (rating_min is not None and ratings[position] < rating_min):
+                        continue
+                    if not (min_lat <= lats[position] <= max_lat and lo <= lngs[position] <= hi):
+                        continue
+                    if overlay and ids[position] in overlay:
+                        continue
+                    yield position
+        for row in self._overlay_rows():
+            if attribute_flags(row) & flag_mask != flag_value or \
+                    (rating_min is not None and float(row.get("average_rating") or 0) < rating_min):
+                continue
+            latitude, longitude = row["latitude"], row["longitude"]
+            if min_lat <= latitude <= max_lat and any(lo <= longitude <= hi for lo, hi in ranges):
+                yield row
+
+    def within_bbox(
+        self,
+        min_lat: float,
+        min_lng: float,
+        max_lat: float,
+        max_lng: float,
+        limit: int,
+        rating_min: Optional[float] = None,
+        flag_mask: int = 0,
+        flag_value: int = 0
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """Get the bathrooms inside a bounding box, see ``SpatialIndex.within_bbox``."""
+        snapshot = self._snapshot
+        found = []
+        for match in self._in_bbox(min_lat, min_lng, max_lat, max_lng, rating_min, flag_mask, flag_value):
+            if len(found) == limit:
+                return found, True
+            found.append(dict(match) if isinstance(match, dict) else self._decode(snapshot, match))
+        return found, False
+
+    def points_in_bbox(
+        self,
+        min_lat: float,
+        min_lng: float,
+        max_lat: float,
+        max_lng: float,
+        limit: int,
+        rating_min: Optional[float] = None,
+        flag_mask: int = 0,
+        flag_value: int = 0
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Like ``within_bbox``, but only the columns clustering needs, read
+        straight from the mapped columns without decoding whole rows.
+        """
+        snapshot = self._snapshot
+        ids, lats, lngs, flags, ratings = (snapshot.ids, snapshot.latitude, snapshot.longitude,
+                                           snapshot.flags, snapshot.rating)
+        found = []
+        for match in self._in_bbox(min_lat, min_lng, max_lat, max_lng, rating_min, flag_mask, flag_value):
+            if len(found) == limit:
+                return found, True
+            if isinstance(match, dict):
+                found.append(match)
+                continue
+            bits = flags[match]
+            found.append({
+                "id": ids[match], "latitude": lats[match], "longitude": lngs[match],
+                "average_rating": ratings[match], "is_unisex": bool(bits & FLAG_UNISEX),
+                "is_accessible": bool(bits & FLAG_ACCESSIBLE), "has_changing_table": bool(bits & FLAG_CHANGING_TABLE),
+            })
+        return found, False
+
+    def query(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        limit: int,
+        rating_min: Optional[float] = None,
+        flag_mask: int = 0,
+        flag_value: int = 0,
+        after: Optional[Tuple[float, int]] = None
+    ) -> List[Dict[str, Any]]:
+        """Get the bathrooms within ``radius_km`` of a point, nearest first, see ``SpatialIndex.query``."""
+        if limit <= 0 or radius_km < 0:
+            return []
+        snapshot = self._snapshot
+        ids, lats, lngs, flags, ratings = (snapshot.ids, snapshot.latitude, snapshot.longitude,
+                                           snapshot.flags, snapshot.rating)
+        overlay = self._overlay
+        lat0 = math.radians(latitude)
+        lng0 = math.radians(longitude)
+        cos0 = math.cos(lat0)
+        max_h = math.sin(min(radius_km / EARTH_RADIUS_KM, math.pi) / 2) ** 2
+        min_h, tie_h = after_bounds(after)
+        sin, cos = math.sin, math.cos
+        # Max-heap of the best (h, id, position) so far, stored negated; overlay rows have position None
+        best: List[Tuple[float, int, Optional[int]]] = []
+
+        def consider(h: float, bathroom_id: int, position: Optional[int]) -> None:
+            if len(best) < limit:
+                heapq.heappush(best, (-h, -bathroom_id, position))
+            elif (h, bathroom_id) < (-best[0][0], -best[0][1]):
+                heapq.heapreplace(best, (-h, -bathroom_id, position))
+
+        for row in self._overlay_rows():
+            lat, lng, cos_lat, row_flags, rating = self._point(row)
+            if row_flags & flag_mask != flag_value or (rating_min is not None and rating < rating_min):
+                continue
+            h = sin((lat - lat0) / 2) ** 2 + cos0 * cos_lat * sin((lng - lng0) / 2) ** 2
+            if h > max_h or h < min_h or (h <= tie_h and (h_distance(h), row["id"]) <= after):
+                continue
+            consider(h, row["id"], None)
+
+        for bound, (start, end) in self._cells_in_radius(latitude, longitude, radius_km, max_h, min_h):
+            if len(best) == limit and bound > -best[0][0]:
+                break
+            for position in range(start, end):
+                if flags[position] & flag_mask != flag_value or \
+                        (rating_min is not None and ratings[position] < rating_min):
+                    continue
+                lat = lats[position] * _RADIANS
+                h = sin((lat - lat0) / 2) ** 2 + cos0 * cos(lat) * sin((lngs[position] * _RADIANS - lng0) / 2) ** 2
+                if h > max_h or h < min_h:
+                    continue
+                bathroom_id = ids[position]
+                if overlay and bathroom_id in overlay:
+                    continue
+                if h <= tie_h and (h_distance(h), bathroom_id) <= after:
+                    continue
+                if len(best) < limit:
+                    heapq.heappush(best, (-h, -bathroom_id, position))
+                elif (h, bathroom_id) < (-best[0][0], -best[0][1]):
+                    heapq.heapreplace(best, (-h, -bathroom_id, position))
+
+        results = []
+        for neg_h, neg_id, position in sorted(best, key=lambda entry: entry[:2], reverse=True):
+            row = self._decode(snapshot, position) if position is not None else dict(self._overlay[-neg_id][0])
+            row["distance"] = h_distance(-neg_h)
+            results.append(row)
+        return results
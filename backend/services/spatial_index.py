@@ -0,0 +1,474 @@
+import math
+import heapq
+import time
+import logging
+from typing import List, Optional, Dict, Any, Tuple, Sequence
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0
+
+# Columns kept in the index. Everything the map needs to render a marker and
+# its info window, so nearby queries never have to go back to the database.
+INDEX_COLUMNS = (
+    "id, name, address, latitude, longitude, is_unisex, is_accessible, "
+    "has_changing_table, directions, comment, average_rating, total_ratings, "
+    "external_id, external_source, created_at, updated_at"
+)
+
+
+# Bit per boolean attribute, so attribute filters are a single mask compare
+FLAG_UNISEX = 1
+FLAG_ACCESSIBLE = 2
+FLAG_CHANGING_TABLE = 4
+
+ATTRIBUTE_FLAGS = (
+    ("is_unisex", FLAG_UNISEX),
+    ("is_accessible", FLAG_ACCESSIBLE),
+    ("has_changing_table", FLAG_CHANGING_TABLE),
+)
+
+
+def attribute_flags(row: Dict[str, Any]) -> int:
+    """Pack a bathroom's boolean attributes into a bitmask."""
+    flags = 0
+    for column, bit in ATTRIBUTE_FLAGS:
+        if row.get(column):
+            flags |= bit
+    return flags
+
+
+def filter_mask(
+    is_unisex: Optional[bool] = None,
+    is_accessible: Optional[bool] = None,
+    has_changing_table: Optional[bool] = None
+) -> Tuple[int, int]:
+    """
+    Build the (mask, value) pair for attribute filters.
+
+    A bathroom matches when ``attribute_flags(row) & mask == value``. Filters
+    left as None are not part of the mask.
+    """
+    mask = 0
+    value = 0
+    for wanted, bit in ((is_unisex, FLAG_UNISEX), (is_accessible, FLAG_ACCESSIBLE),
+                        (has_changing_table, FLAG_CHANGING_TABLE)):
+        if wanted is not None:
+            mask |= bit
+            if wanted:
+                value |= bit
+    return mask, value
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance in kilometers between two points given in degrees."""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    h = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+
+def h_distance(h: float) -> float:
+    """Distance in kilometers for a haversine term, as queries report it."""
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+
+def after_bounds(after: Optional[Tuple[float, int]]) -> Tuple[float, float]:
+    """
+    Haversine terms bracketing a (distance, id) paging cursor.
+
+    Candidates below the first are before the cursor; those up to the second
+    are too close to call from the term alone and are compared on
+    ``(h_distance(h), id)``, the key the cursor was taken from. Both are -1
+    without a cursor, so neither check ever fires.
+    """
+    if after is None:
+        return -1.0, -1.0
+    h = math.sin(min(after[0] / EARTH_RADIUS_KM, math.pi) / 2) ** 2
+    return h * (1 - 1e-9), h * (1 + 1e-9)
+
+
+def densify_path(points: Sequence[Tuple[float, float]], step_km: float,
+                 max_points: Optional[int] = None) -> List[Tuple[float, float]]:
+    """
+    Add points along a path of (latitude, longitude) pairs so consecutive
+    points are at most ``step_km`` apart.
+
+    Points are interpolated linearly in latitude and longitude, taking the
+    short way across the antimeridian, which is close enough to the great
+    circle for the segment lengths of a route.
+
+    Raises:
+        ValueError: If that takes more than ``max_points`` points
+    """
+    if not points:
+        return []
+    dense = [tuple(points[0])]
+    for (lat1, lng1), (lat2, lng2) in zip(points, points[1:]):
+        dlng = (lng2 - lng1 + 180) % 360 - 180
+        steps = max(1, int(math.ceil(haversine_km(lat1, lng1, lat2, lng2) / step_km))) if step_km > 0 else 1
+        if max_points is not None and len(dense) + steps > max_points:
+            raise ValueError(f"Path needs more than {max_points} points {step_km}km apart")
+        for i in range(1, steps + 1):
+            lng = lng1 + dlng * i / steps
+            dense.append((lat1 + (lat2 - lat1) * i / steps, (lng + 180) % 360 - 180))
+    return dense
+
+
+class SpatialIndex:
+    """
+    In-memory lat/lng grid over the bathrooms table.
+
+    Bathrooms are bucketed into fixed-size cells of ``cell_degrees`` on each
+    axis. A radius query visits the cells overlapping the bounding box of the
+    search circle, nearest first, and ranks the candidates by exact haversine
+    distance.
+    """
+
+    def __init__(self, cell_degrees: float = 0.01):
+        if cell_degrees <= 0 or abs(360 / cell_degrees - round(360 / cell_degrees)) > 1e-9:
+            raise ValueError("cell_degrees must evenly divide 360")
+        self.cell_degrees = cell_degrees
+        self._lng_cells = int(round(360 / cell_degrees))
+        self._rows: Dict[int, Dict[str, Any]] = {}
+        # cell -> {bathroom_id: (lat_rad, lng_rad, cos_lat, flags, average_rating)}
+        self._cells: Dict[Tuple[int, int], Dict[int, Tuple[float, float, float, int, float]]] = {}
+        self.last_updated_at: Optional[str] = None
+        self.loaded_at: Optional[float] = None
+        # Bumped on every change, so structures derived from the index know when to rebuild
+        self.version = 0
+
+    @property
+    def ready(self) -> bool:
+        """Whether the index has completed its initial load."""
+        return self.loaded_at is not None
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """Get the indexed rows, as a list that stays valid while the index changes."""
+        return list(self._rows.values())
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        row = int(math.floor((latitude + 90) / self.cell_degrees))
+        col = int(math.floor((longitude + 180) / self.cell_degrees)) % self._lng_cells
+        return row, col
+
+    @staticmethod
+    def _point(row: Dict[str, Any]) -> Tuple[float, float, float, int, float]:
+        lat = math.radians(row["latitude"])
+        return (lat, math.radians(row["longitude"]), math.cos(lat),
+                attribute_flags(row), float(row.get("average_rating") or 0))
+
+    def _insert(self, rows: Dict[int, Dict[str, Any]], cells, row: Dict[str, Any]) -> None:
+        bathroom_id = row["id"]
+        rows[bathroom_id] = row
+        cell = self._cell(row["latitude"], row["longitude"])
+        cells.setdefault(cell, {})[bathroom_id] = self._point(row)
+
+    def _track_updated_at(self, row: Dict[str, Any]) -> None:
+        updated_at = row.get("updated_at")
+        if updated_at and (self.last_updated_at is None or str(updated_at) > self.last_updated_at):
+            self.last_updated_at = str(updated_at)
+
+    def load(self, rows: List[Dict[str, Any]]) -> None:
+        """
+        Replace the contents of the index.
+
+        The new grid is built off to the side and swapped in at the end, so
+        queries running concurrently see either the old or the new data.
+        """
+        new_rows: Dict[int, Dict[str, Any]] = {}
+        new_cells: Dict[Tuple[int, int], Dict[int, Tuple[float, float, float, int, float]]] = {}
+        self.last_updated_at = None
+        for row in rows:
+            if row.get("latitude") is None or row.get("longitude") is None:
+                continue
+            self._insert(new_rows, new_cells, row)
+            self._track_updated_at(row)
+        self._rows, self._cells = new_rows, new_cells
+        self.loaded_at = time.time()
+        self.version += 1
+
+    def upsert(self, row: Dict[str, Any]) -> None:
+        """Insert a bathroom or replace the indexed copy of it."""
+        if row.get("latitude") is None or row.get("longitude") is None:
+            return
+        self.remove(row["id"])
+        self._insert(self._rows, self._cells, row)
+        self._track_updated_at(row)
+        self.version += 1
+
+    def remove(self, bathroom_id: int) -> None:
+        """Remove a bathroom from the index if it is present."""
+        row = self._rows.pop(bathroom_id, None)
+        if row is None:
+            return
+        self.version += 1
+        cell = self._cell(row["latitude"], row["longitude"])
+        bucket = self._cells.get(cell)
+        if bucket is not None:
+            bucket.pop(bathroom_id, None)
+            if not bucket:
+                del self._cells[cell]
+
+    def get(self, bathroom_id: int) -> Optional[Dict[str, Any]]:
+        """Get the indexed copy of a bathroom."""
+        return self._rows.get(bathroom_id)
+
+    def within_bbox(
+        self,
+        min_lat: float,
+        min_lng: float,
+        max_lat: float,
+        max_lng: float,
+        limit: int,
+        rating_min: Optional[float] = None,
+        flag_mask: int = 0,
+        flag_value: int = 0
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Get the bathrooms inside a bounding box.
+
+        ``min_lng`` greater than ``max_lng`` selects a box crossing the
+        antimeridian.
+
+        Returns:
+            Copies of up to ``limit`` matching rows, and whether more matched
+        """
+        found = []
+        ranges = [(min_lng, max_lng)] if min_lng <= max_lng else [(min_lng, 180.0), (-180.0, max_lng)]
+        row_lo = self._cell(max(-90.0, min_lat), 0)[0]
+        row_hi = self._cell(min(90.0, max_lat), 0)[0]
+        for lo, hi in ranges:
+            col_lo = int(math.floor((lo + 180) / self.cell_degrees))
+            col_hi = min(self._lng_cells - 1, int(math.floor((hi + 180) / self.cell_degrees)))
+            if (row_hi - row_lo + 1) * (col_hi - col_lo + 1) > len(self._cells):
+                # Box covers more cells than are occupied; walk the occupied ones instead
+                buckets = (bucket for (row, col), bucket in self._cells.items()
+                           if row_lo <= row <= row_hi and col_lo <= col <= col_hi)
+            else:
+                buckets = (self._cells.get((row, col)) for row in range(row_lo, row_hi + 1)
+                           for col in range(col_lo, col_hi + 1))
+            for bucket in buckets:
+                if not bucket:
+                    continue
+                for bathroom_id, (_, _, _, flags, rating) in bucket.items():
+                    if flags & flag_mask != flag_value or (rating_min is not None and rating < rating_min):
+                        continue
+                    indexed = self._rows[bathroom_id]
+                    if not (min_lat <= indexed["latitude"] <= max_lat and lo <= indexed["longitude"] <= hi):
+                        continue
+                    if len(found) == limit:
+                        return found, True
+                    found.append(dict(indexed))
+        return found, False
+
+    def _row_buckets(self, row: int, col_terms: List[Tuple[int, float]]) -> List[Tuple[float, Any]]:
+        """
+        Get the non-empty buckets of one grid row among consecutive columns.
+
+        Args:
+            row: Grid row
+            col_terms: (column, longitude term) pairs, consecutive modulo the number of columns
+
+        Returns:
+            (longitude term, bucket) pairs
+        """
+        cells = self._cells
+        found = []
+        for col, lng_term in col_terms:
+            bucket = cells.get((row, col))
+            if bucket:
+                found.append((lng_term, bucket))
+        return found
+
+    def _cells_in_radius(self, latitude: float, longitude: float, radius_km: float, max_h: float,
+                         min_h: float = 0.0):
+        """
+        Get the non-empty buckets that can hold points within a search circle.
+
+        Each cell gets a lower bound of the haversine term between the center
+        and any point inside it: sin^2(d/2) = sin^2(dphi/2) +
+        cos(phi1)cos(phi2)sin^2(dlambda/2), evaluated with the smallest
+        latitude/longitude gaps to the cell and the largest absolute latitude
+        involved, so it never overestimates the distance.
+
+        With ``min_h``, the run of columns around the center whose cells lie
+        wholly nearer than that (by the same formula with the largest gaps) is
+        skipped in each grid row, so a search past a paging cursor only walks
+        the ring beyond it.
+
+        Returns:
+            List of (lower bound, bucket) pairs, nearest cell first
+        """
+        step = self.cell_degrees
+        cos0 = math.cos(math.radians(latitude))
+        dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+        lat_lo = max(-90.0, latitude - dlat)
+        lat_hi = min(90.0, latitude + dlat)
+        # Skipping inner columns needs the columns in center-relative order, not wrapped
+        skip_inner = False
+        if lat_lo <= -90.0 or lat_hi >= 90.0:
+            col_range = range(self._lng_cells)
+        else:
+            ratio = math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(latitude))
+            dlng = 180.0 if ratio >= 1 else math.degrees(math.asin(ratio))
+            if dlng >= 180.0:
+                col_range = range(self._lng_cells)
+            else:
+                first = int(math.floor((longitude - dlng + 180) / step))
+                last = int(math.floor((longitude + dlng + 180) / step))
+                col_range = range(first, min(last, first + self._lng_cells - 1) + 1)
+                skip_inner = min_h > 0
+
+        # The longitude gap only depends on the column
+        col_terms = []
+        for col in col_range:
+            col %= self._lng_cells
+            offset = (longitude - (col * step - 180)) % 360
+            dlmb = 0.0 if offset <= step else min(offset - step, 360 - offset)
+            col_terms.append((col, math.sin(math.radians(dlmb) / 2) ** 2))
+
+        row_lo = self._cell(lat_lo, 0)[0]
+        row_hi = self._cell(lat_hi, 0)[0]
+        found = []
+        for row in range(row_lo, row_hi + 1):
+            lat_a = row * step - 90
+            lat_b = lat_a + step
+            dphi = lat_a - latitude if latitude < lat_a else (latitude - lat_b if latitude > lat_b else 0.0)
+            lat_term = math.sin(math.radians(dphi) / 2) ** 2
+            cos_sq = math.cos(math.radians(max(abs(latitude), abs(lat_a), abs(lat_b)))) ** 2
+            runs = [col_terms]
+            if skip_inner:
+                far_term = math.sin(math.radians(max(abs(latitude - lat_a), abs(latitude - lat_b))) / 2) ** 2
+                near_cos = cos0 * math.cos(math.radians(0.0 if lat_a < 0 < lat_b else min(abs(lat_a), abs(lat_b))))
+                if far_term + near_cos <= min_h:
+                    # Every cell of the row is nearer than min_h
+                    continue
+                if far_term < min_h:
+                    gap = math.degrees(2 * math.asin(math.sqrt((min_h - far_term) / near_cos)))
+                    inner_lo = int(math.ceil((longitude - gap + 180) / step)) - col_range.start
+                    inner_hi = int(math.floor((longitude + gap + 180) / step)) - col_range.start
+                    if inner_lo < inner_hi:
+                        runs = [col_terms[:max(0, inner_lo)], col_terms[max(0, inner_hi):]]
+            for run in runs:
+                if not run:
+                    continue
+                for lng_term, bucket in self._row_buckets(row, run):
+                    bound = lat_term + cos_sq * lng_term
+                    if bound <= max_h:
+                        found.append((bound, bucket))
+        found.sort(key=lambda cell: cell[0])
+        return found
+
+    def query(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        limit: int,
+        rating_min: Optional[float] = None,
+        flag_mask: int = 0,
+        flag_value: int = 0,
+        after: Optional[Tuple[float, int]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Get the bathrooms within ``radius_km`` of a point, nearest first.
+
+        Cells are visited in order of their distance lower bound, and the scan
+        stops once no remaining cell can beat the ``limit``-th best candidate,
+        so dense areas cost about the same as sparse ones. Filters are checked
+        before a candidate is ranked, so up to ``limit`` matching bathrooms are
+        returned in a single pass. Rows tie-break on id, which makes
+        ``(distance, id)`` a total order to page through: a page starting
+        ``after`` the last row of the previous one skips the cells wholly
+        nearer than it, so it costs about what the first page did.
+
+        Args:
+            latitude: Search center latitude
+            longitude: Search center longitude
+            radius_km: Search radius in kilometers
+            limit: Maximum number of results to return
+            rating_min: Minimum average rating
+            flag_mask: Attribute bits to filter on, see ``filter_mask``
+            flag_value: Required values of the bits in ``flag_mask``
+            after: Only return rows past this (distance, id) paging cursor
+
+        Returns:
+            Copies of the indexed rows with an added ``distance`` in kilometers
+        """
+        if limit <= 0 or radius_km < 0:
+            return []
+        lat0 = math.radians(latitude)
+        lng0 = math.radians(longitude)
+        cos0 = math.cos(lat0)
+        # Compare on the haversine term instead of the distance itself so the
+        # inner loop avoids asin/sqrt entirely.
+        max_h = math.sin(min(radius_km / EARTH_RADIUS_KM, math.pi) / 2) ** 2
+        min_h, tie_h = after_bounds(after)
+        sin = math.sin
+        # Max-heap of the best (h, id) pairs so far, stored negated
+        best: List[Tuple[float, int]] = []
+        for bound, bucket in self._cells_in_radius(latitude, longitude, radius_km, max_h, min_h):
+            if len(best) == limit and bound > -best[0][0]:
+                break
+            for bathroom_id, (lat, lng, cos_lat, flags, rating) in bucket.items():
+                if flags & flag_mask != flag_value or (rating_min is not None and rating < rating_min):
+                    continue
+                h = sin((lat - lat0) / 2) ** 2 + cos0 * cos_lat * sin((lng - lng0) / 2) ** 2
+                if h > max_h or h < min_h:
+                    continue
+                if h <= tie_h and (h_distance(h), bathroom_id) <= after:
+                    continue
+                if len(best) < limit:
+                    heapq.heappush(best, (-h, -bathroom_id))
+                elif (h, bathroom_id) < (-best[0][0], -best[0][1]):
+                    heapq.heapreplace(best, (-h, -bathroom_id))
+        results = []
+        for neg_h, neg_id in sorted(best, reverse=True):
+            row = dict(self._rows[-neg_id])
+            row["distance"] = h_distance(-neg_h)
+            results.append(row)
+        return results
+
+    def nearest(
+        self,
+        latitude: float,
+        longitude: float,
+        limit: int,
+        rating_min: Optional[float] = None,
+        flag_mask: int = 0,
+        flag_value: int = 0,
+        after: Optional[Tuple[float, int]] = None,
+        ring_km: float = 1.0,
+        max_radius_km: float = 100.0
+    ) -> List[Dict[str, Any]]:
+        """
+        Get the ``limit`` matching bathrooms nearest to a point, at any distance up to ``max_radius_km``.
+
+        Searches a ring past ``after`` (or the center) ``ring_km`` wide, then
+        rings twice as wide beyond it until ``limit`` matches are found, so
+        sparse areas and strict filters widen the search instead of coming
+        back short, and later pages start where the previous one ended.
+
+        Returns:
+            Copies of the indexed rows with an added ``distance`` in kilometers
+        """
+        found: List[Dict[str, Any]] = []
+        inner = after[0] if after is not None else 0.0
+        width = ring_km
+        while len(found) < limit and inner < max_radius_km:
+            outer = min(inner + width, max_radius_km)
+            found.extend(self.query(
+                latitude, longitude, outer, limit - len(found),
+                rating_min=rating_min, flag_mask=flag_mask, flag_value=flag_value, after=after
+            ))
+            # Everything matching up to the ring's edge has been seen
+            after = (outer, math.inf)
+            inner = outer
+            width *= 2
+        return found
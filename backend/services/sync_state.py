@@ -0,0 +1,148 @@
+import json
+import hashlib
+import sqlite3
+import logging
+from dataclasses import dataclass, asdict
+from typing import List, Dict, Any, Tuple, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# SQLite caps bound parameters per statement; stay well below it
+_CHUNK = 500
+
+
+def content_hash(row: Dict[str, Any]) -> str:
+    """Stable hash of a transformed bathroom row."""
+    encoded = json.dumps(row, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class SyncReport:
+    """Row counts for one sync run."""
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    deleted: int = 0
+    failed: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+class SyncState:
+    """
+    Content hash of every synced row, keyed by (external_source, external_id).
+
+    Kept in a local SQLite file so re-syncing a region only writes rows whose
+    upstream content changed. Each row also remembers its location and the
+    last run that saw it, which is how rows removed upstream are found.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sync_state ("
+            " external_source TEXT NOT NULL,"
+            " external_id TEXT NOT NULL,"
+            " content_hash TEXT NOT NULL,"
+            " latitude REAL,"
+            " longitude REAL,"
+            " last_seen TEXT,"
+            " PRIMARY KEY (external_source, external_id))"
+        )
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM sync_state").fetchone()[0]
+
+    def hashes(self, source: str, external_ids: List[str]) -> Dict[str, str]:
+        """Stored hashes for the given ids of one source."""
+        found = {}
+        for i in range(0, len(external_ids), _CHUNK):
+            chunk = external_ids[i:i + _CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            cursor = self._conn.execute(
+                f"SELECT external_id, content_hash FROM sync_state "
+                f"WHERE external_source = ? AND external_id IN ({placeholders})",
+                [source, *chunk]
+            )
+            found.update(cursor.fetchall())
+        return found
+
+    def classify(
+        self,
+        rows: List[Dict[str, Any]],
+        run_id: str,
+        report: SyncReport
+    ) -> List[Tuple[Dict[str, Any], str, bool]]:
+        """
+        Split transformed rows into changed and unchanged.
+
+        Every row is marked as seen by ``run_id`` right away, whatever
+        becomes of its write, so a row still upstream is never deleted as
+        stale. Changed rows are returned for writing and their new hash is
+        only recorded once the write succeeds (see ``record``), so a failed
+        write is retried by the next run.
+
+        Returns:
+            (row, content hash, is new) for every new or modified row
+        """
+        by_source: Dict[str, List[Dict[str, Any]]] = {}
+        for row in rows:
+            by_source.setdefault(row["external_source"], []).append(row)
+
+        changed = []
+        for source, source_rows in by_source.items():
+            stored = self.hashes(source, [row["external_id"] for row in source_rows])
+            seen_ids = []
+            for row in source_rows:
+                digest = content_hash(row)
+                previous = stored.get(row["external_id"])
+                if previous is not None:
+                    seen_ids.append(row["external_id"])
+                if previous == digest:
+                    report.unchanged += 1
+                else:
+                    changed.append((row, digest, previous is None))
+            if seen_ids:
+                self._conn.executemany(
+                    "UPDATE sync_state SET last_seen = ? WHERE external_source = ? AND external_id = ?",
+                    [(run_id, source, external_id) for external_id in seen_ids]
+                )
+        self._conn.commit()
+        return changed
+
+    def record(self, written: Iterable[Tuple[Dict[str, Any], str, bool]], run_id: str) -> None:
+        """Store hashes for rows that were written successfully."""
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO sync_state "
+            "(external_source, external_id, content_hash, latitude, longitude, last_seen) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(row["external_source"], row["external_id"], digest, row.get("latitude"), row.get("longitude"), run_id)
+             for row, digest, _ in written]
+        )
+        self._conn.commit()
+
+    def stale(self, source: str, bbox: Tuple[float, float, float, float], run_id: str) -> List[str]:
+        """Ids inside a bounding box that ``run_id`` did not see."""
+        min_lat, min_lng, max_lat, max_lng = bbox
+        cursor = self._conn.execute(
+            "SELECT external_id FROM sync_state WHERE external_source = ? "
+            "AND latitude >= ? AND latitude < ? AND longitude >= ? AND longitude < ? "
+            "AND (last_seen IS NULL OR last_seen != ?)",
+            (source, min_lat, max_lat, min_lng, max_lng, run_id)
+        )
+        return [external_id for (external_id,) in cursor.fetchall()]
+
+    def forget(self, source: str, external_ids: List[str]) -> None:
+        """Remove rows from the state."""
+        self._conn.executemany(
+            "DELETE FROM sync_state WHERE external_source = ? AND external_id = ?",
+            [(source, external_id) for external_id in external_ids]
+        )
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
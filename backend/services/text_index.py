@@ -0,0 +1,377 @@
+import re
+import math
+import time
+import heapq
+import bisect
+import unicodedata
+from typing import List, Dict, Any, Optional, Tuple, Iterable
+
+from services.spatial_index import haversine_km, EARTH_RADIUS_KM
+
+# Searched columns and how much a match in each counts
+FIELD_WEIGHTS = (
+    ("name", 3.0),
+    ("address", 2.0),
+    ("directions", 1.0),
+    ("comment", 1.0),
+)
+
+_WORD = re.compile(r"[0-9a-z]+")
+_APOSTROPHES = re.compile(r"['’]")
+
+# Score factor for terms matched by prefix or by spelling rather than exactly
+PREFIX_FACTOR = 0.8
+FUZZY_FACTOR = 0.7
+
+# BM25 term-frequency saturation
+_K1 = 1.2
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Split text into lowercase ASCII words, with accents and apostrophes dropped ("Café's" -> "cafes")."""
+    if not text:
+        return []
+    text = unicodedata.normalize("NFKD", _APOSTROPHES.sub("", text))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _WORD.findall(text.lower())
+
+
+def trigrams(term: str) -> set:
+    """Trigrams of a word padded like pg_trgm: two spaces in front, one behind."""
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_edits(token: str) -> int:
+    """Typos tolerated in a query word: none below 4 letters, one up to 7, then two."""
+    return 0 if len(token) < 4 else 1 if len(token) < 8 else 2
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Edits (insertions, deletions, substitutions, adjacent swaps) turning ``a`` into ``b``.
+
+    Gives up early with ``limit + 1`` once the distance must exceed ``limit``.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class TextIndex:
+    """
+    In-memory inverted index over bathroom names, addresses and directions.
+
+    Every word maps to the bathrooms containing it, weighted by the fields it
+    appears in. Query words match indexed words exactly, by prefix (the last
+    word, as it is probably still being typed) or, to tolerate typos, by
+    trigram similarity or edit distance; every query word has to match for a
+    bathroom to be found.
+    """
+
+    def __init__(
+        self,
+        fuzzy_threshold: float = 0.4,
+        max_expansions: int = 32,
+        distance_scale_km: float = 1.0
+    ):
+        self.fuzzy_threshold = fuzzy_threshold
+        self.max_expansions = max_expansions
+        self.distance_scale_km = distance_scale_km
+        self._rows: Dict[int, Dict[str, Any]] = {}
+        # bathroom id -> {term: summed field weight}
+        self._doc_terms: Dict[int, Dict[str, float]] = {}
+        # term -> {bathroom id: summed field weight}
+        self._postings: Dict[str, Dict[int, float]] = {}
+        # Sorted terms, for prefix lookups
+        self._vocabulary: List[str] = []
+        # trigram -> alphabetic terms containing it, for fuzzy lookups
+        self._trigrams: Dict[str, set] = {}
+        self.last_updated_at: Optional[str] = None
+        self.loaded_at: Optional[float] = None
+        self.version = 0
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict[str, Any]], **options) -> "TextIndex":
+        """Build a loaded index from bathroom rows."""
+        index = cls(**options)
+        index.load(rows)
+        return index
+
+    @property
+    def ready(self) -> bool:
+        """Whether the index has completed its initial load."""
+        return self.loaded_at is not None
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @staticmethod
+    def _terms(row: Dict[str, Any]) -> Dict[str, float]:
+        terms: Dict[str, float] = {}
+        for column, weight in FIELD_WEIGHTS:
+            value = row.get(column)
+            for term in tokenize(value if isinstance(value, str) else None):
+                terms[term] = terms.get(term, 0.0) + weight
+        return terms
+
+    def _add_term(self, term: str) -> None:
+        bisect.insort(self._vocabulary, term)
+        if not term.isdigit():
+            for trigram in trigrams(term):
+                self._trigrams.setdefault(trigram, set()).add(term)
+
+    def _drop_term(self, term: str) -> None:
+        position = bisect.bisect_left(self._vocabulary, term)
+        if position < len(self._vocabulary) and self._vocabulary[position] == term:
+            del self._vocabulary[position]
+        if not term.isdigit():
+            for trigram in trigrams(term):
+                terms = self._trigrams.get(trigram)
+                if terms is not None:
+                    terms.discard(term)
+                    if not terms:
+                        del self._trigrams[trigram]
+
+    def _track_updated_at(self, row: Dict[str, Any]) -> None:
+        updated_at = row.get("updated_at")
+        if updated_at and (self.last_updated_at is None or str(updated_at) > self.last_updated_at):
+            self.last_updated_at = str(updated_at)
+
+    def load(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """
+        Replace the contents of the index.
+
+        The new postings are built off to the side and swapped in at the end,
+        so queries running concurrently see either the old or the new data.
+        """
+        new_rows: Dict[int, Dict[str, Any]] = {}
+        doc_terms: Dict[int, Dict[str, float]] = {}
+        postings: Dict[str, Dict[int, float]] = {}
+        self.last_updated_at = None
+        for row in rows:
+            bathroom_id = row["id"]
+            terms = self._terms(row)
+            new_rows[bathroom_id] = row
+            doc_terms[bathroom_id] = terms
+            for term, weight in terms.items():
+                postings.setdefault(term, {})[bathroom_id] = weight
+            self._track_updated_at(row)
+        trigram_terms: Dict[str, set] = {}
+        for term in postings:
+            if not term.isdigit():
+                for trigram in trigrams(term):
+                    trigram_terms.setdefault(trigram, set()).add(term)
+        (self._rows, self._doc_terms, self._postings,
+         self._vocabulary, self._trigrams) = new_rows, doc_terms, postings, sorted(postings), trigram_terms
+        self.loaded_at = time.time()
+        self.version += 1
+
+    def upsert(self, row: Dict[str, Any]) -> None:
+        """Insert a bathroom or replace the indexed copy of it."""
+        bathroom_id = row["id"]
+        self.remove(bathroom_id)
+        terms = self._terms(row)
+        self._rows[bathroom_id] = row
+        self._doc_terms[bathroom_id] = terms
+        for term, weight in terms.items():
+            posting = self._postings.get(term)
+            if posting is None:
+                posting = self._postings[term] = {}
+                self._add_term(term)
+            posting[bathroom_id] = weight
+        self._track_updated_at(row)
+        self.version += 1
+
+    def remove(self, bathroom_id: int) -> None:
+        """Remove a bathroom from the index if it is present."""
+        if self._rows.pop(bathroom_id, None) is None:
+            return
+        for term in self._doc_terms.pop(bathroom_id):
+            posting = self._postings[term]
+            del posting[bathroom_id]
+            if not posting:
+                del self._postings[term]
+                self._drop_term(term)
+        self.version += 1
+
+    def get(self, bathroom_id: int) -> Optional[Dict[str, Any]]:
+        """Get the indexed copy of a bathroom."""
+        return self._rows.get(bathroom_id)
+
+    def _prefixed(self, prefix: str) -> List[str]:
+        """Indexed terms starting with ``prefix``, the most common first, at most ``max_expansions``."""
+        vocabulary = self._vocabulary
+        start = bisect.bisect_left(vocabulary, prefix)
+        end = bisect.bisect_left(vocabulary, prefix + "\x7f", start)
+        terms = vocabulary[start:end]
+        if len(terms) > self.max_expansions:
+            terms = heapq.nlargest(self.max_expansions, terms, key=lambda term: len(self._postings[term]))
+        return terms
+
+    def _similar(self, token: str) -> List[Tuple[str, float]]:
+        """
+        Alphabetic indexed terms spelled like ``token``.
+
+        A term is similar when its trigram similarity to ``token`` reaches
+        ``fuzzy_threshold``, or when it is within ``max_edits(token)`` typos
+        of it; the latter catches swapped letters in short words, which
+        break too many of their few trigrams.
+
+        Returns:
+            (term, similarity) pairs, the most similar first, at most ``max_expansions``
+        """
+        wanted = trigrams(token)
+        shared: Dict[str, int] = {}
+        for trigram in wanted:
+            for term in self._trigrams.get(trigram, ()):
+                shared[term] = shared.get(term, 0) + 1
+        edits = max_edits(token)
+        # Each typo changes at most four trigrams (a swap), so closer terms share at least this many
+        min_shared = len(wanted) - 4 * edits
+        similar = []
+        for term, count in shared.items():
+            # Padded words of length n have n + 1 trigrams when all are distinct
+            similarity = count / (len(wanted) + len(term) + 1 - count)
+            if similarity < self.fuzzy_threshold and edits and count >= min_shared:
+                distance = edit_distance(token, term, edits)
+                if distance <= edits:
+                    similarity = max(similarity, 1 - distance / max(len(token), len(term)))
+            if similarity >= self.fuzzy_threshold:
+                similar.append((term, similarity))
+        return heapq.nlargest(self.max_expansions, similar, key=lambda pair: pair[1])
+
+    def _expand(self, token: str, prefix: bool, fuzzy: bool) -> Dict[str, float]:
+        """Indexed terms a query word matches, with the factor each match is scored at."""
+        expansions: Dict[str, float] = {}
+        if fuzzy and len(token) >= 3 and not token.isdigit():
+            for term, similarity in self._similar(token):
+                expansions[term] = FUZZY_FACTOR * similarity
+        if prefix and len(token) >= 2:
+            for term in self._prefixed(token):
+                expansions[term] = max(expansions.get(term, 0.0), PREFIX_FACTOR)
+        if token in self._postings:
+            expansions[token] = 1.0
+        return expansions
+
+    def _token_scores(self, expansions: Dict[str, float], among: Optional[Dict[int, float]]) -> Dict[int, float]:
+        """
+        Best score of one query word per bathroom.
+
+        With ``among``, only those bathrooms are scored, probing each
+        posting instead of walking it when that is cheaper.
+        """
+        total = len(self._rows)
+        weighted = []
+        for term, factor in expansions.items():
+            posting = self._postings[term]
+            idf = math.log(1 + (total - len(posting) + 0.5) / (len(posting) + 0.5))
+            weighted.append((posting, factor * idf))
+        scores: Dict[int, float] = {}
+        walk = among is None or sum(len(posting) for posting, _ in weighted) <= len(among)
+        for posting, term_weight in weighted:
+            items = posting.items() if walk else \
+                ((bathroom_id, posting[bathroom_id]) for bathroom_id in among if bathroom_id in posting)
+            for bathroom_id, weight in items:
+                score = term_weight * weight * (_K1 + 1) / (weight + _K1)
+                if score > scores.get(bathroom_id, 0.0):
+                    scores[bathroom_id] = score
+        return scores
+
+    def search(
+        self,
+        query: str,
+        limit: int = 20,
+        latitude: Optional[float] = None,
+        longitude: Optional[float] = None,
+        radius_km: Optional[float] = None,
+        prefix: bool = True,
+        fuzzy: bool = True
+    ) -> List[Dict[str, Any]]:
+        """
+        Find the bathrooms matching a text query.
+
+        With a location, matches are ranked by their text score divided by
+        ``1 + distance / distance_scale_km``, so a good match nearby beats a
+        slightly better one across town; with ``radius_km`` too, matches
+        farther away are dropped.
+
+        Args:
+            query: Free text; every word has to match
+            limit: Maximum number of results
+            latitude, longitude: Location to rank by distance from
+            radius_km: Only return bathrooms within this distance of the location
+            prefix: Let the last word match longer words it is the start of
+            fuzzy: Let words match similarly spelled words
+
+        Returns:
+            Copies of the indexed rows with an added ``score``, and ``distance``
+            in kilometers when a location is given, best first
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens or limit <= 0:
+            return []
+        per_token = [self._expand(token, prefix and i == len(tokens) - 1, fuzzy) for i, token in enumerate(tokens)]
+        if not all(per_token):
+            return []
+        # Narrow down from the rarest word, so the common ones are only probed
+        per_token.sort(key=lambda expansions: sum(len(self._postings[term]) for term in expansions))
+        scores: Optional[Dict[int, float]] = None
+        for expansions in per_token:
+            token_scores = self._token_scores(expansions, scores)
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {bathroom_id: score + token_scores[bathroom_id]
+                          for bathroom_id, score in scores.items() if bathroom_id in token_scores}
+            if not scores:
+                return []
+
+        located = latitude is not None and longitude is not None
+        distances: Dict[int, float] = {}
+        if located:
+            if radius_km is not None:
+                # Cheap bounding-box test before the exact distance
+                dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+                cos_lat = math.cos(math.radians(min(89.9, abs(latitude) + dlat)))
+                dlng = 180.0 if cos_lat * 180 <= dlat else dlat / cos_lat
+            ranked = {}
+            for bathroom_id, score in scores.items():
+                row = self._rows[bathroom_id]
+                lat, lng = row.get("latitude"), row.get("longitude")
+                if lat is None or lng is None:
+                    continue
+                if radius_km is not None:
+                    if abs(lat - latitude) > dlat or abs((lng - longitude + 180) % 360 - 180) > dlng:
+                        continue
+                    distance = haversine_km(latitude, longitude, lat, lng)
+                    if distance > radius_km:
+                        continue
+                else:
+                    distance = haversine_km(latitude, longitude, lat, lng)
+                distances[bathroom_id] = distance
+                ranked[bathroom_id] = score / (1 + distance / self.distance_scale_km)
+        else:
+            ranked = scores
+
+        best = heapq.nsmallest(limit, ranked.items(), key=lambda item: (-item[1], item[0]))
+        results = []
+        for bathroom_id, rank in best:
+            row = dict(self._rows[bathroom_id])
+            row["score"] = round(rank, 6)
+            if located:
+                row["distance"] = distances[bathroom_id]
+            results.append(row)
+        return results
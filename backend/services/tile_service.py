@@ -0,0 +1,74 @@
+import time
+import logging
+from typing import List, Dict, Any, Optional
+from config.database import Database
+from config.settings import TILES_DIR, TILES_ZOOM, TILES_CHECK_SECONDS
+from services.bathroom_service import BathroomService
+from services.tiles import TileSet, TileStore, Tile, tile_of
+
+logger = logging.getLogger(__name__)
+
+# Published tile packs served by the tiles route, or None when TILES_DIR is not set
+tile_store: Optional[TileStore] = TileStore(TILES_DIR, TILES_CHECK_SECONDS) if TILES_DIR else None
+
+class TileService:
+    @staticmethod
+    async def build(
+        db: Database,
+        directory: str = TILES_DIR,
+        zoom: int = TILES_ZOOM,
+        full: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Build or update the tile packs in ``directory``.
+
+        Incremental builds read the rows changed since the last build's
+        ``updated_at`` watermark and regenerate only the tiles those rows are
+        in now or were in before, merging the changes into the tiles' previous
+        content. Deleted rows don't show up that way, so a periodic ``full``
+        build re-reads the whole table; it still only writes the tiles whose
+        content changed, so unchanged tiles keep their ETags.
+
+        Args:
+            db: Database handle
+            directory: Tile directory, created if missing
+            zoom: Slippy-map zoom level of the tiles
+            full: Re-read the whole table instead of the changes since the last build
+
+        Returns:
+            Counts of changed rows, tiles checked and tiles written, and whether the build was full
+        """
+        if not directory:
+            raise ValueError("No tile directory configured (set TILES_DIR)")
+        started = time.perf_counter()
+        tiles = TileSet(directory, zoom)
+        try:
+            full = full or tiles.watermark is None
+            if full:
+                rows = await BathroomService.fetch_index_rows(db)
+                contents: Dict[Tile, List[Dict[str, Any]]] = {}
+                for row in rows:
+                    contents.setdefault(tile_of(row['latitude'], row['longitude'], zoom), []).append(row)
+                # Tiles that lost all their rows are emptied too
+                touched = set(contents) | set(tiles.built())
+            else:
+                rows = await BathroomService.fetch_changed_rows(db, tiles.watermark)
+                previous = tiles.tiles_of(row['id'] for row in rows)
+                placed = {row['id']: tile_of(row['latitude'], row['longitude'], zoom) for row in rows}
+                touched = set(placed.values()) | set(previous.values())
+                merged = {tile: {row['id']: row for row in tiles.rows(tile)} for tile in touched}
+                for row in rows:
+                    if row['id'] in previous:
+                        merged[previous[row['id']]].pop(row['id'], None)
+                    merged[placed[row['id']]][row['id']] = row
+                contents = {tile: list(by_id.values()) for tile, by_id in merged.items()}
+
+            written = sum(tiles.put(tile, contents.get(tile, [])) for tile in sorted(touched))
+            watermark = max((row['updated_at'] for row in rows if row.get('updated_at')), default=tiles.watermark)
+            tiles.publish(watermark)
+        finally:
+            tiles.close()
+
+        result = {"full": full, "rows": len(rows), "tiles_checked": len(touched), "tiles_written": written}
+        logger.info(f"Built tiles in {directory} in {time.perf_counter() - started:.1f}s: {result}")
+        return result
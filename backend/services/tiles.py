@@ -0,0 +1,262 @@
+"""
+Static tile packs: the bathrooms table cut into slippy-map tiles of one zoom level.
+
+Each non-empty tile is one gzipped JSON array of rows, ordered by id, written
+to ``<directory>/<zoom>/<x>/<y>.<hash>.json.gz`` where the hash is the SHA-1
+of the uncompressed JSON. ``manifest.json`` lists the current hash of every
+tile and is replaced atomically, so readers always see a complete build;
+files it no longer references are deleted afterwards. A side SQLite file maps
+bathroom ids to tiles, which is how an incremental build finds the tile a
+moved or changed row used to be in.
+"""
+import os
+import json
+import gzip
+import math
+import time
+import sqlite3
+import hashlib
+import logging
+from typing import List, Dict, Any, Optional, Tuple, Iterable
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+ROWS_DB_NAME = "tiles.sqlite3"
+TILE_SUFFIX = ".json.gz"
+
+# Web Mercator stops short of the poles
+MAX_LATITUDE = 85.05112878
+
+# SQLite caps bound parameters per statement; stay well below it
+_CHUNK = 500
+
+Tile = Tuple[int, int]
+
+
+def tile_of(latitude: float, longitude: float, zoom: int) -> Tile:
+    """The (x, y) slippy-map tile containing a point."""
+    n = 1 << zoom
+    lat = math.radians(max(-MAX_LATITUDE, min(MAX_LATITUDE, latitude)))
+    x = int((longitude + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(lat)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tiles_covering(min_lat: float, min_lng: float, max_lat: float, max_lng: float, zoom: int) -> List[Tile]:
+    """Tiles overlapping a bounding box (which must not cross the antimeridian)."""
+    min_x, max_y = tile_of(min_lat, min_lng, zoom)
+    max_x, min_y = tile_of(max_lat, max_lng, zoom)
+    return [(x, y) for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1)]
+
+
+def encode_tile(rows: List[Dict[str, Any]]) -> Tuple[bytes, str]:
+    """
+    Encode a tile's rows.
+
+    Returns:
+        The gzipped JSON body and the content hash of the uncompressed JSON
+    """
+    body = json.dumps(sorted(rows, key=lambda row: row["id"]), separators=(",", ":"), default=str).encode("utf-8")
+    # mtime=0 keeps the compressed bytes a pure function of the content
+    return gzip.compress(body, compresslevel=9, mtime=0), hashlib.sha1(body).hexdigest()
+
+
+EMPTY_TILE, EMPTY_TILE_HASH = encode_tile([])
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+class TileSet:
+    """
+    The build side: tiles of one zoom level on disk, updated tile by tile.
+
+    Writes go to new content-hashed files; nothing is visible to readers
+    until ``publish`` replaces the manifest.
+    """
+
+    def __init__(self, directory: str, zoom: int):
+        self.directory = directory
+        self.zoom = zoom
+        os.makedirs(directory, exist_ok=True)
+        manifest = _read_manifest(directory) or {}
+        if manifest.get("zoom") == zoom:
+            self.tiles: Dict[str, Dict[str, Any]] = manifest.get("tiles", {})
+            self.watermark: Optional[str] = manifest.get("watermark")
+        else:
+            # Nothing usable to build on: every tile is new
+            self.tiles = {}
+            self.watermark = None
+        self._superseded: List[str] = []
+        self._conn = sqlite3.connect(os.path.join(directory, ROWS_DB_NAME))
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tile_rows ("
+            " id INTEGER PRIMARY KEY,"
+            " zoom INTEGER NOT NULL,"
+            " x INTEGER NOT NULL,"
+            " y INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS tile_rows_tile ON tile_rows (zoom, x, y)")
+        if self.watermark is None:
+            self._conn.execute("DELETE FROM tile_rows")
+        self._conn.commit()
+
+    def path(self, x: int, y: int, digest: str) -> str:
+        return os.path.join(self.directory, str(self.zoom), str(x), f"{y}.{digest}{TILE_SUFFIX}")
+
+    def tiles_of(self, ids: Iterable[int]) -> Dict[int, Tile]:
+        """The tile each of ``ids`` was in at the last build, for the ids that were in one."""
+        ids = list(ids)
+        found = {}
+        for i in range(0, len(ids), _CHUNK):
+            chunk = ids[i:i + _CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            cursor = self._conn.execute(
+                f"SELECT id, x, y FROM tile_rows WHERE zoom = ? AND id IN ({placeholders})", [self.zoom, *chunk]
+            )
+            found.update((row_id, (x, y)) for row_id, x, y in cursor)
+        return found
+
+    def rows(self, tile: Tile) -> List[Dict[str, Any]]:
+        """The rows of a tile as of the last build."""
+        x, y = tile
+        entry = self.tiles.get(f"{x}/{y}")
+        if entry is None:
+            return []
+        with open(self.path(x, y, entry["hash"]), "rb") as f:
+            return json.loads(gzip.decompress(f.read()))
+
+    def built(self) -> List[Tile]:
+        """Tiles of the current build."""
+        return [tuple(int(part) for part in key.split("/")) for key in self.tiles]
+
+    def put(self, tile: Tile, rows: List[Dict[str, Any]]) -> bool:
+        """
+        Make ``rows`` the content of a tile.
+
+        Returns:
+            Whether the tile changed (and a file was written or dropped)
+        """
+        x, y = tile
+        key = f"{x}/{y}"
+        previous = self.tiles.get(key)
+        self._conn.execute("DELETE FROM tile_rows WHERE zoom = ? AND x = ? AND y = ?", (self.zoom, x, y))
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO tile_rows (id, zoom, x, y) VALUES (?, ?, ?, ?)",
+            [(row["id"], self.zoom, x, y) for row in rows]
+        )
+        if not rows:
+            if previous is None:
+                return False
+            del self.tiles[key]
+            self._superseded.append(self.path(x, y, previous["hash"]))
+            return True
+
+        body, digest = encode_tile(rows)
+        if previous is not None and previous["hash"] == digest:
+            return False
+        path = self.path(x, y, digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_atomic(path, body)
+        self.tiles[key] = {"hash": digest, "count": len(rows), "bytes": len(body)}
+        if previous is not None:
+            self._superseded.append(self.path(x, y, previous["hash"]))
+        return True
+
+    def publish(self, watermark: Optional[str]) -> None:
+        """Replace the manifest with the current tiles, then delete the files it no longer references."""
+        self._conn.commit()
+        self.watermark = watermark
+        manifest = {"zoom": self.zoom, "watermark": watermark, "built_at": time.time(), "tiles": self.tiles}
+        _write_atomic(os.path.join(self.directory, MANIFEST_NAME),
+                      json.dumps(manifest, separators=(",", ":")).encode("utf-8"))
+        # Readers holding the previous manifest re-read it when a file is gone; see TileStore.get
+        for path in self._superseded:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._superseded = []
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def _read_manifest(directory: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME), "rb") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+class TileStore:
+    """
+    The serving side: the published manifest of a tile directory.
+
+    The manifest is re-read when its file changes, checked at most every
+    ``check_seconds``, so workers pick up a new build without a restart.
+    """
+
+    def __init__(self, directory: str, check_seconds: float = 2.0):
+        self.directory = directory
+        self.check_seconds = check_seconds
+        self.manifest: Optional[Dict[str, Any]] = None
+        self.etag: Optional[str] = None
+        self._key: Optional[Tuple[int, int, int]] = None
+        self._checked_at = 0.0
+
+    @property
+    def zoom(self) -> Optional[int]:
+        return self.manifest["zoom"] if self.manifest is not None else None
+
+    def refresh(self, force: bool = False) -> bool:
+        """Re-read the manifest if it changed; returns whether it did."""
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.check_seconds:
+            return False
+        self._checked_at = now
+        path = os.path.join(self.directory, MANIFEST_NAME)
+        try:
+            with open(path, "rb") as f:
+                stat = os.fstat(f.fileno())
+                key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+                if key == self._key:
+                    return False
+                data = f.read()
+        except FileNotFoundError:
+            return False
+        self.manifest = json.loads(data)
+        self.etag = hashlib.sha1(data).hexdigest()
+        self._key = key
+        return True
+
+    def get(self, zoom: int, x: int, y: int) -> Optional[Tuple[str, bytes]]:
+        """
+        The hash and gzipped body of a tile.
+
+        Returns:
+            None when no build of ``zoom`` is published; an empty tile for
+            tiles without bathrooms
+        """
+        self.refresh()
+        for attempt in range(2):
+            if self.manifest is None or self.manifest["zoom"] != zoom:
+                return None
+            entry = self.manifest["tiles"].get(f"{x}/{y}")
+            if entry is None:
+                return EMPTY_TILE_HASH, EMPTY_TILE
+            path = os.path.join(self.directory, str(zoom), str(x), f"{y}.{entry['hash']}{TILE_SUFFIX}")
+            try:
+                with open(path, "rb") as f:
+                    return entry["hash"], f.read()
+            except FileNotFoundError:
+                # Superseded by a build published since the last check
+                if attempt or not self.refresh(force=True):
+                    raise
+        return None
@@ -0,0 +1,235 @@
+import json
+import zlib
+import asyncio
+import logging
+from dataclasses import dataclass, field, asdict
+from typing import List, Dict, Any, Optional, AsyncIterator, Callable, Iterable
+from config.database import Database
+from config.settings import TRANSFER_PAGE_SIZE, TRANSFER_BATCH_SIZE, TRANSFER_MAX_LINE_BYTES
+from services.bulk_writer import BulkWriter, upsert_writer
+from services.bathroom_service import BathroomService
+from services.review_service import review_summaries
+from models.bathroom import BathroomImportItem
+from models.review import ReviewImportItem
+
+logger = logging.getLogger(__name__)
+
+# Invalid lines reported back by message; the rest are only counted
+_MAX_ERRORS = 20
+
+
+@dataclass
+class ImportReport:
+    """Line counts for one NDJSON import."""
+    lines: int = 0
+    written: int = 0
+    failed: int = 0
+    invalid: int = 0
+    errors: List[str] = field(default_factory=list)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    def reject(self, line_number: int, reason: str) -> None:
+        self.invalid += 1
+        if len(self.errors) < _MAX_ERRORS:
+            self.errors.append(f"line {line_number}: {reason}")
+
+
+def _bathrooms_written(rows: List[Dict[str, Any]]) -> None:
+    for row in rows:
+        BathroomService.apply_change(row)
+
+
+def _reviews_written(rows: List[Dict[str, Any]]) -> None:
+    for row in rows:
+        if row.get("bathroom_id") is not None:
+            review_summaries.discard(row["bathroom_id"])
+
+
+class TransferService:
+    # Tables that can be exported and imported, with what to refresh after rows are written
+    TABLES: Dict[str, Callable[[List[Dict[str, Any]]], None]] = {
+        "bathrooms": _bathrooms_written,
+        "reviews": _reviews_written,
+    }
+    # The model each imported line must validate against; only its fields are written
+    MODELS = {
+        "bathrooms": BathroomImportItem,
+        "reviews": ReviewImportItem,
+    }
+
+    @staticmethod
+    async def export_pages(
+        db: Database,
+        table: str,
+        page_size: int = TRANSFER_PAGE_SIZE,
+        after_id: Optional[int] = None
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Read a whole table in id order, one page at a time.
+
+        Pages are keyset-paginated (``id > last id``), so each costs the same
+        however deep into the table it is, and rows inserted meanwhile are
+        neither skipped nor repeated.
+
+        Args:
+            db: Database handle
+            table: Table name, one of ``TABLES``
+            page_size: Rows per query
+            after_id: Start after this id, e.g. to resume an interrupted export
+        """
+        if table not in TransferService.TABLES:
+            raise ValueError(f"Unknown table {table}")
+        last_id = after_id
+        while True:
+            query = db.table(table).select('*').order('id').limit(page_size)
+            if last_id is not None:
+                query = query.gt('id', last_id)
+            response = await db.execute(query)
+
+            if hasattr(response, 'error') and response.error:
+                raise Exception(f"Error exporting {table}: {response.error}")
+
+            if response.data:
+                yield response.data
+            if len(response.data) < page_size:
+                return
+            last_id = response.data[-1]['id']
+
+    @staticmethod
+    async def encode_ndjson(pages: AsyncIterator[List[Dict[str, Any]]], compress: bool = False) -> AsyncIterator[bytes]:
+        """
+        Encode pages of rows as NDJSON, one chunk per page.
+
+        Args:
+            pages: Pages from ``export_pages``
+            compress: Gzip the stream
+        """
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        async for rows in pages:
+            chunk = "".join(json.dumps(row, separators=(",", ":"), default=str) + "\n" for row in rows).encode("utf-8")
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+        if compressor is not None:
+            yield compressor.flush()
+
+    @staticmethod
+    async def _lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[bytes]:
+        """
+        Split a byte stream into lines, gunzipping it first if it starts with the gzip magic.
+
+        Compressed input is inflated at most ``max_line_bytes`` at a time and
+        split as it goes, so a small body that inflates to gigabytes fails on
+        its first overlong line instead of being expanded in memory.
+        """
+        decompressor = None
+        pending = b""
+        first = True
+        async for chunk in chunks:
+            if first and chunk:
+                first = False
+                if chunk[:2] == b"\x1f\x8b":
+                    decompressor = zlib.decompressobj(31)
+            while chunk:
+                if decompressor is not None:
+                    data = decompressor.decompress(chunk, max_line_bytes + 1)
+                    chunk = decompressor.unconsumed_tail
+                else:
+                    data, chunk = chunk, b""
+                pending += data
+                *lines, pending = pending.split(b"\n")
+                for line in lines:
+                    yield line
+                if len(pending) > max_line_bytes:
+                    raise ValueError(f"Line longer than {max_line_bytes} bytes")
+        if decompressor is not None:
+            pending += decompressor.flush()
+            if not decompressor.eof:
+                raise ValueError("Truncated gzip stream")
+        if pending:
+            yield pending
+
+    @staticmethod
+    async def _refresh_ratings(db: Database, bathroom_ids: Iterable[int], max_in_flight: int) -> None:
+        """Recount the ratings of bathrooms whose reviews were imported; failures are logged."""
+        semaphore = asyncio.Semaphore(max_in_flight)
+
+        async def refresh(bathroom_id: int) -> None:
+            async with semaphore:
+                try:
+                    await BathroomService.refresh_rating(db, bathroom_id)
+                except Exception as e:
+                    logger.error(f"Error refreshing rating of bathroom {bathroom_id} after import: {str(e)}")
+
+        await asyncio.gather(*(refresh(bathroom_id) for bathroom_id in bathroom_ids))
+
+    @staticmethod
+    async def import_ndjson(
+        db: Database,
+        table: str,
+        chunks: AsyncIterator[bytes],
+        batch_size: int = TRANSFER_BATCH_SIZE,
+        max_in_flight: int = 4,
+        max_line_bytes: int = TRANSFER_MAX_LINE_BYTES
+    ) -> ImportReport:
+        """
+        Upsert NDJSON rows (plain or gzip) into a table as they stream in.
+
+        Every line must validate against the table's model in ``MODELS``, the
+        create model plus an integer ``id``; only those fields are written and
+        rows are upserted on the id, so importing an export twice is harmless.
+        Ratings are not imported but recounted from the imported reviews. Lines are
+        parsed as they arrive and handed to a ``BulkWriter``, which holds the
+        stream back while its batches are in flight, so memory stays bounded
+        by the batch size whatever the stream's length.
+
+        Args:
+            db: Database handle
+            table: Table name, one of ``TABLES``
+            chunks: Raw request or file body
+            batch_size: Initial rows per upsert
+            max_in_flight: Upsert batches written concurrently
+            max_line_bytes: Longest accepted line
+
+        Returns:
+            Line, written, failed and invalid counts
+        """
+        if table not in TransferService.TABLES:
+            raise ValueError(f"Unknown table {table}")
+        model = TransferService.MODELS[table]
+        report = ImportReport()
+        rated = set()
+
+        def written(rows: List[Dict[str, Any]]) -> None:
+            TransferService.TABLES[table](rows)
+            if table == "reviews":
+                rated.update(row["bathroom_id"] for row in rows)
+
+        writer = BulkWriter(upsert_writer(db, table), max_in_flight=max_in_flight, batch_size=batch_size,
+                            on_written=written)
+        try:
+            async for line in TransferService._lines(chunks, max_line_bytes):
+                report.lines += 1
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    report.reject(report.lines, f"invalid JSON ({e})")
+                    continue
+                item, error = BathroomService._validate(model, row)
+                if error is not None:
+                    report.reject(report.lines, error)
+                    continue
+                await writer.add(item.dict())
+        finally:
+            result = await writer.close()
+        await TransferService._refresh_ratings(db, rated, max_in_flight)
+        report.written = result.written
+        report.failed = result.failed
+        logger.info(f"Imported {report.written} rows into {table} "
+                    f"({report.failed} failed, {report.invalid} invalid lines)")
+        return report
@@ -0,0 +1,308 @@
+import math
+import logging
+from typing import List, Optional, Dict, Any, Callable, Iterable, Sequence
+
+from services.spatial_index import EARTH_RADIUS_KM, ATTRIBUTE_FLAGS
+
+try:
+    import numpy as np
+except ImportError:  # Optional: without it batch queries run one point at a time on the grid index
+    np = None
+
+logger = logging.getLogger(__name__)
+
+NUMPY_AVAILABLE = np is not None
+
+
+class VectorIndex:
+    """
+    NumPy columns of the bathrooms table for ranking many query points at once.
+
+    Rows are sorted by grid cell, the layout of the shared snapshot, so a
+    snapshot's mapped columns can be used as they are. For a batch of
+    points, the cell runs covering every search circle are found with one
+    ``searchsorted``, and filters, haversine distances and top-k selection
+    run over all (point, candidate) pairs in single array operations.
+
+    Immutable: rebuild it (cheaply, from a snapshot) to pick up changes.
+    """
+
+    def __init__(
+        self,
+        cell_degrees: float,
+        ids,
+        latitude,
+        longitude,
+        flags,
+        rating,
+        cell_keys,
+        cell_starts,
+        row_at: Callable[[int], Dict[str, Any]],
+        hidden: Iterable[int] = (),
+        extra: Optional["VectorIndex"] = None
+    ):
+        """
+        Args:
+            cell_degrees: Grid cell size the rows are sorted by
+            ids, latitude, longitude, flags, rating: Per-row columns
+            cell_keys: Occupied cells as ``row * lng_cells + col``, ascending
+            cell_starts: First row of each cell, plus the row count
+            row_at: Returns the full row at a position
+            hidden: Ids to leave out, e.g. rows changed since a snapshot
+            extra: Index of rows to search in addition, e.g. the changed rows
+        """
+        if np is None:
+            raise RuntimeError("numpy is required for VectorIndex")
+        self.cell_degrees = cell_degrees
+        self._lng_cells = int(round(360 / cell_degrees))
+        self._ids = np.asarray(ids, dtype=np.int64)
+        self._latitude = np.asarray(latitude, dtype=np.float64)
+        self._longitude = np.asarray(longitude, dtype=np.float64)
+        self._flags = np.asarray(flags, dtype=np.uint8)
+        self._rating = np.asarray(rating, dtype=np.float64)
+        self._cell_keys = np.asarray(cell_keys, dtype=np.int64)
+        self._cell_starts = np.asarray(cell_starts, dtype=np.int64)
+        self._row_at = row_at
+        self._hidden = np.array(sorted(hidden), dtype=np.int64)
+        self._extra = extra
+
+    def __len__(self) -> int:
+        return len(self._ids) - len(self._hidden) + (len(self._extra) if self._extra is not None else 0)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict[str, Any]], cell_degrees: float = 0.01) -> "VectorIndex":
+        """Build an index holding references to ``rows``."""
+        rows = [row for row in rows if row.get("latitude") is not None and row.get("longitude") is not None]
+        latitude = np.array([row["latitude"] for row in rows], dtype=np.float64)
+        longitude = np.array([row["longitude"] for row in rows], dtype=np.float64)
+        ids = np.array([row["id"] for row in rows], dtype=np.int64)
+        flags = np.zeros(len(rows), dtype=np.uint8)
+        for column, bit in ATTRIBUTE_FLAGS:
+            flags |= np.array([bool(row.get(column)) for row in rows], dtype=np.uint8) * bit
+        rating = np.array([float(row.get("average_rating") or 0) for row in rows], dtype=np.float64)
+
+        lng_cells = int(round(360 / cell_degrees))
+        keys = np.floor((latitude + 90) / cell_degrees).astype(np.int64) * lng_cells + \
+            np.floor((longitude + 180) / cell_degrees).astype(np.int64) % lng_cells
+        order = np.lexsort((ids, keys))
+        keys = keys[order]
+        cell_keys, cell_starts = np.unique(keys, return_index=True)
+        ordered = [rows[i] for i in order]
+        return cls(cell_degrees, ids[order], latitude[order], longitude[order], flags[order], rating[order],
+                   cell_keys, np.append(cell_starts, len(rows)), ordered.__getitem__)
+
+    def _pairs(self, latitudes, longitudes, radius_km: float, rating_min: Optional[float],
+               flag_mask: int, flag_value: int):
+        """
+        Get every (point, row) pair within ``radius_km`` that passes the filters.
+
+        Returns:
+            Point indexes, row positions and haversine terms of the pairs
+        """
+        lng_cells = self._lng_cells
+        step = self.cell_degrees
+        lat = np.asarray(latitudes, dtype=np.float64)
+        lng = np.asarray(longitudes, dtype=np.float64)
+        angle = min(radius_km / EARTH_RADIUS_KM, math.pi)
+        max_h = math.sin(angle / 2) ** 2
+
+        # Grid rows and column ranges of each circle's bounding box, as in SpatialIndex._cells_in_radius
+        dlat = math.degrees(angle)
+        lat_lo = np.maximum(-90.0, lat - dlat)
+        lat_hi = np.minimum(90.0, lat + dlat)
+        row_lo = np.floor((lat_lo + 90) / step).astype(np.int64)
+        row_hi = np.floor((lat_hi + 90) / step).astype(np.int64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = math.sin(angle) / np.cos(np.radians(lat))
+            dlng = np.degrees(np.arcsin(np.minimum(ratio, 1.0)))
+        whole = (lat_lo <= -90.0) | (lat_hi >= 90.0) | ~(ratio < 1)
+        dlng[whole] = 0.0
+        col_lo = np.floor((lng - dlng + 180) / step).astype(np.int64)
+        col_hi = np.minimum(np.floor((lng + dlng + 180) / step).astype(np.int64), col_lo + lng_cells - 1)
+        col_lo[whole], col_hi[whole] = 0, lng_cells - 1
+        # A range crossing the antimeridian becomes two: the part inside [0, lng_cells) and the wrapped part
+        inside_lo, inside_hi = np.maximum(col_lo, 0), np.minimum(col_hi, lng_cells - 1)
+        wrap_lo = np.where(col_lo < 0, col_lo + lng_cells, np.where(col_hi >= lng_cells, 0, 1))
+        wrap_hi = np.where(col_lo < 0, lng_cells - 1, np.where(col_hi >= lng_cells, col_hi - lng_cells, 0))
+
+        rows = int((row_hi - row_lo).max(initial=-1)) + 1
+        grid_rows = row_lo[:, None] + np.arange(rows)[None, :]
+        in_box = grid_rows <= row_hi[:, None]
+        row_point = np.broadcast_to(np.arange(len(lat))[:, None], grid_rows.shape)[in_box]
+        bases = grid_rows[in_box] * lng_cells
+        point = np.concatenate([row_point, row_point])
+        key_lo = np.concatenate([bases + inside_lo[row_point], bases + wrap_lo[row_point]])
+        key_hi = np.concatenate([bases + inside_hi[row_point], bases + wrap_hi[row_point]])
+
+        starts = self._cell_starts[np.searchsorted(self._cell_keys, key_lo, "left")]
+        ends = self._cell_starts[np.searchsorted(self._cell_keys, key_hi, "right")]
+        lengths = np.maximum(ends - starts, 0) * (key_lo <= key_hi)
+        owner = np.repeat(np.arange(len(starts)), lengths)
+        position = starts[owner] + np.arange(len(owner)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        point = point[owner]
+
+        keep = self._flags[position] & flag_mask == flag_value
+        if rating_min is not None:
+            keep &= self._rating[position] >= rating_min
+        if len(self._hidden):
+            keep &= ~np.isin(self._ids[position], self._hidden)
+        point, position = point[keep], position[keep]
+
+        lat0 = np.radians(lat)[point]
+        lat1 = np.radians(self._latitude[position])
+        dlmb = np.radians(self._longitude[position]) - np.radians(lng)[point]
+        h = np.sin((lat1 - lat0) / 2) ** 2 + np.cos(lat0) * np.cos(lat1) * np.sin(dlmb / 2) ** 2
+        near = h <= max_h
+        return point[near], position[near], h[near]
+
+    def _top(self, h, ids, limit: int):
+        """Indexes of the ``limit`` smallest (h, id) pairs, in order, via a partial sort."""
+        if len(h) > limit:
+            kth = np.argpartition(h, limit - 1)[:limit]
+            # Keep every tie of the limit-th term so ids break ties like the grid index does
+            selected = np.nonzero(h <= h[kth].max())[0]
+        else:
+            selected = np.arange(len(h))
+        return selected[np.lexsort((ids[selected], h[selected]))][:limit]
+
+    def _nearest_pairs(self, latitudes, longitudes, radius_km: float, rating_min: Optional[float],
+                       flag_mask: int, flag_value: int, enough: Callable[[Any, Any, int], Any]):
+        """
+        Get the pairs of ``_pairs``, searching a growing radius so dense areas stop early.
+
+        Starting at a sixteenth of ``radius_km``, points ``enough`` says have
+        their ``limit`` nearest rows are retired and the rest are searched
+        again four times wider, like the grid index stops at cells farther
+        than its current top ``limit``. Rows found within a smaller radius are
+        nearer than every row outside it, so the top ``limit`` is unchanged.
+
+        Args:
+            enough: Called with the pairs' point indexes and row positions and
+                the point count, returns which points are done
+        """
+        lat = np.asarray(latitudes, dtype=np.float64)
+        lng = np.asarray(longitudes, dtype=np.float64)
+        pending = np.arange(len(lat))
+        found = []
+        radius = radius_km / 16
+        while len(pending):
+            point, position, h = self._pairs(lat[pending], lng[pending], radius, rating_min, flag_mask, flag_value)
+            if radius >= radius_km:
+                done = np.ones(len(pending), dtype=bool)
+            else:
+                done = enough(point, position, len(pending))
+            keep = done[point]
+            found.append((pending[point[keep]], position[keep], h[keep]))
+            pending = pending[~done]
+            radius = min(radius * 4, radius_km)
+        point, position, h = (np.concatenate(column) for column in zip(*found))
+        return point, position, h
+
+    def _result(self, position: int, h: float) -> Dict[str, Any]:
+        row = dict(self._row_at(int(position)))
+        row["distance"] = 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+        return row
+
+    @staticmethod
+    def _merge(a: List[Dict[str, Any]], b: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+        if not b:
+            return a
+        return sorted(a + b, key=lambda row: (row["distance"], row["id"]))[:limit]
+
+    def query_many(
+        self,
+        latitudes: Sequence[float],
+        longitudes: Sequence[float],
+        radius_km: float,
+        limit: int,
+        rating_min: Optional[float] = None,
+        flag_mask: int = 0,
+        flag_value: int = 0
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Get the bathrooms within ``radius_km`` of each of many points, nearest first.
+
+        Returns:
+            Per point, the same rows ``SpatialIndex.query`` returns for it
+        """
+        if limit <= 0 or radius_km < 0 or len(latitudes) == 0:
+            return [[] for _ in latitudes]
+        point, position, h = self._nearest_pairs(
+            latitudes, longitudes, radius_km, rating_min, flag_mask, flag_value,
+            lambda point, position, points: np.bincount(point, minlength=points) >= limit
+        )
+        results: List[List[Dict[str, Any]]] = [[] for _ in latitudes]
+        if len(latitudes) == 1:
+            for i in self._top(h, self._ids[position], limit):
+                results[0].append(self._result(position[i], h[i]))
+        else:
+            # Group by point with h ascending (two cheap single-key sorts), keep each point's
+            # first ``limit`` terms and their ties, then order that small set by id as well
+            order = np.argsort(h, kind="stable")
+            order = order[np.argsort(point[order], kind="stable")]
+            point, position, h = point[order], position[order], h[order]
+            first = np.searchsorted(point, np.arange(len(latitudes)), "left")
+            counts = np.diff(np.append(first, len(point)))
+            kth = np.full(len(latitudes), np.inf)
+            full = counts >= limit
+            kth[full] = h[first[full] + limit - 1]
+            selected = h <= kth[point]
+            point, position, h = point[selected], position[selected], h[selected]
+            order = np.lexsort((self._ids[position], h, point))
+            point, position, h = point[order], position[order], h[order]
+            rank = np.arange(len(point)) - np.searchsorted(point, point, "left")
+            for i in np.nonzero(rank < limit)[0]:
+                results[point[i]].append(self._result(position[i], h[i]))
+        if self._extra is not None:
+            extra = self._extra.query_many(latitudes, longitudes, radius_km, limit, rating_min, flag_mask, flag_value)
+            results = [self._merge(own, theirs, limit) for own, theirs in zip(results, extra)]
+        return results
+
+    def query(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        limit: int,
+        rating_min: Optional[float] = None,
+        flag_mask: int = 0,
+        flag_value: int = 0
+    ) -> List[Dict[str, Any]]:
+        """Get the bathrooms within ``radius_km`` of a point, nearest first, see ``SpatialIndex.query``."""
+        return self.query_many([latitude], [longitude], radius_km, limit, rating_min, flag_mask, flag_value)[0]
+
+    def corridor(
+        self,
+        latitudes: Sequence[float],
+        longitudes: Sequence[float],
+        radius_km: float,
+        limit: int,
+        rating_min: Optional[float] = None,
+        flag_mask: int = 0,
+        flag_value: int = 0
+    ) -> List[Dict[str, Any]]:
+        """
+        Get the bathrooms within ``radius_km`` of any of the points, e.g.
+        samples along a route.
+
+        Returns:
+            Up to ``limit`` rows, with ``distance`` to the nearest point, nearest first
+        """
+        if limit <= 0 or radius_km < 0 or len(latitudes) == 0:
+            return []
+        _, position, h = self._nearest_pairs(
+            latitudes, longitudes, radius_km, rating_min, flag_mask, flag_value,
+            # The route is one search: done once ``limit`` distinct bathrooms are near it
+            lambda point, position, points: np.full(points, len(np.unique(position)) >= limit)
+        )
+        # Smallest term per bathroom: sort by position, then term, and keep the first of each position
+        order = np.lexsort((h, position))
+        position, h = position[order], h[order]
+        first = np.ones(len(position), dtype=bool)
+        first[1:] = position[1:] != position[:-1]
+        position, h = position[first], h[first]
+        results = [self._result(position[i], h[i]) for i in self._top(h, self._ids[position], limit)]
+        if self._extra is not None:
+            extra = self._extra.corridor(latitudes, longitudes, radius_km, limit, rating_min, flag_mask, flag_value)
+            results = self._merge(results, extra, limit)
+        return results
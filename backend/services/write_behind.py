@@ -0,0 +1,404 @@
+import os
+import json
+import time
+import fcntl
+import sqlite3
+import asyncio
+import logging
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Callable, Awaitable, Tuple
+
+from config.database import Database
+from services.bulk_writer import BulkWriter
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """Raised when a write-behind queue stays full for longer than a submitter is willing to wait."""
+
+
+class Spool:
+    """
+    Durable FIFO of rows in a local SQLite file.
+
+    Rows are appended before they are acknowledged and removed once they are
+    in the database. Every statement runs on the spool's own writer thread,
+    so the fsyncs of ``synchronous=FULL`` never block the event loop.
+    Appends made while a commit is running (or in the same event loop
+    iteration) share the next commit, so a burst costs one fsync rather than
+    one per row. Rows that keep failing are kept but marked dead, so they
+    are neither retried nor lost.
+
+    The file is held under an exclusive ``flock`` on ``<path>.lock`` while
+    open, so worker processes sharing a spool directory never open the same
+    spool twice. Opening creates files and commits, so do it off the event loop.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = open(f"{path}.lock", "w")
+        try:
+            fcntl.flock(self._lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock.close()
+            raise
+        # Only ever used from the writer thread once open
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Acknowledged rows have to survive a power cut, not just a crash
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS spool ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " row TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " dead INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.commit()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"spool-{os.path.basename(path)}")
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._committer: Optional[asyncio.Task] = None
+
+    @classmethod
+    def claim(cls, directory: str, name: str) -> "Spool":
+        """Open the first spool slot in ``directory`` no other process holds."""
+        os.makedirs(directory, exist_ok=True)
+        slot = 0
+        while True:
+            try:
+                return cls(os.path.join(directory, f"{name}-{slot}.sqlite3"))
+            except OSError:
+                slot += 1
+
+    @classmethod
+    def orphans(cls, directory: str, name: str) -> List["Spool"]:
+        """Open every other spool in ``directory`` that no process holds, e.g. those of stopped workers."""
+        found = []
+        for filename in sorted(os.listdir(directory)):
+            if filename.startswith(f"{name}-") and filename.endswith(".sqlite3"):
+                try:
+                    found.append(cls(os.path.join(directory, filename)))
+                except OSError:
+                    continue
+        return found
+
+    async def _run(self, fn: Callable[..., Any], *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._writer, fn, *args)
+
+    async def count(self) -> int:
+        return await self._run(lambda: self._conn.execute("SELECT COUNT(*) FROM spool WHERE dead = 0").fetchone()[0])
+
+    async def dead(self) -> int:
+        return await self._run(lambda: self._conn.execute("SELECT COUNT(*) FROM spool WHERE dead = 1").fetchone()[0])
+
+    async def append(self, row: Dict[str, Any]) -> int:
+        """Store a row durably; returns its sequence number once committed."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((json.dumps(row, default=str), future))
+        if self._committer is None:
+            self._committer = asyncio.ensure_future(self._commit())
+        return await future
+
+    def _insert(self, payloads: List[str]) -> List[int]:
+        try:
+            seqs = [self._conn.execute("INSERT INTO spool (row) VALUES (?)", (payload,)).lastrowid
+                    for payload in payloads]
+            self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            raise
+        return seqs
+
+    async def _commit(self) -> None:
+        try:
+            while self._pending:
+                pending, self._pending = self._pending, []
+                try:
+                    seqs = await self._run(self._insert, [payload for payload, _ in pending])
+                except Exception as e:
+                    for _, future in pending:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for seq, (_, future) in zip(seqs, pending):
+                    if not future.done():
+                        future.set_result(seq)
+        finally:
+            self._committer = None
+
+    def _rows(self) -> List[Tuple[int, Dict[str, Any], int]]:
+        return [(seq, json.loads(row), attempts) for seq, row, attempts in self._conn.execute(
+            "SELECT seq, row, attempts FROM spool WHERE dead = 0 ORDER BY seq"
+        )]
+
+    async def rows(self) -> List[Tuple[int, Dict[str, Any], int]]:
+        """Live rows as (seq, row, attempts), oldest first."""
+        return await self._run(self._rows)
+
+    def _remove(self, seqs: List[int]) -> None:
+        self._conn.executemany("DELETE FROM spool WHERE seq = ?", [(seq,) for seq in seqs])
+        self._conn.commit()
+
+    async def remove(self, seqs: List[int]) -> None:
+        await self._run(self._remove, seqs)
+
+    def _failed(self, entries: List[Tuple[int, bool]]) -> None:
+        self._conn.executemany("UPDATE spool SET attempts = attempts + 1, dead = ? WHERE seq = ?",
+                               [(int(dead), seq) for seq, dead in entries])
+        self._conn.commit()
+
+    async def failed(self, entries: List[Tuple[int, bool]]) -> None:
+        """Count a failed attempt for each (seq, dead) pair, marking those given up on dead, in one commit."""
+        await self._run(self._failed, entries)
+
+    def _close(self) -> None:
+        self._conn.close()
+        self._lock.close()
+
+    async def close(self) -> None:
+        if self._committer is not None:
+            await self._committer
+        await self._run(self._close)
+        self._writer.shutdown(wait=False)
+
+
+@dataclass
+class _Entry:
+    seq: int
+    row: Dict[str, Any]
+    attempts: int = 0
+    written: Optional[Dict[str, Any]] = None
+
+
+class WriteBehindQueue:
+    """
+    Acknowledge rows once spooled to disk and insert them in the background.
+
+    ``submit`` appends a row to the local ``Spool`` and returns; a flusher
+    task collects queued rows into batches of up to ``batch_size`` (waiting
+    at most ``linger_seconds`` for a batch to fill) and inserts each batch
+    with a ``BulkWriter``, which isolates bad rows by splitting. Every
+    written batch is handed to ``on_written`` once, so aggregates are updated
+    per batch rather than per row.
+
+    At most ``max_queued`` rows wait at a time; ``submit`` blocks while the
+    queue is full and raises ``QueueFull`` after ``wait_seconds``. Rows whose
+    insert fails are retried with backoff and marked dead in the spool after
+    ``max_attempts``. On start, rows left in this process's spool or in
+    spools no running process holds are queued again; ``already_written``
+    filters out those that reached the database before a crash.
+
+    Args:
+        directory: Spool directory, shared by the worker processes
+        name: Spool file prefix
+        write: Inserts a batch of rows; returns the inserted rows, in order
+        on_written: Called with the inserted rows of every written batch
+        already_written: Returns the indexes of replayed rows already in the database
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        name: str,
+        write: Callable[[Database, List[Dict[str, Any]]], Awaitable[List[Dict[str, Any]]]],
+        on_written: Callable[[Database, List[Dict[str, Any]]], Awaitable[None]],
+        already_written: Optional[Callable[[Database, List[Dict[str, Any]]], Awaitable[set]]] = None,
+        max_queued: int = 10000,
+        batch_size: int = 200,
+        linger_seconds: float = 0.05,
+        wait_seconds: float = 1.0,
+        max_attempts: int = 5,
+        retry_seconds: float = 1.0
+    ):
+        self.directory = directory
+        self.name = name
+        self._write = write
+        self._on_written = on_written
+        self._already_written = already_written
+        self.max_queued = max_queued
+        self.batch_size = batch_size
+        self.linger_seconds = linger_seconds
+        self.wait_seconds = wait_seconds
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.spool: Optional[Spool] = None
+        self._db: Optional[Database] = None
+        self._queue: "asyncio.Queue[_Entry]" = asyncio.Queue()
+        # Rows accepted and not yet written or given up on
+        self._outstanding = 0
+        self._space = asyncio.Condition()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self, db: Database) -> None:
+        """Open the spool, queue the rows left over from earlier runs and start flushing."""
+        if self.running:
+            return
+        self._db = db
+        loop = asyncio.get_running_loop()
+        if self.spool is None:
+            self.spool = await loop.run_in_executor(None, Spool.claim, self.directory, self.name)
+        entries = [_Entry(seq, row, attempts) for seq, row, attempts in await self.spool.rows()]
+        for orphan in await loop.run_in_executor(None, Spool.orphans, self.directory, self.name):
+            adopted = await orphan.rows()
+            seqs = await asyncio.gather(*(self.spool.append(row) for _, row, _ in adopted))
+            entries.extend(_Entry(seq, row, attempts) for seq, (_, row, attempts) in zip(seqs, adopted))
+            await orphan.remove([seq for seq, _, _ in adopted])
+            await orphan.close()
+        if entries and self._already_written is not None:
+            written = await self._already_written(db, [entry.row for entry in entries])
+            if written:
+                await self.spool.remove([entries[i].seq for i in written])
+                entries = [entry for i, entry in enumerate(entries) if i not in written]
+        for entry in entries:
+            self._enqueue(entry)
+        if entries:
+            logger.info(f"Replaying {len(entries)} spooled {self.name}")
+        self._task = asyncio.create_task(self._flusher(), name=f"write-behind-{self.name}")
+
+    async def stop(self, drain_seconds: float = 5.0) -> None:
+        """Stop flushing, after waiting up to ``drain_seconds`` for the queue to empty; the rest stays spooled."""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._idle.wait(), drain_seconds)
+        except asyncio.TimeoutError:
+            logger.warning(f"{self._outstanding} {self.name} still spooled at shutdown")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.spool.close()
+        self.spool = None
+        self._queue = asyncio.Queue()
+        self._outstanding = 0
+
+    def _enqueue(self, entry: _Entry) -> None:
+        self._outstanding += 1
+        self._idle.clear()
+        self._queue.put_nowait(entry)
+
+    async def _release(self, count: int) -> None:
+        self._outstanding -= count
+        if not self._outstanding:
+            self._idle.set()
+        async with self._space:
+            self._space.notify(count)
+
+    async def submit(self, row: Dict[str, Any]) -> None:
+        """
+        Accept a row for writing; returns once it is spooled to disk.
+
+        Raises:
+            QueueFull: If the queue stayed full for ``wait_seconds``
+        """
+        if not self.running:
+            raise Exception(f"Write-behind queue for {self.name} is not running")
+        async with self._space:
+            try:
+                await asyncio.wait_for(
+                    self._space.wait_for(lambda: self._outstanding < self.max_queued), self.wait_seconds
+                )
+            except asyncio.TimeoutError:
+                raise QueueFull(f"{self._outstanding} {self.name} are waiting to be written")
+            # Counted before the append, so concurrent submitters cannot overshoot max_queued
+            self._outstanding += 1
+        self._idle.clear()
+        try:
+            seq = await self.spool.append(row)
+        except Exception:
+            await self._release(1)
+            raise
+        self._queue.put_nowait(_Entry(seq, row))
+
+    async def _next_batch(self) -> List[_Entry]:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.linger_seconds
+        while len(batch) < self.batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _write_entries(self, entries: List[_Entry]) -> None:
+        inserted = await self._write(self._db, [entry.row for entry in entries])
+        for entry, row in zip(entries, inserted):
+            entry.written = row
+
+    async def _flusher(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                # Keep flushing; whatever was not removed from the spool is replayed on restart
+                logger.error(f"Error flushing {self.name}: {e}")
+
+    async def _flush(self, batch: List[_Entry]) -> None:
+        failed: List[_Entry] = []
+        writer = BulkWriter(
+            self._write_entries,
+            max_in_flight=1,
+            batch_size=len(batch),
+            min_batch_size=1,
+            max_batch_size=len(batch),
+            max_retries=1,
+            on_failed=lambda entry, error: failed.append(entry)
+        )
+        await writer.add_many(batch)
+        await writer.close()
+        written = [entry for entry in batch if entry.written is not None]
+        if written:
+            await self.spool.remove([entry.seq for entry in written])
+            self.written += len(written)
+            self.batches += 1
+            try:
+                await self._on_written(self._db, [entry.written for entry in written])
+            except Exception as e:
+                logger.error(f"Error applying {len(written)} written {self.name}: {e}")
+
+        for entry in failed:
+            entry.attempts += 1
+        if failed:
+            await self.spool.failed([(entry.seq, entry.attempts >= self.max_attempts) for entry in failed])
+        given_up = 0
+        for entry in failed:
+            if entry.attempts >= self.max_attempts:
+                logger.error(f"Giving up on spooled {self.name} row {entry.seq} after {entry.attempts} attempts")
+                self.failed += 1
+                given_up += 1
+            else:
+                delay = self.retry_seconds * 2 ** (entry.attempts - 1)
+                asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, entry)
+        await self._release(len(written) + given_up)
+
+    async def stats(self) -> Dict[str, Any]:
+        spool = self.spool
+        return {
+            "running": self.running,
+            "outstanding": self._outstanding,
+            "spooled": await spool.count() if spool is not None else 0,
+            "dead": await spool.dead() if spool is not None else 0,
+            "written": self.written,
+            "batches": self.batches,
+            "failed": self.failed,
+        }
@@ -0,0 +1,31 @@
+-- Count new reviews into their bathrooms' ratings, atomically and in O(1) per bathroom.
+--
+-- Called once per inserted review, or once per batch of them, with one
+-- (bathroom id, review count, rating sum) delta per bathroom. Each row is
+-- updated relative to its current value, and the update locks it, so
+-- concurrent calls (from any worker) add up instead of overwriting each
+-- other. The running rating_sum keeps the average exact however many reviews
+-- are added; average_rating itself is rounded for display.
+--
+-- Apply in the Supabase SQL editor (or psql) once per project. The backfill
+-- below counts the reviews already stored; run it before deploying the
+-- backend that calls the function.
+alter table bathrooms add column if not exists rating_sum bigint not null default 0;
+
+update bathrooms b
+set rating_sum = s.total
+from (select bathroom_id, sum(rating) as total from reviews group by bathroom_id) s
+where b.id = s.bathroom_id and b.rating_sum <> s.total;
+
+create or replace function add_bathroom_ratings(p_bathroom_ids bigint[], p_counts integer[], p_sums integer[])
+returns setof bathrooms
+language sql
+as $$
+    update bathrooms b
+    set total_ratings = b.total_ratings + d.count,
+        rating_sum = b.rating_sum + d.total,
+        average_rating = coalesce(round((b.rating_sum + d.total)::numeric / nullif(b.total_ratings + d.count, 0), 2), 0)
+    from unnest(p_bathroom_ids, p_counts, p_sums) as d(bathroom_id, count, total)
+    where b.id = d.bathroom_id
+    returning b.*;
+$$;
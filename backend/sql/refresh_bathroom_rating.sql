@@ -0,0 +1,32 @@
+-- Recount a bathroom's rating from its reviews and store it, atomically.
+--
+-- New reviews are counted in incrementally by add_bathroom_ratings
+-- (add_bathroom_ratings.sql, which also adds the rating_sum column); this
+-- full recount is for when reviews move between bathrooms, are imported in
+-- bulk, or an increment may have been lost. The bathroom row is locked before the
+-- recount, and the recount runs in a statement of its own, so it sees every
+-- review committed before the lock was granted: whichever of several
+-- concurrent calls (from any worker) writes last has counted all of them.
+--
+-- Apply in the Supabase SQL editor (or psql) once per project.
+create or replace function refresh_bathroom_rating(p_bathroom_id bigint)
+returns setof bathrooms
+language plpgsql
+as $$
+begin
+    perform 1 from bathrooms where id = p_bathroom_id for update;
+
+    return query
+    update bathrooms b
+    set average_rating = coalesce(s.average, 0),
+        total_ratings = s.total,
+        rating_sum = s.rating_sum
+    from (
+        select round(avg(rating)::numeric, 2) as average, count(*) as total, coalesce(sum(rating), 0) as rating_sum
+        from reviews
+        where bathroom_id = p_bathroom_id
+    ) s
+    where b.id = p_bathroom_id
+    returning b.*;
+end;
+$$;
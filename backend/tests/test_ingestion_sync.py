@@ -0,0 +1,56 @@
+import asyncio
+
+import httpx
+
+from config.database import Database
+from scripts import data_ingestion
+from benchmarks.fakes import FakeSupabase, FakeRefugeAPI
+
+BBOX = "42.0,-71.5,42.5,-71.0"
+
+
+def restrooms(renamed=None):
+    return [{
+        "id": i, "name": f"Renamed {i}" if i == renamed else f"Restroom {i}", "street": f"{i} Main St",
+        "city": "Boston", "state": "MA", "accessible": True, "unisex": False, "changing_table": False,
+        "directions": "", "comment": "", "latitude": 42.25 + i * 0.001, "longitude": -71.25,
+        "created_at": "2024-01-01T00:00:00.000Z", "updated_at": "2024-01-01T00:00:00.000Z",
+    } for i in range(1, 6)]
+
+
+def sync(db, tmp_path, upstream):
+    refuge = FakeRefugeAPI(upstream)
+    argv = ["--bbox", BBOX, "--rate", "1000", "--no-http-cache",
+            "--checkpoint", str(tmp_path / "checkpoint.json"), "--state", str(tmp_path / "state.sqlite3")]
+
+    async def run():
+        async with httpx.AsyncClient(transport=refuge.transport(),
+                                     base_url="https://refuge.test/api/v1/restrooms") as client:
+            return await data_ingestion.main(argv, db=db, client=client)
+    return asyncio.run(run())
+
+
+def test_rejected_update_is_not_deleted_as_stale(tmp_path):
+    backend = FakeSupabase()
+    db = Database(backend, 4)
+    try:
+        first = sync(db, tmp_path, restrooms())
+        assert first.inserted == 5
+
+        # The modified row's upsert fails, but the row is still upstream
+        backend.reject = lambda row: row.get("name") == "Renamed 3"
+        second = sync(db, tmp_path, restrooms(renamed=3))
+        assert (second.unchanged, second.failed, second.deleted) == (4, 1, 0)
+        assert len(backend.table_data("bathrooms").rows) == 5
+
+        # The next run retries it
+        backend.reject = None
+        third = sync(db, tmp_path, restrooms(renamed=3))
+        assert (third.unchanged, third.updated, third.deleted) == (4, 1, 0)
+
+        # Rows gone upstream are still deleted
+        fourth = sync(db, tmp_path, restrooms(renamed=3)[:4])
+        assert fourth.deleted == 1
+        assert len(backend.table_data("bathrooms").rows) == 4
+    finally:
+        db.close()
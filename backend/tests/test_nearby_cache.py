@@ -0,0 +1,109 @@
+import math
+import asyncio
+
+import pytest
+
+import services.bathroom_service as bathroom_service
+from config.database import Database
+from services.bathroom_service import BathroomService
+from services.query_cache import NearbyQueryCache
+from services.spatial_index import SpatialIndex, haversine_km
+from benchmarks.fakes import FakeSupabase
+from benchmarks.common import synthetic_bathrooms, query_points
+
+CENTER = (42.3601, -71.0589)
+KM_PER_DEGREE_LAT = 111.195
+
+
+def ring_rows():
+    """Bathrooms due north of CENTER every 10 m out to 1 km."""
+    return [{
+        "id": i, "name": f"Restroom {i}", "latitude": CENTER[0] + i * 0.01 / KM_PER_DEGREE_LAT,
+        "longitude": CENTER[1], "is_unisex": i % 2 == 0, "is_accessible": True,
+        "has_changing_table": False, "average_rating": 4.0,
+    } for i in range(1, 101)]
+
+
+@pytest.fixture(params=["index", "rpc"])
+def db(request, monkeypatch):
+    rows = ring_rows()
+    backend = FakeSupabase()
+    backend.seed("bathrooms", rows)
+    index = None
+    if request.param == "index":
+        index = SpatialIndex()
+        index.load(rows)
+    monkeypatch.setattr(bathroom_service, "bathroom_index", index)
+    monkeypatch.setattr(bathroom_service, "nearby_cache", NearbyQueryCache())
+    database = Database(backend, 4)
+    yield database
+    database.close()
+
+
+def expected(latitude, longitude, radius, limit):
+    found = sorted((haversine_km(latitude, longitude, row["latitude"], row["longitude"]), row["id"])
+                   for row in ring_rows())
+    return [bathroom_id for distance, bathroom_id in found if distance <= radius][:limit]
+
+
+def test_quantize_never_shrinks_the_radius():
+    cache = NearbyQueryCache(radius_step_km=0.25)
+    for radius in (0.1, 0.25, 0.26, 0.3, 0.5, 0.74, 2.0):
+        assert cache.quantize(0.0, 0.0, radius)[2] >= radius
+
+
+def test_cached_results_match_the_requested_query(db):
+    # Off the snapping grid, so the snapped center differs from the real one
+    latitude, longitude = CENTER[0] + 0.00021, CENTER[1] + 0.00019
+    for radius, limit in ((0.3, 100), (0.3, 5), (0.05, 100), (1.0, 40)):
+        for attempt in range(2):  # a miss, then a hit
+            rows = asyncio.run(BathroomService.get_bathrooms_by_location(db, latitude, longitude, radius, limit))
+            assert [row["id"] for row in rows] == expected(latitude, longitude, radius, limit)
+            for row in rows:
+                real = haversine_km(latitude, longitude, row["latitude"], row["longitude"])
+                assert math.isclose(row["distance"], real, abs_tol=1e-6)
+    assert bathroom_service.nearby_cache.hits > 0
+
+
+def test_nearby_centers_share_an_entry(db):
+    for offset in (0.0, 0.0001, -0.0001):
+        rows = asyncio.run(BathroomService.get_bathrooms_by_location(
+            db, CENTER[0] + offset, CENTER[1], 0.3, 10, is_unisex=True
+        ))
+        assert [row["id"] for row in rows] == [i for i in expected(CENTER[0] + offset, CENTER[1], 0.3, 100)
+                                               if i % 2 == 0][:10]
+    assert len(bathroom_service.nearby_cache) == 1
+
+
+@pytest.mark.parametrize("source", ["index", "rpc"])
+def test_pages_agree_with_the_cache_on_and_off(source, monkeypatch):
+    rows = synthetic_bathrooms(20000, 42)
+    backend = FakeSupabase()
+    backend.seed("bathrooms", rows)
+    index = None
+    if source == "index":
+        index = SpatialIndex()
+        index.load(rows)
+    monkeypatch.setattr(bathroom_service, "bathroom_index", index)
+    database = Database(backend, 4)
+
+    async def pages(cache, **query):
+        # Page 1 is served from the cache when it is on, later pages never are
+        monkeypatch.setattr(bathroom_service, "nearby_cache", cache)
+        ids, after = [], None
+        while True:
+            page = await BathroomService.get_bathrooms_by_location(database, after=after, **query)
+            ids.extend(row["id"] for row in page)
+            if len(page) < query["limit"]:
+                return ids
+            after = (page[-1]["distance"], page[-1]["id"])
+
+    try:
+        for point in query_points(5, 7):
+            for query in ({"radius": 2, "limit": 50}, {"radius": None, "limit": 25, "rating_min": 4.5}):
+                query = dict(query, latitude=point["latitude"], longitude=point["longitude"])
+                cached = asyncio.run(pages(NearbyQueryCache(), **query))
+                assert len(set(cached)) == len(cached)
+                assert cached == asyncio.run(pages(None, **query))
+    finally:
+        database.close()
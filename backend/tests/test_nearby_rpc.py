@@ -0,0 +1,75 @@
+import asyncio
+
+import httpx
+import pytest
+
+import services.bathroom_service as bathroom_service
+from app import app
+from api.dependencies import get_database
+from api.cursors import NEXT_CURSOR_HEADER
+from config.database import Database
+from services.spatial_index import haversine_km
+from benchmarks.fakes import FakeSupabase
+
+CENTER = (42.3601, -71.0589)
+
+
+def grid_rows():
+    """A 10 x 10 grid of bathrooms about 100 m apart around CENTER."""
+    return [{
+        "id": i, "name": f"Restroom {i}", "latitude": CENTER[0] + (i // 10 - 5) * 0.0009,
+        "longitude": CENTER[1] + (i % 10 - 5) * 0.0012, "is_unisex": i % 3 == 0, "is_accessible": True,
+        "has_changing_table": False, "average_rating": 4.0, "total_ratings": 1,
+        "created_at": "2024-01-01T00:00:00+00:00", "updated_at": "2024-01-01T00:00:00+00:00",
+    } for i in range(100)]
+
+
+@pytest.fixture(params=[True, False], ids=["rpc-distance", "no-rpc-distance"])
+def backend(request, monkeypatch):
+    monkeypatch.setattr(bathroom_service, "bathroom_index", None)
+    monkeypatch.setattr(bathroom_service, "nearby_cache", None)
+    backend = FakeSupabase(rpc_distance=request.param)
+    backend.seed("bathrooms", grid_rows())
+    database = Database(backend, 4)
+    app.dependency_overrides[get_database] = lambda: database
+    yield backend
+    app.dependency_overrides.pop(get_database, None)
+    database.close()
+
+
+def expected(unisex_only=False):
+    found = sorted((haversine_km(CENTER[0], CENTER[1], row["latitude"], row["longitude"]), row["id"])
+                   for row in grid_rows() if row["is_unisex"] or not unisex_only)
+    return [bathroom_id for _, bathroom_id in found]
+
+
+def pages(params):
+    async def run():
+        ids, cursor = [], None
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            while True:
+                query = {"latitude": CENTER[0], "longitude": CENTER[1], **params}
+                if cursor:
+                    query["cursor"] = cursor
+                response = await client.get("/api/bathrooms/", params=query)
+                assert response.status_code == 200, response.text
+                rows = response.json()
+                assert all(row["distance"] is not None for row in rows)
+                ids.extend(row["id"] for row in rows)
+                cursor = response.headers.get(NEXT_CURSOR_HEADER)
+                if not cursor:
+                    return ids
+    return asyncio.run(run())
+
+
+def test_rpc_pages_follow_distance(backend):
+    assert pages({"radius": 5, "limit": 15}) == expected()
+
+
+def test_rpc_filtered_pages_follow_distance(backend):
+    assert pages({"radius": 5, "limit": 7, "is_unisex": "true"}) == expected(unisex_only=True)
+
+
+def test_rpc_k_nearest_pages(backend):
+    assert pages({"k": 12}) == expected()
@@ -0,0 +1,52 @@
+import asyncio
+
+import httpx
+import pytest
+
+import services.bathroom_service as bathroom_service
+from app import app
+from api.dependencies import get_database
+from config.database import Database
+from config.settings import RESPONSE_VALIDATION
+from benchmarks.fakes import FakeSupabase
+
+ROW = {"id": 1, "name": "Restroom", "latitude": 42.36, "longitude": -71.06, "average_rating": 4.5,
+       "total_ratings": 2, "created_at": "2024-01-01T00:00:00+00:00", "updated_at": "2024-01-01T00:00:00+00:00"}
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    monkeypatch.setattr(bathroom_service, "bathroom_index", None)
+    monkeypatch.setattr(bathroom_service, "nearby_cache", None)
+    backend = FakeSupabase(seed=1)
+    database = Database(backend, 4)
+    app.dependency_overrides[get_database] = lambda: database
+    yield backend
+    app.dependency_overrides.pop(get_database, None)
+    database.close()
+
+
+def _get(path: str):
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get(path)
+    return asyncio.run(run())
+
+
+def test_validation_is_on_outside_production():
+    assert RESPONSE_VALIDATION
+
+
+def test_valid_bathroom_is_rendered_by_its_model(backend):
+    backend.seed("bathrooms", [{**ROW, "internal_note": "not for clients"}])
+    response = _get("/api/bathrooms/1")
+    assert response.status_code == 200
+    assert response.json()["name"] == "Restroom"
+    assert "internal_note" not in response.json()
+
+
+def test_malformed_bathroom_is_a_server_error(backend):
+    backend.seed("bathrooms", [{key: value for key, value in ROW.items() if key != "latitude"}])
+    response = _get("/api/bathrooms/1")
+    assert response.status_code == 500
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+import services.bathroom_service as bathroom_service
+import services.review_service as review_service
+from config.database import Database
+from models.review import ReviewCreate
+from services.review_service import ReviewService
+from services.review_summary import ReviewSummaryStore
+from benchmarks.fakes import FakeSupabase
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(review_service, "review_summaries", ReviewSummaryStore())
+    monkeypatch.setattr(bathroom_service, "bathroom_index", None)
+    monkeypatch.setattr(bathroom_service, "nearby_cache", None)
+    backend = FakeSupabase(latency_ms=5, jitter_ms=5, seed=3)
+    backend.seed("bathrooms", [{"id": i, "name": "Restroom", "latitude": 42.36, "longitude": -71.06,
+                                "average_rating": 0, "total_ratings": 0} for i in (1, 2, 3)])
+    database = Database(backend, 16)
+    yield database, backend
+    database.close()
+
+
+def test_concurrent_reviews_all_count(db):
+    database, backend = db
+    ratings = [1 + i % 5 for i in range(30)]
+
+    async def run():
+        # Warm the summary cache so a stale copy would be there to overwrite with
+        await ReviewService.get_summaries(database, [1])
+        await asyncio.gather(*(ReviewService.create_review(
+            database, ReviewCreate(bathroom_id=1, rating=rating)) for rating in ratings))
+        calls = backend.calls
+        summaries = await ReviewService.get_summaries(database, [1])
+        # Counted into the cached summary, not rebuilt from the reviews table
+        assert backend.calls == calls
+        return summaries
+
+    summary, = asyncio.run(run())
+    row = backend.table_data("bathrooms").rows[1]
+    assert row["total_ratings"] == 30
+    assert row["rating_sum"] == sum(ratings)
+    assert row["average_rating"] == round(sum(ratings) / 30, 2)
+    assert summary["count"] == 30
+    assert summary["average_rating"] == round(sum(ratings) / 30, 2)
+    assert summary["histogram"] == {str(r): ratings.count(r) for r in range(1, 6)}
+
+
+def test_reviews_are_counted_without_rescanning(db, monkeypatch):
+    database, backend = db
+
+    async def no_recount(db, bathroom_id):
+        raise AssertionError("a new review recounted the bathroom's reviews")
+
+    monkeypatch.setattr(bathroom_service.BathroomService, "refresh_rating", no_recount)
+    asyncio.run(ReviewService.create_review(database, ReviewCreate(bathroom_id=1, rating=4)))
+    row = backend.table_data("bathrooms").rows[1]
+    assert (row["total_ratings"], row["average_rating"]) == (1, 4.0)
+
+
+def test_written_batch_is_one_delta_per_bathroom(db, monkeypatch):
+    database, backend = db
+
+    async def no_recount(db, bathroom_id):
+        raise AssertionError("a written batch recounted a bathroom's reviews")
+
+    monkeypatch.setattr(bathroom_service.BathroomService, "refresh_rating", no_recount)
+    batch = [{"id": i, "bathroom_id": 1 + i % 3, "rating": 1 + i % 5, "created_at": f"2024-01-01T00:00:{i:02d}+00:00"}
+             for i in range(12)]
+    backend.seed("reviews", batch[:3])
+
+    async def run():
+        await ReviewService.get_summaries(database, [1])
+        calls = backend.calls
+        await ReviewService._apply_reviews(database, batch[3:])
+        assert backend.calls == calls + 1
+        return await ReviewService.get_summaries(database, [1])
+
+    summary, = asyncio.run(run())
+    for bathroom_id in (1, 2, 3):
+        ratings = [r["rating"] for r in batch[3:] if r["bathroom_id"] == bathroom_id]
+        row = backend.table_data("bathrooms").rows[bathroom_id]
+        assert (row["total_ratings"], row["rating_sum"]) == (len(ratings), sum(ratings))
+    ratings = [r["rating"] for r in batch if r["bathroom_id"] == 1]
+    assert summary["count"] == len(ratings)
+    assert summary["latest"][0]["id"] == 9
@@ -0,0 +1,24 @@
+import pytest
+
+from api.routes.tiles import accepts_gzip
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False),
+    ("", False),
+    ("gzip", True),
+    ("gzip, deflate, br", True),
+    ("br;q=1.0, gzip;q=0.8", True),
+    ("gzip;q=0", False),
+    ("gzip; q=0.000", False),
+    ("identity, gzip;q=0", False),
+    ("*", True),
+    ("*;q=0", False),
+    ("gzip;q=0, *", False),
+    ("*;q=0, gzip", True),
+    ("x-gzip", True),
+    ("deflate", False),
+    ("GZIP;Q=0.5", True),
+])
+def test_accepts_gzip_honours_q_values(header, expected):
+    assert accepts_gzip(header) is expected
@@ -0,0 +1,89 @@
+import zlib
+import asyncio
+import tracemalloc
+
+import httpx
+import pytest
+
+import api.routes.transfer as transfer_routes
+import services.bathroom_service as bathroom_service
+import services.review_service as review_service
+import services.transfer_service as transfer_service
+from app import app
+from api.dependencies import get_database
+from config.database import Database
+from services.review_summary import ReviewSummaryStore
+from services.transfer_service import TransferService
+from benchmarks.fakes import FakeSupabase
+
+
+@pytest.fixture
+def db(monkeypatch):
+    summaries = ReviewSummaryStore()
+    monkeypatch.setattr(review_service, "review_summaries", summaries)
+    monkeypatch.setattr(transfer_service, "review_summaries", summaries)
+    monkeypatch.setattr(bathroom_service, "bathroom_index", None)
+    monkeypatch.setattr(bathroom_service, "nearby_cache", None)
+    backend = FakeSupabase(seed=5)
+    backend.seed("bathrooms", [{"id": 1, "name": "Restroom", "latitude": 42.36, "longitude": -71.06,
+                                "average_rating": 0, "total_ratings": 0}])
+    database = Database(backend, 4)
+    app.dependency_overrides[get_database] = lambda: database
+    yield database, backend
+    app.dependency_overrides.pop(get_database, None)
+    database.close()
+
+
+async def _chunks(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def test_gzip_bomb_is_not_inflated_in_memory(db):
+    database, _ = db
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+    bomb = compressor.compress(b"\0" * (64 * 1024 * 1024)) + compressor.flush()
+
+    tracemalloc.start()
+    try:
+        with pytest.raises(ValueError, match="Line longer"):
+            asyncio.run(TransferService.import_ndjson(database, "bathrooms", _chunks(bomb), max_line_bytes=4096))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < 4 * 1024 * 1024
+
+
+def _post(body: bytes):
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/api/transfer/reviews", content=body)
+    return asyncio.run(run())
+
+
+def test_import_is_disabled_by_default(db):
+    _, backend = db
+    response = _post(b'{"id": 1, "bathroom_id": 1, "rating": 5}\n')
+    assert response.status_code == 403
+    assert not backend.table_data("reviews").rows
+
+
+def test_import_validates_rows_and_recounts_ratings(db, monkeypatch):
+    _, backend = db
+    monkeypatch.setattr(transfer_routes, "TRANSFER_IMPORT_ENABLED", True)
+    body = b"\n".join([
+        b'{"id": 1, "bathroom_id": 1, "rating": 5}',
+        b'{"id": 2, "bathroom_id": 1, "rating": 3, "is_admin": true}',
+        b'{"id": 3, "bathroom_id": 1, "rating": 9}',
+        b'{"bathroom_id": 1, "rating": 4}',
+    ])
+    response = _post(body)
+    assert response.status_code == 200
+    report = response.json()
+    assert (report["written"], report["invalid"]) == (2, 2)
+    reviews = backend.table_data("reviews").rows
+    assert sorted(reviews) == [1, 2]
+    assert "is_admin" not in reviews[2]
+    row = backend.table_data("bathrooms").rows[1]
+    assert (row["total_ratings"], row["average_rating"]) == (2, 4.0)
@@ -0,0 +1,83 @@
+import time
+import asyncio
+
+from services.write_behind import Spool, WriteBehindQueue
+
+
+def test_spool_commits_do_not_block_the_event_loop(tmp_path, monkeypatch):
+    insert = Spool._insert
+
+    def slow_insert(self, payloads):
+        # Stands in for the fsync of a synchronous=FULL commit on a slow disk
+        time.sleep(0.1)
+        return insert(self, payloads)
+
+    monkeypatch.setattr(Spool, "_insert", slow_insert)
+    written = []
+
+    async def write(db, rows):
+        return rows
+
+    async def on_written(db, rows):
+        written.extend(rows)
+
+    async def run():
+        queue = WriteBehindQueue(str(tmp_path), "reviews", write=write, on_written=on_written, linger_seconds=0)
+        await queue.start(None)
+        gaps = []
+
+        async def tick():
+            last = time.perf_counter()
+            while True:
+                await asyncio.sleep(0.005)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        ticker = asyncio.create_task(tick())
+        for i in range(5):
+            await asyncio.gather(*(queue.submit({"n": i * 20 + j}) for j in range(20)))
+        await queue.stop()
+        ticker.cancel()
+        return gaps
+
+    gaps = asyncio.run(run())
+    assert sorted(row["n"] for row in written) == list(range(100))
+    assert max(gaps) < 0.05
+
+
+def test_spooled_rows_survive_a_restart(tmp_path):
+    async def failing(db, rows):
+        raise Exception("database is down")
+
+    async def ignore(db, rows):
+        pass
+
+    async def first_run():
+        queue = WriteBehindQueue(str(tmp_path), "reviews", write=failing, on_written=ignore, retry_seconds=60)
+        await queue.start(None)
+        await asyncio.gather(*(queue.submit({"n": n}) for n in range(3)))
+        await queue.stop(drain_seconds=0.2)
+
+    async def second_run():
+        written = []
+
+        async def write(db, rows):
+            return rows
+
+        async def on_written(db, rows):
+            written.extend(rows)
+
+        queue = WriteBehindQueue(str(tmp_path), "reviews", write=write, on_written=on_written)
+        await queue.start(None)
+        await queue.stop()
+        spool = Spool.claim(str(tmp_path), "reviews")
+        try:
+            return written, await spool.count()
+        finally:
+            await spool.close()
+
+    asyncio.run(first_run())
+    written, left = asyncio.run(second_run())
+    assert sorted(row["n"] for row in written) == [0, 1, 2]
+    assert left == 0